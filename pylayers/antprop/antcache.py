@@ -0,0 +1,411 @@
+#-*- coding:Utf-8 -*-
+r"""
+.. currentmodule:: pylayers.antprop.antcache
+
+Antenna pattern cache
+=====================
+
+Evaluating an antenna pattern (vector or scalar spherical harmonics,
+Gauss, 3gpp, ...) in a set of directions costs the same at every call.
+A simulation which queries the same antenna again and again (e.g.
+Coverage, one call per access point and per block of grid points)
+pays that cost each time.
+
+A PatternCache evaluates the pattern once on a regular (theta,phi,f)
+grid and serves the direction queries by bilinear interpolation of
+Ft and Fp in (theta,phi).
+
++ The grid step is refined until the interpolation error, checked
+  against the exact complex pattern at the centre of every grid cell,
+  meets the accuracy target tol (dB). If the target is not met at the
+  finest step, or if the grid would exceed nmax values, the cache is not
+  valid and the queries fall back to the exact evaluation.
++ Queries at frequencies which are not in the cache fall back to the
+  exact evaluation as well.
++ The grids are shared between the antennas with the same type, the
+  same parameters and the same antenna file, each antenna has its own
+  view (see PatternCache.view) and query counters. For an antenna file, the
+  cache can be stored next to it (.npz added to the file name) and is
+  reused as long as it is more recent than the antenna file.
+
+.. autosummary::
+    :toctree: generated/
+
+    PatternCache
+    getcache
+
+"""
+from __future__ import print_function
+import os
+import copy
+from collections import OrderedDict
+import numpy as np
+import pylayers.util.pyutil as pyu
+from pylayers.util.project import pstruc
+
+# caches of the current session, indexed by their key (least recently
+# used first out beyond _ncache caches)
+_dcache = OrderedDict()
+_ncache = 32
+
+# antenna state modified by a pattern evaluation
+_state = ['theta', 'phi', 'grid', 'full', 'fGHz', 'nf', 'nth', 'nph', 'cache']
+
+
+def _errdB(Fti, Fpi, Fte, Fpe, floor):
+    """ bound on the gain error (dB) of an approximate pattern
+
+    20 log10(1 + |Fi - Fe| / |Fe|) with the floor (linear gain) added to
+    |Fe|^2, amplitude and phase errors of Ft and Fp are both accounted
+    """
+    dF = np.abs(Fti - Fte)**2 + np.abs(Fpi - Fpe)**2
+    F = np.abs(Fte)**2 + np.abs(Fpe)**2 + floor
+    return 20*np.log10(1 + np.sqrt(dF/F))
+
+
+class PatternCache(object):
+    """ pattern of an antenna on a regular (theta,phi,f) grid
+
+    Parameters
+    ----------
+
+    fGHz : np.array
+        frequencies of the cache
+    tol : float
+        accuracy target on the gain (dB)
+    steps : list
+        grid steps (degrees) tried in that order, the first one which
+        meets the accuracy target is kept
+    floordB : float
+        gains lower than the maximum gain by more than floordB (dB) are
+        not distinguished by the accuracy check
+    nmax : int
+        maximum number of values nth*nph*nf of the grid, the steps with
+        a larger grid are not tried
+    nblock : int
+        number of grid cells checked at once
+
+    Attributes
+    ----------
+
+    Ft : np.array (nth*nph x nf)
+        theta major, nf is 1 if the pattern does not depend on frequency
+    Fp : np.array (nth*nph x nf)
+    nth : int
+        number of theta in [0,pi] (bounds included)
+    nph : int
+        number of phi in [0,2pi[
+    err : float
+        maximum error (dB) at the cell centres (see build), the check
+        stops as soon as it exceeds tol
+    valid : boolean
+        True if err <= tol
+    ninterp : int
+        number of queries served by interpolation
+    nexact : int
+        number of queries which fell back to the exact evaluation
+
+    Examples
+    --------
+
+    >>> import numpy as np
+    >>> from pylayers.antprop.antenna import Antenna
+    >>> A = Antenna('Gauss')
+    >>> pc = PatternCache(fGHz=np.array([2.4]),tol=0.1)
+    >>> pc.build(A)
+    >>> pc.valid
+    True
+    >>> Ft,Fp = pc(np.array([np.pi/2]),np.array([0.1]),np.array([2.4]))
+    >>> Ft.shape
+    (1, 1)
+
+    """
+
+    def __init__(self, fGHz, tol=0.1, steps=[2, 1, 0.5], floordB=30,
+                 nmax=2**22, nblock=16384):
+        self.fGHz = np.asarray(fGHz, dtype=float)
+        self.tol = tol
+        self.steps = steps
+        self.floordB = floordB
+        self.nmax = nmax
+        self.nblock = nblock
+        self.valid = False
+        self.err = np.inf
+        self.nth = 0
+        self.nph = 0
+        self.Ft = np.zeros((0, 1), dtype=complex)
+        self.Fp = np.zeros((0, 1), dtype=complex)
+        self.ninterp = 0
+        self.nexact = 0
+
+    def __repr__(self):
+        st = 'PatternCache : ' + ('valid' if self.valid else 'not valid') + '\n'
+        st = st + 'fGHz : ' + str(self.fGHz) + '\n'
+        if self.nth > 0:
+            st = st + 'grid (nth x nph x nf) : ' + str((self.nth, self.nph,
+                                                        self.Ft.shape[1])) + '\n'
+        st = st + 'error / target (dB) : %.3f / %.3f\n' % (self.err, self.tol)
+        st = st + 'queries (interpolated/exact) : ' + str(self.ninterp) + '/' + \
+            str(self.nexact)
+        return st
+
+    def build(self, A):
+        """ evaluate the pattern of antenna A on the grid
+
+        Parameters
+        ----------
+
+        A : Antenna
+
+        Notes
+        -----
+
+        The grid steps are tried from the coarsest to the finest, skipping
+        the grids of more than nmax values. For each step, the
+        interpolated pattern is compared to the exact pattern at the
+        centre of every grid cell, where the bilinear interpolation is the
+        farthest from the grid nodes. The error is the bound on the gain
+        error 20 log10(1 + |Fi - Fe| / |Fe|), over Ft and Fp and all the
+        frequencies, which accounts for amplitude and phase errors.
+
+        """
+        saved = dict([(k, A.__dict__[k]) for k in _state if k in A.__dict__])
+        nf = len(self.fGHz)
+        # the check is made against the exact pattern
+        A.cache = None
+        try:
+            for step in self.steps:
+                nth = int(round(180./step)) + 1
+                nph = int(round(360./step))
+                if nth*nph*nf > self.nmax:
+                    continue
+                Ft, Fp = A.eval(fGHz=self.fGHz, nth=nth, nph=nph,
+                                inplace=False)
+                shp = (nth, nph, nf)
+                Ft = np.broadcast_to(Ft, shp)
+                Fp = np.broadcast_to(Fp, shp)
+                # a pattern which does not depend on frequency is stored once
+                if np.all(Ft == Ft[..., :1]) and np.all(Fp == Fp[..., :1]):
+                    Ft = Ft[..., :1]
+                    Fp = Fp[..., :1]
+                self.Ft = Ft.reshape(nth*nph, -1).copy()
+                self.Fp = Fp.reshape(nth*nph, -1).copy()
+                self.nth = nth
+                self.nph = nph
+                Gmax = np.max(np.real(Ft*np.conj(Ft) + Fp*np.conj(Fp)))
+                floor = Gmax*10**(-self.floordB/10.)
+                # centres of all the cells, by blocks of nblock cells
+                dt = np.pi/(nth-1)
+                dp = 2*np.pi/nph
+                ncell = (nth-1)*nph
+                self.err = 0.
+                for c0 in range(0, ncell, self.nblock):
+                    uc = np.arange(c0, min(c0 + self.nblock, ncell))
+                    th = (uc // nph + 0.5)*dt
+                    ph = (uc % nph + 0.5)*dp
+                    Fte, Fpe = A.eval(fGHz=self.fGHz, th=th, ph=ph,
+                                      inplace=False)
+                    Fti, Fpi = self.interp(th, ph)
+                    err = np.max(_errdB(Fti, Fpi, Fte, Fpe, floor))
+                    self.err = max(self.err, float(err))
+                    if self.err > self.tol:
+                        break
+                self.valid = bool(self.err <= self.tol)
+                if self.valid:
+                    break
+        finally:
+            A.__dict__.update(saved)
+
+    def view(self):
+        """ view of the cache with its own query counters
+
+        Returns
+        -------
+
+        pc : PatternCache
+            shallow copy, the grid arrays are shared
+
+        """
+        pc = copy.copy(self)
+        pc.ninterp = 0
+        pc.nexact = 0
+        return pc
+
+    def interp(self, theta, phi, uf=slice(None)):
+        """ bilinear interpolation of the pattern
+
+        Parameters
+        ----------
+
+        theta : np.array (Nd)
+        phi : np.array (Nd)
+        uf : index of the cache frequencies
+
+        Returns
+        -------
+
+        Ft : np.array (Nd x Nf)
+        Fp : np.array (Nd x Nf)
+
+        """
+        x = np.clip(theta*(self.nth-1)/np.pi, 0, self.nth-1)
+        it = np.minimum(x.astype(int), self.nth-2)
+        wt = x - it
+        y = np.mod(phi, 2*np.pi)*self.nph/(2*np.pi)
+        ip = np.floor(y).astype(int)
+        wp = y - ip
+        ip = np.mod(ip, self.nph)
+        ip1 = np.mod(ip + 1, self.nph)
+        # 4 corners of the grid cells (Nd) and their weights (Nd x 1)
+        k = it*self.nph
+        lu = [k + ip, k + ip1, k + self.nph + ip, k + self.nph + ip1]
+        lw = [(1-wt)*(1-wp), (1-wt)*wp, wt*(1-wp), wt*wp]
+        lw = [w[:, None] for w in lw]
+        if self.Ft.shape[1] > 1:
+            Ft = self.Ft[:, uf]
+            Fp = self.Fp[:, uf]
+        else:
+            Ft = self.Ft
+            Fp = self.Fp
+        nf = len(self.fGHz[uf])
+        F = []
+        for T in [Ft, Fp]:
+            Fi = sum([w*T[u] for u, w in zip(lu, lw)])
+            if Fi.shape[1] != nf:
+                Fi = Fi*np.ones(nf)[None, :]
+            F.append(Fi)
+        return F[0], F[1]
+
+    def __call__(self, theta, phi, fGHz):
+        """ pattern in a set of directions
+
+        Parameters
+        ----------
+
+        theta : np.array (Nd)
+        phi : np.array (Nd)
+        fGHz : np.array (Nf)
+
+        Returns
+        -------
+
+        (Ft, Fp) : np.array (Nd x Nf) or None if the cache is not valid
+            or does not hold all the frequencies fGHz
+
+        """
+        if self.valid:
+            d = np.abs(self.fGHz[None, :] - np.asarray(fGHz)[:, None])
+            uf = np.argmin(d, axis=1)
+            if np.all(d[np.arange(len(uf)), uf] < 1e-9):
+                self.ninterp += 1
+                if np.array_equal(uf, np.arange(len(self.fGHz))):
+                    uf = slice(None)
+                return self.interp(theta, phi, uf)
+        self.nexact += 1
+        return None
+
+    def save(self, filename, mtime=0):
+        """ save the cache in a .npz file
+
+        Parameters
+        ----------
+
+        filename : string
+            full name of the file
+        mtime : float
+            modification time of the antenna file
+
+        """
+        np.savez(filename, key=self.key, mtime=mtime, fGHz=self.fGHz,
+                 tol=self.tol, err=self.err, valid=self.valid,
+                 nth=self.nth, nph=self.nph,
+                 Ft=self.Ft, Fp=self.Fp)
+
+    def load(self, filename, mtime=0):
+        """ load the cache from a .npz file
+
+        Parameters
+        ----------
+
+        filename : string
+            full name of the file
+        mtime : float
+            modification time of the antenna file
+
+        Returns
+        -------
+
+        boolean : True if the file holds this cache and is more recent
+            than the antenna file
+
+        """
+        if not os.path.isfile(filename):
+            return False
+        with np.load(filename) as d:
+            if (str(d['key']) != self.key) or (float(d['mtime']) < mtime):
+                return False
+            self.Ft = d['Ft']
+            self.Fp = d['Fp']
+            self.err = float(d['err'])
+            self.valid = bool(d['valid'])
+            self.nth = int(d['nth'])
+            self.nph = int(d['nph'])
+        return True
+
+
+def getcache(A, fGHz=[], tol=0.1, save=False, **kwargs):
+    """ get the pattern cache of an antenna
+
+    Parameters
+    ----------
+
+    A : Antenna
+    fGHz : np.array
+        frequencies of the cache (default : frequencies of A)
+    tol : float
+        accuracy target on the gain (dB)
+    save : boolean
+        if True and A is read from an antenna file, the cache is stored
+        next to it (.npz added to the file name) and reused by the next
+        sessions
+    kwargs : see PatternCache
+
+    Returns
+    -------
+
+    pc : PatternCache
+        view of the shared cache, its query counters belong to A
+
+    Notes
+    -----
+
+    The cache is built once for all the antennas which have the same
+    type, parameters, antenna file and cache parameters. The last _ncache
+    caches used in the session are kept.
+
+    """
+    if len(fGHz) == 0:
+        fGHz = A.fGHz
+    pc = PatternCache(fGHz, tol=tol, **kwargs)
+    fromfile = getattr(A, 'fromfile', False)
+    pc.key = pyu.hashkey(typ=A.typ, param=repr(getattr(A, 'param', {})),
+                     filename=A._filename if fromfile else '',
+                     fGHz=pc.fGHz, tol=pc.tol, steps=repr(pc.steps),
+                     floordB=pc.floordB, nmax=pc.nmax)
+    if pc.key in _dcache:
+        _dcache.move_to_end(pc.key)
+        return _dcache[pc.key].view()
+    if fromfile:
+        fileant = pyu.getlong(A._filename, pstruc['DIRANT'])
+        filecache = fileant + '.npz'
+        mtime = os.path.getmtime(fileant) if os.path.isfile(fileant) else 0
+        if not pc.load(filecache, mtime):
+            pc.build(A)
+            if save:
+                pc.save(filecache, mtime)
+    else:
+        pc.build(A)
+    _dcache[pc.key] = pc
+    while len(_dcache) > _ncache:
+        _dcache.popitem(last=False)
+    return pc.view()
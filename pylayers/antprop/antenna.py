@@ -30,6 +30,7 @@ from pylayers.util.project import PyLayers
 from pylayers.antprop.spharm import *
 from pylayers.antprop.antssh import ssh, SSHFunc2, SSHFunc, SSHCoeff, CartToSphere
 from pylayers.antprop.coeffModel import *
+from pylayers.antprop.antcache import getcache
 import copy
 from mayavi import mlab
 try:
@@ -67,6 +68,7 @@ class Pattern(PyLayers):
         self.grid = False
         self.evaluated = False
         self.full = False
+        self.cache = None
 
     def eval(self, **kwargs):
         """  evaluate pattern functions
@@ -203,8 +205,15 @@ class Pattern(PyLayers):
 
         #
         # evaluation of the specific Pattern__p function
+        # directions are served by the pattern cache if any (see setcache)
         #
-        Ft,Fp = eval('self._Pattern__p'+self.typ)(param=self.param)
+        F = None
+        if (not self.grid) and (getattr(self,'cache',None) is not None):
+            F = self.cache(self.theta,self.phi,self.fGHz)
+        if F is None:
+            Ft,Fp = eval('self._Pattern__p'+self.typ)(param=self.param)
+        else:
+            Ft,Fp = F
         if kwargs['inplace']:
             self.Ft = Ft
             self.Fp = Fp
@@ -213,6 +222,51 @@ class Pattern(PyLayers):
         else:
             return Ft,Fp
 
+    def setcache(self,fGHz=[],tol=0.1,save=False,**kwargs):
+        """ evaluate the pattern once for the following direction queries
+
+        Parameters
+        ----------
+
+        fGHz : np.array
+            frequencies of the cache (default : self.fGHz)
+        tol : float
+            accuracy target on the gain (dB)
+        save : boolean
+            store the cache next to the antenna file
+        kwargs : see pylayers.antprop.antcache.PatternCache
+
+        Notes
+        -----
+
+        The pattern is evaluated on a (theta,phi,f) grid whose step is
+        refined until the interpolated gain meets the accuracy target.
+        Then eval in a set of directions (pt,pr or th,ph) interpolates
+        the grid, except for the frequencies out of the cache or if the
+        accuracy target has not been met (exact evaluation).
+        setcache(tol=None) removes the cache.
+
+        Examples
+        --------
+
+        >>> import numpy as np
+        >>> A = Antenna('Gauss')
+        >>> A.setcache(fGHz=np.array([2.4]),tol=0.05)
+        >>> A.eval(fGHz=np.array([2.4]),th=np.array([1.5]),ph=np.array([0.2]))
+        >>> A.cache.ninterp
+        1
+
+        See Also
+        --------
+
+        pylayers.antprop.antcache
+
+        """
+        if tol is None:
+            self.cache = None
+        else:
+            self.cache = getcache(self,fGHz=fGHz,tol=tol,save=save,**kwargs)
+
     def vsh(self,threshold=-1):
         if self.evaluated:
             vsh(self)
@@ -2210,6 +2264,7 @@ class Antenna(Pattern):
 
         self.tau = 0
         self.evaluated = False
+        self.cache = None
         #determine if pattern for all theta/phi is constructed
 
         if self.fromfile:
@@ -0,0 +1,443 @@
+#-*- coding:Utf-8 -*-
+r"""
+.. currentmodule:: pylayers.antprop.applacement
+
+Access point placement
+======================
+
+Selection of access point sites and channels among candidates, on the
+grid of a Coverage.
+
+The received power planes of all the candidate sites are evaluated once
+by the Coverage engine (in a pool of workers, optionally out of core).
+A configuration, a list of (site, channel) pairs, is then scored with
+array reductions over these planes :
+
++ the APs on a same channel interfere, the others do not
++ a grid point is served by the AP of best SINR
+
+Two criteria are available :
+
++ 'area' : fraction of the grid points with a SINR above a threshold
++ 'minsinr' : minimum SINR over the grid (dB)
+
+The search is a greedy construction followed by a local search (best
+replacement of one AP), optionally refined by simulated annealing.
+
+.. autosummary::
+    :toctree: generated/
+
+    APPlacement
+
+"""
+from __future__ import print_function
+import copy
+import time
+import numpy as np
+import pylayers.signal.standard as std
+from pylayers.util.project import logger
+
+
+class APPlacement(object):
+    """ access point placement on candidate sites
+
+    Parameters
+    ----------
+
+    C : Coverage
+        provides the layout, the grid and the receiver parameters
+    sites : np.array (ns x 2) or (ns x 3)
+        candidate AP positions
+    lchan : list
+        candidate channels (default : all channels of the standard)
+    hap : float
+        AP height if sites are 2D
+    polar : string
+        'o' | 'p'
+    workers : int
+        workers of the evaluation of the planes (see Coverage.cover)
+    size : int
+        grid points per block of the evaluation of the planes
+    h5file : string or None
+        out of core evaluation of the planes (see Coverage.cover)
+    ap : dict
+        AP template : 'wstd', 'PtdBm', 'ant', 'phideg' (default : taken
+        from the first AP of C.dap)
+
+    Attributes
+    ----------
+
+    P : np.array (ns x nc x ng)
+        received power of each candidate site on each channel (mW)
+    NmW : np.array (nc,)
+        noise power of each channel (mW)
+    neval : int
+        number of configurations scored
+    tplanes : float
+        time of the evaluation of the planes (s)
+
+    Examples
+    --------
+
+    >>> import numpy as np
+    >>> from pylayers.antprop.coverage import Coverage
+    >>> from pylayers.antprop.applacement import APPlacement
+    >>> C = Coverage()
+    >>> sites = np.array([[2,2],[5,8],[8,3],[12,6]])
+    >>> A = APPlacement(C,sites,lchan=[1,6,11])
+    >>> res = A.run(2,crit='area',sinrdB=10)
+    >>> C.dap = A.todap(res['conf'])
+
+    """
+
+    def __init__(self, C, sites, lchan=[], hap=1.2, polar='p', workers=0,
+                 size=100, h5file=None, **kwargs):
+
+        assert polar in ['o', 'p'], "polar should be 'o' or 'p'"
+        sites = np.asarray(sites, dtype=float)
+        if sites.shape[1] == 2:
+            sites = np.hstack((sites, hap * np.ones((len(sites), 1))))
+        iap = list(C.dap.keys())[0]
+        dtemp = {'wstd': C.dap[iap]['wstd'],
+                 'PtdBm': C.dap[iap]['PtdBm'],
+                 'ant': C.dap[iap]['ant'],
+                 'phideg': C.dap[iap]['phideg']}
+        dtemp.update(kwargs.pop('ap', {}))
+        self.C = C
+        self.sites = sites
+        self.ap = dtemp
+        self.polar = polar
+        self.ns = len(sites)
+
+        #
+        # evaluation of the planes of all the candidate sites with the
+        # Coverage engine
+        #
+        t0 = time.time()
+        Cc = copy.copy(C)
+        Cc.h5 = None
+        Cc.fGHz = np.array([])
+        Cc.snr = False
+        Cc.sinr = False
+        Cc.best = False
+        s = std.Wstandard(dtemp['wstd'])
+        if lchan == []:
+            lchan = sorted(s.chan.keys())
+        self.lchan = list(lchan)
+        self.nc = len(lchan)
+        Cc.dap = {}
+        for k in range(self.ns):
+            Cc.dap[k] = std.AP(name='site' + str(k), p=tuple(sites[k]),
+                               chan=[lchan[0]], on=True, **dtemp)
+        Cc.cover(workers=workers, size=size, h5file=h5file)
+
+        # frequency index of each channel
+        self.fcGHz = np.array([s.chan[c]['fcGHz'] for c in lchan])
+        ifc = np.array([np.argmin(np.abs(Cc.fGHz - fc)) for fc in self.fcGHz])
+        # sorted frequency indices (HDF5 selection)
+        uf, iu = np.unique(ifc, return_inverse=True)
+        CmW = getattr(Cc, 'CmW' + polar)
+        self.P = np.empty((self.ns, self.nc, C.ng))
+        for g0, g1 in Cc.tiles:
+            u = slice(g0, g1)
+            # nc x nu x ns
+            W = CmW[list(uf), u, :][iu]
+            self.P[:, :, u] = W.transpose(2, 0, 1)
+        if Cc.h5 is not None:
+            Cc.h5.close()
+
+        # noise power of each channel
+        kB = 1.3806503e-23
+        bmhz = np.array([s.chan[c]['BMHz'] for c in lchan])
+        self.NmW = (10**(C.noisefactordb / 10.)) * kB * C.temperaturek * bmhz * 1e9
+
+        self.tplanes = time.time() - t0
+        self.neval = 0
+        logger.info('APPlacement : %d sites x %d channels in %.2f s',
+                    self.ns, self.nc, self.tplanes)
+
+    def __repr__(self):
+        st = 'APPlacement : ' + str(self.ns) + ' sites, channels ' + str(self.lchan) + '\n'
+        st = st + 'grid points : ' + str(self.P.shape[2]) + '\n'
+        st = st + 'planes evaluation (s) : %.2f' % self.tplanes + '\n'
+        st = st + 'configurations scored : ' + str(self.neval)
+        return st
+
+    def evconf(self, conf):
+        """ SINR of a configuration
+
+        Parameters
+        ----------
+
+        conf : list
+            (site index, channel index in lchan) of each AP
+
+        Returns
+        -------
+
+        sinr : np.array (ng,)
+            SINR of the best AP at each grid point (linear scale)
+
+        """
+        ls = [k[0] for k in conf]
+        lc = [k[1] for k in conf]
+        # P : nap x ng
+        P = self.P[ls, lc, :]
+        # total received power on each channel
+        T = np.zeros((self.nc, P.shape[1]))
+        np.add.at(T, lc, P)
+        sinr = P / (T[lc, :] - P + self.NmW[lc][:, np.newaxis])
+        return np.max(sinr, axis=0)
+
+    def score(self, conf, crit='area', sinrdB=10.):
+        """ score of a configuration
+
+        Parameters
+        ----------
+
+        conf : list
+            (site index, channel index in lchan) of each AP
+        crit : string
+            'area' : fraction of the grid with SINR >= sinrdB
+            'minsinr' : minimum SINR over the grid (dB)
+        sinrdB : float
+            SINR threshold of the 'area' criterion
+
+        Returns
+        -------
+
+        score : float (the higher the better)
+
+        """
+        self.neval += 1
+        sinr = self.evconf(conf)
+        if crit == 'area':
+            return np.mean(sinr >= 10**(sinrdB / 10.))
+        if crit == 'minsinr':
+            return 10 * np.log10(np.min(sinr))
+        raise ValueError('unknown criterion ' + str(crit))
+
+    def _moves(self, conf, k):
+        """ candidates replacing the AP k of a configuration
+        """
+        used = set(c[0] for i, c in enumerate(conf) if i != k)
+        return [(s, c) for s in range(self.ns) if s not in used
+                for c in range(self.nc) if (s, c) != tuple(conf[k])]
+
+    def greedy(self, nap, crit='area', sinrdB=10.):
+        """ greedy construction of a configuration
+
+        Parameters
+        ----------
+
+        nap : int
+            number of AP
+        crit : string
+        sinrdB : float
+
+        Returns
+        -------
+
+        conf : list of (site, channel)
+        score : float
+
+        """
+        assert nap <= self.ns, "more AP than candidate sites"
+        conf = []
+        for k in range(nap):
+            lm = self._moves(conf + [(-1, -1)], k)
+            lsc = [self.score(conf + [m], crit, sinrdB) for m in lm]
+            conf = conf + [lm[int(np.argmax(lsc))]]
+        return conf, self.score(conf, crit, sinrdB)
+
+    def localsearch(self, conf, crit='area', sinrdB=10., maxiter=20):
+        """ local search by replacement of one AP
+
+        Parameters
+        ----------
+
+        conf : list of (site, channel)
+            initial configuration
+        crit : string
+        sinrdB : float
+        maxiter : int
+            maximum number of improving moves
+
+        Returns
+        -------
+
+        conf : list of (site, channel)
+        score : float
+
+        Notes
+        -----
+
+        Each iteration applies the best replacement (site and channel) of
+        a single AP, until no replacement improves the score.
+
+        """
+        conf = list(conf)
+        best = self.score(conf, crit, sinrdB)
+        for it in range(maxiter):
+            bmove = None
+            for k in range(len(conf)):
+                for m in self._moves(conf, k):
+                    sc = self.score(conf[:k] + [m] + conf[k + 1:], crit, sinrdB)
+                    if sc > best:
+                        best = sc
+                        bmove = (k, m)
+            if bmove is None:
+                break
+            conf[bmove[0]] = bmove[1]
+        return conf, best
+
+    def anneal(self, conf, crit='area', sinrdB=10., niter=1000, T0=None,
+               alpha=0.995, seed=0):
+        """ simulated annealing
+
+        Parameters
+        ----------
+
+        conf : list of (site, channel)
+            initial configuration
+        crit : string
+        sinrdB : float
+        niter : int
+            number of moves
+        T0 : float
+            initial temperature (default 0.01 for 'area', 1 dB for 'minsinr')
+        alpha : float
+            geometric cooling factor
+        seed : int
+
+        Returns
+        -------
+
+        conf : list of (site, channel)
+            best configuration visited
+        score : float
+
+        """
+        rng = np.random.RandomState(seed)
+        if T0 is None:
+            T0 = 0.01 if crit == 'area' else 1.
+        conf = list(conf)
+        cur = self.score(conf, crit, sinrdB)
+        bconf, best = list(conf), cur
+        T = T0
+        for it in range(niter):
+            k = rng.randint(len(conf))
+            lm = self._moves(conf, k)
+            if not lm:
+                break
+            m = lm[rng.randint(len(lm))]
+            nconf = conf[:k] + [m] + conf[k + 1:]
+            sc = self.score(nconf, crit, sinrdB)
+            if (sc >= cur) or (rng.rand() < np.exp((sc - cur) / T)):
+                conf, cur = nconf, sc
+                if cur > best:
+                    bconf, best = list(conf), cur
+            T = T * alpha
+        return bconf, best
+
+    def run(self, nap, crit='area', sinrdB=10., anneal=False, **kwargs):
+        """ AP placement
+
+        Parameters
+        ----------
+
+        nap : int
+            number of AP
+        crit : string
+            'area' | 'minsinr'
+        sinrdB : float
+            SINR threshold of the 'area' criterion
+        anneal : boolean
+            refine the local search result by simulated annealing
+        kwargs : passed to anneal (niter, T0, alpha, seed)
+
+        Returns
+        -------
+
+        res : dict
+            'conf' : list of (site, channel)
+            'sites' : positions of the AP (nap x 3)
+            'chan' : channels of the AP
+            'score' : score of conf
+            'neval' : number of configurations scored
+            'rate' : configurations scored per second
+
+        """
+        t0 = time.time()
+        neval = self.neval
+        conf, sc = self.greedy(nap, crit, sinrdB)
+        conf, sc = self.localsearch(conf, crit, sinrdB)
+        if anneal:
+            conf, sc = self.anneal(conf, crit, sinrdB, **kwargs)
+            conf, sc = self.localsearch(conf, crit, sinrdB)
+        elapsed = time.time() - t0
+        neval = self.neval - neval
+        return {'conf': conf,
+                'sites': self.sites[[k[0] for k in conf]],
+                'chan': [self.lchan[k[1]] for k in conf],
+                'score': sc,
+                'neval': neval,
+                'rate': neval / max(elapsed, 1e-9)}
+
+    def bench(self, nap, neval=1000, crit='area', sinrdB=10., seed=0):
+        """ benchmark of the configuration scoring
+
+        Parameters
+        ----------
+
+        nap : int
+            number of AP of the random configurations
+        neval : int
+            number of configurations
+        crit : string
+        sinrdB : float
+        seed : int
+
+        Returns
+        -------
+
+        dbench : dict
+            'neval', 'elapsed' (s), 'rate' (configurations per second),
+            'tplanes' (s, evaluation of the planes)
+
+        """
+        rng = np.random.RandomState(seed)
+        lconf = []
+        for k in range(neval):
+            ls = rng.choice(self.ns, nap, replace=False)
+            lc = rng.randint(self.nc, size=nap)
+            lconf.append(list(zip(ls, lc)))
+        t0 = time.time()
+        for conf in lconf:
+            self.score(conf, crit, sinrdB)
+        elapsed = time.time() - t0
+        return {'neval': neval,
+                'elapsed': elapsed,
+                'rate': neval / max(elapsed, 1e-9),
+                'tplanes': self.tplanes}
+
+    def todap(self, conf):
+        """ access points of a configuration
+
+        Parameters
+        ----------
+
+        conf : list of (site, channel)
+
+        Returns
+        -------
+
+        dap : dict
+            std.AP, to be used as Coverage.dap
+
+        """
+        dap = {}
+        for k, (s, c) in enumerate(conf):
+            dap[k] = std.AP(name='ap' + str(k), p=tuple(self.sites[s]),
+                            chan=[self.lchan[c]], on=True, **self.ap)
+        return dap
@@ -0,0 +1,161 @@
+#-*- coding:Utf-8 -*-
+r"""
+.. currentmodule:: pylayers.antprop.chainprod
+
+Batched matrix chain product of the ray interactions
+
+.. autosummary::
+    :toctree: generated
+
+    chainprod
+    chainprod_np
+
+Notes
+-----
+
+For a group of rays with l interactions the propagation matrix of a ray
+is the chain product
+
+.. math::
+
+    C = w B_{l-1} A_{l-1} B_{l-2} \cdots A_1 B_0 A_0 B^0
+
+where :math:`A_i` are the interaction matrices (frequency dependent),
+:math:`B_i` the basis changes between interactions, :math:`B^0` the
+departure basis and :math:`w` the spreading factor of the ray.
+
+When numba is available the product is computed by a compiled kernel
+which reuses two 3x3 work matrices for the whole chain, otherwise it
+falls back to batched np.matmul.
+
+"""
+from __future__ import print_function
+import numpy as np
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+def chainprod_np(A, B, B0, w=None):
+    """ matrix chain product (numpy implementation)
+
+    Parameters
+    ----------
+
+    A : np.array (nf,r,l,3,3)
+        interaction matrices
+    B : np.array (r,l,3,3)
+        basis changes, B[:,i] follows interaction i
+    B0 : np.array (r,3,3)
+        departure basis
+    w : np.array (r,) or None
+        spreading factors
+
+    Returns
+    -------
+
+    Z : np.array (nf,r,3,3)
+
+    """
+    rdtype = np.finfo(A.dtype).dtype
+    B = B.astype(rdtype, copy=False)
+    B0 = B0.astype(rdtype, copy=False)
+    l = A.shape[2]
+    Z = np.matmul(A[:, :, 0], B0[None, ...])
+    for i in range(1, l):
+        Z = np.matmul(A[:, :, i], np.matmul(B[None, :, i - 1], Z))
+    Z = np.matmul(B[None, :, l - 1], Z)
+    if w is not None:
+        Z *= w.astype(rdtype, copy=False)[None, :, None, None]
+    return Z
+
+
+if numba is not None:
+
+    @numba.njit(cache=True)
+    def _chainprod_nb(A, B, B0, w, Z):
+        nf, nr, nl = A.shape[0], A.shape[1], A.shape[2]
+        T = np.empty((3, 3), dtype=Z.dtype)
+        U = np.empty((3, 3), dtype=Z.dtype)
+        for f in range(nf):
+            for r in range(nr):
+                # U = A0 . B0
+                for i in range(3):
+                    for j in range(3):
+                        U[i, j] = (A[f, r, 0, i, 0] * B0[r, 0, j] +
+                                   A[f, r, 0, i, 1] * B0[r, 1, j] +
+                                   A[f, r, 0, i, 2] * B0[r, 2, j])
+                for k in range(1, nl + 1):
+                    # T = B(k-1) . U
+                    for i in range(3):
+                        for j in range(3):
+                            T[i, j] = (B[r, k - 1, i, 0] * U[0, j] +
+                                       B[r, k - 1, i, 1] * U[1, j] +
+                                       B[r, k - 1, i, 2] * U[2, j])
+                    if k == nl:
+                        break
+                    # U = A(k) . T
+                    for i in range(3):
+                        for j in range(3):
+                            U[i, j] = (A[f, r, k, i, 0] * T[0, j] +
+                                       A[f, r, k, i, 1] * T[1, j] +
+                                       A[f, r, k, i, 2] * T[2, j])
+                for i in range(3):
+                    for j in range(3):
+                        Z[f, r, i, j] = T[i, j] * w[r]
+
+
+def chainprod(A, B, B0, w=None, engine='auto'):
+    """ matrix chain product of the ray interactions
+
+    Parameters
+    ----------
+
+    A : np.array (nf,r,l,3,3)
+        interaction matrices (complex or complex64)
+    B : np.array (r,l,3,3)
+        basis changes, B[:,i] follows interaction i
+    B0 : np.array (r,3,3)
+        departure basis
+    w : np.array (r,) or None
+        spreading factors
+    engine : string
+        'auto' : numba if available, else numpy
+        'numba' | 'numpy'
+
+    Returns
+    -------
+
+    Z : np.array (nf,r,3,3)
+        same type as A
+
+    Examples
+    --------
+
+    >>> import numpy as np
+    >>> A = np.ones((2,4,3,3,3),dtype=complex)*np.eye(3)
+    >>> B = np.ones((4,3,3,3))*np.eye(3)
+    >>> B0 = np.ones((4,3,3))*np.eye(3)
+    >>> Z = chainprod(A,B,B0,w=np.arange(1.,5.))
+    >>> Z.shape
+    (2, 4, 3, 3)
+    >>> Z[0,3,1,1]
+    (4+0j)
+
+    """
+    if engine == 'auto':
+        engine = 'numba' if numba is not None else 'numpy'
+    if engine == 'numpy':
+        return chainprod_np(A, B, B0, w=w)
+    if numba is None:
+        raise ImportError('chainprod : numba is not installed')
+    rdtype = np.finfo(A.dtype).dtype
+    if w is None:
+        w = np.ones(A.shape[1], dtype=rdtype)
+    Z = np.empty(A.shape[:2] + (3, 3), dtype=A.dtype)
+    _chainprod_nb(np.ascontiguousarray(A),
+                  np.ascontiguousarray(B, dtype=rdtype),
+                  np.ascontiguousarray(B0, dtype=rdtype),
+                  np.ascontiguousarray(w, dtype=rdtype), Z)
+    return Z
@@ -3338,6 +3338,98 @@ class Tchannel(bs.FUsignal):
             fh5.close()
             raise NameError('Channel Tchannel: issue when reading h5py file')
 
+    def _storetables(self):
+        """ tables of the channel for a RayStore entry
+
+        Returns
+        -------
+
+        tables : dict
+            'H'    : x, isFriis               (one row)
+            'Hray' : y, taud, dod, doa        (one row per ray)
+
+        """
+        tables = {'H': {'x': np.asarray(self.x)[None, :],
+                        'isFriis': np.array([self.isFriis])},
+                  'Hray': {'y': self.y,
+                           'taud': self.taud,
+                           'dod': self.dod,
+                           'doa': self.doa}}
+        return tables
+
+    def savestore(self, store, ida, idb, wstd='', t=0.):
+        """ append the channel to a columnar store
+
+        Parameters
+        ----------
+
+        store : RayStore
+        ida : string
+            node a identifier
+        idb : string
+            node b identifier
+        wstd : string
+            wireless standard
+        t : float
+            time (s)
+
+        Returns
+        -------
+
+        ie : int
+            entry index in store
+
+        See Also
+        --------
+
+        pylayers.antprop.raystore.RayStore
+
+        """
+        return store.append(ida, idb, wstd, t, **self._storetables())
+
+    def loadstore(self, store, ie):
+        """ load the channel from a columnar store
+
+        Parameters
+        ----------
+
+        store : RayStore
+        ie : int
+            entry index (see RayStore.query)
+
+        """
+        d = store.read(ie, 'H')
+        r = store.read(ie, 'Hray')
+        self.__init__(d['x'][0], r['y'], r['taud'], r['dod'], r['doa'])
+        self.isFriis = bool(d['isFriis'][0])
+
+    def reciprocal(self):
+        """ transmission channel of the reverse link
+
+        Returns
+        -------
+
+        H : Tchannel
+            channel from b to a, the antennas of both ends and their
+            orientations being unchanged
+
+        Notes
+        -----
+
+        By reciprocity the ray transfer matrices of the reverse link are
+        the transposed (Nr x Nt) ray transfer matrices of the direct link.
+        Delays are unchanged, directions of departure and arrival are
+        swapped.
+
+        """
+        y = self.y
+        if y.ndim == 4:
+            y = np.swapaxes(y, 1, 2)
+        H = Tchannel(x=self.x, y=y.copy(), tau=self.taud, dod=self.doa,
+                     doa=self.dod)
+        H.isFriis = self.isFriis
+        return H
+
 
     def apply(self, W=[]):
         """ apply FUsignal W to the Tchannel
@@ -5749,6 +5841,11 @@ class Ctilde(PyLayers):
             Rb = Rb.transpose((1,0,2))
             self.islocal=True
 
+        # keep the precision of the channel (complex64 or complex128)
+        rdtype = np.finfo(np.result_type(self.Ctt.y.dtype, np.complex64)).dtype
+        Ra = Ra.astype(rdtype)
+        Rb = Rb.astype(rdtype)
+
         #
         # update direction of departure and arrival
         #
@@ -6113,7 +6210,7 @@ class Ctilde(PyLayers):
         self.Ctp.y = self.Ctp.y[u,:]
         self.Cpt.y = self.Cpt.y[u,:]
 
-    def prop2tran(self,a=[],b=[],Friis=True,debug=False):
+    def prop2tran(self,a=[],b=[],Friis=True,debug=False,Fa=[],Fb=[]):
         r""" transform propagation channel into transmission channel
 
         Parameters
@@ -6130,6 +6227,12 @@ class Ctilde(PyLayers):
             if True scale with :math:`-j\frac{\lambda}{f}`
         debug : boolean
             if True the antenna gain for each ray is stored
+        Fa : tuple (fGHz,Ft,Fp)
+            pattern of antenna a already evaluated in the departure
+            directions (tangl), antenna a is then not evaluated
+        Fb : tuple (fGHz,Ft,Fp)
+            pattern of antenna b already evaluated in the arrival
+            directions (rangl)
 
         Returns
         -------
@@ -6151,14 +6254,22 @@ class Ctilde(PyLayers):
         if b ==[]:
             b = ant.Antenna('Omni',param={'pol':'t','GmaxdB':0},fGHz=self.fGHz)
 
-        a.eval(th = self.tangl[:, 0], ph = self.tangl[:, 1])
-        Fat = bs.FUsignal(a.fGHz, a.Ft)
-        Fap = bs.FUsignal(a.fGHz, a.Fp)
+        # the antenna patterns are cast to the precision of the channel
+        # (complex64 when Rays.eval has been called with dtype=np.complex64)
+        dtype = np.result_type(self.Ctt.y.dtype, np.complex64)
+
+        if Fa == []:
+            a.eval(th = self.tangl[:, 0], ph = self.tangl[:, 1])
+            Fa = (a.fGHz, a.Ft, a.Fp)
+        Fat = bs.FUsignal(Fa[0], Fa[1].astype(dtype))
+        Fap = bs.FUsignal(Fa[0], Fa[2].astype(dtype))
         #b.eval(th=self.rangl[:, 0], ph=self.rangl[:, 1], grid=False)
-        b.eval(th = self.rangl[:, 0], ph = self.rangl[:, 1])
+        if Fb == []:
+            b.eval(th = self.rangl[:, 0], ph = self.rangl[:, 1])
+            Fb = (b.fGHz, b.Ft, b.Fp)
 
-        Fbt = bs.FUsignal(b.fGHz, b.Ft)
-        Fbp = bs.FUsignal(b.fGHz, b.Fp)
+        Fbt = bs.FUsignal(Fb[0], Fb[1].astype(dtype))
+        Fbp = bs.FUsignal(Fb[0], Fb[2].astype(dtype))
 
         #
         #  C  :  2 x 2 x r x f
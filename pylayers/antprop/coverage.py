@@ -29,7 +29,10 @@ else:
 
 import pdb
 import doctest
-from itertools import product
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import h5py
+import pylayers.util.mputil as mpu
 
 try:
     from mayavi import mlab
@@ -37,6 +40,25 @@ try:
 except:
     print('mayavi not installed')
 
+# Coverage of the worker processes of Coverage.cover
+_cover = None
+
+
+def _coverinit(C):
+    """ initializer of the worker processes of Coverage.cover
+
+    C is the Coverage without its HDF5 file, its result arrays and its
+    configuration (see Coverage.__getstate__).
+    """
+    global _cover
+    _cover = C
+
+
+def _covertask(g0,g1,lk=None):
+    """ evaluate a block of grid points in a worker process
+    """
+    return _cover._coverblock(g0,g1,lk)
+
 
 class Coverage(PyLayers):
     """ Handle Layout Coverage
@@ -173,6 +195,8 @@ class Coverage(PyLayers):
         self.capacity = False
         self.pr = False
         self.loss = False
+        # HDF5 file of the out of core mode
+        self.h5 = None
 
     def __repr__(self):
         st=''
@@ -294,8 +318,23 @@ class Coverage(PyLayers):
         sinr : boolean
         snr  : boolean
         best : boolean
-        size : integer 
-            size of grid points block
+        size : integer
+            size of grid points block (default 100)
+        workers : int
+            0 or 1 : serial evaluation (default)
+            -1 : one worker per cpu
+            N > 1 : N workers
+        start : string or None
+            start method of the worker processes ('fork', 'spawn' or
+            'forkserver'). Default 'fork' if available.
+        h5file : string or None
+            if not None, out of core mode : the result arrays are chunked
+            datasets of this HDF5 file (relative names are placed in the
+            output directory of the project)
+        antcache : float or None
+            if not None, accuracy target (dB) of the pattern caches of the
+            access point antennas (see Pattern.setcache). Omnidirectional
+            antennas are always evaluated exactly.
 
         Examples
         --------
@@ -323,6 +362,18 @@ class Coverage(PyLayers):
         abstract the EM solver in order to make use of other calculation
         approaches as a full or partial Ray Tracing.
 
+        The result arrays (nf x ng x na) are allocated once and filled in
+        place, block of grid points by block of grid points. Blocks are
+        independent, they are evaluated in a pool of worker processes if
+        workers is not 0 or 1. The Coverage is passed to the workers at
+        their start (no copy with the fork start method, pickled without
+        its HDF5 file and its result arrays otherwise). Threads are not
+        used as antennas and slabs keep the state of their last evaluation.
+
+        In out of core mode (h5file), each tile of the result arrays
+        (nf x size x na) is a chunk of the HDF5 file. cover, evsnr, evsinr,
+        evbestsv and show only hold a few tiles in memory at once.
+
         The following members variables are evaluated :
 
         + freespace Loss @ fGHz   PL()  PathLoss (shoud be rename FS as free space) $
@@ -340,193 +391,252 @@ class Coverage(PyLayers):
         """
 
         sizebloc = kwargs.pop('size',100)
+        workers = kwargs.pop('workers',0)
+        start = kwargs.pop('start',None)
+        h5file = kwargs.pop('h5file',None)
+        antcache = kwargs.pop('antcache',None)
 
         #
         # select active AP
         #
-        lactiveAP = []
+        lactiveAP = [ iap for iap in self.dap if self.dap[iap]['on'] ]
+        for iap in lactiveAP:
+            # set frequency for each AP
+            fGHz = self.dap[iap].s.fcghz
+            self.fGHz = np.unique(np.hstack((self.fGHz,fGHz)))
+
+        ng = self.ng
+        self.nf = len(self.fGHz)
+        self._setap(lactiveAP)
+        self.pg = np.vstack((self.grid.T,self.zgrid*np.ones(ng)))
+        # antenna patterns are evaluated once on a grid of directions
+        if antcache is not None:
+            for iap in lactiveAP:
+                if self.dap[iap].A.typ != 'Omni':
+                    self.dap[iap].A.setcache(fGHz=self.fGHz,tol=antcache)
+
+        #
+        # result arrays f x g x a are filled in place block of grid points
+        # by block of grid points (tiles)
+        #
+        self.sizebloc = sizebloc
+        self.tiles = mpu.chunkslices(ng,sizebloc)
+        if self.h5 is not None:
+            self.h5.close()
+            self.h5 = None
+        if h5file is not None:
+            if not os.path.isabs(h5file):
+                h5file = pyu.getlong(h5file,pstruc['DIRLNK'])
+            self.h5 = h5py.File(h5file,'w')
+
+        for name in ['Lwo','Lwp','Edo','Edp','freespace','tgain','CmWo','CmWp']:
+            setattr(self,name,self._array(name))
+        # planes of the access points which have been switched off
+        self._planes = {}
+
+        self._run(workers=workers,start=start)
+
+        logger.info('Lwo[0][0] %.2f' % self.Lwo[0,0,0])
+
+        if self.snr:
+            self.evsnr()
+        if self.sinr:
+            self.evsinr()
+        if self.best:
+            self.evbestsv()
+
+    def __getstate__(self):
+        """ state of the Coverage sent to the worker processes
+
+        The HDF5 file (out of core mode) stays open in the parent process
+        which writes the tiles returned by the workers. It is not picklable,
+        nor is the configuration, and the result arrays are not used by
+        _coverblock : they are left out.
+        """
+        state = self.__dict__.copy()
+        state['h5'] = None
+        for name in ['config','Lwo','Lwp','Edo','Edp','freespace','tgain',
+                     'CmWo','CmWp','_planes']:
+            state.pop(name,None)
+        return state
+
+    def _setap(self,lactiveAP):
+        """ set the parameters of the active access points
+
+        Parameters
+        ----------
 
-        try:
-            del self.aap
-            del self.ptdbm
-        except:
-            pass
+        lactiveAP : list
+            keys of the active access points in self.dap
 
+        Notes
+        -----
+
+        pa : access points 3 x na (extended in 3 dimensions if necessary)
+        ptdbm : 1 x na
+        bmhz : na x 1
+        pndbm : 1 x na noise power
 
+        """
         # Boltzmann constant
         kB = 1.3806503e-23
 
-        #
-        # Loop over access points
-        #    set parameter of each active ap
-        #        p
-        #        PtdBm
-        #        BMHz
-
-        for iap in self.dap:
-            if self.dap[iap]['on']:
-                lactiveAP.append(iap)
-                # set frequency for each AP
-                fGHz = self.dap[iap].s.fcghz
-                self.fGHz=np.unique(np.hstack((self.fGHz,fGHz)))
-                apchan = self.dap[iap]['chan']
-                #
-                # stacking  AP position Power Bandwidth
-                #
-                try:
-                    self.aap   = np.vstack((self.aap,self.dap[iap]['p']))
-                    self.ptdbm = np.vstack((self.ptdbm,self.dap[iap]['PtdBm']))
-                    self.bmhz  = np.vstack((self.bmhz,self.dap[iap].s.chan[apchan[0]]['BMHz']))
-                except:
-                    self.aap   = self.dap[iap]['p']
-                    self.ptdbm = np.array(self.dap[iap]['PtdBm'])
-                    self.bmhz  = np.array(self.dap[iap].s.chan[apchan[0]]['BMHz'])
+        self.lactiveAP = lactiveAP
+        na = len(lactiveAP)
+        self.na = na
+        self.pa = np.ones((3,na))
+        for k,iap in enumerate(lactiveAP):
+            p = np.array(self.dap[iap]['p'])
+            self.pa[0:len(p),k] = p
+        self.ptdbm = np.array([[self.dap[iap]['PtdBm'] for iap in lactiveAP]])
+        self.bmhz = np.array([[self.dap[iap].s.chan[self.dap[iap]['chan'][0]]['BMHz']]
+                             for iap in lactiveAP]).reshape(na,1)
 
-        self.nf = len(self.fGHz)
-        PnW = np.array((10**(self.noisefactordb/10.))*kB*self.temperaturek*self.bmhz*1e6)
         # Evaluate Noise Power (in dBm)
+        PnW = np.array((10**(self.noisefactordb/10.))*kB*self.temperaturek*self.bmhz*1e6)
+        self.pndbm = np.array(10*np.log10(PnW) + 30).T
 
-        self.pndbm = np.array(10*np.log10(PnW) + 30)
+        # key of the loss and gain planes of each AP
+        self._keys = [ self._apkey(iap) for iap in lactiveAP ]
 
-        #lchan = map(lambda x: self.dap[x]['chan'],lap)
-        #apchan = zip(self.dap.keys(),lchan)
-        #self.bmhz = np.array(map(lambda x: self.dap[x[0]].s.chan[x[1][0]]['BMHz']*len(x[1]),apchan))
+    def _apkey(self,iap):
+        """ key of the loss and gain planes of an access point
 
-        self.ptdbm = self.ptdbm.T
-        self.pndbm = self.pndbm.T
-        # creating all links
-        # from all grid point to all ap
-        #
+        The planes of an AP only depend on its position, its orientation
+        and its antenna.
+        """
+        ap = self.dap[iap]
+        return(tuple(np.array(ap['p'],dtype=float)),ap['phideg'],ap['ant'])
 
-        if len(self.pndbm.shape ) == 0:
-            self.ptdbm = self.ptdbm.reshape(1,1)
-            self.pndbm = self.pndbm.reshape(1,1)
+    def _run(self,lk=None,workers=0,start=None):
+        """ evaluate the planes of access points block by block
 
-        self.nf = len(self.fGHz)
-        Nbloc = self.ng//sizebloc
+        Parameters
+        ----------
 
-        r1 = np.arange(0,(Nbloc+1)*sizebloc,sizebloc)
-        if self.ng != r1[-1]:
-            r1 = np.append(r1,self.ng)
-        lblock = list(zip(r1[0:-1],r1[1:]))
+        lk : list or None
+            sorted indices of the AP columns to evaluate (None : all)
+        workers : int
+        start : string or None
+            start method of the worker processes (default 'fork' if
+            available)
 
-        for bg in lblock:
-            p = product(range(bg[0],bg[1]),lactiveAP)
-            #
-            # pa : access point ,3
-            # pg : grid point ,2
-            #
-            # 1 x na
-
-            for k in p:
-                pg = self.grid[k[0],:]
-                pa = np.array(self.dap[k[1]]['p'])
-                # exemple with 3 AP
-                # 321 0
-                # 321 1
-                # 321 2
-                # 322 0
-                try:
-                    self.pa = np.vstack((self.pa,pa))
-                except:
-                    self.pa = pa
-                try:
-                    self.pg = np.vstack((self.pg,pg))
-                except:
-                    self.pg = pg
+        Notes
+        -----
 
-            self.pa = self.pa.T
-            shpa = self.pa.shape
-            shpg = self.pg.shape
+        The received powers CmWo and CmWp of these columns are updated.
 
-            # extend in 3 dimensions if necessary
+        """
+        c = slice(None) if lk is None else lk
+        lblock = self.tiles
+        nproc = min(mpu.nworkers(workers),max(len(lblock),1))
+
+        # transmitting power in mW  1 x 1 x na
+        ptmW = 10**(self.ptdbm[np.newaxis,...]/10.)[...,c]
+
+        def store(bg,res):
+            u = slice(bg[0],bg[1])
+            Lwo,Lwp,Edo,Edp,freespace,tgain = res
+            self.Lwo[:,u,c] = Lwo
+            self.Lwp[:,u,c] = Lwp
+            self.Edo[:,u,c] = Edo
+            self.Edp[:,u,c] = Edp
+            self.freespace[:,u,c] = freespace
+            self.tgain[:,u,c] = tgain
+            # CmW : Received Power coverage in mW
+            # TODO : tgain in o and p polarization
+            self.CmWo[:,u,c] = ptmW*Lwo*freespace*tgain
+            self.CmWp[:,u,c] = ptmW*Lwp*freespace*tgain
+
+        if nproc == 1:
+            for bg in lblock:
+                store(bg,self._coverblock(bg[0],bg[1],lk))
+        else:
+            if start is None and 'fork' in multiprocessing.get_all_start_methods():
+                start = 'fork'
+            ctx = multiprocessing.get_context(start)
+            executor = ProcessPoolExecutor(nproc,mp_context=ctx,
+                                           initializer=_coverinit,
+                                           initargs=(self,))
+            lf = { executor.submit(_covertask,bg[0],bg[1],lk):bg for bg in lblock }
+            try:
+                for f in as_completed(lf):
+                    store(lf[f],f.result())
+            finally:
+                executor.shutdown(wait=True)
 
-            if shpa[0] != 3:
-                self.pa = np.vstack((self.pa,np.ones(shpa[1])))
+    def _array(self,name):
+        """ allocate a result array (nf x ng x na)
 
-            self.pg = self.pg.T
-            self.pg = np.vstack((self.pg,self.zgrid*np.ones(shpg[0])))
+        Parameters
+        ----------
 
-            # retrieving dimensions along the 3 axis
-            # a : number of active access points
-            # g : grid block
-            # f : frequency
+        name : string
 
-            na = len(lactiveAP)
-            self.na = na
-            ng = self.ng
-            nf = self.nf
+        Returns
+        -------
 
-            # calculate antenna gain from ap to grid point
-            #
-            # loop over all AP
-            #
-            k = 0
-            for iap in self.dap:
-                # select only one access point
-                # n
-                u = na*np.arange(0,bg[1]-bg[0],1).astype('int')+k
-                if self.dap[iap]['on']:
-                    pa = self.pa[:,u]
-                    pg = self.pg[:,u]
-                    azoffset = self.dap[iap]['phideg']*np.pi/180.
-                    # the eval function of antenna should also specify polar
-                    self.dap[iap].A.eval(fGHz=self.fGHz, pt=pa, pr=pg, azoffset=azoffset)
-                    gain = (self.dap[iap].A.G).T
-                    # to handle omnidirectional antenna (nf,1,1)
-                    if gain.shape[1]==1:
-                        gain = np.repeat(gain,bg[1]-bg[0],axis=1)
-                    if k==0:
-                        tgain = gain[:,:,None]
-                    else:
-                        tgain = np.dstack((tgain,gain[:,:,None]))
-                    k = k+1
-
-            tgain = tgain.reshape(nf,tgain.shape[1]*tgain.shape[2])
-            Lwo,Lwp,Edo,Edp = loss.Losst(self.L, self.fGHz, self.pa, self.pg, dB=False)
-            logger.info('Lwo[0][0] %.2f' % Lwo[0,0])
-            freespace = loss.PL(self.fGHz, self.pa, self.pg, dB=False)
-            try:
-                self.Lwo = np.hstack((self.Lwo,Lwo))
-                self.Lwp = np.hstack((self.Lwp,Lwp))
-                self.Edo = np.hstack((self.Edo,Edo))
-                self.Edp = np.hstack((self.Edp,Edp))
-                self.freespace = np.hstack((self.freespace,freespace))
-                self.tgain = np.hstack((self.tgain,tgain))
-            except:
-                self.Lwo = Lwo
-                self.Lwp = Lwp
-                self.Edo = Edo
-                self.Edp = Edp
-                self.freespace = freespace
-                self.tgain = tgain
+        A : np.array, or chunked h5py dataset of self.h5 in out of core mode
 
+        """
+        shp = (self.nf,self.ng,self.na)
+        if self.h5 is None:
+            return np.empty(shp)
+        if name in self.h5:
+            del self.h5[name]
+        chunks = (self.nf,min(self.sizebloc,self.ng),self.na)
+        return self.h5.create_dataset(name,shp,dtype='f8',chunks=chunks)
 
-        self.Lwo = self.Lwo.reshape(nf,ng,na)
-        self.Edo = self.Edo.reshape(nf,ng,na)
-        self.Lwp = self.Lwp.reshape(nf,ng,na)
-        self.Edp = self.Edp.reshape(nf,ng,na)
-        self.tgain = self.tgain.reshape(nf,ng,na)
+    def _coverblock(self,g0,g1,lk=None):
+        """ evaluate the links between a block of grid points and the active AP
 
-        self.freespace = self.freespace.reshape(nf,ng,na)
+        Parameters
+        ----------
 
-        # transmitting power
-        # f x g x a
+        g0 : int
+            index of the first grid point of the block
+        g1 : int
+            index following the last grid point of the block
+        lk : list or None
+            indices of the AP columns (None : all the active AP)
 
-        # CmW : Received Power coverage in mW
-        # TODO : tgain in o and p polarization
-        self.CmWo = 10**(self.ptdbm[np.newaxis,...]/10.)*self.Lwo*self.freespace*self.tgain
-        self.CmWp = 10**(self.ptdbm[np.newaxis,...]/10.)*self.Lwp*self.freespace*self.tgain
-        #self.CmWo = 10**(self.ptdbm[np.newaxis,...]/10.)*self.Lwo*self.freespace
-        #self.CmWp = 10**(self.ptdbm[np.newaxis,...]/10.)*self.Lwp*self.freespace
+        Returns
+        -------
 
+        Lwo,Lwp,Edo,Edp,freespace,tgain : np.array (nf x (g1-g0) x len(lk))
 
-        if self.snr:
-            self.evsnr()
-        if self.sinr:
-            self.evsinr()
-        if self.best:
-            self.evbestsv()
+        Notes
+        -----
+
+        Links are ordered grid point first, AP second : the link between
+        the grid point g0+kg and the AP lk[ka] is the link kg*na+ka.
+
+        """
+        if lk is None:
+            lk = range(self.na)
+        na = len(lk)
+        nf = self.nf
+        nb = g1-g0
+        # pa : 3 x nb*na
+        # pg : 3 x nb*na
+        pa = np.tile(self.pa[:,lk],(1,nb))
+        pg = np.repeat(self.pg[:,g0:g1],na,axis=1)
+
+        # antenna gain from ap to grid point
+        tgain = np.empty((nf,nb,na))
+        for ka,k in enumerate(lk):
+            iap = self.lactiveAP[k]
+            azoffset = self.dap[iap]['phideg']*np.pi/180.
+            # the eval function of antenna should also specify polar
+            self.dap[iap].A.eval(fGHz=self.fGHz, pt=pa[:,ka::na], pr=pg[:,ka::na], azoffset=azoffset)
+            # to handle omnidirectional antenna (nf,1,1)
+            tgain[:,:,ka] = (self.dap[iap].A.G).T
+
+        Lwo,Lwp,Edo,Edp = loss.Losst(self.L, self.fGHz, pa, pg, dB=False)
+        freespace = loss.PL(self.fGHz, pa, pg, dB=False)
+        shp = (nf,nb,na)
+        return(Lwo.reshape(shp),Lwp.reshape(shp),Edo.reshape(shp),
+               Edp.reshape(shp),freespace.reshape(shp),tgain)
 
     def evsnr(self):
         """ calculates signal to noise ratio
@@ -534,32 +644,51 @@ class Coverage(PyLayers):
 
         NmW = 10**(self.pndbm/10.)[np.newaxis,:]
 
-        self.snro = self.CmWo/NmW
-        self.snrp = self.CmWp/NmW
+        self.snro = self._array('snro')
+        self.snrp = self._array('snrp')
+        for g0,g1 in self.tiles:
+            u = slice(g0,g1)
+            self.snro[:,u,:] = self.CmWo[:,u,:]/NmW
+            self.snrp[:,u,:] = self.CmWp[:,u,:]/NmW
         self.snr = True
 
     def evsinr(self):
         """ calculates sinr
 
-        """
-
-        # na : number of access point
-        na = self.na
+        Notes
+        -----
 
-        # U : 1 x 1 x na x na
-        U = (np.ones((na,na))-np.eye(na))[np.newaxis,np.newaxis,:,:]
+        CtmWo and CtmWp (nf x ng) are the total received powers, the
+        interference of an AP is the total minus its own received power.
 
+        """
         # CmWo : received power in mW orthogonal polarization
         # CmWp : received power in mW parallel polarization
-
-        ImWo = np.einsum('ijkl,ijl->ijk',U,self.CmWo)
-        ImWp = np.einsum('ijkl,ijl->ijk',U,self.CmWp)
-
-
+        self.CtmWo = np.empty((self.nf,self.ng))
+        self.CtmWp = np.empty((self.nf,self.ng))
+        for g0,g1 in self.tiles:
+            u = slice(g0,g1)
+            self.CtmWo[:,u] = np.sum(self.CmWo[:,u,:],axis=2)
+            self.CtmWp[:,u] = np.sum(self.CmWp[:,u,:],axis=2)
+
+        self.sinro = self._array('sinro')
+        self.sinrp = self._array('sinrp')
+        self._sinr()
+
+    def _sinr(self):
+        """ calculates sinr from the total received powers
+        """
         NmW = 10**(self.pndbm/10.)[np.newaxis,:]
 
-        self.sinro = self.CmWo/(ImWo+NmW)
-        self.sinrp = self.CmWp/(ImWp+NmW)
+        for g0,g1 in self.tiles:
+            u = slice(g0,g1)
+            CmWo = self.CmWo[:,u,:]
+            CmWp = self.CmWp[:,u,:]
+            # interference : power received from all the other AP
+            ImWo = self.CtmWo[:,u,np.newaxis]-CmWo
+            ImWp = self.CtmWp[:,u,np.newaxis]-CmWp
+            self.sinro[:,u,:] = CmWo/(ImWo+NmW)
+            self.sinrp[:,u,:] = CmWp/(ImWp+NmW)
 
         self.sinr = True
 
@@ -571,25 +700,241 @@ class Coverage(PyLayers):
 
         C.bestsv
 
+        bestmWo and bestmWp (nf x ng) are the received powers of the best
+        server.
+
         """
-        na = self.na
-        ng = self.ng
-        nf = self.nf
+        # ka : 1 x 1 x na  AP number (from 1)
+        ka = np.arange(1,self.na+1)[np.newaxis,np.newaxis,:]
         # find best server regions
-        Vo = self.CmWo
-        Vp = self.CmWp
-        self.bestsvo = np.empty(nf*ng*na).reshape(nf,ng,na)
-        self.bestsvp = np.empty(nf*ng*na).reshape(nf,ng,na)
-        for kf in range(nf):
-            MaxVo = np.max(Vo[kf,:,:],axis=1)
-            MaxVp = np.max(Vp[kf,:,:],axis=1)
-            for ka in range(na):
-                uo = np.where(Vo[kf,:,ka]==MaxVo)
-                up = np.where(Vp[kf,:,ka]==MaxVp)
-                self.bestsvo[kf,uo,ka]=ka+1
-                self.bestsvp[kf,up,ka]=ka+1
+        self.bestsvo = self._array('bestsvo')
+        self.bestsvp = self._array('bestsvp')
+        self.bestmWo = np.empty((self.nf,self.ng))
+        self.bestmWp = np.empty((self.nf,self.ng))
+        for g0,g1 in self.tiles:
+            u = slice(g0,g1)
+            Vo = self.CmWo[:,u,:]
+            Vp = self.CmWp[:,u,:]
+            self.bestmWo[:,u] = np.max(Vo,axis=2)
+            self.bestmWp[:,u] = np.max(Vp,axis=2)
+            self.bestsvo[:,u,:] = (Vo==self.bestmWo[:,u,np.newaxis])*ka
+            self.bestsvp[:,u,:] = (Vp==self.bestmWp[:,u,np.newaxis])*ka
+        self.best = True
+
+    def _bestsv(self,lk):
+        """ update the best server map after a change of the AP columns lk
+
+        Parameters
+        ----------
+
+        lk : list
+            sorted indices of the AP columns whose received power changed
+
+        Notes
+        -----
+
+        Only the grid points whose best server was one of lk, or whose
+        received power from one of lk reaches the best one, are updated.
+
+        """
+        ka = np.arange(1,self.na+1)[np.newaxis,:]
+        for polar in ['o','p']:
+            CmW = getattr(self,'CmW'+polar)
+            bestsv = getattr(self,'bestsv'+polar)
+            bestmW = getattr(self,'bestmW'+polar)
+            for g0,g1 in self.tiles:
+                u = slice(g0,g1)
+                # t : nf x nu  grid points to update
+                t = np.any(bestsv[:,u,lk]>0,axis=2) | \
+                    (np.max(CmW[:,u,lk],axis=2)>=bestmW[:,u])
+                if t.any():
+                    V = CmW[:,u,:]
+                    B = bestsv[:,u,:]
+                    M = bestmW[:,u]
+                    M[t] = np.max(V[t],axis=1)
+                    B[t] = (V[t]==M[t][:,np.newaxis])*ka
+                    bestsv[:,u,:] = B
         self.best = True
 
+    def update(self,**kwargs):
+        """ update the coverage after changes of the access points
+
+        Parameters
+        ----------
+
+        workers : int
+            see cover
+
+        Returns
+        -------
+
+        dup : dict
+            'computed' : AP whose planes have been evaluated
+            'rescaled' : AP whose received power has been rescaled (PtdBm)
+            'cached' : AP switched on again, planes taken from the cache
+
+        Examples
+        --------
+
+        >>> from pylayers.antprop.coverage import *
+        >>> C = Coverage()
+        >>> C.cover()
+        >>> C.dap[1]['PtdBm'] = 10
+        >>> dup = C.update()
+
+        Notes
+        -----
+
+        The loss and gain planes of an AP (Lwo, Lwp, Edo, Edp, freespace
+        and tgain along its column) only depend on its position, its
+        orientation (phideg) and its antenna. update compares them with
+        the state of the last evaluation :
+
+        + a change of PtdBm only rescales the received power of the AP
+        + a moved, reoriented or new AP has its planes evaluated
+        + the planes of an AP switched off are kept, they are reused
+          when it is switched on again at the same place
+
+        When the set of active AP is unchanged, the total received power
+        (CtmWo, CtmWp) is updated with the contributions of the modified
+        AP, and the best server map is only updated where it can change.
+        Otherwise the result arrays are rebuilt column by column and
+        snr, sinr and best server are evaluated again.
+
+        A change of the frequency set or of the grid requires cover.
+
+        """
+        workers = kwargs.pop('workers',0)
+        lactiveAP = [ iap for iap in self.dap if self.dap[iap]['on'] ]
+        lfGHz = [ self.dap[iap].s.fcghz for iap in lactiveAP ]
+        if (not hasattr(self,'tiles')) or (len(lactiveAP)==0) or \
+           (len(np.setdiff1d(np.hstack(lfGHz),self.fGHz))>0):
+            h5file = None if self.h5 is None else self.h5.filename
+            self.cover(workers=workers,size=getattr(self,'sizebloc',100),h5file=h5file)
+            return({'computed':lactiveAP,'rescaled':[],'cached':[]})
+
+        lplane = ['Lwo','Lwp','Edo','Edp','freespace','tgain']
+        oldcol = { iap:k for k,iap in enumerate(self.lactiveAP) }
+        oldkeys = self._keys
+        oldptdbm = self.ptdbm[0,:]
+        oldpndbm = self.pndbm[0,:]
+        #
+        # src : former column of each new column (None : new planes)
+        #
+        src = []
+        lcomp = []
+        lres = []
+        lcache = []
+        for k,iap in enumerate(lactiveAP):
+            ko = oldcol.get(iap)
+            key = self._apkey(iap)
+            if (ko is not None) and (oldkeys[ko]==key):
+                src.append(ko)
+                if oldptdbm[ko]!=self.dap[iap]['PtdBm']:
+                    lres.append(k)
+            else:
+                src.append(None)
+                if (iap in self._planes) and (self._planes[iap][0]==key):
+                    lcache.append(k)
+                else:
+                    lcomp.append(k)
+
+        if lactiveAP == self.lactiveAP:
+            # columns whose received power changes
+            lch = sorted(lcomp+lres)
+            if self.sinr and lch:
+                for g0,g1 in self.tiles:
+                    u = slice(g0,g1)
+                    self.CtmWo[:,u] -= np.sum(self.CmWo[:,u,lch],axis=2)
+                    self.CtmWp[:,u] -= np.sum(self.CmWp[:,u,lch],axis=2)
+            self._setap(lactiveAP)
+            if lcomp:
+                self._run(lcomp,workers=workers)
+            if lres:
+                self._evcmw(lres)
+            lsnr = sorted(set(lch)|set(np.where(self.pndbm[0,:]!=oldpndbm)[0].tolist()))
+            if self.snr and lsnr:
+                NmW = 10**(self.pndbm/10.)[np.newaxis,...][...,lsnr]
+                for g0,g1 in self.tiles:
+                    u = slice(g0,g1)
+                    self.snro[:,u,lsnr] = self.CmWo[:,u,lsnr]/NmW
+                    self.snrp[:,u,lsnr] = self.CmWp[:,u,lsnr]/NmW
+            if self.sinr and lsnr:
+                for g0,g1 in self.tiles:
+                    u = slice(g0,g1)
+                    self.CtmWo[:,u] += np.sum(self.CmWo[:,u,lch],axis=2)
+                    self.CtmWp[:,u] += np.sum(self.CmWp[:,u,lch],axis=2)
+                self._sinr()
+            if self.best and lch:
+                self._bestsv(lch)
+        else:
+            # keep the planes of the AP switched off
+            for iap in self.lactiveAP:
+                if iap not in lactiveAP:
+                    ko = oldcol[iap]
+                    dplane = { name:np.array(getattr(self,name)[:,:,ko]) for name in lplane }
+                    self._planes[iap] = (oldkeys[ko],dplane)
+            self._setap(lactiveAP)
+            for name in lplane+['CmWo','CmWp']:
+                self._remap(name,src)
+            for k in lcache:
+                key,dplane = self._planes.pop(lactiveAP[k])
+                for name in lplane:
+                    getattr(self,name)[:,:,k] = dplane[name]
+            if lcomp:
+                self._run(lcomp,workers=workers)
+            lcm = sorted(lres+lcache)
+            if lcm:
+                self._evcmw(lcm)
+            if self.snr:
+                self.evsnr()
+            if self.sinr:
+                self.evsinr()
+            if self.best:
+                self.evbestsv()
+
+        return({'computed':[ lactiveAP[k] for k in lcomp ],
+                'rescaled':[ lactiveAP[k] for k in lres ],
+                'cached':[ lactiveAP[k] for k in lcache ]})
+
+    def _evcmw(self,lk):
+        """ evaluate the received power of the AP columns lk from their planes
+        """
+        ptmW = 10**(self.ptdbm[np.newaxis,...]/10.)[...,lk]
+        for g0,g1 in self.tiles:
+            u = slice(g0,g1)
+            freespace = self.freespace[:,u,lk]
+            tgain = self.tgain[:,u,lk]
+            self.CmWo[:,u,lk] = ptmW*self.Lwo[:,u,lk]*freespace*tgain
+            self.CmWp[:,u,lk] = ptmW*self.Lwp[:,u,lk]*freespace*tgain
+
+    def _remap(self,name,src):
+        """ rebuild a result array for a new list of AP columns
+
+        Parameters
+        ----------
+
+        name : string
+        src : list
+            former column index of each new column (None : not filled)
+
+        """
+        old = getattr(self,name)
+        new = self._array(name+'_')
+        kn = [ k for k,ko in enumerate(src) if ko is not None ]
+        ko = [ src[k] for k in kn ]
+        if kn:
+            for g0,g1 in self.tiles:
+                u = slice(g0,g1)
+                W = np.empty((self.nf,g1-g0,self.na))
+                W[:,:,kn] = old[:,u,:][:,:,ko]
+                new[:,u,:] = W
+        if self.h5 is not None:
+            del self.h5[name]
+            self.h5.move(name+'_',name)
+            new = self.h5[name]
+        setattr(self,name,new)
+
 
 #    def showEd(self,polar='o',**kwargs):
 #        """ shows a map of direct path excess delay
@@ -861,6 +1206,51 @@ class Coverage(PyLayers):
 #        if self.show:
 #            plt.show()
 #
+    def evmap(self,typ='pr',polar='p',f=0,a=-1):
+        """ evaluate a coverage map tile by tile
+
+        Parameters
+        ----------
+
+        typ : string
+            'pr' | 'sinr' | 'snr' | 'capacity' | 'loss' | 'egd' | 'ref'
+        polar : string
+            'o' | 'p'
+        f : int
+            frequency index
+        a : int
+            access point index (-1 maximum over all access points)
+
+        Returns
+        -------
+
+        V : np.array (ng,)
+            linear scale
+
+        """
+        V = np.empty(self.ng)
+        for g0,g1 in self.tiles:
+            u = slice(g0,g1)
+            if typ == 'egd':
+                W = getattr(self,'Ed'+polar)[f,u,:]
+            if typ == 'sinr':
+                W = getattr(self,'sinr'+polar)[f,u,:]
+            if typ == 'snr':
+                W = getattr(self,'snr'+polar)[f,u,:]
+            if typ == 'capacity':
+                W = self.bmhz.T*np.log(1+getattr(self,'sinr'+polar)[f,u,:])/np.log(2)
+            if typ == 'pr':
+                W = getattr(self,'CmW'+polar)[f,u,:]
+            if typ == 'ref':
+                W = 10**(self.ref[f,u,:]/10)
+            if typ == 'loss':
+                W = getattr(self,'Lw'+polar)[f,u,:]*self.freespace[f,u,:]
+            if a == -1:
+                V[u] = np.max(W,axis=1)
+            else:
+                V[u] = W[:,a]
+        return V
+
     def plot(self,**kwargs):
         """
         """
@@ -901,9 +1291,10 @@ class Coverage(PyLayers):
             if kwargs['db']:
                 U = 10*np.log10(U)
 
-        D = np.sqrt(np.sum((self.pa-self.pg)*(self.pa-self.pg),axis=0))
+        # D : ng x na
+        dp = self.pa[:,np.newaxis,:]-self.pg[:,:,np.newaxis]
+        D = np.sqrt(np.sum(dp*dp,axis=0))
         if kwargs['a']!=-1:
-            D = D.reshape(self.ng,self.na)
             ax.semilogx(D[:,kwargs['a']],U,'.',color=kwargs['col'],label=kwargs['label'])
         else:
             ax.semilogx(D,U,'.',color=kwargs['col'],label=kwargs['label'])
@@ -1028,10 +1419,6 @@ class Coverage(PyLayers):
         else:
             if typ == 'egd':
                 title = title + 'excess group delay (ortho): '+' fc = '+str(self.fGHz[f])+' GHz'+ ' polar : '+polar
-                if polar=='o':
-                    V = self.Edo
-                if polar=='p':
-                    V = self.Edp
                 dB = False
                 legcb =  'Delay (ns)'
             if typ == 'sinr':
@@ -1040,41 +1427,24 @@ class Coverage(PyLayers):
                     legcb = 'dB'
                 else:
                     legcb = 'Linear scale'
-                if polar=='o':
-                    V = self.sinro
-                if polar=='p':
-                    V = self.sinrp
             if typ == 'snr':
                 title = title + 'SNR : '+' fc = '+str(self.fGHz[f])+' GHz'+ ' polar : '+polar
                 if dB:
                     legcb = 'dB'
                 else:
                     legcb = 'Linear scale'
-                if polar=='o':
-                    V = self.snro
-                if polar=='p':
-                    V = self.snrp
             if typ == 'capacity':
                 title = title + 'Capacity : '+' fc = '+str(self.fGHz[f])+' GHz'+ ' polar : '+polar
                 legcb = 'Mbit/s'
-                if polar=='o':
-                    V = self.bmhz.T[np.newaxis,:]*np.log(1+self.sinro)/np.log(2)
-                if polar=='p':
-                    V = self.bmhz.T[np.newaxis,:]*np.log(1+self.sinrp)/np.log(2)
             if typ == "pr":
                 title = title + 'Pr : '+' fc = '+str(self.fGHz[f])+' GHz'+ ' polar : '+polar
                 if dB:
                     legcb = 'dBm'
                 else:
                     lgdcb = 'mW'
-                if polar=='o':
-                    V = self.CmWo
-                if polar=='p':
-                    V = self.CmWp
 
             if typ == "ref":
                 title = kwargs['title']
-                V = 10**(self.ref/10)
                 if dB:
                     legcb = 'dB'
                 else:
@@ -1086,15 +1456,8 @@ class Coverage(PyLayers):
                     legcb = 'dB'
                 else:
                     legcb = 'Linear scale'
-                if polar=='o':
-                    V = self.Lwo*self.freespace
-                if polar=='p':
-                    V = self.Lwp*self.freespace
 
-            if a == -1:
-                V = np.max(V[f,:,:],axis=1)
-            else:
-                V = V[f,:,a]
+            V = self.evmap(typ=typ,polar=polar,f=f,a=a)
 
             # reshaping the data on the grid
             if self.mode!='file':
@@ -1145,9 +1508,9 @@ class Coverage(PyLayers):
             if best:
                 if self.mode!='file':
                     if polar=='o':
-                        ax.contour(np.sum(self.bestsvo,axis=2)[f,:].reshape(self.nx,self.ny).T,extent=(l,r,b,t),linestyles='dotted')
+                        ax.contour(np.sum(self.bestsvo[f,:,:],axis=1).reshape(self.nx,self.ny).T,extent=(l,r,b,t),linestyles='dotted')
                     if polar=='p':
-                        ax.contour(np.sum(self.bestsvp,axis=2)[f,:].reshape(self.nx,self.ny).T,extent=(l,r,b,t),linestyles='dotted')
+                        ax.contour(np.sum(self.bestsvp[f,:,:],axis=1).reshape(self.nx,self.ny).T,extent=(l,r,b,t),linestyles='dotted')
 
         # display access points
         if a==-1:
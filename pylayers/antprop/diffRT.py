@@ -16,7 +16,8 @@ import scipy.special as sps
 import matplotlib.pyplot as plt
 import pdb
 
-def diff(fGHz,phi0,phi,si,sd,N,mat0,matN,beta=np.pi/2,mode='tab',debug=False):
+def diff(fGHz,phi0,phi,si,sd,N,mat0,matN,beta=np.pi/2,mode='tab',debug=False,
+         tol=1e-6):
     """ Luebbers Diffration coefficient
     for Ray tracing
 
@@ -35,15 +36,21 @@ def diff(fGHz,phi0,phi,si,sd,N,mat0,matN,beta=np.pi/2,mode='tab',debug=False):
     sd : np.array (Nr)
     N: np.array (Nb)
     mat0 : Mat
+        or dict of arrays (Nr) with keys 'epr', 'mur', 'sigma' and
+        'roughness' (one material per ray)
     matN : Mat
+        idem
     beta : np.array (Nb)
         skew incidence angle (rad)
     mode : str ( 'tab','exact')
-        if 'tab': the Fresnel function is interpolated
-        ( increase speed)
-        if 'exact': the Fresnel function is computed for each values
+        if 'tab': the transition function is interpolated from the
+        process wide table of FreFtab ( increase speed)
+        if 'exact': the transition function is computed for each values
         ( increase accuracy)
         (see FreF)
+    tol : float
+        interpolation error bound of the transition function table
+        (mode 'tab')
 
     Returns
     -------
@@ -109,23 +116,15 @@ def diff(fGHz,phi0,phi,si,sd,N,mat0,matN,beta=np.pi/2,mode='tab',debug=False):
 #--------------------------------------------------
 
 
-    tho  = np.empty((fGHz.shape[0],phi.shape[1]))
-    thn  = np.empty((fGHz.shape[0],phi.shape[1]))
-    # PHI0 = phi0 * np.ones(phi.shape)
-    # PHI  = np.ones(phi0.shape)*phi
-    # BN   = np.ones(phi0.shape)*N
-
-
-
     c1 = phi>phi0
-    c2 = ~c1
-    tho[:,c1[0,:]] = phi0[:,c1[0,:]]
-    thn[:,c1[0,:]] = N[:,c1[0,:]]*np.pi-phi[:,c1[0,:]]
-    tho[:,c2[0,:]] = phi[:,c2[0,:]]
-    thn[:,c2[0,:]] = N[:,c2[0,:]]*np.pi-phi0[:,c2[0,:]]
-
-
-
+    # ,Nr
+    tho = np.where(c1,phi0,phi)[0,:]
+    thn = np.where(c1,N*np.pi-phi,N*np.pi-phi0)[0,:]
+    # Nf x Nr
+    tho = tho[None,:]*np.ones((fGHz.shape[0],1))
+    thn = thn[None,:]*np.ones((fGHz.shape[0],1))
+
+    # material parameters are scalars or (1 x Nr) arrays
     er0  = np.real(mat0['epr'])
     err0 = np.imag(mat0['epr'])
     ur0  = np.real(mat0['mur'])
@@ -135,53 +134,19 @@ def diff(fGHz,phi0,phi,si,sd,N,mat0,matN,beta=np.pi/2,mode='tab',debug=False):
 
     erN  = np.real(matN['epr'])
     errN = np.imag(matN['epr'])
-    urN  = np.real(mat0['mur'])
-    urrN = np.imag(mat0['mur'])
+    urN  = np.real(matN['mur'])
+    urrN = np.imag(matN['mur'])
     sigmaN = matN['sigma']
     deltahN = matN['roughness']
 
-
     Rsofto,Rhardo = R(tho,k,er0,err0,sigma0,ur0,urr0,deltah0)
     Rsoftn,Rhardn = R(thn,k,erN,errN,sigmaN,urN,urrN,deltahN)
 
-#--------------------------------------------------
-# grazing angle Go et Gn
-#--------------------------------------------------
-
-    Gsofto,Gsoftn = G(N,phi0,Rsofto,Rsoftn)
-
-    Ghardo,Ghardn = G(N,phi0,Rhardo,Rhardn)
-
 #--------------------------------------------------
 #calcul des 4 termes du coeff diff
 #--------------------------------------------------
-    #by construction
-    #0 < KLA < 2*k*L
-    klamax = 2*np.max(k)*np.max(L)
-    if mode == 'tab':
-        #xF0 = np.logspace(-6,-2,1000)
-        #xF1 = np.logspace(-2,np.log10(klamax),1000)
-        #xF = np.hstack((xF0,xF1))
-        #pdb.set_trace()
-        # xF = np.logspace(-6,np.log10(klamax),1000)
-        xF =  np.linspace(-8,np.log10(klamax),2000)
-        pxF = 10**xF
-        F = FreF(pxF)[0]
-    else :
-        xF = []
-        F=[]
-
-    sign  =  1.0
-    D1     = Dfunc(sign,k,N,phi-phi0,si,sd,xF,F,beta)
-
-    sign  =  -1.0
-    D2     = Dfunc(sign,k,N,phi-phi0,si,sd,xF,F,beta)
 
-    sign  =  +1.0
-    D3     = Dfunc(sign,k,N,phi+phi0,si,sd,xF,F,beta)
-
-    sign  =  -1.0
-    D4     = Dfunc(sign,k,N,phi+phi0,si,sd,xF,F,beta)
+    D1,D2,D3,D4 = Dfuncs(k,N,phi,phi0,si,sd,beta,mode=mode,tol=tol)
 
 #--------------------------------------
 #n>=1 : exterior wedge
@@ -381,6 +346,186 @@ def Dfunc(sign,k,N,dphi,si,sd,xF=[],F=[],beta=np.pi/2):
 
     return(Di)
 
+def Dfuncs(k,N,phi,phi0,si,sd,beta=np.pi/2,mode='tab',tol=1e-6):
+    """ the 4 terms of the diffraction coefficient in one evaluation
+
+    Parameters
+    ----------
+
+    k : np.array (Nf x 1)
+        wave number
+    N : np.array (1 x Nr)
+        wedge parameter
+    phi : np.array (1 x Nr)
+    phi0 : np.array (1 x Nr)
+    si : np.array (1 x Nr)
+        distance source-D
+    sd : np.array (1 x Nr)
+        distance D-observation
+    beta : np.array (1 x Nr)
+        skew incidence angle
+    mode : string
+        'tab' : interpolation of the transition function (see FreFi)
+        'exact' : FreF
+    tol : float
+        interpolation error bound ('tab' mode)
+
+    Returns
+    -------
+
+    D1,D2,D3,D4 : np.array (Nf x Nr)
+
+    Notes
+    -----
+
+    Same as Dfunc with (sign,dphi) = (1,phi-phi0), (-1,phi-phi0),
+    (1,phi+phi0), (-1,phi+phi0) stacked along a leading axis.
+
+    """
+    sign = np.array([1.,-1.,1.,-1.])[:,None,None]
+    dphi = np.stack((phi-phi0,phi-phi0,phi+phi0,phi+phi0))
+
+    sb   = np.sin(beta)
+    cste = (1.0-1.0*1j)*(1.0/(4.0*N*np.sqrt(k*np.pi)*sb))
+    rnn  = (dphi+np.pi*sign)/(2.0*N*np.pi)
+    nn   = (1.*(rnn>0.5) + 1.*(rnn>1.5)
+            - 1.*(rnn<-0.5) - 1.*(rnn<-1.5))
+
+    # KLA  ref[1] eq 27
+    L   = ((si*sd)*sb**2)/(1.*(si+sd))
+    AC  = np.cos( (2.0*N*nn*np.pi-dphi) / 2.0 )
+    A   = 2*AC**2
+    # 4 x Nf x Nr
+    KLA = k[None,...] * (L * A)
+
+    angle = (np.pi+sign*dphi)/(2.0*N)
+    tan   = np.tan(angle)
+
+    if mode == 'tab':
+        Fkla = FreFi(KLA,tol=tol)
+    else:
+        Fkla = FreF(KLA.ravel())[0].reshape(KLA.shape)
+
+    # 4.56 Mac Namara
+    with np.errstate(divide='ignore',invalid='ignore'):
+        Di = -cste[None,...]*Fkla/tan
+    Di = np.where(np.abs(tan)<1e-9,0.5*np.sqrt(L)+0j,Di)
+
+    return Di[0],Di[1],Di[2],Di[3]
+
+# process wide tables of the transition function (see FreFtab)
+_FTAB = {}
+
+def FreFtab(tol=1e-6,xmin=1e-8,xmax=10.):
+    """ table of the transition function F on a log10(x) grid
+
+    Parameters
+    ----------
+
+    tol : float
+        maximum error of the linear interpolation of F, measured at the
+        middle of the grid intervals
+    xmin : float
+    xmax : float
+
+    Returns
+    -------
+
+    tab : dict
+        'lx' : log10(x) grid (regular)
+        'F'  : F(10**lx)
+        'err' : maximum interpolation error
+
+    Notes
+    -----
+
+    The grid is doubled until the error bound is reached. The table is
+    built once per process and per (tol,xmin,xmax).
+
+    """
+    key = (tol,xmin,xmax)
+    if key in _FTAB:
+        return _FTAB[key]
+    n  = 257
+    lx = np.linspace(np.log10(xmin),np.log10(xmax),n)
+    F  = FreF(10**lx)[0]
+    while True:
+        lxm = 0.5*(lx[1:]+lx[:-1])
+        Fm  = FreF(10**lxm)[0]
+        err = np.abs(Fm-0.5*(F[1:]+F[:-1])).max()
+        if (err <= tol) or (n > 2**22):
+            break
+        lx2 = np.empty(2*n-1)
+        F2  = np.empty(2*n-1,dtype=complex)
+        lx2[0::2] = lx
+        lx2[1::2] = lxm
+        F2[0::2] = F
+        F2[1::2] = Fm
+        lx,F,n = lx2,F2,2*n-1
+    tab = {'lx':lx,'F':F,'err':err}
+    _FTAB[key] = tab
+    return tab
+
+def FreFi(x,tol=1e-6):
+    """ transition function F interpolated from FreFtab
+
+    Parameters
+    ----------
+
+    x : np.array
+        real positive argument (any shape)
+    tol : float
+        interpolation error bound
+
+    Returns
+    -------
+
+    y : np.array
+        F(x)
+
+    Notes
+    -----
+
+    Below the table the small argument expansion ([1] eq 30) is used,
+    above it the large argument expansion as in FreF.
+
+    Examples
+    --------
+
+    >>> import numpy as np
+    >>> x = np.logspace(-4,2,100)
+    >>> print(np.abs(FreFi(x)-FreF(x)[0]).max()<1e-6)
+    True
+
+    """
+    tab = FreFtab(tol)
+    lx  = tab['lx']
+    F   = tab['F']
+    x   = np.asarray(x,dtype=float)
+    y   = np.empty(x.shape,dtype=complex)
+
+    with np.errstate(divide='ignore'):
+        lxx = np.log10(x)
+    us  = lxx < lx[0]
+    ul  = lxx > lx[-1]
+    um  = ~(us|ul)
+
+    dlx = (lx[-1]-lx[0])/(len(lx)-1)
+    v   = (lxx[um]-lx[0])/dlx
+    iv  = np.minimum(v.astype(int),len(lx)-2)
+    w   = v-iv
+    y[um] = (1-w)*F[iv]+w*F[iv+1]
+
+    xs  = x[us]
+    y[us] = ((np.sqrt(np.pi*xs)-2*xs*np.exp(1j*np.pi/4)
+             -(2/3.)*xs**2*np.exp(-1j*np.pi/4))*np.exp(1j*(np.pi/4+xs)))
+
+    xl  = x[ul]
+    y[ul] = (1-0.75/(xl*xl)+4.6875/(xl*xl*xl*xl)
+             + 1j*( 0.5/xl -1.875/(xl*xl*xl)))
+
+    return y
+
 def  FresnelI(x) :
     """ calculates Fresnel integral
 
@@ -569,6 +714,9 @@ def R(th,k,er,err,sigma,ur,urr,deltah):
     urr  : imaginary part of permeability
     deltah : height standard deviation
 
+    Material parameters are either scalars or arrays broadcastable with th
+    (one material per ray). er < 0 denotes a metalic surface.
+
     Examples
     --------
 
@@ -589,47 +737,44 @@ def R(th,k,er,err,sigma,ur,urr,deltah):
     #cas des surfaces dielectriques (sinon er=-1)
     #--------------------------------------------
 
-    if (er >= 0.0 ):
-        if ( (( ur-1.0)<1e-16) & ((er-1.0)<1e-16) ):
-            Rs = np.zeros(len(th),dtype=complex)
-            Rh = np.zeros(len(th),dtype=complex)
-
-        u1 = np.where(th >= 1.5*np.pi)
-        u2 = np.where(th >= np.pi )
-        u3 = np.where(th >= 0.5*np.pi)
+    metal = np.asarray(er) < 0.0
+    if metal.all():
+        Rs = -np.ones(np.shape(th),dtype=complex)
+        Rh =  np.ones(np.shape(th),dtype=complex)
+        return Rs,Rh
 
-        th[u1] = 2.0*np.pi - th[u1]
-        th[u2] = th[u2] - np.pi
-        th[u3] = np.pi - th[u3]
+    # folding of the incidence angle (u1,u2,u3 evaluated on the
+    # unfolded angle)
+    th = np.array(th,dtype=float)
+    u1 = th >= 1.5*np.pi
+    u2 = th >= np.pi
+    u3 = th >= 0.5*np.pi
 
-        #if (th >= 1.5*np.pi ):
-        #    th = 2.0*np.pi - th
-        #elif (th >= np.pi ):
-        #    th = th - np.pi
-        #elif (th >= 0.5*np.pi):
-        #    th = np.pi - th
+    th[u1] = 2.0*np.pi - th[u1]
+    th[u2] = th[u2] - np.pi
+    th[u3] = np.pi - th[u3]
 
-        uo   = 4.0*np.pi*1e-7
-        eo   = 1.0/(uo*cel*cel)
+    uo   = 4.0*np.pi*1e-7
+    eo   = 1.0/(uo*cel*cel)
 
-        pulse   = k*cel
-        permi   = (er-1j*err)-(1j*sigma)/(pulse*eo)
+    pulse   = k*cel
+    permi   = (er-1j*err)-(1j*sigma)/(pulse*eo)
 
-        perme   = ur - 1j*urr
+    perme   = ur - 1j*urr
 
-        yy      = (permi/perme)
+    yy      = (permi/perme)
 
-        st      = np.sin(th)
-        ct      = np.cos(th)
+    st      = np.sin(th)
+    ct      = np.cos(th)
 
-        bb      = np.sqrt(yy-ct**2)
+    bb      = np.sqrt(yy-ct**2)
 
-        Rs  = (st - bb) / (st + bb )
-        Rh  = (yy*st-bb)/(yy*st+bb)
+    Rs  = (st - bb) / (st + bb )
+    Rh  = (yy*st-bb)/(yy*st+bb)
 
-    else: # metalic case
-        Rs = -np.ones(th.shape,dtype=complex)
-        Rh =  np.ones(th.shape,dtype=complex)
+    # metalic case
+    Rs = np.where(metal,-1.0+0j,Rs)
+    Rh = np.where(metal,1.0+0j,Rh)
 
     roughness = 1.0
 
@@ -0,0 +1,76 @@
+#-*- coding:Utf-8 -*-
+"""
+Micro-benchmark of the ray interaction chain product
+
+The former loop of Rays.eval (broadcast products summed over an axis)
+is compared with chainprod (numpy and numba engines) for l = 1..8
+interactions, nf frequency points and nr rays.
+
+    python ex_chainprod.py [nf] [nr]
+
+"""
+from __future__ import print_function
+import sys
+import time
+import numpy as np
+from pylayers.antprop.chainprod import chainprod, numba
+
+
+def legacy(A, Bl, B0l, idis):
+    """ chain product as formerly written in Rays.eval
+    """
+    l = A.shape[2]
+    Bl = Bl[None, ...]
+    B0l = B0l[None, ...]
+    for i in range(0, l):
+        if i == 0:
+            Atmp = A[:, :, i, :, :]
+            B00 = B0l[:, :, :, :]
+            Z = np.sum(Atmp[..., :, :, np.newaxis]
+                       * B00[..., np.newaxis, :, :], axis=-2)
+        else:
+            Atmp = A[:, :, i, :, :]
+            BB = Bl[:, :, i - 1, :, :]
+            Ztmp = np.sum(Atmp[..., :, :, np.newaxis]
+                          * BB[..., np.newaxis, :, :], axis=-2)
+            Z = np.sum(Ztmp[..., :, :, np.newaxis]
+                       * Z[..., np.newaxis, :, :], axis=-2)
+        if i == l - 1:
+            BB = Bl[:, :, i, :, :]
+            Z = np.sum(BB[..., :, :, np.newaxis]
+                       * Z[..., np.newaxis, :, :], axis=-2)
+    return Z * idis[None, :, None, None]
+
+
+def timeit(fun, *args, **kwargs):
+    fun(*args, **kwargs)
+    n = 0
+    t0 = time.time()
+    while (time.time() - t0) < 0.5:
+        Z = fun(*args, **kwargs)
+        n = n + 1
+    return (time.time() - t0) / n, Z
+
+
+nf = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+nr = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+rng = np.random.RandomState(0)
+
+lengine = ['numpy'] + (['numba'] if numba is not None else [])
+print('nf = %d  nr = %d' % (nf, nr))
+print('%3s %12s ' % ('l', 'legacy (ms)') +
+      ' '.join('%12s %8s' % (e + ' (ms)', 'speedup') for e in lengine) +
+      ' %10s' % 'max err')
+for l in range(1, 9):
+    A = (rng.randn(nf, nr, l, 3, 3) + 1j * rng.randn(nf, nr, l, 3, 3))
+    Bl = rng.randn(nr, l, 3, 3)
+    B0l = rng.randn(nr, 3, 3)
+    idis = 1. / rng.uniform(1, 20, nr)
+    tl, Zl = timeit(legacy, A, Bl, B0l, idis)
+    st = '%3d %12.2f ' % (l, 1e3 * tl)
+    err = 0
+    for e in lengine:
+        te, Ze = timeit(chainprod, A, Bl, B0l, w=idis, engine=e)
+        err = max(err, np.abs(Ze - Zl).max() / np.abs(Zl).max())
+        st = st + '%12.2f %8.1f ' % (1e3 * te, tl / te)
+    print(st + '%10.1e' % err)
@@ -0,0 +1,59 @@
+#-*- coding:Utf-8 -*-
+"""
+Accuracy of the complex64 ray field evaluation
+
+For a few bundled layouts the rays between two cycles are evaluated
+with Rays.eval(dtype=complex) and Rays.eval(dtype=np.complex64) and the
+resulting transmission channels are compared.
+
+For each layout the report gives
+
+    nray    : number of rays
+    erel    : max over rays of || H32 - H64 || / || H64 ||
+    dEdB    : error on the total received energy (dB)
+    Mbytes  : size of the interaction array I for both precisions
+
+"""
+from __future__ import print_function
+import sys
+import numpy as np
+from pylayers.gis.layout import Layout
+from pylayers.antprop.signature import Signatures
+
+fGHz = np.linspace(2, 11, 256)
+
+if len(sys.argv) > 1:
+    llay = sys.argv[1:]
+else:
+    llay = ['defstr.lay', 'DLR2.lay', 'homeK_vf.lay']
+
+print('%-16s %6s %10s %10s %18s' % ('layout', 'nray', 'erel', 'dEdB',
+                                     'Mbytes (c128/c64)'))
+for lay in llay:
+    L = Layout(lay)
+    L.build()
+    lcy = [cy for cy in L.Gt.nodes() if cy > 0]
+    cya, cyb = lcy[0], lcy[len(lcy) // 2]
+    S = Signatures(L, cya, cyb)
+    S.run(cutoff=3, progress=False)
+    tx = np.r_[np.array(L.Gt.pos[cya]), 1.2]
+    rx = np.r_[np.array(L.Gt.pos[cyb]), 1.5]
+    r3d = S.raysv(tx, rx).to3D(L)
+    r3d.locbas(L)
+    r3d.fillinter(L)
+    lH = []
+    lM = []
+    for dtype in [complex, np.complex64]:
+        C = r3d.eval(fGHz, dtype=dtype)
+        lM.append(r3d.I.I.nbytes / 1e6)
+        C.locbas(Ta=np.eye(3), Tb=np.eye(3))
+        H = C.prop2tran()
+        lH.append(H.y.reshape(H.y.shape[0], -1))
+    H64, H32 = lH
+    n64 = np.sqrt(np.sum(np.abs(H64)**2, axis=1))
+    erel = np.max(np.sqrt(np.sum(np.abs(H32 - H64)**2, axis=1)) / n64)
+    E64 = np.sum(np.abs(H64)**2)
+    E32 = np.sum(np.abs(H32.astype(complex))**2)
+    dEdB = 10 * np.log10(E32 / E64)
+    print('%-16s %6d %10.2e %10.2e %9.1f/%-8.1f' % (lay, r3d.nray, erel, dEdB,
+                                                    lM[0], lM[1]))
@@ -0,0 +1,73 @@
+#-*- coding:Utf-8 -*-
+"""
+Timing of Rays.to3D and Rays.locbas
+
+For a few bundled layouts the 2D rays between two cycles are computed
+once, then Rays.to3D is timed for each ceil height H (zceil of the
+layout, 0 : floor only, -1 : no floor nor ceil) and each number of
+mirror reflexions N, and Rays.locbas is timed on the resulting 3D rays.
+
+usage : python ex_to3D.py [layout cutoff] ...
+
+For each layout the report gives
+
+    nray2D : number of 2D rays
+    nray3D : number of 3D rays (sum over the H and N cases)
+    to3D   : total time of Rays.to3D (s)
+    locbas : total time of Rays.locbas (s)
+
+"""
+from __future__ import print_function
+import sys
+import time
+import numpy as np
+from pylayers.gis.layout import Layout
+from pylayers.antprop.signature import Signatures
+
+nrep = 5
+
+if len(sys.argv) > 2:
+    lcase = [(lay, int(cutoff)) for lay, cutoff in
+             zip(sys.argv[1::2], sys.argv[2::2])]
+else:
+    lcase = [('defstr.lay', 6), ('homeK_vf.lay', 5), ('DLR2.lay', 4)]
+
+print('%-16s %7s %7s %9s %9s' % ('layout', 'nray2D', 'nray3D', 'to3D',
+                                 'locbas'))
+tto3D = 0
+tlocbas = 0
+for lay, cutoff in lcase:
+    L = Layout(lay)
+    L.build()
+    lcy = [cy for cy in L.Gt.nodes() if cy > 0]
+    cya, cyb = lcy[0], lcy[len(lcy) // 2]
+    S = Signatures(L, cya, cyb)
+    S.run(cutoff=cutoff, progress=False)
+    tx = np.r_[np.array(L.Gt.pos[cya]), 1.2]
+    rx = np.r_[np.array(L.Gt.pos[cyb]), 1.5]
+    r2d = S.raysv(tx, rx)
+    nray2D = sum([np.shape(r2d[k]['sig'])[2] for k in r2d])
+    nray3D = 0
+    t3 = 0
+    tl = 0
+    for H in [L.zceil, 0, -1]:
+        for N in [1, 2]:
+            # best of nrep runs
+            lt = []
+            for k in range(nrep):
+                t0 = time.time()
+                r3d = r2d.to3D(L, H=H, N=N)
+                lt.append(time.time() - t0)
+            t3 = t3 + min(lt)
+            lt = []
+            for k in range(nrep):
+                r3d = r2d.to3D(L, H=H, N=N)
+                t0 = time.time()
+                r3d.locbas(L)
+                lt.append(time.time() - t0)
+            tl = tl + min(lt)
+            nray3D = nray3D + r3d.nray
+    tto3D = tto3D + t3
+    tlocbas = tlocbas + tl
+    print('%-16s %7d %7d %9.3f %9.3f' % (lay, nray2D, nray3D, t3, tl))
+print('%-16s %7s %7s %9.3f %9.3f' % ('total', '', '', tto3D, tlocbas))
@@ -58,10 +58,17 @@ class Inter(PyLayers):
             number of step into freq range
         olf : np.array
             np.ones((nf)) used for broadcasting
+        rttol : float
+            error bound of the tabulated slab coefficients used by
+            IntR/IntT (see SlabDB.rttable). 0 (default) selects the
+            exact Slab.eval evaluation.
 
 
     """
 
+    # default error bound of the slab R/T tables (0 : exact evaluation)
+    rttol = 0
+
     def __init__(self, 
             typ=0, 
             data=np.array(()), 
@@ -106,6 +113,46 @@ class Inter(PyLayers):
         else:
             return 'I not yet evaluated'
 
+    def slabrt(self, m, fGHz, theta, RT='R', compensate=False, rttol=None,
+               dtype=complex):
+        """ R or T matrices of slab m
+
+        Parameters
+        ----------
+
+        m : string
+            slab name
+        fGHz : np.array (nf,)
+        theta : np.array (N,)
+        RT : 'R' | 'T'
+        compensate : boolean
+        rttol : float
+            table error bound (default self.rttol)
+        dtype : np.dtype
+            complex type of the tabulated result
+
+        Returns
+        -------
+
+        A : np.array (nf,N,2,2)
+
+        Notes
+        -----
+
+        The coefficients are interpolated from the slab table of
+        SlabDB.rttable when an error bound is set and the slab database
+        supports it, otherwise Slab.eval is called.
+
+        """
+        if rttol is None:
+            rttol = self.rttol
+        if rttol and hasattr(self.slab, 'rttable'):
+            tab = self.slab.rttable(m, fGHz, tol=rttol)
+            return tab.eval(theta, RT=RT, compensate=compensate, dtype=dtype)
+        self.slab[m].eval(fGHz=fGHz, theta=theta, RT=RT,
+                          compensate=compensate)
+        return getattr(self.slab[m], RT)
+
     def create_dusl(self,a):
         """ create dictionnary of used slab.
 
@@ -307,13 +354,19 @@ class Interactions(Inter,dict):
             self['T'] = i.idx
             self.typ[i.idx] = 'T'
 
-    def eval(self,fGHz=np.array([2.4])):
+    def eval(self,fGHz=np.array([2.4]),rttol=None,dtype=complex):
         """ evaluate all the interactions
 
         Parameters
         ----------
 
         fGHz : np.array()
+        rttol : float
+            error bound of the slab R/T tables (default Inter.rttol,
+            0 : exact).
+            0 selects the exact slab evaluation.
+        dtype : np.dtype
+            complex type of self.I (complex or np.complex64)
 
         Notes
         -----
@@ -340,7 +393,7 @@ class Interactions(Inter,dict):
         self.fGHz = fGHz
         self.nf = len(fGHz)
 
-        self.I = np.zeros((self.nf, self.nimax, 3, 3), dtype=complex)
+        self.I = np.zeros((self.nf, self.nimax, 3, 3), dtype=dtype)
         self.sout = np.zeros((self.nimax))
         self.si0 = np.zeros((self.nimax))
         self.alpha = np.ones((self.nimax), dtype=complex)
@@ -369,7 +422,8 @@ class Interactions(Inter,dict):
         # evaluate R and fill I
         if len(self.R.data)!=0:
             #try:
-            self.I[:, self.R.idx, :, :] = self.R.eval(fGHz=fGHz)
+            self.I[:, self.R.idx, :, :] = self.R.eval(fGHz=fGHz, rttol=rttol,
+                                                     dtype=dtype)
             self.sout[self.R.idx] = self.R.sout
             self.si0[self.R.idx] = self.R.si0
             self.alpha[self.R.idx] = self.R.alpha
@@ -380,7 +434,8 @@ class Interactions(Inter,dict):
         # evaluate T and fill I
         if len(self.T.data)!=0:
             #try:
-            self.I[:, self.T.idx, :, :] = self.T.eval(fGHz=fGHz)
+            self.I[:, self.T.idx, :, :] = self.T.eval(fGHz=fGHz, rttol=rttol,
+                                                     dtype=dtype)
             self.sout[self.T.idx] = self.T.sout
             self.si0[self.T.idx] = self.T.si0
             self.alpha[self.T.idx] = self.T.alpha
@@ -393,7 +448,7 @@ class Interactions(Inter,dict):
 
         if len(self.D.data)!=0:
             #try:
-            self.I[:, self.D.idx, :, :] = self.D.eval(fGHz=fGHz)
+            self.I[:, self.D.idx, :, :] = self.D.eval(fGHz=fGHz, dtype=dtype)
             self.sout[self.D.idx] = self.D.sout
             self.si0[self.D.idx] = self.D.si0
 
@@ -438,7 +493,7 @@ class IntB(Inter):
         s = 'number of B basis :' + str(np.shape(self.data)[0])
         return s    
 
-    def eval(self,fGHz=np.array([2.4])):
+    def eval(self,fGHz=np.array([2.4]),dtype=complex):
         """ evaluation of B interactions
 
         Parameters
@@ -447,6 +502,9 @@ class IntB(Inter):
         fGHz : np.array()nn
 
             frequency range
+        dtype : np.dtype
+            complex type of the evaluation, B is returned with the
+            corresponding real type
 
         Returns
         -------
@@ -480,9 +538,10 @@ class IntB(Inter):
         self.sinsout()
         if len(self.data) != 0:
             lidx = len(self.idx)
-            data = self.data.reshape(lidx, 3, 3)
+            rdtype = np.finfo(dtype).dtype
+            data = self.data.reshape(lidx, 3, 3).astype(rdtype)
             #return(self.olf[:, np.newaxis, np.newaxis, np.newaxis]*data[np.newaxis, :, :, :])
-            return(np.ones((len(fGHz),1,1,1))*data[None, :, :, :])
+            return(np.ones((len(fGHz),1,1,1),dtype=rdtype)*data[None, :, :, :])
         else:
             print('no B interactions to evaluate')
             return(self.data[:, None, None, None])
@@ -580,13 +639,17 @@ class IntR(Inter):
         s = 'number of R interactions :' + str(np.shape(self.data)[0])
         return s    
 
-    def eval(self,fGHz=np.array([2.4])):
+    def eval(self,fGHz=np.array([2.4]),rttol=None,dtype=complex):
         """ evaluation of reflexion interactions
 
         Parameters
         ----------
 
         fGHz : np.array (,Nf)
+        rttol : float
+            slab table error bound (default self.rttol, 0 : exact)
+        dtype : np.dtype
+            complex type of self.A (complex or np.complex64)
 
 
         Returns
@@ -646,7 +709,7 @@ class IntR(Inter):
 
         # A : f ri 2 2
 
-        self.A = np.zeros((self.nf, len(self.idx), 3, 3), dtype=complex)
+        self.A = np.zeros((self.nf, len(self.idx), 3, 3), dtype=dtype)
         self.A[:,:,0,0]=1
 
         if np.shape(self.data)[0]!=len(self.idx):
@@ -663,12 +726,13 @@ class IntR(Inter):
                     # find the index of angles which satisfied the data
                     #if m not in self.slab:
                     #    m = m.lower()
-                    self.slab[m].eval(fGHz=fGHz, theta=ut, RT='R')
+                    Rm = self.slabrt(m, fGHz, ut, RT='R', rttol=rttol,
+                                     dtype=dtype)
                     try:
-                        R = np.concatenate((R, self.slab[m].R), axis=1)
+                        R = np.concatenate((R, Rm), axis=1)
                         mapp.extend(self.dusl[m])
                     except:
-                        R = self.slab[m].R
+                        R = Rm
                         mapp.extend(self.dusl[m])
 
             # replace in correct order the reflexion coeff
@@ -709,9 +773,18 @@ class IntT(Inter):
         s = 'number of T interaction :' + str(np.shape(self.data)[0])
         return(s)
 
-    def eval(self,fGHz=np.array([2.4])):
+    def eval(self,fGHz=np.array([2.4]),rttol=None,dtype=complex):
         """ evaluate transmission
 
+        Parameters
+        ----------
+
+        fGHz : np.array (,Nf)
+        rttol : float
+            slab table error bound (default self.rttol, 0 : exact)
+        dtype : np.dtype
+            complex type of self.A (complex or np.complex64)
+
         Examples
         --------
 
@@ -757,7 +830,7 @@ class IntT(Inter):
         self.fGHz=fGHz
         self.nf=len(fGHz)
 
-        self.A = np.zeros((self.nf, len(self.idx), 3, 3), dtype=complex)
+        self.A = np.zeros((self.nf, len(self.idx), 3, 3), dtype=dtype)
         self.A[:,:,0,0] = 1
 
         self.alpha = np.zeros((len(self.idx)), dtype=complex)
@@ -796,13 +869,14 @@ class IntT(Inter):
                         gamma = g
 
                     # find the index of angles which satisfied the data
-                    self.slab[m].eval(fGHz=fGHz, theta=ut, RT='T', compensate=True)
+                    Tm = self.slabrt(m, fGHz, ut, RT='T', compensate=True,
+                                     rttol=rttol, dtype=dtype)
 
                     try:
-                        T = np.concatenate((T, self.slab[m].T), axis=1)
+                        T = np.concatenate((T, Tm), axis=1)
                         mapp.extend(self.dusl[m])
                     except:
-                        T = self.slab[m].T
+                        T = Tm
                         mapp.extend(self.dusl[m])
             # replace in proper order the Transmission coeff
             self.A[:, np.array((mapp)), 1:, 1:] = T
@@ -827,13 +901,15 @@ class IntD(Inter):
         s = 'number of D interaction :' + str(np.shape(self.data)[0])
         return s
 
-    def eval(self,fGHz=np.array([2.4])):
+    def eval(self,fGHz=np.array([2.4]),dtype=complex):
         """ evaluate diffraction interaction
 
         Parameters
         ----------
 
         fGHz : np.array
+        dtype : np.dtype
+            complex type of self.A (complex or np.complex64)
 
 
         """
@@ -841,7 +917,7 @@ class IntD(Inter):
 
         self.fGHz = fGHz
         self.nf = len(fGHz)
-        self.A = np.zeros((self.nf, len(self.idx), 3, 3), dtype=complex)
+        self.A = np.zeros((self.nf, len(self.idx), 3, 3), dtype=dtype)
         self.A[:,:,0,0]=1
 
         if len(self.data) != 0 :
@@ -850,40 +926,39 @@ class IntD(Inter):
             self.beta = self.data[:,2]
             self.N    = self.data[:,3]
             self.sinsout()
-            D = np.zeros([self.nf, len(self.phi), 2, 2], dtype=complex)
+            D = np.zeros([self.nf, len(self.phi), 2, 2], dtype=dtype)
+            #
+            # one material per ray on both faces of the wedge (cf
+            # Rays.locbas : 'mat0@matN'), all the groups are evaluated
+            # in a single call of diff
+            #
+            nd = len(self.phi)
+            lk = ['epr','mur','sigma','roughness']
+            mat0 = {k: np.zeros(nd, dtype=complex) for k in lk}
+            matN = {k: np.zeros(nd, dtype=complex) for k in lk}
             mapp=[]
             for m in self.dusl.keys():
                 idx = self.dusl[m]
-                mats = m.split('@') # cf Rays.locbas =>Start diffraction specific case
-                mat0name = mats[0]
-                matNname = mats[1]
-                # 
-                # mat0 first material of slab 0 
-                # matN first material of slab N 
-                #
-                mat0 = self.slab[mat0name]['lmat'][0]
-                matN = self.slab[matNname]['lmat'][0]
-                # from IPython.core.debugger import Tracer
-                # Tracer()()
-                # Ds,Dh = diff(self.fGHz,self.phi0[idx],self.phi[idx],self.si0[idx],self.sout[idx],self.N[idx],mat0,matN,beta=self.beta[idx])
-                Ds,Dh = diff(self.fGHz,self.phi0[idx],self.phi[idx],self.si0[idx],self.sout[idx],self.N[idx],mat0,matN,mode='tab',beta=self.beta[idx])
-                #D[:,idx,0,0]=-Dh
-                #D[:,idx,1,1]=Ds
-                D[:,idx,1,1]=-Dh
-                D[:,idx,0,0]=Ds
-                # from IPython.core.debugger import Tracer
-                # Tracer()()
+                mats = m.split('@')
+                # mat0 first material of slab 0
+                # matN first material of slab N
+                m0 = self.slab[mats[0]]['lmat'][0]
+                mN = self.slab[mats[1]]['lmat'][0]
+                for k in lk:
+                    mat0[k][idx] = m0[k]
+                    matN[k][idx] = mN[k]
                 mapp.extend(self.dusl[m])
-                # import ipdb
-                # ipdb.set_trace()
-                # try:
-                #     D = np.concatenate((D, self.slab[m].T), axis=1)
-                #     mapp.extend(self.dusl[m])
-                # except:
-                #     D = np.empty([self.nf, len(idx), 2, 2], dtype=complex)
-                #     D[:,:,0,0]=Ds
-                #     D[:,:,1,1]=Dh
-                #     mapp.extend(self.dusl[m])
+            for k in ['sigma','roughness']:
+                mat0[k] = np.real(mat0[k])
+                matN[k] = np.real(matN[k])
+            mapp = np.array(mapp, dtype=int)
+            Ds,Dh = diff(self.fGHz,self.phi0[mapp],self.phi[mapp],
+                         self.si0[mapp],self.sout[mapp],self.N[mapp],
+                         {k: mat0[k][mapp] for k in lk},
+                         {k: matN[k][mapp] for k in lk},
+                         mode='tab',beta=self.beta[mapp])
+            D[:,mapp,1,1]=-Dh
+            D[:,mapp,0,0]=Ds
             self.A[:, np.array((mapp)), 1:, 1:] = D[:,mapp,:,:]
             return(self.A)
         else :
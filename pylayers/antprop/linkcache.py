@@ -0,0 +1,228 @@
+#-*- coding:Utf-8 -*-
+r"""
+.. currentmodule:: pylayers.antprop.linkcache
+
+Reciprocity aware link cache
+============================
+
+A radio link between the nodes a and b is computed once. The reverse
+link b -> a is obtained from the stored one by reciprocity :
+
++ the rays are travelled backward (Rays.reciprocal)
++ the ray transfer matrices are transposed and the directions of
+  departure and arrival are swapped (Tchannel.reciprocal)
+
+This holds as long as each node uses the same antenna, with the same
+orientation, for transmission and reception and as long as the rays are
+computed with the same parameters in both directions. Otherwise the
+cache is created with reciprocal=False and both directions are stored
+separately.
+
+Signatures.tchannels(..., lc=LinkCache()) only evaluates the links which
+are not in the cache.
+
+.. autosummary::
+    :toctree: generated/
+
+    LinkCache
+
+"""
+from __future__ import print_function
+from collections import OrderedDict
+import numpy as np
+import pylayers.util.pyutil as pyu
+
+
+class LinkCache(object):
+    """ cache of links served in both directions
+
+    Parameters
+    ----------
+
+    reciprocal : boolean
+        if True (default) the reverse direction of a stored link is
+        served by reciprocity. If False the links are directed.
+    maxsize : int
+        maximum number of stored links (least recently used first out)
+
+    Attributes
+    ----------
+
+    ndir : int
+        number of requests served by a link stored in the same direction
+    nrec : int
+        number of requests served by reciprocity
+    nmiss : int
+        number of requests which were not in the cache
+
+    Notes
+    -----
+
+    A link is identified by its two nodes, its wireless standard and the
+    hash of its parameters (see pylayers.util.pyutil.hashkey). With
+    reciprocity, (a,b) and (b,a) share the same entry which keeps the
+    direction it has been computed in.
+
+    The objects stored and returned in the stored direction are shared,
+    they should not be modified by the caller. When a node moves, its
+    links are removed with invalidate.
+
+    Examples
+    --------
+
+    >>> import numpy as np
+    >>> from pylayers.antprop.channel import Tchannel
+    >>> H = Tchannel(x=np.arange(2,4,0.5),y=np.ones((3,2,1,4)),
+    ...              tau=np.array([10,12,15.]),dod=np.zeros((3,2)),
+    ...              doa=np.ones((3,2)))
+    >>> lc = LinkCache()
+    >>> lc.put('ap1','dev3',H=H,wstd='wifi')
+    >>> r, Hr = lc.get('dev3','ap1',wstd='wifi')
+    >>> Hr.y.shape
+    (3, 1, 2, 4)
+    >>> print(lc.get('dev3','ap1',wstd='ble'))
+    None
+    >>> print(lc.ndir, lc.nrec, lc.nmiss)
+    0 1 1
+
+    """
+
+    def __init__(self, reciprocal=True, maxsize=1024):
+        self.reciprocal = reciprocal
+        self.maxsize = maxsize
+        self.lru = OrderedDict()
+        self.ndir = 0
+        self.nrec = 0
+        self.nmiss = 0
+
+    def __repr__(self):
+        st = 'LinkCache : ' + ('reciprocal' if self.reciprocal else 'directed') + '\n'
+        st = st + 'links : ' + str(len(self.lru)) + '/' + str(self.maxsize) + '\n'
+        st = st + 'hits (direct/reciprocal/miss) : ' + str(self.ndir) + '/' + \
+            str(self.nrec) + '/' + str(self.nmiss)
+        return st
+
+    def __len__(self):
+        return len(self.lru)
+
+    def key(self, a, b, wstd='', **kwargs):
+        """ canonical key of a link
+
+        Parameters
+        ----------
+
+        a : hashable
+            node a
+        b : hashable
+            node b
+        wstd : string
+            wireless standard
+        kwargs : link parameters (see pylayers.util.pyutil.hashkey)
+
+        Returns
+        -------
+
+        key : tuple
+            (n1, n2, wstd, parameter hash), (n1, n2) is sorted when the
+            cache is reciprocal
+
+        """
+        if self.reciprocal and (repr(b) < repr(a)):
+            a, b = b, a
+        return (a, b, wstd, pyu.hashkey(**kwargs))
+
+    def put(self, a, b, rays=None, H=None, wstd='', **kwargs):
+        """ store the link a -> b
+
+        Parameters
+        ----------
+
+        a : hashable
+            node a (transmitter)
+        b : hashable
+            node b (receiver)
+        rays : Rays or None
+        H : Tchannel or None
+        wstd : string
+        kwargs : link parameters (see pylayers.util.pyutil.hashkey)
+
+        """
+        key = self.key(a, b, wstd, **kwargs)
+        self.lru.pop(key, None)
+        self.lru[key] = (a, rays, H)
+        while len(self.lru) > self.maxsize:
+            self.lru.popitem(last=False)
+
+    def get(self, a, b, wstd='', fun=None, **kwargs):
+        """ get the link a -> b
+
+        Parameters
+        ----------
+
+        a : hashable
+            node a (transmitter)
+        b : hashable
+            node b (receiver)
+        wstd : string
+        fun : callable or None
+            fun(a, b) returns the tuple (rays, H) of a missing link,
+            which is then stored
+        kwargs : link parameters (see pylayers.util.pyutil.hashkey)
+
+        Returns
+        -------
+
+        (rays, H) : tuple
+            rays in the direction a -> b (geometry only when served by
+            reciprocity, see Rays.reciprocal) and Tchannel, or None if
+            the link is missing and fun is None
+
+        """
+        key = self.key(a, b, wstd, **kwargs)
+        if key in self.lru:
+            self.lru.move_to_end(key)
+            na, rays, H = self.lru[key]
+            if na == a:
+                self.ndir += 1
+                return rays, H
+            self.nrec += 1
+            if rays is not None:
+                rays = rays.reciprocal()
+            if H is not None:
+                H = H.reciprocal()
+            return rays, H
+        self.nmiss += 1
+        if fun is None:
+            return None
+        rays, H = fun(a, b)
+        self.put(a, b, rays=rays, H=H, wstd=wstd, **kwargs)
+        return rays, H
+
+    def invalidate(self, n):
+        """ remove the links of a node
+
+        Parameters
+        ----------
+
+        n : hashable
+            node (e.g. a node which has moved)
+
+        Returns
+        -------
+
+        nrm : int
+            number of removed links
+
+        """
+        lk = [k for k in self.lru if (k[0] == n) or (k[1] == n)]
+        for k in lk:
+            del self.lru[k]
+        return len(lk)
+
+    def clear(self):
+        """ remove all the links and reset the counters
+        """
+        self.lru.clear()
+        self.ndir = 0
+        self.nrec = 0
+        self.nmiss = 0
@@ -898,12 +898,13 @@ def Losst(L,fGHz,p1,p2,dB=True,bceilfloor=False):
         Nlink = 1
 
     # determine incidence angles on segment crossing p1-p2 segment
-    logger.debug('losst before angleonlink3')
-    data = L.angleonlink3(p1,p2)
+    logger.debug('losst before angleonlinks')
+    indptr, data = L.angleonlinks(np.asarray(p1).T,np.asarray(p2).T)
+    ilink = np.repeat(np.arange(len(indptr)-1),np.diff(indptr))
 
     # as many slabs as segments and subsegments
-    us = data['s']
-    slabs = np.array([ L.Gs.nodes[x]['name'] for x in us ])
+    lname = np.array([ L.Gs.nodes[x]['name'] for x in L.tsg ])
+    slabs = lname[data['k']]
 
 
     #slabs = L.sla[us]
@@ -939,21 +940,19 @@ def Losst(L,fGHz,p1,p2,dB=True,bceilfloor=False):
         # calculate Excess delay for slab slname
         #
         do , dp  = L.sl[slname].excess_grdelay(theta=data['a'][u])
-        # data['i'][u] links number
-        indexu = data['i'][u]
+        # ilink[u] links number
+        indexu = ilink[u]
         # reduce to involved links
+        # (indexu is sorted : the crossings of a link are contiguous)
         involved_links, indices = np.unique(indexu,return_index=True)
-        indicep = np.hstack((indices[1:],np.array([len(indexu)])))
-        # range on involved links
-        irange = np.arange(len(involved_links))
         #
         # sum contribution of slab of a same link
         #
-        Wallo = np.array([ np.sum(lko[:,indices[x]:indicep[x]],axis=1) for x in irange ] ).T
-        Wallp = np.array([ np.sum(lkp[:,indices[x]:indicep[x]],axis=1) for x in irange ] ).T
+        Wallo = np.add.reduceat(lko,indices,axis=1)
+        Wallp = np.add.reduceat(lkp,indices,axis=1)
 
-        Edo = np.array([np.sum(do[indices[x]:indicep[x]]) for x in irange]).T
-        Edp = np.array([np.sum(dp[indices[x]:indicep[x]]) for x in irange]).T
+        Edo = np.add.reduceat(do,indices)
+        Edp = np.add.reduceat(dp,indices)
 
         LossWallo[:,involved_links] = LossWallo[:,involved_links] + Wallo
         LossWallp[:,involved_links] = LossWallp[:,involved_links] + Wallp
@@ -1043,7 +1042,6 @@ def Losst(L,fGHz,p1,p2,dB=True,bceilfloor=False):
         LossWallo = 10**(-LossWallo/10)
         LossWallp = 10**(-LossWallp/10)
 
-    print(LossWallo)
     return(LossWallo,LossWallp,EdWallo,EdWallp)
 
 def gaspl(d,fGHz,T,PhPa,wvden):
@@ -37,10 +37,13 @@ import pylayers.util.pyutil as pyu
 from pylayers.util.project import *
 from pylayers.antprop.interactions import *
 from pylayers.antprop.slab import *
-from pylayers.antprop.channel import Ctilde
+from pylayers.antprop.chainprod import chainprod
+from pylayers.antprop.channel import Ctilde, Tchannel
+import pylayers.antprop.antenna as ant
 from pylayers.gis.layout import Layout
 import pylayers.signal.bsignal as bs
 import shapely.geometry as shg
+import matplotlib.path as mpath
 import h5py
 import operator
 
@@ -109,6 +112,9 @@ class Rays(PyLayers, dict):
     the local basis are evaluated along those rays. This is
     done through the **locbas** method
 
+    Before locbas, the rays whose amplitude upper bound lies outside a
+    given dynamic range can be removed with the **prune** method.
+
     Once the local basis have been calculated the different
     interactions along rays can be informed via the **fillinter**
     method.
@@ -506,21 +512,183 @@ class Rays(PyLayers, dict):
         #     return self.eval(self.fGHz)
 
 
+    def _storetables(self):
+        """ tables of the rays for a RayStore entry
+
+        Returns
+        -------
+
+        tables : dict
+            'rays'  : pTx, pRx, los, is3D    (one row)
+            'ray'   : nint, dis              (one row per ray)
+            'inter' : pt, sig                (one row per interaction)
+
+        Notes
+        -----
+
+        Rays are written group after group in the order of self.keys(),
+        the interactions of a ray are contiguous. For 3D rays the Tx and
+        Rx terminations are not stored.
+
+        """
+        ndim = 3 if self.is3D else 2
+        lnint = [np.zeros(0, dtype=int)]
+        ldis = [np.zeros(0)]
+        lpt = [np.zeros((0, ndim))]
+        lsig = [np.zeros((0, 2), dtype=int)]
+        for k in self.keys():
+            pt = self[k]['pt']
+            sig = self[k]['sig']
+            if self.is3D:
+                pt = pt[:, 1:-1, :]
+                sig = sig[:, 1:-1, :]
+            nr = np.shape(sig)[2]
+            lnint.append(k * np.ones(nr, dtype=int))
+            if 'dis' in self[k]:
+                ldis.append(self[k]['dis'] * np.ones(nr))
+            else:
+                ldis.append(np.zeros(nr))
+            # (i x r) -> (r x i) rows
+            lpt.append(pt.transpose(2, 1, 0).reshape(-1, ndim))
+            lsig.append(sig.transpose(2, 1, 0).reshape(-1, 2))
+        tables = {'rays': {'pTx': np.array(self.pTx, dtype=float)[None, :],
+                           'pRx': np.array(self.pRx, dtype=float)[None, :],
+                           'los': np.array([self.los]),
+                           'is3D': np.array([self.is3D])},
+                  'ray': {'nint': np.concatenate(lnint),
+                          'dis': np.concatenate(ldis)},
+                  'inter': {'pt': np.concatenate(lpt),
+                            'sig': np.concatenate(lsig).astype(int)}}
+        return tables
+
+    def savestore(self, store, ida, idb, wstd='', t=0.):
+        """ append the rays to a columnar store
+
+        Parameters
+        ----------
+
+        store : RayStore
+        ida : string
+            node a identifier
+        idb : string
+            node b identifier
+        wstd : string
+            wireless standard
+        t : float
+            time (s)
+
+        Returns
+        -------
+
+        ie : int
+            entry index in store
+
+        See Also
+        --------
+
+        loadstore
+        pylayers.antprop.raystore.RayStore
+
+        """
+        return store.append(ida, idb, wstd, t, **self._storetables())
+
+    def loadstore(self, store, ie):
+        """ load rays from a columnar store
+
+        Parameters
+        ----------
+
+        store : RayStore
+        ie : int
+            entry index (see RayStore.query)
+
+        Notes
+        -----
+
+        Only the geometry of the rays is restored (pt, sig and for 3D
+        rays vsi, si, dis, rayidx and delays), locbas and fillinter
+        have to be applied again.
+
+        """
+        d = store.read(ie, 'rays')
+        self.pTx = d['pTx'][0]
+        self.pRx = d['pRx'][0]
+        self.los = bool(d['los'][0])
+        self.is3D = bool(d['is3D'][0])
+        r = store.read(ie, 'ray')
+        inter = store.read(ie, 'inter')
+        nint = r['nint']
+        off = np.hstack((0, np.cumsum(nint)))
+        # groups in their save order
+        lk, ik = np.unique(nint, return_index=True)
+        lk = lk[np.argsort(ik)]
+        self.nray = 0
+        val = 0
+        for k in lk:
+            u = np.where(nint == k)[0]
+            # iu : r x i
+            iu = off[u][:, None] + np.arange(k)[None, :]
+            pt = inter['pt'][iu].transpose(2, 1, 0)
+            sig = inter['sig'][iu].transpose(2, 1, 0)
+            nr = len(u)
+            if self.is3D:
+                Tx = self.pTx.reshape(3, 1, 1) * np.ones((1, 1, nr))
+                Rx = self.pRx.reshape(3, 1, 1) * np.ones((1, 1, nr))
+                pt = np.hstack((Tx, pt, Rx))
+                z = np.zeros((2, 1, nr), dtype=int)
+                sig = np.hstack((z, sig, z))
+            self[k] = {'pt': pt, 'sig': sig}
+            if self.is3D:
+                v = pt[:, 1:, :] - pt[:, 0:-1, :]
+                lsi = np.sqrt(np.sum(v*v, axis=0))
+                self[k]['vsi'] = v/lsi
+                self[k]['si'] = lsi
+                self[k]['dis'] = np.sum(lsi, axis=0)
+                self[k]['nbrays'] = nr
+                self[k]['rayidx'] = np.arange(nr) + val
+                val = val + nr
+                self.nray = self.nray + nr
+        if self.is3D:
+            self.delays = np.zeros((self.nray))
+            for k in self.keys():
+                self.delays[self[k]['rayidx']] = self[k]['dis']/0.3
+
     def reciprocal(self):
         """ switch tx and rx
 
+        Returns
+        -------
+
+        r : Rays
+            the same rays travelled from rx to tx. The geometry of 3D
+            rays (pt, sig, si, vsi, dis, rayidx) is reversed, so that
+            locbas, fillinter and eval can be applied to r. Each ray
+            keeps its index.
+
         """
 
         r = Rays(self.pRx,self.pTx)
         r.is3D = self.is3D
         r.nray = self.nray
+        r.los = self.los
         r.origin_sig_name = self.origin_sig_name
         r.nb_origin_sig = self.nb_origin_sig
+        for attr in ['nray2D', 'Lfilename', 'filename']:
+            if hasattr(self, attr):
+                setattr(r, attr, getattr(self, attr))
+        if hasattr(self, 'delays'):
+            r.delays = self.delays.copy()
 
         for k in self:
             r[k]={}
             r[k]['pt']=self[k]['pt'][:,::-1,:]
             r[k]['sig']=self[k]['sig'][:,::-1,:]
+            if 'si' in self[k]:
+                r[k]['si'] = self[k]['si'][::-1,:]
+                r[k]['vsi'] = -self[k]['vsi'][:,::-1,:]
+                r[k]['dis'] = self[k]['dis']
+                r[k]['rayidx'] = self[k]['rayidx']
+                r[k]['nbrays'] = self[k]['nbrays']
         return(r)
 
 
@@ -1121,9 +1289,9 @@ class Rays(PyLayers, dict):
         #
         # heights of transmitter and receiver
         #
-        if za == []:
+        if isinstance(za, list):
             za=self.pTx[2]
-        if zb == []:
+        if isinstance(zb, list):
             zb=self.pRx[2]
         ht = za
         hr = zb
@@ -1250,16 +1418,11 @@ class Rays(PyLayers, dict):
             # array of cumulative distance of 2D ray
             al1 = np.cumsum(si, axis=0)
 
-            # initialize parameterization parameter alpha
-            self[i]['alpha'] = np.zeros(np.shape(si[:-1, :]))
-
-            for j in range(len(self[i]['alpha'][:, 0])):
-                # get alpha
-                self[i]['alpha'][j, :] = np.sum(si[0:j+1, :], axis=0) \
-                        /np.sum(si, axis=0)
-                # get z coordinate
-                self[i]['pt'][2, j, :] = tx[2] + self[i]['alpha'][j, :] \
-                    * (rx[2] - tx[2])
+            # parameterization parameter alpha  (i x r)
+            self[i]['alpha'] = al1[:-1, :] / al1[-1, :]
+            # z coordinate (no interaction point for the LOS ray)
+            if len(self[i]['alpha']) > 0:
+                self[i]['pt'][2, :, :] = tx[2] + self[i]['alpha'] * (rx[2] - tx[2])
 
         #
         #  Phase 3 : Initialize 3D rays dictionnary
@@ -1270,6 +1433,19 @@ class Rays(PyLayers, dict):
         r3d.nray2D = len(self)
         r3d.nb_origin_sig = self.nb_origin_sig
         #
+        # contour of the outdoor cycles : one compound path (the cycles do
+        # not overlap), built at the first ceil reflexion
+        #
+        pout = None
+        #
+        # iso segments : sorted sub-segments and their z interval, and
+        # diffraction points involving sub-segments
+        #
+        if len(L.lsss)>0:
+            lsss = np.sort(np.array(L.lsss))
+            zsss = np.array([L.Gs.nodes[x]['z'] for x in lsss]).reshape(-1, 2)
+            lnss = np.array(L.lnss, dtype=int)
+        #
         # Phase 4 : Fill 3D rays information
         #
         # Two nested loops
@@ -1320,6 +1496,8 @@ class Rays(PyLayers, dict):
 
             # extension
             for l in d:                     # for each vertical pattern (C,F,CF,FC,....)
+                # 2D signature of the rays of this vertical pattern
+                sig2d = sigsave
                 #print k,l,d[l]
                 Nint = len(d[l])            # number of additional interaction
                 #if ((k==1) & (l==5.0)):print
@@ -1425,21 +1603,21 @@ class Rays(PyLayers, dict):
                     # Antrieurement il y avait une hypothese de succession
                     # immediate d'un point 2D renseigne.
                     #
-                    try:
-                        iintm_f = [ np.where( (siges[1,0:x[0],x[1]]!=4) &
-                                             (siges[1,0:x[0],x[1]]!=5))[0][-1]
-                                   for x in  zip(iint_f,iray_f) ]
-                        iintp_f = [ np.where( (siges[1,x[0]:,x[1]]!=4) &
-                                             (siges[1,x[0]:,x[1]]!=5))[0][0]+x[0]
-                                   for x in  zip(iint_f,iray_f) ]
-                        iintm_c = [ np.where( (siges[1,0:x[0],x[1]]!=4) &
-                                             (siges[1,0:x[0],x[1]]!=5))[0][-1]
-                                   for x in zip(iint_c,iray_c) ]
-                        iintp_c = [ np.where( (siges[1,x[0]:,x[1]]!=4) &
-                                             (siges[1,x[0]:,x[1]]!=5))[0][0]+x[0]
-                                   for x in  zip(iint_c,iray_c) ]
-                    except:
-                        pdb.set_trace()
+                    # cf : ceil or floor interaction  ((Nint+k+2) x Nrayk)
+                    # iprev : index of the last point <= i which is not
+                    #         a ceil or floor point
+                    # inext : index of the first point >= i which is not
+                    #         a ceil or floor point
+                    # Tx and Rx are never ceil or floor points
+                    cf = (siges[1, :] == 4) | (siges[1, :] == 5)
+                    ii = np.arange(cf.shape[0])[:, None]
+                    iprev = np.maximum.accumulate(np.where(cf, -1, ii), axis=0)
+                    inext = np.minimum.accumulate(np.where(cf, cf.shape[0], ii)[::-1],
+                                                  axis=0)[::-1]
+                    iintm_f = iprev[iint_f, iray_f]
+                    iintp_f = inext[iint_f, iray_f]
+                    iintm_c = iprev[iint_c, iray_c]
+                    iintp_c = inext[iint_c, iray_c]
 
                     # Update coordinate in the horizontal plane
                     #
@@ -1518,87 +1696,53 @@ class Rays(PyLayers, dict):
                 #
                 #   ptes (3 x i+2 x r )
                 if len(L.lsss)>0:
-                    #
-                    # lsss : list of sub segments ( iso segments siges)
-                    # lnss : list of diffaction point involving
-
-                    lsss = np.array(L.lsss)
-                    lnss = np.array(L.lnss)
-
                     # array of structure element (nstr) with TxRx extension  (nstr=0)
                     anstr = siges[0,:,:]
                     # type of interaction
                     typi = siges[1,:,:]
 
-                    # lss : list of subsegments in the current signature
-                    #
-                    # scalability : avoid a loop over all the subsegments in lsss
                     #
-                    lss = [ x for x in lsss if x in anstr.ravel()]
-
-                    ray_to_delete = []
-                    for s in lss:
-                        u  = np.where(anstr==s)
-                        if len(u)>0:
-                            zs = ptees[2,u[0],u[1]]
-                            zinterval = L.Gs.nodes[s]['z']
-                            unot_in_interval = ~((zs<=zinterval[1]) & (zs>=zinterval[0]))
-                            ray_to_delete.extend(u[1][unot_in_interval])
-
-                    # lns : list of diffraction points in the current signature
-                    #       with involving multi segments (iso)
-                    # scalability : avoid a loop over all the points in lnss
+                    # interactions on a sub-segment : the ray is deleted
+                    # if the interaction height is out of the z interval
+                    # of the sub-segment
                     #
-                    lns = [ x for x in lnss if x in anstr.ravel()]
+                    u = np.where(np.isin(anstr, lsss))
+                    zs = ptees[2,u[0],u[1]]
+                    zinterval = zsss[np.searchsorted(lsss, anstr[u])]
+                    unot_in_interval = ~((zs<=zinterval[:,1]) & (zs>=zinterval[:,0]))
+                    ray_to_delete = list(u[1][unot_in_interval])
 
                     #
-                    # loop over multi diffraction points
+                    # loop over the multi diffraction points of the current
+                    # signatures
                     #
-
-                    for npt in lns:
-                        # diffraction cornet in espoo.lay
-                        #if npt==-225:
-                        #    import ipdb
-                        #    ipdb.set_trace()
-
+                    for npt in np.intersect1d(lnss, anstr):
                         u  = np.where(anstr==npt)
-                        if len(u)>0:
-                           # height of the diffraction point
-                            zp = ptees[2,u[0],u[1]]
-
-                            #
-                            # At which couple of segments belongs this height ?
-                            # get_diffslab function answers that question
-                            #
-
-                            ltu_seg,ltu_slab = L.get_diffslab(npt,zp)
-
-                            #
-                            # delete rays where diffraction point is connected to
-                            # 2 AIR segments
-                            #
-                            # print(type(ltu_slab))
-                            vals = list(ltu_slab)
-                            [ray_to_delete.append(u[1][i]) for i in range(len(zp))
-                            if ((vals[i][0]=='AIR') & (vals[i][1]=='AIR'))]
-                            # [ray_to_delete.append(u[1][i]) for i in range(len(zp))
-                            # if ((ltu_slab[i][0]=='AIR') & (ltu_slab[i][1]=='AIR'))]
-                            # #zinterval = L.Gs.nodes[s]['z']
-                            # # if (zs<=zinterval[1]) & (zs>=zinterval[0]):
-                            # if ((tu_slab[0]!='AIR') & (tu_slab[1]!='AIR')):
-                            #     #print(npt , zp)
-                            #     pass
-                            # else:
-                            #     ray_to_delete.append(u[1][0])
-
-                    # # nstr : structure number
-                    # nstr  = np.delete(nstr,ray_to_delete,axis=1)
-                    # typi : type of interaction
-                    typi  = np.delete(typi,ray_to_delete,axis=1)
-                    # 3d sequence of points
-                    ptees = np.delete(ptees,ray_to_delete,axis=2)
-                    # extended (floor/ceil) signature
-                    siges = np.delete(siges,ray_to_delete,axis=2)
+                        # height of the diffraction point
+                        zp = ptees[2,u[0],u[1]]
+
+                        #
+                        # At which couple of segments belongs this height ?
+                        # get_diffslab function answers that question
+                        #
+
+                        ltu_seg,ltu_slab = L.get_diffslab(int(npt),zp)
+
+                        #
+                        # delete rays where diffraction point is connected to
+                        # 2 AIR segments
+                        #
+                        vals = list(ltu_slab)
+                        ray_to_delete.extend([u[1][i] for i in range(len(zp))
+                                              if ((vals[i][0]=='AIR') & (vals[i][1]=='AIR'))])
+
+                    if len(ray_to_delete)>0:
+                        # typi : type of interaction
+                        typi  = np.delete(typi,ray_to_delete,axis=1)
+                        # 3d sequence of points
+                        ptees = np.delete(ptees,ray_to_delete,axis=2)
+                        # extended (floor/ceil) signature
+                        siges = np.delete(siges,ray_to_delete,axis=2)
 
                 if rmoutceilR:
                     # 1 determine Ceil reflexion index
@@ -1606,18 +1750,14 @@ class Rays(PyLayers, dict):
                     uc = np.where(siges[1,:,:]==5)
                     ptc = ptees[:,uc[0],uc[1]]
                     if len(uc[0]) !=0:
-                        P = shg.MultiPoint(ptc[:2,:].T)
-                        # to determine the cycle where ceil reflexions append
-                        # uinter(nb pt x nb cycles)
-                        mapnode = list(L.Gt.nodes())
-                        uinter = np.array([[L.Gt.nodes[x]['polyg'].contains(p) for x in mapnode if x>0] for p in P])
-                        # import ipdb
-                        # ipdb.set_trace()
-                        #[plt.scatter(p.xy[0],p.xy[1],c='r') for up,p in enumerate(P) if uinter[0,up]]
-                        #[ plt.scatter(p.xy[0],p.xy[1],c='r') for up,p in enumerate(P) if uinter[0,up]]
-                        # find points are indoor/outdoor cycles
-                        upt,ucy = np.where(uinter)
-                        uout = np.where([not L.Gt.nodes[mapnode[u+1]]['indoor'] for u in ucy])[0] #ucy+1 is to manage cycle 0
+                        # 2 determine the ceil reflexion points which are
+                        # in outdoor cycles
+                        if pout is None:
+                            pout = mpath.Path.make_compound_path(*[
+                                mpath.Path(np.array(L.Gt.nodes[cy]['polyg'].exterior.coords))
+                                for cy in L.Gt.nodes()
+                                if (cy > 0) and (not L.Gt.nodes[cy]['indoor']) ])
+                        uout = np.where(pout.contains_points(ptc[:2, :].T))[0]
                         # 3 remove ceil reflexions of outdoor cycles
                         if len(uout)>0:
                             # print(f"rafael : {ptees}, {uc[1][uout]}")
@@ -1625,19 +1765,20 @@ class Rays(PyLayers, dict):
                             siges = np.delete(siges,uc[1][uout],axis=2)
                             #sigsave = np.delete(sigsave,uc[1][uout],axis=2)
                             # RSM
-                            if not sigsave.any():
-                                sigsave = np.delete(sigsave,uc[1][uout],axis=2)
+                            if not sig2d.any():
+                                sig2d = np.delete(sig2d,uc[1][uout],axis=2)
 
+                # the blocks of a group are stacked once (see below)
                 if k+Nint in r3d:
-                    r3d[k+Nint]['pt']  = np.dstack((r3d[k+Nint]['pt'], ptees))
-                    r3d[k+Nint]['sig'] = np.dstack((r3d[k+Nint]['sig'], siges))
-                    r3d[k+Nint]['sig2d'].append(sigsave)
+                    r3d[k+Nint]['pt'].append(ptees)
+                    r3d[k+Nint]['sig'].append(siges)
+                    r3d[k+Nint]['sig2d'].append(sig2d)
                 else:
                     if ptees.shape[2]!=0:
                         r3d[k+Nint] = {}
-                        r3d[k+Nint]['pt'] = ptees
-                        r3d[k+Nint]['sig'] = siges
-                        r3d[k+Nint]['sig2d'] = [sigsave]
+                        r3d[k+Nint]['pt'] = [ptees]
+                        r3d[k+Nint]['sig'] = [siges]
+                        r3d[k+Nint]['sig2d'] = [sig2d]
                 # ax=plt.gca()
                 # uu = np.where(ptees[2,...]==3.0)
                 # ax.plot(ptees[0,uu[0],uu[1]],ptees[1,uu[0],uu[1]],'ok')
@@ -1668,6 +1809,8 @@ class Rays(PyLayers, dict):
         val =0
 
         for k in r3d.keys():
+            r3d[k]['pt'] = np.dstack(r3d[k]['pt'])
+            r3d[k]['sig'] = np.dstack(r3d[k]['sig'])
             nrayk = np.shape(r3d[k]['sig'])[2]
             r3d[k]['nbrays'] = nrayk
             r3d[k]['rayidx'] = np.arange(nrayk)+val
@@ -1867,6 +2010,201 @@ class Rays(PyLayers, dict):
                 dk[k] = d2
         return(dk)
 
+    def powerbound(self, L, fGHz=np.array([2.4]), rttol=1e-4):
+        """ upper bound of the ray amplitudes
+
+        Parameters
+        ----------
+
+        L : Layout
+        fGHz : np.array
+            frequency in GHz
+        rttol : float
+            error bound of the slab R/T tables (see SlabDB.rttable)
+
+        Returns
+        -------
+
+        ab : np.array (nray,)
+            upper bound over frequencies and polarizations of the
+            magnitude of the ray transfer matrix (1/m)
+
+        Notes
+        -----
+
+        The bound is the free space spreading 1/d of the ray times the
+        product of the bounds of its interactions. It only needs the
+        geometry of the 3D rays and can be evaluated before locbas.
+
+        + reflection, transmission : largest magnitude of the tabulated
+          coefficient of the slab over the band and the polarizations,
+          on the table interval containing the incidence angle, plus the
+          table error.
+        + diffraction : 2 sqrt(si sd/(si+sd)), each of the four terms of
+          the UTD coefficient is bounded by its shadow boundary value
+          0.5 sqrt(si sd/(si+sd)).
+        + subsegments : 1
+
+        """
+        assert self.is3D, "powerbound : 3D rays are required (see to3D)"
+        fGHz = np.asarray(fGHz, dtype=float).ravel()
+        nsmax = max(L.Gs.nodes.keys())
+        # (slab name, 'R'|'T') : (table angles, bound per angle interval)
+        denv = {}
+
+        def rtbound(name, key, th):
+            if (name, key) not in denv:
+                tab = L.sl.rttable(name, fGHz, tol=rttol)
+                prof = np.abs(getattr(tab, key)).max(axis=(1, 2))
+                env = np.maximum(prof[:-1], prof[1:]) + tab.err
+                env[tab.bad] = 1.
+                denv[(name, key)] = (tab.theta, env)
+            theta, env = denv[(name, key)]
+            i0 = np.searchsorted(theta, th, side='right') - 1
+            return env[np.clip(i0, 0, len(env) - 1)]
+
+        ab = np.zeros(self.nray)
+        for k in self:
+            a = 1. / self[k]['dis']
+            if k != 0:
+                # nstr, ityp : i x r
+                nstr = self[k]['sig'][0, 1:-1, :]
+                ityp = self[k]['sig'][1, 1:-1, :]
+                si = self[k]['si']
+                # incoming direction : 3 x i x r
+                vin = self[k]['vsi'][:, :-1, :]
+                g = np.ones(ityp.shape)
+
+                u = np.where(ityp == 1)
+                sin, sout = si[:-1, :][u], si[1:, :][u]
+                g[u] = 2 * np.sqrt(sin * sout / (sin + sout))
+
+                for typ, key in [(2, 'R'), (3, 'T'), (4, 'R'), (5, 'R')]:
+                    if typ in [2, 3]:
+                        u = np.where((ityp == typ) & (nstr <= nsmax))
+                        if len(u[0]) == 0:
+                            continue
+                        us, inv = np.unique(nstr[u], return_inverse=True)
+                        names = np.array([L.Gs.nodes[s]['name'] for s in us])
+                        norm = np.array([L.Gs.nodes[s]['norm'] for s in us])
+                        names = names[inv]
+                        cth = np.sum(norm[inv].T * vin[:, u[0], u[1]], axis=0)
+                    else:
+                        u = np.where(ityp == typ)
+                        if len(u[0]) == 0:
+                            continue
+                        names = np.array(['FLOOR', 'CEIL'][typ - 4])
+                        names = np.repeat(names, len(u[0]))
+                        cth = vin[2, u[0], u[1]]
+                    th = np.arccos(np.minimum(np.abs(cth), 1.))
+                    gu = np.empty(len(th))
+                    for name in np.unique(names):
+                        um = names == name
+                        gu[um] = rtbound(name, key, th[um])
+                    g[u] = gu
+                a = a * np.prod(g, axis=0)
+            ab[self[k]['rayidx']] = a
+        return ab
+
+    def prune(self, L, fGHz=np.array([2.4]), drange=60., ref='los',
+              rttol=1e-4):
+        """ remove the rays which cannot reach the dynamic range
+
+        Parameters
+        ----------
+
+        L : Layout
+        fGHz : np.array
+            frequency in GHz
+        drange : float
+            dynamic range (dB)
+        ref : string
+            'los' : free space amplitude between pTx and pRx
+            'max' : largest ray amplitude bound
+        rttol : float
+            error bound of the slab R/T tables
+
+        Returns
+        -------
+
+        report : dict
+            nray : number of rays before pruning
+            npruned : number of removed rays
+            ref : reference amplitude (1/m)
+            Emax : upper bound of the energy of the removed rays (1/m2)
+            EmaxdB : Emax relative to the reference energy (dB)
+
+        Notes
+        -----
+
+        A ray is removed if the upper bound of its amplitude (see
+        powerbound) is more than drange dB below the reference. The
+        pruning has to be applied on the 3D rays, before locbas. The
+        remaining rays are renumbered and the report is kept in
+        self.pruned.
+
+        Examples
+        --------
+
+        >>> from pylayers.gis.layout import Layout
+        >>> from pylayers.antprop.signature import Signatures
+        >>> L = Layout('defstr.lay')
+        >>> L.build()
+        >>> S = Signatures(L,1,2)
+        >>> S.run(cutoff=3,progress=False)
+        >>> tx = np.r_[L.Gt.pos[1],1.2]
+        >>> rx = np.r_[L.Gt.pos[2]+0.3,1.5]
+        >>> r3d = S.raysv(tx,rx).to3D(L)
+        >>> nray = r3d.nray
+        >>> report = r3d.prune(L,fGHz=np.arange(2,6,0.5),drange=30)
+        >>> print(report['nray'] == nray, report['npruned'] > 0)
+        True True
+        >>> r3d.locbas(L)
+        >>> r3d.fillinter(L)
+
+        """
+        assert self.is3D, "prune : 3D rays are required (see to3D)"
+        assert not self.isbased, "prune : must be applied before locbas"
+        ab = self.powerbound(L, fGHz=fGHz, rttol=rttol)
+        if ref == 'los':
+            aref = 1. / np.sqrt(np.sum((self.pTx - self.pRx)**2))
+        else:
+            aref = ab.max() if len(ab) > 0 else 1.
+        keep = ab >= aref * 10**(-drange / 20.)
+
+        nray = self.nray
+        val = 0
+        for k in list(self.keys()):
+            u = keep[self[k]['rayidx']]
+            if not u.any():
+                del self[k]
+                continue
+            for key in ['pt', 'sig', 'vsi']:
+                if key in self[k]:
+                    self[k][key] = self[k][key][:, :, u]
+            self[k]['si'] = self[k]['si'][:, u]
+            self[k]['dis'] = self[k]['dis'][u]
+            nrayk = np.sum(u)
+            self[k]['nbrays'] = nrayk
+            self[k]['rayidx'] = np.arange(nrayk) + val
+            val = val + nrayk
+        self.nray = val
+        self.los = 0 in self
+        self.delays = np.zeros(self.nray)
+        for k in self:
+            self.delays[self[k]['rayidx']] = self[k]['dis'] / 0.3
+
+        Emax = np.sum(ab[~keep]**2)
+        with np.errstate(divide='ignore'):
+            EmaxdB = 10 * np.log10(Emax / aref**2)
+        self.pruned = {'nray': nray,
+                       'npruned': nray - self.nray,
+                       'drange': drange,
+                       'ref': aref,
+                       'Emax': Emax,
+                       'EmaxdB': EmaxdB}
+        return self.pruned
+
     def simplify(self):
         if not self.is3D:
             return None
@@ -1957,6 +2295,8 @@ class Rays(PyLayers, dict):
 
         # list of used wedges
         luw=[]
+        # wedges already handled  nstr : (position, segment points, slabs)
+        dwedge = {}
 
         lgi = list(self.keys())
         lgi.sort()
@@ -2256,32 +2596,29 @@ class Rays(PyLayers, dict):
 
                     # diffseg,udiffseg  = np.unique(nstr[udiff],return_inverse=True)
                     diffupt=nstr[udiff]
-                    # position of diff seg (- because iupnt accept > 0 reference to points)
-                    #
-                    # TO BE FIXED
-                    #
-                    #ptdiff = L.pt[:,L.iupnt[-diffupt]]
-                    ptdiff = np.array([ (L.Gs.pos[x][0],L.Gs.pos[x][1])  for x in diffupt ]).T
 
                     self[k]['diffidx'] = idx[udiff[0],udiff[1]]
-                    # get tail head position of seg associated to diff point
+                    #
+                    # wedge geometry is evaluated once per diffraction point
+                    #
+                    # position of diff point, tail head position of the 2
+                    # segments associated to diff point and their slabs
+                    #
                     lair = L.name['AIR'] + L.name['_AIR']
-                    #aseg = map(lambda x : filter(lambda y : y not in lair,
-                    #                     nx.neighbors(L.Gs,x)),
-                    #                     diffupt)
-
-                    aseg = [ [ y for y in nx.neighbors(L.Gs,x) if y not in lair ] for x in diffupt ]
-
-                    #manage flat angle : diffraction by flat segment e.g. door limitation)
-                    [aseg[ix].extend(x) for ix,x in enumerate(aseg) if len(x)==1]
-                    # get points positions
-                    #pdb.set_trace()
-                    pts = np.array([ L.seg2pts([x[0],x[1]]) for x in aseg ])
-
-                    #self[k]['diffslabs']=[str(L.sl[L.Gs.nodes[x[0]]['name']])+'_'
-                    #                    + str(L.sl[L.Gs.nodes[x[1]]['name']]]) for x in aseg]
-                    self[k]['diffslabs']=[ L.Gs.nodes[x[0]]['name']+'@'
-                                        +  L.Gs.nodes[x[1]]['name'] for x in aseg]
+                    udp,iudp = np.unique(diffupt,return_inverse=True)
+                    for x in udp:
+                        if x not in dwedge:
+                            aseg = [ y for y in nx.neighbors(L.Gs,x) if y not in lair ]
+                            #manage flat angle : diffraction by flat segment e.g. door limitation)
+                            if len(aseg)==1:
+                                aseg.extend(aseg)
+                            dwedge[x] = (np.array(L.Gs.pos[x][0:2]),
+                                         L.seg2pts([aseg[0],aseg[1]]),
+                                         L.Gs.nodes[aseg[0]]['name']+'@'
+                                         + L.Gs.nodes[aseg[1]]['name'])
+                    ptdiff = np.array([dwedge[x][0] for x in udp]).T[:,iudp]
+                    pts = np.array([dwedge[x][1] for x in udp])[iudp]
+                    self[k]['diffslabs'] = [dwedge[x][2] for x in udp[iudp]]
 
                     uwl = np.unique(self[k]['diffslabs']).tolist()
                     luw.extend(uwl)
@@ -2825,7 +3162,7 @@ class Rays(PyLayers, dict):
 
         self.filled = True
 
-    def eval(self,fGHz=np.array([2.4]),bfacdiv=False,ib=[]):
+    def eval(self,fGHz=np.array([2.4]),bfacdiv=False,ib=[],dtype=complex):
         """  field evaluation of rays
 
         Parameters
@@ -2834,6 +3171,10 @@ class Rays(PyLayers, dict):
         fGHz : array
             frequency in GHz
         ib : list of interactions block
+        dtype : np.dtype
+            complex type of the evaluation (complex or np.complex64).
+            np.complex64 halves the memory of the interaction and channel
+            arrays, the relative error on the ray amplitudes is about 1e-6.
 
         """
 
@@ -2846,7 +3187,9 @@ class Rays(PyLayers, dict):
         # core calculation of all interactions is done here
         #
 
-        self.I.eval(fGHz)
+        self.I.eval(fGHz,dtype=dtype)
+        # real type associated to dtype
+        rdtype = np.finfo(dtype).dtype
 
         # if np.isnan(self.I.I).any():
         #     pdb.set_trace()
@@ -2856,14 +3199,14 @@ class Rays(PyLayers, dict):
         #pdb.set_trace()
 
         # 1 x i x 3 x 3
-        B  = self.B.data[np.newaxis,...]
+        B  = self.B.data[np.newaxis,...].astype(rdtype)
         B  = B.swapaxes(2,3)
         # 1 x r x 3 x 3
-        B0 = self.B0.data[np.newaxis,...]
+        B0 = self.B0.data[np.newaxis,...].astype(rdtype)
         B0  = B0.swapaxes(2,3)
 
         # Ct : f x r x 3 x 3
-        Ct = np.zeros((self.I.nf, self.nray, 3, 3), dtype=complex)
+        Ct = np.zeros((self.I.nf, self.nray, 3, 3), dtype=dtype)
 
         # delays : ,r
         self.delays = np.zeros((self.nray))
@@ -2908,102 +3251,14 @@ class Rays(PyLayers, dict):
                 Bl = B[:, rrl, :, :].reshape(1, r, l, 3, 3)
                 # get the first unitary matrix B0l
                 B0l = B0[:,ir,:, :]
-                # get alpha
-                alpha = self.I.alpha[rrl].reshape(r, l,order='F')
-                # # get gamma
-                gamma = self.I.gamma[rrl].reshape(r, l,order='F')
-                # # get si0
-                si0 = self.I.si0[rrl].reshape(r, l,order='F')
-                # # get sout
-                sout = self.I.sout[rrl].reshape(r, l,order='F')
-
-                try:
-                    del Z
-                except:
-                    pass
-
-
-                #print "\nrays",ir
-                #print "-----------------------"
-                ## loop on all the interactions of ray with l interactions
-                for i in range(0, l):
-
-
-    ############################################
-    ##                # Divergence factor D
-    ###                 not yet implementented
-    ############################################
-#                    if i == 0:
-#                        pdb.set_trace()
-#                        D0 = 1./si0[:,1]
-#                        rho1 = si0[:,1]*alpha[:,i]
-#                        rho2 = si0[:,1]*alpha[:,i]*gamma[:,i]
-#                        D =np.sqrt(
-#                         ( (rho1 ) / (rho1 + sout[:,i]) )
-#                         *( (rho2) / (rho2 + sout[:,i])))
-#                        D=D*D0
-#                        rho1=rho1+(sout[:,i]*alpha[:,i])
-#                        rho2=rho2+(sout[:,i]*alpha[:,i]*gamma[:,i])
-#
-#   ##                     gerer le loss
-#                        if np.isnan(D).any():
-#                            p=np.nonzero(np.isnan(D))[0]
-#                            D[p]=1./sout[p,1]
-#                    else :
-#                        D=np.sqrt(
-#                         ( (rho1 ) / (rho1 + sout[:,i]) )
-#                         *( (rho2) / (rho2 + sout[:,i])))
-#
-#                        rho1=rho1+(sout[:,i]*alpha[:,i])
-#                        rho2=rho2+(sout[:,i]*alpha[:,i]*gamma[:,i])
-    ############################################
-
-                    #  A0  (X dot Y)
-                    #  |    |     |
-                    #  v    v     v
-                    ##########################
-                    ## B  # I  # B  # I  # B #
-                    ##########################
-                    #      \_____/   \______/
-                    #         |         |
-                    #       Atmp(i)   Atmp(i+1)
-                    #
-                    # Z=Atmp(i) dot Atmp(i+1)
-
-                    #X = A [:, :, i, :, :]
-                    #Y = Bl[:, :, i, :, :]
-                    # pdb.set_trace()
-                    if i == 0:
-                    ## First Basis added
-                        Atmp = A[:, :, i, :, :]
-                        B00 = B0l[:, :,  :, :]
-                        Z = np.sum(Atmp[..., :, :, np.newaxis]
-                                  *B00[..., np.newaxis, :, :], axis=-2)
-                    else:
-                        Atmp = A[:, :, i, :, :]
-                        BB = Bl[:, :, i-1, :, :]
-                        Ztmp = np.sum(Atmp[..., :, :, np.newaxis]
-                                  *BB[..., np.newaxis, :, :], axis=-2)
-
-
-                        Z = np.sum(Ztmp[..., :, :, np.newaxis]
-                                  *Z[..., np.newaxis, :, :], axis=-2)
-
-                    if i == l-1:
-                        BB = Bl[:, :, i, :, :]
-                        Z = np.sum(BB[..., :, :, np.newaxis]
-                                  *Z[..., np.newaxis, :, :], axis=-2)
-
-
-                # fill the C tilde MDA
-
-                Ct[:,ir, :, :] = Z[:, :, :, :]
-
+                # chain product of the interactions and spreading factor
                 #
-                if bfacdiv:
-                    Ct[:,ir, :, :] = Ct[:, ir, :, :]*1./(self[l]['dis'][np.newaxis, :, np.newaxis, np.newaxis])
-                else:
-                    Ct[:,ir, :, :] = Ct[:, ir, :, :]*1./(self[l]['dis'][np.newaxis, :, np.newaxis, np.newaxis])
+                #  B0 , A_0 , B_0 , A_1 , ... , A_{l-1} , B_{l-1}
+                #
+                # (see pylayers.antprop.chainprod)
+                #
+                idis = (1./self[l]['dis']).astype(rdtype)
+                Ct[:, ir, :, :] = chainprod(A, Bl[0], B0l[0], w=idis)
                 self.delays[ir] = self[l]['dis']/0.3
                 self.dis[ir] = self[l]['dis']
         #
@@ -3013,7 +3268,7 @@ class Rays(PyLayers, dict):
             Ct[:,0, :, :]= np.eye(3,3)[None,None,:,:]
             #self[0]['dis'] = self[0]['si'][0]
             # Fris
-            Ct[:,0, :, :] = Ct[:,0, :, :]*1./(self[0]['dis'][None, :, None, None])
+            Ct[:,0, :, :] = Ct[:,0, :, :]*(1./self[0]['dis']).astype(rdtype)[None, :, None, None]
             self.delays[0] = self[0]['dis']/0.3
             self.dis[0] = self[0]['dis']
 
@@ -3072,6 +3327,165 @@ class Rays(PyLayers, dict):
 
         return(Cn)
 
+    def evalblock(self, fGHz, nfb=64, a=[], b=[], Ta=np.eye(3), Tb=np.eye(3),
+                  Friis=True, mode='H', filename='', dtype=complex):
+        """ frequency blocked evaluation of the transmission channel
+
+        The frequency axis is split into blocks of nfb points. For each
+        block the rays are evaluated (Rays.eval), rotated in the antenna
+        frames (Ctilde.locbas) and the antennas are applied
+        (Ctilde.prop2tran). The antennas are evaluated once in the ray
+        directions and their patterns are sliced on the frequencies of each
+        block. Only the requested result is accumulated, hence the memory
+        of the interaction and propagation channel arrays is bounded by
+        the block size.
+
+        Parameters
+        ----------
+
+        fGHz : np.array (nf,)
+            frequency (GHz)
+        nfb : int
+            number of frequency points per block
+        a : Antenna
+            antenna a (default omni)
+        b : Antenna
+            antenna b (default omni)
+        Ta : np.array (3x3)
+            orientation of antenna a
+        Tb : np.array (3x3)
+            orientation of antenna b
+        Friis : boolean
+            apply the Friis factor
+        mode : string | None
+            'H' : ray transmission channel
+            'energy' : energy of each ray
+            'tf' : transfer function (sum over rays)
+            None : nothing is accumulated (filename should be given)
+        filename : string
+            if not '' the blocks of the ray transmission channel are
+            written into the dataset 'H' (nray x Nr x Nt x nf) of this hdf5
+            file, together with the datasets 'fGHz', 'tau', 'dod' and 'doa'
+        dtype : np.dtype
+            complex type of the evaluation (see Rays.eval)
+
+        Returns
+        -------
+
+        'H' : Tchannel (nray x Nr x Nt x nf)
+        'energy' : np.array (nray x Nr x Nt)
+            sum over frequency of the squared modulus of the ray transfer
+            function
+        'tf' : bs.FUsignal (Nr x Nt x nf)
+            sum over rays of the ray transfer functions. The channel impulse
+            response is obtained by inverse Fourier transform.
+
+        Examples
+        --------
+
+        >>> from pylayers.gis.layout import *
+        >>> from pylayers.antprop.signature import *
+        >>> L = Layout('defstr.lay')
+        >>> L.build()
+        >>> S = Signatures(L,1,2)
+        >>> S.run(cutoff=2,progress=False)
+        >>> tx = np.r_[np.array(L.Gt.pos[1]),1.2]
+        >>> rx = np.r_[np.array(L.Gt.pos[2]),1.5]
+        >>> r3d = S.raysv(tx,rx).to3D(L)
+        >>> r3d.locbas(L)
+        >>> r3d.fillinter(L)
+        >>> E = r3d.evalblock(np.linspace(2,11,1001),nfb=100,mode='energy')
+
+        """
+        assert mode in ['H', 'energy', 'tf', None], \
+            "evalblock : mode should be 'H', 'energy', 'tf' or None"
+        fGHz = np.asarray(fGHz, dtype=float).ravel()
+        nf = len(fGHz)
+        nfb = max(int(nfb), 1)
+
+        # the antenna patterns in the ray directions do not depend on the
+        # block, the antennas are evaluated once and their patterns sliced
+        # on the frequencies of each block
+        if a == []:
+            a = ant.Antenna('Omni', param={'pol': 't', 'GmaxdB': 0}, fGHz=fGHz)
+        if b == []:
+            b = ant.Antenna('Omni', param={'pol': 't', 'GmaxdB': 0}, fGHz=fGHz)
+
+        def _slice(F, fb):
+            uf = np.in1d(np.round(F[0]*100).astype(int),
+                         np.round(fb*100).astype(int))
+            return (F[0][uf], F[1][..., uf], F[2][..., uf])
+
+        f = None
+        res = None
+        lfGHz = []
+        try:
+            for k0 in range(0, nf, nfb):
+                fb = fGHz[k0:k0 + nfb]
+                C = self.eval(fb, dtype=dtype)
+                C.locbas(Ta=Ta, Tb=Tb)
+                if k0 == 0:
+                    a.eval(th=C.tangl[:, 0], ph=C.tangl[:, 1])
+                    Fa = (a.fGHz, a.Ft, a.Fp)
+                    b.eval(th=C.rangl[:, 0], ph=C.rangl[:, 1])
+                    Fb = (b.fGHz, b.Ft, b.Fp)
+                H = C.prop2tran(a=a, b=b, Friis=Friis,
+                                Fa=_slice(Fa, fb), Fb=_slice(Fb, fb))
+                # prop2tran keeps the frequencies common with the antennas
+                lfGHz.append(H.x)
+                y = H.y
+                nk = y.shape[-1]
+                if filename != '':
+                    if f is None:
+                        f = h5py.File(filename, 'w')
+                        dH = f.create_dataset('H', shape=y.shape[:-1] + (nf,),
+                                              dtype=y.dtype,
+                                              chunks=y.shape[:-1] + (nk,),
+                                              maxshape=y.shape[:-1] + (None,))
+                        f.create_dataset('tau', data=H.taud)
+                        f.create_dataset('dod', data=H.dod)
+                        f.create_dataset('doa', data=H.doa)
+                        nw = 0
+                    dH[..., nw:nw + nk] = y
+                    nw = nw + nk
+                if mode == 'H':
+                    if res is None:
+                        res = []
+                        H0 = H
+                    res.append(y)
+                elif mode == 'energy':
+                    e = np.sum(np.real(y * np.conj(y)), axis=-1)
+                    res = e if res is None else res + e
+                elif mode == 'tf':
+                    if res is None:
+                        res = []
+                    res.append(np.sum(y, axis=0))
+
+            fGHz = np.hstack(lfGHz)
+            if f is not None:
+                # drop the frequencies not shared with the antennas
+                if dH.shape[-1] != len(fGHz):
+                    dH.resize(dH.shape[:-1] + (len(fGHz),))
+                f.create_dataset('fGHz', data=fGHz)
+        except:
+            # a half written file is not left behind
+            if f is not None:
+                f.close()
+                f = None
+                os.remove(filename)
+            raise
+        finally:
+            if f is not None:
+                f.close()
+
+        if mode == 'H':
+            H = Tchannel(x=fGHz, y=np.concatenate(res, axis=-1),
+                         tau=H0.taud, dod=H0.dod, doa=H0.doa)
+            H.isFriis = Friis
+            return H
+        elif mode == 'tf':
+            return bs.FUsignal(fGHz, np.concatenate(res, axis=-1))
+        return res
 
     def rayfromseg(self,ls):
         ''' DEPRECATED 
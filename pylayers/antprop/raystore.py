@@ -0,0 +1,446 @@
+#-*- coding:Utf-8 -*-
+r"""
+.. currentmodule:: pylayers.antprop.raystore
+
+Columnar store of rays and channels
+
+.. autosummary::
+    :toctree: generated
+
+    RayStore
+
+Notes
+-----
+
+A campaign of ray tracing results (trajectories, many links) is stored
+in a single hdf5 file made of a few large chunked and compressed
+datasets instead of one group per link and time step.
+
+::
+
+    store.h5
+        |index/ida   (ne,)      node a identifier
+        |index/idb   (ne,)      node b identifier
+        |index/wstd  (ne,)      wireless standard
+        |index/t     (ne,)      time (s)
+        |index/<tab> (ne,2)     [start,stop[ rows of table <tab>
+        |                       (-1,-1 if the entry has no row in <tab>)
+        |<tab>/<col> (nrows,...) columns of table <tab>
+
+An entry is a (ida,idb,wstd,t) record of the index. Each table is a set
+of columns sharing the same number of rows and each entry owns a
+contiguous range of rows of the tables it has written, for instance
+
++--------+----------------------+---------------------------------+
+| table  | one row per          | columns                         |
++========+======================+=================================+
+| rays   | entry                | pTx, pRx, los, is3D             |
++--------+----------------------+---------------------------------+
+| ray    | ray                  | nint, dis                       |
++--------+----------------------+---------------------------------+
+| inter  | interaction          | pt, sig                         |
++--------+----------------------+---------------------------------+
+| H      | entry                | x, isFriis                      |
++--------+----------------------+---------------------------------+
+| Hray   | ray                  | y, taud, dod, doa               |
++--------+----------------------+---------------------------------+
+| aktk   | ray                  | ak, tk                          |
++--------+----------------------+---------------------------------+
+
+The row shape (and type) of a column is fixed by its first append.
+Appends are buffered in memory and written by flush (or close), so that
+datasets are resized once per buffer rather than once per entry.
+
+Chunked datasets are read through h5py. Once the campaign is complete,
+consolidate writes a copy with contiguous uncompressed datasets whose
+columns are then read as numpy memmaps.
+
+"""
+from __future__ import print_function
+import os
+import numpy as np
+import h5py
+import pylayers.util.pyutil as pyu
+from pylayers.util.project import *
+
+
+class RayStore(PyLayers):
+    """ columnar store of rays and channels
+
+    Parameters
+    ----------
+
+    filename : string
+        hdf5 file, relative to pstruc['DIRLNK'] if not absolute
+    mode : string
+        'a' (default) read/append | 'r' read only | 'w' truncate
+    chunk : int
+        number of scalar values per chunk
+    compression : string or None
+        hdf5 compression filter of the chunked datasets ('lzf','gzip',...)
+    nbuf : int
+        number of buffered entries before an automatic flush
+
+    Examples
+    --------
+
+    >>> import os, tempfile
+    >>> import numpy as np
+    >>> fd, fname = tempfile.mkstemp(suffix='.h5')
+    >>> os.close(fd)
+    >>> st = RayStore(fname, mode='w')
+    >>> for t in range(4):
+    ...     ie = st.append('Tx', 'Rx', 'ieee802154', t*0.1,
+    ...                    aktk={'ak': np.ones(3)*t, 'tk': np.arange(3.)})
+    >>> ie
+    3
+    >>> st.query(ida='Tx', t=(0.05, 0.25)).tolist()
+    [1, 2]
+    >>> st.read(2, 'aktk')['ak'].tolist()
+    [2.0, 2.0, 2.0]
+    >>> st.close()
+    >>> os.remove(fname)
+
+    """
+
+    def __init__(self, filename, mode='a', chunk=8192,
+                 compression='lzf', nbuf=1024):
+        if not os.path.isabs(filename):
+            filename = pyu.getlong(filename, pstruc['DIRLNK'])
+        self.filename = filename
+        self.mode = mode
+        self.chunk = chunk
+        self.compression = compression
+        self.nbuf = nbuf
+        self.f = h5py.File(filename, mode, rdcc_nbytes=32*1024**2)
+        self._mmap = {}
+        self._clear()
+        # index in memory
+        self.index = {}
+        if 'index' in self.f:
+            for k in self.f['index']:
+                self.index[k] = self.f['index'][k][:]
+        else:
+            self.index = {'ida': np.array([], dtype='S64'),
+                          'idb': np.array([], dtype='S64'),
+                          'wstd': np.array([], dtype='S64'),
+                          't': np.array([], dtype=float)}
+        # number of rows of each table (written + buffered)
+        self.nrows = {}
+        for k in self.index:
+            if k not in ['ida', 'idb', 'wstd', 't']:
+                self.nrows[k] = self.f[k][list(self.f[k].keys())[0]].shape[0]
+
+    def __repr__(self):
+        st = 'RayStore : ' + self.filename + '\n'
+        st = st + 'entries : ' + str(len(self)) + '\n'
+        for k in self.nrows:
+            st = st + k + ' : ' + str(self.nrows[k]) + ' rows '
+            st = st + str(self.columns(k)) + '\n'
+        return st
+
+    def __len__(self):
+        return len(self.index['t']) + len(self._bidx)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _clear(self):
+        """ clear the append buffers
+        """
+        self._bidx = []
+        self._btab = {}
+
+    def columns(self, table):
+        """ columns of a table
+
+        Parameters
+        ----------
+
+        table : string
+
+        Returns
+        -------
+
+        lcol : list of string
+
+        """
+        if table in self.f:
+            return list(self.f[table].keys())
+        elif table in self._btab:
+            return list(self._btab[table][0].keys())
+        return []
+
+    def append(self, ida, idb, wstd='', t=0., **tables):
+        """ append an entry
+
+        Parameters
+        ----------
+
+        ida : string
+            node a identifier
+        idb : string
+            node b identifier
+        wstd : string
+            wireless standard
+        t : float
+            time (s)
+        tables : dict
+            table name : {column name : np.array (nrow,...)}
+            all the columns of a table share the same number of rows,
+            every entry of a table has the same columns
+
+        Returns
+        -------
+
+        ie : int
+            entry index
+
+        """
+        if self.mode == 'r':
+            raise IOError('RayStore : read only store')
+        ie = len(self)
+        ltab = {}
+        dcols = {}
+        for tab in tables:
+            cols = {k: np.asarray(v) for k, v in tables[tab].items()}
+            lnr = [np.shape(v)[0] for v in cols.values()]
+            if len(set(lnr)) != 1:
+                raise ValueError('RayStore : columns of ' + tab +
+                                 ' have different number of rows')
+            lcol = self.columns(tab)
+            if (len(lcol) > 0) and (set(cols) != set(lcol)):
+                raise ValueError('RayStore : columns of ' + tab + ' are ' +
+                                 str(sorted(lcol)) + ' not ' +
+                                 str(sorted(cols)))
+            dcols[tab] = cols
+        for tab in dcols:
+            cols = dcols[tab]
+            nr = np.shape(list(cols.values())[0])[0]
+            start = self.nrows.get(tab, 0)
+            self.nrows[tab] = start + nr
+            ltab[tab] = (start, start + nr)
+            if tab not in self._btab:
+                self._btab[tab] = []
+            self._btab[tab].append(cols)
+        self._bidx.append((ida, idb, wstd, t, ltab))
+        if len(self._bidx) >= self.nbuf:
+            self.flush()
+        return ie
+
+    def flush(self):
+        """ write the buffered entries
+        """
+        if len(self._bidx) == 0:
+            return
+        ne0 = len(self.index['t'])
+        nb = len(self._bidx)
+        # tables
+        for tab in self._btab:
+            lcols = self._btab[tab]
+            if tab not in self.f:
+                self.f.create_group(tab)
+            g = self.f[tab]
+            for col in lcols[0]:
+                data = np.concatenate([c[col] for c in lcols], axis=0)
+                if col not in g:
+                    rshape = data.shape[1:]
+                    nrc = max(1, self.chunk // max(1, int(np.prod(rshape))))
+                    g.create_dataset(col, data=data,
+                                     maxshape=(None,) + rshape,
+                                     chunks=(nrc,) + rshape,
+                                     compression=self.compression)
+                else:
+                    ds = g[col]
+                    n0 = ds.shape[0]
+                    ds.resize(n0 + data.shape[0], axis=0)
+                    ds[n0:] = data
+        # index
+        lnew = {'ida': np.array([b[0] for b in self._bidx], dtype='S64'),
+                'idb': np.array([b[1] for b in self._bidx], dtype='S64'),
+                'wstd': np.array([b[2] for b in self._bidx], dtype='S64'),
+                't': np.array([b[3] for b in self._bidx], dtype=float)}
+        ltab = set(self.nrows.keys())
+        for tab in ltab:
+            if tab not in self.index:
+                self.index[tab] = -np.ones((ne0, 2), dtype=np.int64)
+            lnew[tab] = np.array([b[4].get(tab, (-1, -1))
+                                  for b in self._bidx], dtype=np.int64)
+        if 'index' not in self.f:
+            self.f.create_group('index')
+        g = self.f['index']
+        for k in lnew:
+            self.index[k] = np.concatenate((self.index[k], lnew[k]), axis=0)
+            if k not in g:
+                rshape = lnew[k].shape[1:]
+                g.create_dataset(k, data=self.index[k],
+                                 maxshape=(None,) + rshape,
+                                 chunks=(max(1, self.chunk // 8),) + rshape)
+            else:
+                g[k].resize(ne0 + nb, axis=0)
+                g[k][ne0:] = lnew[k]
+        self._clear()
+        self._mmap = {}
+        self.f.flush()
+
+    def close(self):
+        """ flush and close the store
+        """
+        if self.f.id.valid:
+            if self.mode != 'r':
+                self.flush()
+            self.f.close()
+        self._mmap = {}
+
+    def query(self, ida=None, idb=None, wstd=None, t=None, table=None):
+        """ select entries
+
+        Parameters
+        ----------
+
+        ida : string or None
+        idb : string or None
+        wstd : string or None
+        t : float | (t0,t1) | None
+            time or closed time range
+        table : string or None
+            only entries with rows in table
+
+        Returns
+        -------
+
+        ie : np.array
+            entry indices in append order
+
+        """
+        self.flush()
+        u = np.ones(len(self.index['t']), dtype=bool)
+        for k, v in [('ida', ida), ('idb', idb), ('wstd', wstd)]:
+            if v is not None:
+                u &= (self.index[k] == np.array(v, dtype='S64'))
+        if t is not None:
+            if np.size(t) == 2:
+                u &= (self.index['t'] >= t[0]) & (self.index['t'] <= t[1])
+            else:
+                u &= (self.index['t'] == t)
+        if table is not None:
+            if table not in self.index:
+                return np.array([], dtype=int)
+            u &= self.index[table][:, 0] >= 0
+        return np.where(u)[0]
+
+    def entry(self, ie):
+        """ index record of an entry
+
+        Parameters
+        ----------
+
+        ie : int
+
+        Returns
+        -------
+
+        (ida, idb, wstd, t)
+
+        """
+        self.flush()
+        return (self.index['ida'][ie].decode('utf-8'),
+                self.index['idb'][ie].decode('utf-8'),
+                self.index['wstd'][ie].decode('utf-8'),
+                self.index['t'][ie])
+
+    def column(self, table, col):
+        """ column of a table
+
+        Parameters
+        ----------
+
+        table : string
+        col : string
+
+        Returns
+        -------
+
+        np.memmap if the dataset is contiguous and uncompressed (see
+        consolidate), h5py.Dataset otherwise
+
+        """
+        self.flush()
+        ds = self.f[table][col]
+        if (ds.chunks is None) and (ds.compression is None):
+            key = (table, col)
+            if key not in self._mmap:
+                offset = ds.id.get_offset()
+                if offset is None:
+                    return ds
+                self._mmap[key] = np.memmap(self.filename, mode='r',
+                                            dtype=ds.dtype, shape=ds.shape,
+                                            offset=offset)
+            return self._mmap[key]
+        return ds
+
+    def read(self, ie, table, columns=None):
+        """ read the rows of an entry
+
+        Parameters
+        ----------
+
+        ie : int
+            entry index
+        table : string
+        columns : list of string or None (all the columns)
+
+        Returns
+        -------
+
+        d : dict
+            column name : np.array (nrow,...)
+
+        """
+        self.flush()
+        if table not in self.index:
+            raise KeyError('RayStore : no table ' + table)
+        start, stop = self.index[table][ie]
+        if start < 0:
+            raise KeyError('RayStore : entry ' + str(ie) +
+                           ' has no rows in ' + table)
+        if columns is None:
+            columns = self.columns(table)
+        return {c: np.asarray(self.column(table, c)[start:stop])
+                for c in columns}
+
+    def consolidate(self, filename):
+        """ copy the store with contiguous uncompressed datasets
+
+        Parameters
+        ----------
+
+        filename : string
+            destination file (relative to pstruc['DIRLNK'] if not absolute)
+
+        Returns
+        -------
+
+        st : RayStore
+            the consolidated store open in read mode, its columns are
+            read as numpy memmaps
+
+        """
+        self.flush()
+        if not os.path.isabs(filename):
+            filename = pyu.getlong(filename, pstruc['DIRLNK'])
+        fo = h5py.File(filename, 'w')
+        try:
+            for g in self.f:
+                fo.create_group(g)
+                for d in self.f[g]:
+                    data = self.f[g][d][:]
+                    ds = fo[g].create_dataset(d, shape=data.shape,
+                                              dtype=data.dtype)
+                    ds[...] = data
+        finally:
+            fo.close()
+        return RayStore(filename, mode='r')
@@ -28,6 +28,7 @@ import pylayers.util.cone as cone
 #import pylayers.util.graphutil as gph
 import pylayers.util.pyutil as pyu
 import pylayers.util.plotutil as plu
+import pylayers.antprop.antenna as ant
 from pylayers.antprop.rays import Rays
 from pylayers.util.project import *
 import heapq
@@ -397,6 +398,586 @@ def valid(lsig,L,tahe=[]):
 
 
 
+def sigcoord(L, nid):
+    """ coordinates of the Gs nodes of a block of signatures
+
+    Parameters
+    ----------
+
+    L : Layout
+    nid : np.array (N,k)
+        Gs nodes (segments > 0, points < 0)
+
+    Returns
+    -------
+
+    pa : np.array (N,k,2)
+        segment tail (point coordinates for a point)
+    pb : np.array (N,k,2)
+        segment head (point coordinates for a point)
+
+    """
+    nid = np.asarray(nid)
+    pa = np.empty(nid.shape + (2,))
+    pb = np.empty(nid.shape + (2,))
+    useg = nid > 0
+    if useg.any():
+        it = L.tahe[:, L.tgs[nid[useg]]]
+        pa[useg] = L.pt[:, it[0]].T
+        pb[useg] = L.pt[:, it[1]].T
+    upt = ~useg
+    if upt.any():
+        # index of points in L.pt
+        ipt = -np.ones(-np.min(L.upnt) + 1, dtype=int)
+        ipt[-L.upnt] = np.arange(len(L.upnt))
+        pa[upt] = L.pt[:, ipt[-nid[upt]]].T
+        pb[upt] = pa[upt]
+    return pa, pb
+
+
+def sigimage(tx, pa, pb, typ):
+    """ images of a point through a block of signatures
+
+    Parameters
+    ----------
+
+    tx : np.array (2,)
+    pa : np.array (N,k,2)
+    pb : np.array (N,k,2)
+        see sigcoord
+    typ : np.array (N,k)
+        interaction types (1 : D, 2 : R, 3 : T)
+
+    Returns
+    -------
+
+    M : np.array (N,k,2)
+        M[:,n] is the image of tx after the n+1 first interactions
+
+    Notes
+    -----
+
+    A reflection mirrors the previous image with respect to the
+    segment line, a transmission keeps it and a diffraction restarts
+    from the diffraction point (eq 2.61 to 2.67 of N. Amiot PhD thesis).
+
+    See Also
+    --------
+
+    sigbacktrace
+
+    """
+    N, k = np.shape(typ)
+    M = np.empty((N, k, 2))
+    p = np.broadcast_to(np.asarray(tx, dtype=float)[:2], (N, 2))
+    for n in range(k):
+        a = pa[:, n]
+        d = pb[:, n] - a
+        den = np.sum(d * d, axis=1)
+        den[den == 0] = 1.
+        t = np.sum((p - a) * d, axis=1) / den
+        # transmission
+        M[:, n] = p
+        uR = typ[:, n] == 2
+        M[uR, n] = 2 * (a[uR] + t[uR, None] * d[uR]) - p[uR]
+        uD = typ[:, n] == 1
+        M[uD, n] = a[uD]
+        p = M[:, n]
+    return M
+
+
+def sigbacktrace(rx, M, pa, pb, typ, epsilon=1e-12):
+    """ interaction points of a block of signatures
+
+    Parameters
+    ----------
+
+    rx : np.array (2,) or (...,2)
+        receiver, or one receiver per signature
+    M : np.array (...,k,2)
+        images of tx (see sigimage)
+    pa : np.array (...,k,2)
+    pb : np.array (...,k,2)
+    typ : np.array (...,k)
+    epsilon : float
+        tolerance at the segment extremities
+
+    Returns
+    -------
+
+    P : np.array (...,k,2)
+        interaction points (meaningful where valid)
+    valid : np.array (...) boolean
+        True if the signature is a valid 2D ray
+
+    Notes
+    -----
+
+    Going backward from rx, the line from the current point to the image
+    M[...,n,:] has to cross the segment n strictly between the current
+    point and the image (0 < alpha < 1) and inside the segment
+    (epsilon <= beta <= 1-epsilon). A diffraction point is always valid.
+
+    The leading axes of the arguments are broadcast together, e.g. a
+    block of receivers rx (Nr,1,2) against the signatures M (1,N,k,2)
+    gives P (Nr,N,k,2) without repeating the signatures.
+
+    See Also
+    --------
+
+    sigimage
+
+    """
+    rx = np.asarray(rx, dtype=float)[..., :2]
+    k = np.shape(typ)[-1]
+    sh = np.broadcast_shapes(rx.shape[:-1], np.shape(typ)[:-1],
+                             np.shape(M)[:-2], np.shape(pa)[:-2])
+    P = np.empty(sh + (k, 2))
+    valid = np.ones(sh, dtype=bool)
+    p = rx
+    for n in range(k - 1, -1, -1):
+        a = pa[..., n, :]
+        d1 = M[..., n, :] - p
+        d2 = pb[..., n, :] - a
+        r = a - p
+        D = d1[..., 0] * d2[..., 1] - d1[..., 1] * d2[..., 0]
+        uD = typ[..., n] == 1
+        ok = np.abs(D) >= 1e-15
+        Ds = np.where(ok, D, 1.)
+        alpha = (r[..., 0] * d2[..., 1] - r[..., 1] * d2[..., 0]) / Ds
+        beta = (r[..., 0] * d1[..., 1] - r[..., 1] * d1[..., 0]) / Ds
+        ok = ok & (alpha > 0.) & (alpha < 1.) & \
+            (beta >= epsilon) & (beta <= 1. - epsilon)
+        ok = ok | uD
+        P[..., n, :] = np.where(uD[..., None], a, a + beta[..., None] * d2)
+        valid = valid & ok
+        p = P[..., n, :]
+    return P, valid
+
+
+class SignatureSearch(object):
+    """ iterative pruned enumeration of signatures over Gi
+
+    Parameters
+    ----------
+
+    L : Layout
+        built layout (Gt, Gi)
+    diffraction : boolean
+        if False the diffraction interactions are ignored
+
+    Notes
+    -----
+
+    The search is a depth first walk over Gi driven by an explicit stack
+    of iterators. The following pruning rules are applied before a node
+    is expanded :
+
+    + interaction budget : an interaction is skipped when the number
+      of interactions of the same type (nD, nR, nT) on the current
+      prefix has reached its budget
+    + depth : cutoff, airwalls excluded
+    + distance excess : the distance between the source cycle centroid
+      and the mirrored interaction plus the distance between the
+      interaction and the target cycle centroid, minus the
+      source-target centroid distance, must stay below
+      0.3 * delay_excess_max_ns meters. This test is evaluated before
+      the cone test
+    + cone ratio : the fraction of the mirrored interaction seen from
+      the illuminating cone must exceed threshold. The test is skipped
+      for the nodes at the depth limit which do not reach a target
+
+    A single walk serves several target cycles : a prefix is expanded as
+    long as the distance excess holds for at least one target, and a
+    signature is recorded for a target only if the distance excess has
+    held for this target along the whole prefix. The result for each
+    target is identical to the one of a separate walk.
+
+    Examples
+    --------
+
+    >>> from pylayers.gis.layout import *
+    >>> from pylayers.antprop.signature import *
+    >>> L = Layout('defstr.lay')
+    >>> L.build()
+    >>> ss = SignatureSearch(L)
+    >>> dS = ss.run(1,[2,3],cutoff=2)
+    >>> isinstance(dS[2],Signatures)
+    True
+
+    See Also
+    --------
+
+    Signatures.run
+
+    """
+
+    def __init__(self, L, diffraction=True):
+        self.L = L
+        self.diffraction = diffraction
+        self.lair = set(L.name.get('AIR', []) + L.name.get('_AIR', []))
+        # number of expanded nodes
+        self.cpt = 0
+        # tail-head coordinates and mirroring matrices of Gs nodes
+        self._th = {}
+        self._axm = {}
+
+    def th(self, n):
+        """ tail-head coordinates of a Gs node (2 x 2)
+
+        a point is repeated twice
+
+        """
+        try:
+            return self._th[n]
+        except KeyError:
+            if n > 0:
+                pts = list(dict(self.L.Gs[n]).keys())
+                th = np.array([self.L.Gs.pos[pts[0]], self.L.Gs.pos[pts[1]]])
+            else:
+                th = self.L.Gs.pos[n]
+                th = np.array([th, th])
+            self._th[n] = th
+            return th
+
+    def axm(self, n):
+        """ mirroring transformation of segment n (see geomutil.axmat)
+        """
+        try:
+            return self._axm[n]
+        except KeyError:
+            th = self.th(n)
+            r = geu.axmat(th[0], th[1])
+            self._axm[n] = r
+            return r
+
+    def children(self, prev, cur):
+        """ interactions reachable from cur coming from prev
+        """
+        if prev is None:
+            lint = list(self.L.Gi[cur])
+        else:
+            lint = list(self.L.Gi[prev][cur]['output'].keys())
+        if not self.diffraction:
+            lint = [x for x in lint if len(x) > 1]
+        return lint
+
+    def cone(self, visited, tahe, th_mirror):
+        """ ratio of the mirrored interaction inside the illuminating cone
+
+        Parameters
+        ----------
+
+        visited : list of interactions (the last one being evaluated)
+        tahe : list of mirrored tail-head of the accepted prefix
+        th_mirror : np.array (2 x 2)
+            mirrored tail-head of the last interaction
+
+        Returns
+        -------
+
+        ratio : float
+        th_mirror : np.array (2 x 2)
+            part of th_mirror inside the cone
+
+        """
+        if (len(tahe) < 2) or (len(visited[-2]) == 1) or (len(visited[-1]) == 1):
+            return 1.0, th_mirror
+
+        # origin of the cone : first interaction or last diffraction
+        udiff = [k for k in range(len(visited)) if len(visited[k]) == 1]
+        if udiff == []:
+            ilast = 0
+        else:
+            ilast = udiff[-1]
+
+        pta0 = tahe[ilast][0]
+        phe0 = tahe[ilast][1]
+        pta_ = tahe[-1][0]
+        phe_ = tahe[-1][1]
+
+        apex = None
+        connected = False
+        if (pta0 == pta_).all():
+            apex = pta0
+            connected = True
+            v0 = phe0 - apex
+            v_ = phe_ - apex
+        elif (pta0 == phe_).all():
+            apex = pta0
+            connected = True
+            v0 = phe0 - apex
+            v_ = pta_ - apex
+        elif (phe0 == pta_).all():
+            apex = phe0
+            connected = True
+            v0 = pta0 - apex
+            v_ = phe_ - apex
+        elif (phe0 == phe_).all():
+            apex = phe0
+            connected = True
+            v0 = pta0 - apex
+            v_ = pta_ - apex
+
+        if not connected:
+            if not (geu.ccw(pta0, phe0, phe_) ^
+                    geu.ccw(phe0, phe_, pta_)):
+                vr = (pta0, phe_)
+                vl = (phe0, pta_)
+            else:  # twisted case
+                vr = (pta0, pta_)
+                vl = (phe0, phe_)
+
+            vr_n = (vr[1] - vr[0]) / np.linalg.norm(vr[1] - vr[0])
+            vl_n = (vl[1] - vl[0]) / np.linalg.norm(vl[1] - vl[0])
+
+            vrdotvl = np.dot(vr_n, vl_n)
+            angle_cone = np.arccos(np.maximum(np.minimum(vrdotvl, 1.0), -1.0))
+            if angle_cone != 0:
+                # apex calculation
+                a0u = np.dot(pta0, vr_n)
+                a0v = np.dot(pta0, vl_n)
+                b0u = np.dot(phe0, vr_n)
+                b0v = np.dot(phe0, vl_n)
+                kb = ((b0v - a0v) - vrdotvl * (b0u - a0u)) / (vrdotvl * vrdotvl - 1)
+                apex = phe0 + kb * vl_n
+        else:
+            v0n = v0 / np.linalg.norm(v0)
+            v_n = v_ / np.linalg.norm(v_)
+            sign = np.sign(np.cross(v_n, v0n))
+            if sign > 0:
+                vr_n = -v0n
+                vl_n = v_n
+            else:
+                vr_n = v_n
+                vl_n = -v0n
+            vrdotvl = np.dot(vr_n, vl_n)
+            angle_cone = np.arccos(np.maximum(np.minimum(vrdotvl, 1.0), -1.))
+
+        # scalar forms of np.isclose / np.allclose
+        seg = (th_mirror[0], th_mirror[1])
+        if ((abs(angle_cone) > 1e-6) and
+            (abs(angle_cone - np.pi) > 1e-8 + 1e-5 * np.pi)):
+            seg, ratio = geu.intersect_cone_seg((apex, vl_n), (apex, vr_n),
+                                                (th_mirror[0], th_mirror[1]),
+                                                bvis=False)
+        elif (abs(angle_cone) > 1e-8):
+            ratio = 1
+        else:
+            ratio = 0
+        if len(seg) == 2:
+            th_mirror = np.vstack((seg[0], seg[1]))
+
+        if (apex is not None) and (
+            (np.abs(th_mirror[0] - apex) <= 1e-8 + 1e-5 * np.abs(apex)).all() or
+            (np.abs(th_mirror[1] - apex) <= 1e-8 + 1e-5 * np.abs(apex)).all()):
+            ratio = 1.
+
+        return ratio, th_mirror
+
+    def run(self, source, targets, **kwargs):
+        """ signatures from a source cycle to a list of target cycles
+
+        Parameters
+        ----------
+
+        source : int
+            source cycle
+        targets : list of int
+            target cycles
+        cutoff : int
+        threshold : float
+        delay_excess_max_ns : float
+        nD : int
+        nR : int
+        nT : int
+        bt : boolean
+            allow to visit an already visited interaction
+        progress : boolean
+
+        Returns
+        -------
+
+        dS : dict
+            {target : Signatures}
+
+        """
+        defaults = {'cutoff': 2,
+                    'threshold': 0.1,
+                    'delay_excess_max_ns': 400,
+                    'nD': 1,
+                    'nR': 10,
+                    'nT': 10,
+                    'bt': True,
+                    'progress': False}
+        for k in defaults:
+            if k not in kwargs:
+                kwargs[k] = defaults[k]
+        cutoff = kwargs['cutoff']
+        threshold = kwargs['threshold']
+        nD = kwargs['nD']
+        nR = kwargs['nR']
+        nT = kwargs['nT']
+        bt = kwargs['bt']
+        dist_excess_max = kwargs['delay_excess_max_ns'] * 0.3
+
+        L = self.L
+        targets = list(targets)
+        Nt = len(targets)
+
+        lisR, lisT, lisD = L.intercy(source, typ='source')
+        if self.diffraction:
+            lis = lisT + lisR + lisD
+        else:
+            lis = lisT + lisR
+
+        llit = []
+        for t in targets:
+            litR, litT, litD = L.intercy(t, typ='target')
+            if self.diffraction:
+                llit.append(set(litT + litR + litD))
+            else:
+                llit.append(set(litT + litR))
+
+        pt_source = np.array(L.Gt.nodes[source]['polyg'].centroid.coords.xy)[:, 0]
+        pt_target = np.array([np.array(L.Gt.nodes[t]['polyg'].centroid.coords.xy)[:, 0]
+                              for t in targets]).reshape(Nt, 2)
+        d_source_target = np.sqrt(np.sum((pt_target - pt_source) ** 2, axis=1))
+
+        # per target : {length : list of signatures}, ratios, hashes
+        lsig = [{} for t in targets]
+        lrat = [{} for t in targets]
+        lhash = [set() for t in targets]
+
+        def record(it, anstr, typ, ratio):
+            lsig[it].setdefault(len(typ), []).append((anstr, typ))
+            lrat[it].setdefault(len(typ), []).append(ratio)
+
+        if kwargs['progress']:
+            lis_iter = tqdm(lis, desc='Signatures')
+        else:
+            lis_iter = lis
+
+        for s in lis_iter:
+            visited = [s]
+            tahe = [self.th(s[0])]
+            # mirroring transformations (None stands for identity)
+            R = [None]
+            if (len(s) == 3) and (L.Gs.nodes[s[0]]['name'] in ('AIR', '_AIR')):
+                lawp = [1]
+            else:
+                lawp = [0]
+            naw = lawp[0]
+            # number of interactions of each type in visited
+            count = {1: 0, 2: 0, 3: 0}
+            count[len(s)] += 1
+            budget = {1: nD, 2: nR, 3: nT}
+
+            for it, t in enumerate(targets):
+                if (s in llit[it]) or (s[-1] == t):
+                    record(it, (s[0],), (len(s),), 1.)
+            alive = [np.ones(Nt, dtype=bool)]
+
+            stack = [iter(self.children(None, s))]
+            while stack:
+                interaction = next(stack[-1], None)
+                if ((interaction is not None) and
+                    (bt or (interaction not in visited)) and
+                    (len(visited) <= cutoff + naw)):
+                    li = len(interaction)
+                    if count[li] >= budget[li]:
+                        continue
+                    visited.append(interaction)
+                    count[li] += 1
+                    aw = int(interaction[0] in self.lair)
+                    lawp.append(aw)
+                    naw += aw
+                    self.cpt += 1
+                    nstr = interaction[0]
+
+                    lprev = len(visited[-2])
+                    if lprev == 1:
+                        R.append(None)
+                    elif lprev == 2:
+                        R.append(self.axm(visited[-2][0]))
+
+                    th = self.th(nstr)
+                    # mirroring th back to the last diffraction or source
+                    th_mirror = th
+                    ik = 1
+                    r = R[-ik]
+                    while r is not None:
+                        th_mirror = np.einsum('ki,ij->kj', th_mirror, r[0]) + r[1]
+                        ik = ik + 1
+                        r = R[-ik]
+
+                    pt_th = np.sum(th, axis=0) / 2.
+                    pt_mirror = np.sum(th_mirror, axis=0) / 2.
+                    d_target = np.sqrt(np.sum((pt_target - pt_th) ** 2, axis=1))
+                    d_source = np.sqrt(np.sum((pt_source - pt_mirror) ** 2))
+                    d_excess = d_source + d_target - d_source_target
+                    balive = alive[-1] & (d_excess < dist_excess_max)
+
+                    # a node at the depth limit is only useful if it
+                    # reaches a target, the cone test is skipped otherwise
+                    lt = [it for it in np.nonzero(balive)[0]
+                          if interaction in llit[it]]
+                    accept = (lt != []) or (balive.any() and
+                                            (len(visited) <= cutoff + naw))
+                    if accept:
+                        ratio, th_mirror = self.cone(visited, tahe, th_mirror)
+                        accept = ratio > threshold
+
+                    if accept:
+                        if nstr < 0:
+                            tahe.append(th)
+                        else:
+                            tahe.append(th_mirror)
+                        alive.append(balive)
+                        if lt != []:
+                            anstr = tuple([x[0] for x in visited])
+                            typ = tuple([len(x) for x in visited])
+                            for it in lt:
+                                # signatures differing only by cycles
+                                # are recorded once
+                                if (anstr, typ) not in lhash[it]:
+                                    lhash[it].add((anstr, typ))
+                                    record(it, anstr, typ, ratio)
+                        stack.append(iter(self.children(visited[-2], interaction)))
+                    else:
+                        if lprev in (1, 2):
+                            R.pop()
+                        visited.pop()
+                        count[li] -= 1
+                        naw -= lawp.pop()
+                else:
+                    if len(visited) > 1:
+                        if len(visited[-2]) in (1, 2):
+                            R.pop()
+                    last = visited.pop()
+                    count[len(last)] -= 1
+                    tahe.pop()
+                    naw -= lawp.pop()
+                    alive.pop()
+                    stack.pop()
+
+        dS = {}
+        for it, t in enumerate(targets):
+            S = Signatures(L, source, t, cutoff=cutoff, threshold=threshold)
+            lk = sorted(lsig[it])
+            if len(lk) > 0:
+                lsk = [x for k in lk for x in lsig[it][k]]
+                node = np.fromiter((n for x in lsk for n in x[0]),
+                                   dtype=np.int32)
+                typ = np.fromiter((n for x in lsk for n in x[1]),
+                                  dtype=np.int8)
+                ptr = np.hstack((0, np.cumsum([len(x[1]) for x in lsk])))
+                ratio = np.hstack([lrat[it][k] for k in lk])
+                S.setcsr(ptr, node, typ, ratio)
+            dS[t] = S
+        return dS
+
+
 class Signatures(PyLayers,dict):
     """ set of Signature given 2 Gt cycle (convex) indices
 
@@ -409,6 +990,25 @@ class Signatures(PyLayers,dict):
     target : int
         target convex cycle
 
+    Notes
+    -----
+
+    The signatures are stored in flat arrays (compressed sparse row) :
+
+    + _ptr : np.int64 (Nsig+1) offsets of the signatures in _node/_typ
+    + _node : np.int32 Gs node of each interaction
+    + _typ : np.int8 type of each interaction (1 : D, 2 : R, 3 : T)
+
+    The signatures are sorted by number of interactions, hence the block
+    of signatures with k interactions is a (nsig_k,k) view of _node and
+    _typ (see nodes and types).
+
+    The dictionnary interface is kept : the keys are the numbers of
+    interactions and self[k] returns the legacy (2*nsig_k,k) array
+    interleaving nodes and types. It is built on demand, the blocks set
+    with self[k] = array are merged in the flat arrays at the next flat
+    access (see csr).
+
     """
 
     def __init__(self,L,source,target,cutoff=3,threshold = 0.6):
@@ -442,8 +1042,235 @@ class Signatures(PyLayers,dict):
         self.cutoff = cutoff
         self.threshold = threshold
         self.ratio = {}
+        self._reset()
         self.filename = self.L._filename.split('.')[0] +'_' + str(self.source) +'_' + str(self.target) +'_' + str(self.cutoff) +'.sig'
 
+    def _pack(self):
+        """ merge the blocks set with __setitem__ in the flat arrays
+        """
+        pend = self.__dict__.setdefault('_pend', {})
+        if len(pend) == 0:
+            return
+        blk = self.__dict__.get('_blk', {})
+        dblock = {}
+        for k in blk:
+            if k not in pend:
+                dblock[k] = (self._nview(k), self._tview(k))
+        for k in pend:
+            a = pend[k]
+            dblock[k] = (a[0::2, :], a[1::2, :])
+        lk = sorted(dblock)
+        ln = [dblock[k][0].shape[0] for k in lk]
+        self._node = np.concatenate([dblock[k][0].ravel() for k in lk]).astype(np.int32)
+        self._typ = np.concatenate([dblock[k][1].ravel() for k in lk]).astype(np.int8)
+        self._ptr = np.hstack((0, np.cumsum(np.repeat(lk, ln)))).astype(np.int64)
+        i0 = np.hstack((0, np.cumsum(ln))).astype(int)
+        self._blk = {k: (i0[i], i0[i + 1]) for i, k in enumerate(lk)}
+        self._pend = {}
+
+    def _nview(self, k):
+        i0, i1 = self._blk[k]
+        o = self._ptr[i0]
+        return self._node[o:o + (i1 - i0) * k].reshape(i1 - i0, k)
+
+    def _tview(self, k):
+        i0, i1 = self._blk[k]
+        o = self._ptr[i0]
+        return self._typ[o:o + (i1 - i0) * k].reshape(i1 - i0, k)
+
+    def csr(self):
+        """ flat arrays of the signatures
+
+        Returns
+        -------
+
+        ptr : np.array int64 (Nsig+1)
+            signature i is node[ptr[i]:ptr[i+1]], typ[ptr[i]:ptr[i+1]]
+        node : np.array int32
+            Gs node of each interaction
+        typ : np.array int8
+            interaction type (1 : D, 2 : R, 3 : T)
+
+        """
+        self._pack()
+        return self._ptr, self._node, self._typ
+
+    def setcsr(self, ptr, node, typ, ratio=None):
+        """ set the signatures from flat arrays
+
+        Parameters
+        ----------
+
+        ptr : np.array (Nsig+1)
+        node : np.array
+        typ : np.array
+        ratio : np.array (Nsig) or None
+            cone ratio of each signature (self.ratio is emptied if None)
+
+        Notes
+        -----
+
+        The signatures are reordered by increasing number of interactions
+        if needed (stable order inside a block).
+
+        """
+        ptr = np.asarray(ptr, dtype=np.int64)
+        node = np.asarray(node, dtype=np.int32)
+        typ = np.asarray(typ, dtype=np.int8)
+        lens = np.diff(ptr)
+        if np.any(np.diff(lens) < 0):
+            u = np.argsort(lens, kind='stable')
+            # interaction indices of the reordered signatures
+            iu = np.repeat(ptr[u] - np.hstack((0, np.cumsum(lens[u])[:-1])),
+                           lens[u]) + np.arange(lens.sum())
+            node = node[iu]
+            typ = typ[iu]
+            if ratio is not None:
+                ratio = np.asarray(ratio)[u]
+            lens = lens[u]
+            ptr = np.hstack((0, np.cumsum(lens))).astype(np.int64)
+        dict.clear(self)
+        self._ptr = ptr
+        self._node = node
+        self._typ = typ
+        self._pend = {}
+        self._blk = {}
+        lk, i0 = np.unique(lens, return_index=True)
+        i1 = np.hstack((i0[1:], len(lens)))
+        for k, a, b in zip(lk, i0, i1):
+            self._blk[int(k)] = (int(a), int(b))
+            dict.__setitem__(self, int(k), None)
+        self.ratio = {}
+        if (ratio is not None) and (len(ratio) == len(lens)):
+            ratio = np.asarray(ratio)
+            self.ratio = {k: ratio[a:b] for k, (a, b) in self._blk.items()}
+
+    def ratiocsr(self):
+        """ flat array of the signature ratios (in csr order)
+
+        Returns
+        -------
+
+        ratio : np.array (Nsig) , empty if ratio is not available for
+            every signature
+
+        """
+        self._pack()
+        lk = sorted(self._blk)
+        for k in lk:
+            i0, i1 = self._blk[k]
+            if (k not in self.ratio) or (len(self.ratio[k]) != i1 - i0):
+                return np.zeros(0)
+        if len(lk) == 0:
+            return np.zeros(0)
+        return np.hstack([self.ratio[k] for k in lk])
+
+    def nodes(self, k):
+        """ Gs nodes of the signatures with k interactions
+
+        Returns
+        -------
+
+        node : np.array int32 (nsig_k,k) view of the flat array
+
+        """
+        self._pack()
+        return self._nview(k)
+
+    def types(self, k):
+        """ interaction types of the signatures with k interactions
+
+        Returns
+        -------
+
+        typ : np.array int8 (nsig_k,k) view of the flat array
+
+        """
+        self._pack()
+        return self._tview(k)
+
+    def sig(self, i):
+        """ i-th signature (csr order)
+
+        Returns
+        -------
+
+        node : np.array int32 view
+        typ : np.array int8 view
+
+        """
+        self._pack()
+        return (self._node[self._ptr[i]:self._ptr[i + 1]],
+                self._typ[self._ptr[i]:self._ptr[i + 1]])
+
+    def __getitem__(self, k):
+        pend = self.__dict__.get('_pend', {})
+        if k in pend:
+            return pend[k]
+        if k not in self.__dict__.get('_blk', {}):
+            raise KeyError(k)
+        nd = self._nview(k)
+        ty = self._tview(k)
+        a = np.empty((2 * nd.shape[0], k), dtype=int)
+        a[0::2, :] = nd
+        a[1::2, :] = ty
+        return a
+
+    def __setitem__(self, k, a):
+        a = np.asarray(a)
+        if a.size == 0:
+            if k in self:
+                del self[k]
+            return
+        a = a.reshape(-1, k)
+        assert a.shape[0] % 2 == 0, 'signatures : (2*nsig,k) array expected'
+        self.__dict__.setdefault('_pend', {})[k] = a
+        dict.__setitem__(self, k, None)
+
+    def __delitem__(self, k):
+        dict.__delitem__(self, k)
+        pend = self.__dict__.setdefault('_pend', {})
+        pend.pop(k, None)
+        if k in self._blk:
+            # the other packed blocks go through the pending blocks
+            for x in self._blk:
+                if (x != k) and (x not in pend):
+                    pend[x] = self[x]
+            self._reset()
+            self._pend = pend
+            self._pack()
+
+    def _reset(self):
+        self._ptr = np.zeros(1, dtype=np.int64)
+        self._node = np.zeros(0, dtype=np.int32)
+        self._typ = np.zeros(0, dtype=np.int8)
+        self._blk = {}
+        self._pend = {}
+
+    def clear(self):
+        dict.clear(self)
+        self._reset()
+
+    def get(self, k, default=None):
+        if k in self:
+            return self[k]
+        return default
+
+    def values(self):
+        return [self[k] for k in self]
+
+    def items(self):
+        return [(k, self[k]) for k in self]
+
+    def update(self, *args, **kwargs):
+        for d in args + (kwargs,):
+            if hasattr(d, 'keys'):
+                for k in d.keys():
+                    self[k] = d[k]
+            else:
+                for k, v in d:
+                    self[k] = v
+
     def __repr__(self):
 
         def fun1(x):
@@ -481,11 +1308,8 @@ class Signatures(PyLayers,dict):
         return(s)
 
     def __len__(self):
-        nsig = 0
-        for k in self:
-            size = int(len(self[k])/2)
-            nsig += size
-        return(nsig)
+        self._pack()
+        return(len(self._ptr) - 1)
 
     def compl(self,lint,L):
         """ completion from lint
@@ -533,6 +1357,7 @@ class Signatures(PyLayers,dict):
             L : Layout
             lsi : nd.array 
                 signature (2xnb_sig,sig_length)
+                if [] all the signatures are converted (csr order)
 
             Examples:
             ---------
@@ -545,21 +1370,25 @@ class Signatures(PyLayers,dict):
         assert L.isbuilt,  AttributeError('Layout is not built')
         assert len(lsi)%2==0,   AttributeError('Incorrect signature(s) shape')
 
-        tlinter = []
-        for uu in range(0,len(lsi),2):
-
-            si = lsi[uu:uu+2,:]
+        if len(lsi) == 0:
+            ptr, node, typ = self.csr()
+            lnt = [(node[ptr[i]:ptr[i+1]],typ[ptr[i]:ptr[i+1]])
+                   for i in range(len(ptr)-1)]
+        else:
+            lnt = [(lsi[uu],lsi[uu+1]) for uu in range(0,len(lsi),2)]
 
+        tlinter = []
+        for snode,styp in lnt:
 
-            lsig = si.shape[1]
+            lsig = len(snode)
             linter = []
 
             for k in range(lsig):
                 # nstr : seg or points
-                nstr = si[0,k]
-                typ  = si[1,k]
+                nstr = int(snode[k])
+                typ  = styp[k]
                 # cycles connected to seg or point
-                seg_cy = copy.deepcopy(L.Gs.node[nstr]['ncycles'])
+                seg_cy = copy.deepcopy(L.Gs.nodes[nstr]['ncycles'])
 
                 if k == 0:
                     cy0 = self.source
@@ -574,7 +1403,7 @@ class Signatures(PyLayers,dict):
 
                 if typ == 1:
                     inter = (nstr,)
-                    lcy0 = L.Gs.node[nstr]['ncycles']
+                    lcy0 = L.Gs.nodes[nstr]['ncycles']
                 elif typ == 2:
                     inter = (nstr,cy0)
                 elif typ == 3:
@@ -635,12 +1464,9 @@ class Signatures(PyLayers,dict):
     def num(self):
         """ determine the number of signatures
         """
-        self.nsig = 0
-        self.nint = 0
-        for k in self:
-            size = int(len(self[k])/2)
-            self.nsig += size
-            self.nint += size*k
+        ptr, node, typ = self.csr()
+        self.nsig = len(ptr) - 1
+        self.nint = len(node)
 
     def info(self):
         # print "Signatures for scenario defined by :"
@@ -723,6 +1549,13 @@ class Signatures(PyLayers,dict):
 
     def saveh5(self):
         """ save signatures in hdf5 format
+
+        Notes
+        -----
+
+        The flat arrays of the signatures (see csr) are written as the
+        datasets ptr, node, typ and ratio.
+
         """
 
         filename=pyu.getlong(self.filename+'.h5',pstruc['DIRSIG'])
@@ -735,8 +1568,12 @@ class Signatures(PyLayers,dict):
             f.attrs['source']=self.source
             f.attrs['target']=self.target
             f.attrs['cutoff']=self.cutoff
-            for k in self.keys():
-                f.create_dataset(str(k),shape=np.shape(self[k]),data=self[k])
+            f.attrs['threshold']=self.threshold
+            ptr, node, typ = self.csr()
+            f.create_dataset('ptr',data=ptr)
+            f.create_dataset('node',data=node)
+            f.create_dataset('typ',data=typ)
+            f.create_dataset('ratio',data=self.ratiocsr())
             f.close()
         except:
             f.close()
@@ -756,8 +1593,12 @@ class Signatures(PyLayers,dict):
         # read/write error
         try:
             f=h5py.File(filename,'r')
-            for k in f.keys():
-                self.update({eval(k):f[k][:]})
+            if 'ptr' in f.keys():
+                self.setcsr(f['ptr'][:],f['node'][:],f['typ'][:],f['ratio'][:])
+            # old h5 format : one dataset per number of interactions
+            else:
+                for k in f.keys():
+                    self.update({eval(k):f[k][:]})
             f.close()
         except:
             f.close()
@@ -1100,6 +1941,8 @@ class Signatures(PyLayers,dict):
             activate diffraction
         threshold : float
             for reducing calculation time
+        delay_excess_max_ns : float
+            maximum excess delay with respect to the cycle centroids
         animations :  boolean
         nD : int
             maximum number of diffraction
@@ -1107,13 +1950,103 @@ class Signatures(PyLayers,dict):
             maximum number of reflection
         nT : int
             maximum number of transmission
+        store : SignatureStore
+            if given, the signatures are obtained from the store
+            (get or compute)
 
+        Notes
+        -----
+
+        The enumeration is delegated to SignatureSearch. The animation
+        option is only available in runold.
 
         See Also
         --------
 
+        SignatureSearch
+        pylayers.antprop.sigstore.SignatureStore
         pylayers.simul.link.Dlink.eval
 
+        """
+        defaults = {'cutoff' : 2,
+                    'threshold': 0.1,
+                    'delay_excess_max_ns': 400,
+                    'nD': 1,
+                    'nR': 10,
+                    'nT': 10,
+                    'bt' : True,
+                    'progress': True,
+                    'diffraction' : True,
+                    'animation' : False,
+                    'store' : None
+                    }
+        for k in defaults:
+            if k not in kwargs:
+                kwargs[k] = defaults[k]
+
+        if kwargs['animation']:
+            return self.runold(**kwargs)
+
+        self.cutoff = kwargs['cutoff']
+        self.threshold = kwargs['threshold']
+
+        self.filename = self.L._filename.split('.')[0] +'_' + str(self.source) +'_' + str(self.target) +'_' + str(self.cutoff) +'.sig'
+
+        store = kwargs.pop('store')
+        if store is not None:
+            S = store.get(self.source, self.target, **kwargs)
+        else:
+            ss = SignatureSearch(self.L, diffraction=kwargs['diffraction'])
+            S = ss.run(self.source, [self.target],
+                       cutoff=self.cutoff,
+                       threshold=self.threshold,
+                       delay_excess_max_ns=kwargs['delay_excess_max_ns'],
+                       nD=kwargs['nD'],
+                       nR=kwargs['nR'],
+                       nT=kwargs['nT'],
+                       bt=kwargs['bt'],
+                       progress=kwargs['progress'])[self.target]
+            self.cpt = ss.cpt
+
+        ptr, node, typ = S.csr()
+        self.setcsr(ptr, node, typ, S.ratiocsr())
+
+    def runold(self,**kwargs):
+        """ evaluate signatures between cycle of tx and cycle of rx (deprecated)
+
+        Parameters
+        ----------
+
+        cutoff : int
+            limit the exploration of all_simple_path
+        bt : boolean
+            backtrace (allow to visit already visited nodes in simple path algorithm)
+        progress : boolean
+            display the time passed in the loop
+        diffraction : boolean
+            activate diffraction
+        threshold : float
+            for reducing calculation time
+        animations :  boolean
+        nD : int
+            maximum number of diffraction
+        nR : int
+            maximum number of reflection
+        nT : int
+            maximum number of transmission
+
+
+        Notes
+        -----
+
+        This is the former recursive-like implementation, kept for the
+        animation option and as a reference for SignatureSearch.
+
+        See Also
+        --------
+
+        run
+
         """
         defaults = {'cutoff' : 2,
                     'threshold': 0.1,
@@ -1482,6 +2415,7 @@ class Signatures(PyLayers,dict):
                             #     import ipdb
                             #     ipdb.set_trace()
 
+                            apex = None
                             connected = False
                             if (pta0==pta_).all():
                                 apex = pta0
@@ -1586,6 +2520,7 @@ class Signatures(PyLayers,dict):
                             # the th_mirror to be tested with this cone are known
                             #
 
+                            seg = (th_mirror[0],th_mirror[1])
                             if ( (not np.isclose(angle_cone,0,atol=1e-6) )
                              and ( not np.isclose(angle_cone,np.pi)) ) :
                                 #if self.cpt==16176:
@@ -1603,7 +2538,7 @@ class Signatures(PyLayers,dict):
 
                             al = np.arctan2(vl_n[1],vl_n[0])
                             ar = np.arctan2(vr_n[1],vr_n[0])
-                            if np.allclose(th_mirror[0],apex) or np.allclose(th_mirror[1],apex):
+                            if (apex is not None) and (np.allclose(th_mirror[0],apex) or np.allclose(th_mirror[1],apex)):
                                 ratio2 = 1.
 
                             # On connecte l'apex du cone courant aux extrémités du segment courant mirroré
@@ -2189,15 +3124,11 @@ class Signatures(PyLayers,dict):
         #  this part should be a generator
         #
         for k in self:
-            # print 'block#',k
-            # if k ==3:
-            #     import ipdb
-            #     ipdb.set_trace()
             # get signature block with k interactions
-            tsig = self[k]
-            shsig = np.shape(tsig)
-            for l in range(shsig[0]/2):
-                sig = tsig[2*l:2*l+2,:]
+            tnode = self.nodes(k)
+            ttyp = self.types(k)
+            for l in range(len(tnode)):
+                sig = np.vstack((tnode[l],ttyp[l])).astype(int)
                 ns0 = sig[0,0]
                 nse = sig[0,-1]
                 validtx = True
@@ -2359,285 +3290,327 @@ class Signatures(PyLayers,dict):
 
         return rays
 
-    def backtrace(self, tx, rx, M):
-        ''' backtracing betwen tx and rx
+    def raysvm(self, ptx, prx, nrb=64):
+        """ 2D rays from one transmitter to a set of receivers
 
         Parameters
         ----------
 
-            tx : ndarray
-                position of tx (2,)
-            rx : ndarray
-                position of tx (2,)
-            M : dict
-                position of intermediate points obtained from self.image()
+        ptx : numpy.array or int
+            Tx coordinates or cycle (see raysv)
+        prx : numpy.array (nrx,2) or (nrx,3)
+            Rx coordinates, all the receivers are expected to lie in the
+            target cycle of the signatures
+        nrb : int
+            number of receivers backtraced together
 
         Returns
         -------
 
-            rayp : dict
-            key = number_of_interactions
-            value =ndarray positions of interactions for creating rays
+        lrays : list of Rays
+            one Rays per receiver, identical to raysv(ptx,prx[i])
 
         Notes
         -----
 
-        dictionnary of intermediate coordinated :
-        key = number_of_interactions
-        value = nd array M with shape : (2,nb_signatures,nb_interactions)
-        and 2 represent x and y coordinates
+        The transmitter side of raysv (coordinates of the signature nodes,
+        images of the transmitter, transmitter cycle) is evaluated once.
+        Only the backtrace depends on the receiver, it is evaluated for
+        blocks of nrb receivers at once by sigbacktrace.
 
-        See Also
+        Examples
         --------
 
-        pylayers.antprop.signature.image
+        >>> from pylayers.gis.layout import *
+        >>> L = Layout('defstr.lay')
+        >>> L.build()
+        >>> S = Signatures(L,1,2)
+        >>> S.run(cutoff=3,progress=False)
+        >>> tx = np.r_[L.Gt.pos[1],1.2]
+        >>> prx = np.r_[L.Gt.pos[2],1.5] + np.array([[0,0,0],[0.3,0,0],[0,0.3,0]])
+        >>> lr = S.raysvm(tx,prx)
+        >>> len(lr)
+        3
 
-        '''
+        """
+        if type(ptx)==int:
+            ptx = np.array(self.L.Gt.pos[ptx])
 
+        if len(ptx) == 2:
+            ptx= np.r_[ptx, 0.5]
 
-        if len(tx) > 2:
-            tx = tx[:2]
-        if len(rx) > 2:
-            rx = rx[:2]
+        prx = np.array(prx, dtype=float)
+        if prx.ndim == 1:
+            prx = prx[None, :]
+        nrx = len(prx)
+        if prx.shape[1] == 2:
+            prx = np.hstack((prx, 0.5*np.ones((nrx, 1))))
 
-        rayp={}
+        # convex cycle of the transmitter
+        cyptx = self.L.pt2cy(ptx)
+        polyctx = self.L.Gt.nodes[cyptx]['polyg']
 
-        # loop on number of interactions
+        # tx side : signature nodes, their coordinates and the tx images
+        dsig = {}
         for ninter in self.keys():
-            signatures = copy.deepcopy(self[ninter])
-            #get segment ids of signature with ninter interactions
-            # seg = self[ninter][::2]
-            # unegseg=np.where(seg<0)
-            # uninegseg,idx = np.unique(seg[unegseg],return_inverse=True)
-            # pneg = np.array([self.L.Gs.pos[x] for x in uninegseg])
-
-            # nsig = len(seg)
-
-            # # determine positions of points limiting the semgments
-            # #1 get index in L.tahe
-            # # 2 get associated position in L.pt
-
-
-            # utahe = self.L.tahe[:,self.L.tgs[seg]]
-            # # pt : (xycoord (2),pt indexes (2),nb_signatures,nb_interactions)
-            # pt = self.L.pt[:,utahe]
-            
-
-            # ####WARNING BIG TRICK HERE :
-            # #### pa and pb are not set as the same value 
-            # #### to avoid a singular matrixnext.
-            # #### set pa =-pb has no incidence but avoid complex and vain code 
-            # #### modification for handling diffractions
-            # try:
-            #     pt[:,0,unegseg[0],unegseg[1]]=pneg[idx].T
-            #     pt[:,1,unegseg[0],unegseg[1]]=-pneg[idx].T
-            # except:
-            #     pass
-            # pt shape =
-            # 0 : (x,y) coordinates x=0,y=1
-            # 1 : 2 points (linking the semgnet) a=0,b=1
-            #2 : nb of found signatures/segments
-            # 3 : nb interaction
-
+            nid = self.nodes(ninter)
+            ityp = self.types(ninter)
+            pa, pb = sigcoord(self.L, nid)
+            M = sigimage(ptx, pa, pb, ityp)
+            dsig[ninter] = (nid, ityp, pa, pb, M)
+
+        # rx side : backtrace of blocks of receivers
+        lR = [{} for i in range(nrx)]
+        for ninter in dsig:
+            nid, ityp, pa, pb, M = dsig[ninter]
+            for i0 in range(0, nrx, nrb):
+                nb = min(nrb, nrx - i0)
+                # receivers (nb,1,2) broadcast against signatures (1,N,k,2)
+                P, valid = sigbacktrace(prx[i0:i0+nb, None, :2], M[None],
+                                        pa[None], pb[None], ityp[None])
+                for j in range(nb):
+                    uvalid = np.where(valid[j])[0]
+                    if len(uvalid) > 0:
+                        # (3,ninter,nray)
+                        pt = np.zeros((3, ninter, len(uvalid)))
+                        pt[:2] = np.moveaxis(P[j, uvalid], -1, 0).swapaxes(1, 2)
+                        sig = np.empty((2, ninter, len(uvalid)), dtype=int)
+                        sig[0] = nid[uvalid].T
+                        sig[1] = ityp[uvalid].T
+                        lR[i0+j][ninter] = {'pt': pt, 'sig': sig}
+
+        lrays = []
+        for i in range(nrx):
+            rays = Rays(ptx, prx[i])
+            los = shg.LineString(((ptx[0], ptx[1]), (prx[i, 0], prx[i, 1])))
+            dtxrx = np.sum((ptx-prx[i])*(ptx-prx[i]))
+            if dtxrx>1e-15:
+                rays.los = polyctx.contains(los)
+            R = lR[i]
+            if rays.los:
+                R[0]= {'sig':np.zeros(shape=(0,0,1)),'pt': np.zeros(shape=(2,1,0))}
+            rays.update(R)
+            rays.nb_origin_sig = len(self.keys())
+            rays.origin_sig_name = self.filename
+            lrays.append(rays)
+
+        return lrays
+
+    def _linkkey(self):
+        """ hash of the signatures which does not depend on their direction
 
+        Returns
+        -------
 
-            ################################
-            ###############################
-            ####### This part between hash has been copy/paste from self.image2
-            ###### should be considered to become a function
-
-            #get segment ids of signature with ninter interactions
-            # nid = node id
-            nid = self[ninter][::2]
-            nsig = len(nid)
+        key : tuple of string
+            sorted hashes of the signatures and of the reversed signatures,
+            a set of signatures and the set of its reversed signatures
+            have the same key
 
+        """
+        lh = []
+        for rev in [False, True]:
+            d = {}
+            for k in sorted(self.keys()):
+                a = np.hstack((self.nodes(k), self.types(k)))
+                if rev:
+                    a = np.hstack((self.nodes(k)[:, ::-1], self.types(k)[:, ::-1]))
+                d['s' + str(k)] = np.unique(a, axis=0)
+            lh.append(pyu.hashkey(**d))
+        return tuple(sorted(lh))
+
+    def tchannels(self, ptx, prx, fGHz, a=[], b=[], Ta=np.eye(3),
+                  Tb=np.eye(3), H=3, N=1, drange=None, nrb=64, nfb=64,
+                  dtype=complex, lc=None, wstd=''):
+        """ transmission channels from one transmitter to a set of receivers
 
-            # pt shape =
-            # 0 : (x,y) coordinates x=0,y=1
-            # 1 : 2 points (linking the nidment) a=0,b=1
-            # 2 : nb of found signatures/nidments
-            # 3 : nb interactions
-            pt = np.empty((2,2,nsig,ninter))
+        Parameters
+        ----------
 
+        ptx : numpy.array or int
+            Tx coordinates or cycle
+        prx : numpy.array (nrx,3)
+            Rx coordinates (see raysvm)
+        fGHz : np.array (nf,)
+            frequency (GHz)
+        a : Antenna
+            antenna a (default omni)
+        b : Antenna
+            antenna b (default omni)
+        Ta : np.array (3x3)
+            orientation of antenna a
+        Tb : np.array (3x3) or (nrx,3,3)
+            orientation of antenna b, common or one per receiver
+        H : float
+            ceil height (see Rays.to3D)
+        N : int
+            number of multiple floor/ceil reflections (see Rays.to3D)
+        drange : float or None
+            if not None, dynamic range (dB) of the ray pruning (see
+            Rays.prune)
+        nrb : int
+            number of receivers backtraced together (see raysvm)
+        nfb : int
+            number of frequency points per block (see Rays.evalblock)
+        dtype : np.dtype
+            complex type of the evaluation (see Rays.eval)
+        lc : LinkCache or None
+            if not None, the links found in lc are not evaluated and the
+            evaluated links are stored in lc
+        wstd : string
+            wireless standard of the links in lc
 
-            # 1 negative points
-            # seek for diffraction 
-            # negative index points are diffraction points
-            upoint = np.where(nid<0)
-            unipoint,idx = np.unique(nid[upoint],return_inverse=True)
+        Returns
+        -------
 
-            #get their coordinates
-            #
-            # TO BE FIXED 
-            #
-            #upointcoord = self.L.iupnt[-unipoint]
-            #pointcoord = self.L.pt[:,upointcoord]
-
-            pointcoord = np.array([ (self.L.Gs.pos[x][0],self.L.Gs.pos[x][1])  for x in unipoint ]).T
-            # #### WARNING BIG TRICK HERE :
-            # #### pa and pb are not set as the same value 
-            # #### to avoid a singular matrixnext.
-            # #### set pa =-pb has no incidence but avoid complex and vain code 
-            # #### modification for handling diffractions
-            try:
-                pt[:,0,upoint[0],upoint[1]] = pointcoord[:,idx]
-                pt[:,1,upoint[0],upoint[1]] = -pointcoord[:,idx]
-            except:
-                pass
+        lH : list of Tchannel
+            one Tchannel per receiver (None if the receiver has no ray)
 
+        Notes
+        -----
 
-            # 2 positive points
-            # seek for segments
-            useg = np.where(nid>0)
-            # removing duplicates ( for increasing speed)
-            uniseg,idxp = np.unique(nid[useg],return_inverse=True)
+        The 2D rays of all the receivers are obtained from raysvm. The
+        3D rays, local bases and fields are then receiver dependent,
+        they share the antennas, the slab R/T tables and the diffraction
+        transition function table which are built once.
 
-            # determine positions of points limiting the nidments
-            #1 get index in L.tahe
-            utahe = self.L.tahe[:,self.L.tgs[uniseg]]
-            segcoord = self.L.pt[:,utahe]
+        In the link cache lc, the nodes of a link are the Tx and Rx
+        coordinates. The link parameters are the frequencies, the
+        evaluation parameters, the layout, the antennas with their
+        orientation and the signatures, taken regardless of their
+        direction. A link evaluated from a to b is then served from b to
+        a by reciprocity (see LinkCache) when the signatures from b to a
+        are the reversed signatures from a to b.
 
-            pt[:,:,useg[0],useg[1]]=segcoord[:,:,idxp]
+        Examples
+        --------
 
-            ###################################
-            ########################################
+        >>> from pylayers.gis.layout import *
+        >>> L = Layout('defstr.lay')
+        >>> L.build()
+        >>> S = Signatures(L,1,2)
+        >>> S.run(cutoff=3,progress=False)
+        >>> tx = np.r_[L.Gt.pos[1],1.2]
+        >>> prx = np.r_[L.Gt.pos[2],1.5] + np.array([[0,0,0],[0.3,0,0]])
+        >>> lH = S.tchannels(tx,prx,np.linspace(2,6,11))
+        >>> lH[1].y.shape[-1]
+        11
 
+        """
+        fGHz = np.asarray(fGHz, dtype=float).ravel()
+        # default antennas are built once for all the receivers
+        if a == []:
+            a = ant.Antenna('Omni', param={'pol':'t','GmaxdB':0}, fGHz=fGHz)
+        if b == []:
+            b = ant.Antenna('Omni', param={'pol':'t','GmaxdB':0}, fGHz=fGHz)
+        Ta = np.asarray(Ta)
+        Tb = np.asarray(Tb)
+        prx = np.array(prx, dtype=float)
+        if prx.ndim == 1:
+            prx = prx[None, :]
+        nrx = len(prx)
+        lH = [None] * nrx
+        umiss = list(range(nrx))
+        if lc is not None:
+            if type(ptx) == int:
+                ptx = np.array(self.L.Gt.pos[ptx])
+            if len(ptx) == 2:
+                ptx = np.r_[ptx, 0.5]
+            if prx.shape[1] == 2:
+                prx = np.hstack((prx, 0.5*np.ones((nrx, 1))))
+            ntx = tuple(np.round(ptx, 6))
+            lnrx = [tuple(np.round(p, 6)) for p in prx]
+            param = dict(fGHz=fGHz, hceil=H, N=N, drange=drange,
+                         dtype=str(np.dtype(dtype)), layout=self.L._filename,
+                         sig=self._linkkey())
+            def antkey(A):
+                return (A.typ, repr(getattr(A, 'param', {})), A._filename)
+            lkw = []
+            for i in range(nrx):
+                Tbi = Tb[i] if Tb.ndim == 3 else Tb
+                # nodes with their antenna, regardless of the direction
+                lant = sorted([(ntx, antkey(a), np.round(Ta, 9).tolist()),
+                               (lnrx[i], antkey(b), np.round(Tbi, 9).tolist())])
+                lkw.append(dict(param, ant=repr(lant)))
+            umiss = []
+            for i in range(nrx):
+                res = lc.get(ntx, lnrx[i], wstd=wstd, **lkw[i])
+                if res is None:
+                    umiss.append(i)
+                else:
+                    lH[i] = res[1]
+        if len(umiss) == 0:
+            return lH
+        lrays = self.raysvm(ptx, prx[umiss], nrb=nrb)
+        for i, r2d in zip(umiss, lrays):
+            r3d = r2d.to3D(self.L, H=H, N=N)
+            if drange is not None:
+                r3d.prune(self.L, fGHz=fGHz, drange=drange)
+            if r3d.nray > 0:
+                r3d.locbas(self.L)
+                r3d.fillinter(self.L)
+                Tbi = Tb[i] if Tb.ndim == 3 else Tb
+                lH[i] = r3d.evalblock(fGHz, nfb=nfb, a=a, b=b, Ta=Ta,
+                                      Tb=Tbi, dtype=dtype)
+            if lc is not None:
+                lc.put(ntx, lnrx[i], rays=r3d, H=lH[i], wstd=wstd, **lkw[i])
+        return lH
 
+    def backtrace(self, tx, rx, M):
+        ''' backtracing betwen tx and rx
 
-            # how to do this into a while loop ?
-            p=rx
+        Parameters
+        ----------
 
-            # creating W matrix required in eq (2.70) thesis Nicolas AMIOT
-            # Warning W is rolled after and becomes (nsig,4,4)
-            W = np.zeros((4,4,nsig))
-            I = np.eye(2)[:,:,np.newaxis]*np.ones((nsig))
+            tx : ndarray
+                position of tx (2,)
+            rx : ndarray
+                position of tx (2,)
+            M : dict
+                position of intermediate points obtained from self.image2()
 
-            W[:2,:2,...] = I
-            W[2:4,:2,...] = I
+        Returns
+        -------
 
-            # once rolled :
-            # W (nsig,4,4)
-            W = np.rollaxis(W,-1)
+            rayp : dict
+            key = number_of_interactions
+            value = {'pt' : (3,nb_interactions,nb_rays),
+                     'sig' : (2,nb_interactions,nb_rays)}
 
+        Notes
+        -----
 
-            kinter=ninter-1
+        dictionnary of intermediate coordinated :
+        key = number_of_interactions
+        value = nd array M with shape : (2,nb_signatures,nb_interactions)
+        and 2 represent x and y coordinates
 
-            ptr = pt
-            Mr = copy.deepcopy(M)
+        All the signatures with the same number of interactions are
+        processed together (see sigbacktrace).
 
-            epsilon = 1e-12
-            rayp_i = np.zeros((3,nsig,ninter))
-            # rayp_i[:2,:,-1]=rx[:,None]
-            #backtrace process
-            # if ninter == 6:
-            #     print np.where(((signatures[:,0]==42) &(signatures[:,1]==-277) & (signatures[:,2]==135) & (signatures[:,3]==21) & (signatures[:,4]==46) & (signatures[:,5]==319)))
-            #     import ipdb
-            #     ipdb.set_trace()
+        See Also
+        --------
 
-            while kinter > -1:
+        pylayers.antprop.signature.image2
+        pylayers.antprop.signature.sigbacktrace
 
-                #Initilization, using the Tx position
-                if kinter == ninter-1:
-                    p_min_m = p[:,np.newaxis]-Mr[ninter][:,:,kinter]
-                else :
-                    p_min_m = pvalid[:].T-Mr[ninter][:,:,kinter]
-
-                a_min_b = ptr[:,0,:,kinter]-ptr[:,1,:,kinter]
-
-                # Creating W from  eq (2.71)
-                # a_min_b <=> a_{Lh-l}-b_{Lh-l}
-                # p_min_m <=> \tilde{p}_{Lh}-\tilde{b}_{Lh-l}
-                # W (nsig,4,4)
-                # p_min_m (2,nsig)
-                # a_min_b (2,nsig)
-                W[...,:2,2] = p_min_m.T
-                W[...,2:,3] = a_min_b.T
-
-                # create 2nd member from eq (2.72)
-                if kinter == ninter-1:
-                    y= np.concatenate((p[:,np.newaxis]*np.ones((nsig)),ptr[:,0,:,kinter]))
-                else:
-                    y= np.concatenate((pvalid.T,ptr[:,0,:,kinter]))
-
-                # y once transposed :
-                # y (nsig,4)
-                y=y.T
-
-
-                # search and remove point with singular matrix
-                invalid_sig=np.where(abs(np.linalg.det(W))<1e-15)
-
-                W = np.delete(W,invalid_sig,axis=0)
-                y = np.delete(y,invalid_sig,axis=0)
-                ptr = np.delete(ptr,invalid_sig,axis=2)
-                Mr[ninter] = np.delete(Mr[ninter],invalid_sig,axis=1)
-                rayp_i = np.delete(rayp_i,invalid_sig,axis=1)
-
-                #remove signatures
-
-                usig = np.repeat(invalid_sig[0],2)
-                usig[::2]=usig[::2]*2
-                usig[1::2]=usig[1::2]*2+1
-                signatures = np.delete(signatures,usig,axis=0)
-                # detect diffrac
-                uD = signatures[1::2,kinter]==1
-                uuD = np.where(signatures[1::2,kinter]==1)[0]
-
-
-                psolved = np.linalg.solve(W,y)
-
-                #valid ray is : 0 < \alpha < 1 and 0< \beta < 1
-
-                # alpha
-                uvalidA = psolved[:,2]>0.
-                uvalidB = psolved[:,2]<1.
-                #beta
-                uvalidC = psolved[:,3] >= epsilon
-                uvalidD = psolved[:,3] <=1.-epsilon
-                valid = uvalidA & uvalidB & uvalidC & uvalidD
-                # consider valid diffraction interactions
-                valid = valid | uD
-                uvalid = np.where(valid)[0]
-
-                # re-add correct position of diffraction interations
-                #indeed diffraction point should not been solved with linalg, 
-                # but by setting pa=-pb, no singular matrix appear
-                #and diffraction points can be re-add thereafter.
-                psolved[uuD,:2] = ptr[:,0,uuD,kinter].T
-
-                pvalid = psolved[uvalid,:2]
-
-
-                # keep only valid rays for ptr and Mr
-                Mr[ninter]=Mr[ninter][:,uvalid,:]
-                ptr=ptr[:,:,uvalid,:]
-                W = W[uvalid,:,:]
-
-
-                # remove signatures
-                usigv = np.repeat(uvalid,2)
-                usigv[::2]=usigv[::2]*2
-                usigv[1::2]=usigv[1::2]*2+1
-                signatures = signatures[usigv,:]
-                rayp_i[:2,uvalid,kinter] = pvalid.T
-                rayp_i = rayp_i[:,uvalid,:]
-                #if no more rays are valid , then quit block
-                # (kinter <0 is the exit while condition)
-                if len(uvalid) > 0 :
-                    kinter=kinter-1
-                else :
-                    kinter = -2
-
-            # rayp_i[:2,:,0]=tx[:,None]
-            if len(uvalid) !=0:
-                N = int(len(usigv)/2)
-                sir1=signatures[::2].T.reshape(ninter,N)
-                sir2=signatures[1::2].T.reshape(ninter,N)
-                sig = np.empty((2,ninter,N))
-                sig[0,:,:]=sir1
-                sig[1,:,:]=sir2
-                rayp_i=np.swapaxes(rayp_i,1,2)
-                rayp.update({ninter:{'pt':rayp_i,'sig':sig.astype('int')}})
+        '''
+        rayp = {}
+        for ninter in self.keys():
+            nid = self.nodes(ninter)
+            ityp = self.types(ninter)
+            pa, pb = sigcoord(self.L, nid)
+            Mn = np.moveaxis(M[ninter], 0, -1)
+            P, valid = sigbacktrace(rx, Mn, pa, pb, ityp)
+            uvalid = np.where(valid)[0]
+            if len(uvalid) > 0:
+                # (3,ninter,nray)
+                pt = np.zeros((3, ninter, len(uvalid)))
+                pt[:2] = np.moveaxis(P[uvalid], -1, 0).swapaxes(1, 2)
+                sig = np.empty((2, ninter, len(uvalid)), dtype=int)
+                sig[0] = nid[uvalid].T
+                sig[1] = ityp[uvalid].T
+                rayp.update({ninter: {'pt': pt, 'sig': sig}})
         return rayp
 
 
@@ -2649,140 +3622,24 @@ class Signatures(PyLayers,dict):
 
         tx : point
 
-        
-        """
-        if len(tx) > 2:
-            tx = tx[:2]
-        dM={}
-        # loop on number of interactions
-        for ninter in self.keys():
-
-            #get segment ids of signature with ninter interactions
-            # nid = node id
-            nid = self[ninter][::2]
-            nsig = len(nid)
-            M = np.empty((2,nsig,ninter))
-
-
-            # pt shape =
-            # 0 : (x,y) coordinates x=0,y=1
-            # 1 : 2 points (linking the nidment) a=0,b=1
-            # 2 : nb of found signatures/nidments
-            # 3 : nb interactions
-
-            try:
-                pt = np.nan*np.zeros((2,2,nsig,ninter))
-            except:
-                pdb.set_trace()
-
-            #1 negative points
-            # seek for diffraction 
-            # negative index points are diffraction points
-            upoint = np.where(nid<0)
-            unipoint,idxpt = np.unique(nid[upoint],return_inverse=True)
-
-            #get their coordinates
-            #
-            # To be FIXED
-            #
-            #upointcoord = self.L.iupnt[-unipoint]
-            #pointcoord = self.L.pt[:,upointcoord]
-
-            pointcoord = np.array([ (self.L.Gs.pos[x][0],self.L.Gs.pos[x][1])  for x in unipoint ]).T
-        
-            # try except to handle the case where there is no diffraction point
-            try:
-                pt[:,0,upoint[0],upoint[1]] = pointcoord[:,idxpt]
-                pt[:,1,upoint[0],upoint[1]] = pointcoord[:,idxpt]
-            except:
-                pass
-
-
-            #2 positive points
-            #seek for segments
-            useg = np.where(nid>0)
-            # removing duplicates ( for increasing speed)
-            uniseg,idxseg = np.unique(nid[useg],return_inverse=True)
-
-            # determine positions of points limiting the nidments
-            #1 get index in L.tahe
-            utahe = self.L.tahe[:,self.L.tgs[uniseg]]
-            segcoord = self.L.pt[:,utahe]
-
-            pt[:,:,useg[0],useg[1]]=segcoord[:,:,idxseg]
-
-            # check every element of pt is filled
-            assert not np.isnan(pt).any()
-            #
-            # TODO Upgrading layout for handling slab offsets 
-            #
-            # uncomment those two lines when the numpy array L.norm and
-            # L.offset exist
-            #norm    = self.L.normal[:,utahe]
-            #offset  = self.L.offset[:,utahe]
-            # pt = pt + offset*norm
-
-
-            ############
-            #formula 2.61 -> 2.64 N.AMIOT PH.D thesis
-            ############
-            sx = pt[0,1,:,:]-pt[0,0,:,:]
-            sy = pt[1,1,:,:]-pt[1,0,:,:]
-            den = sx**2+sy**2
-            # den = ((pt[0,0,:,:]-pt[0,1,:,:])**2+(pt[1,0,:,:]-pt[1,1,:,:])**2)
-            # avoiding singularity (should not be possible)
-            uz = np.where(den==0)
-            den[uz] = 1.
-
-            a = 1 - (2. / den) * (pt[1,0,:, :] - pt[1,1,:, :]) ** 2
-            b= (2. / den) * (pt[0,1,:, :] - pt[0,0,:, :]) * (pt[1,0,:, :] - pt[1,1,:, :])
-            c = (2. / den) * (pt[0,0,:, :] * (pt[1,0,:, :] - pt[1,1,:, :]) ** 2 +
-                              pt[1,0,:, :] * (pt[1,0,:, :] - pt[1,1,:, :]) *
-                             (pt[0,1,:, :] - pt[0,0,:, :]))
-            d = (2. / den) * (pt[1,0,:, :] * (pt[0,1,:, :] - pt[0,0,:, :]) ** 2 +
-                              pt[0,0,:, :] * (pt[1,0,:, :] - pt[1,1,:, :]) *
-                             (pt[0,1,:, :] - pt[0,0,:, :]))
-            # a = ((pt[0,0,:,:]-pt[0,1,:,:])**2-(pt[1,0,:,:]-pt[1,1,:,:])**2)
-            # a=a/(1.*den)
-
-            # b = 2*(pt[0,1,:,:]-pt[0,0,:,:])*(pt[1,1,:,:]-pt[1,0,:,:])
-            # b=b/(1.*den)
-
-            # c= 2*(pt[0,0,:,:]*(pt[1,0,:,:]-pt[1,1,:,:])**2+pt[1,0,:,:]*(pt[0,1,:,:]-pt[0,0,:,:])*(pt[1,0,:,:]-pt[1,1,:,:]))
-            # c = c/(1.*den)
-
-            # d= 2*(pt[0,0,:,:]*(pt[1,0,:,:]-pt[1,1,:,:])*(pt[0,1,:,:]-pt[0,0,:,:])+pt[1,0,:,:]*(pt[0,1,:,:]-pt[0,0,:,:])**2)
-            # d= d/(1.*den)
-
-            # K=np.array([[a,-b],[-b,-a]])
-            K = np.array([[a,-b],[-b,-a]])
+        Returns
+        -------
 
-            # translation vector v (2.60)
-            v =np.array(([c,d]))
+        dM : dict
+            key = number of interactions
+            value = np.array (2,nb_signatures,nb_interactions) images of tx
 
-            ityp = self[ninter][1::2]
+        See Also
+        --------
 
-            for n in np.arange(ninter):
-                #get segment ids of signature with ninter interactions
-                uT = np.where(ityp[:,n]==3)[0]
-                uR = np.where(ityp[:,n]==2)[0]
-                uD = np.where(ityp[:,n]==1)[0]
-                if n ==0:
-                    p = tx[:,None]*np.ones((nsig))
-                else :
-                    p = M[:,:,n-1]
-                #reflexion 0 (2.67)
-                M[:,uR,n] = np.einsum('ijk,jk->ik',K[:,:,uR,n],p[:,uR])+v[:,uR,n]
-                #transmission 0 (2.67)
-                M[:,uT,n] = p[:,uT]
-                M[:,uD,n] = pt[:,0,uD,n]
-
-            # if ninter==6:
-            #     print np.where(((seg[:,0]==42) & (seg[:,1]==-277) & (seg[:,2]==135) & (seg[:,3]==21)&(seg[:,-1]==319)))
-            #     import ipdb
-            #     ipdb.set_trace()
+        pylayers.antprop.signature.sigimage
 
-            dM.update({ninter:M})
+        """
+        dM = {}
+        for ninter in self.keys():
+            pa, pb = sigcoord(self.L, self.nodes(ninter))
+            M = sigimage(tx, pa, pb, self.types(ninter))
+            dM.update({ninter: np.moveaxis(M, -1, 0)})
         return dM
 
     def image(self,tx=np.array([2.7,12.5])):
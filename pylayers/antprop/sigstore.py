@@ -0,0 +1,680 @@
+#-*- coding:Utf-8 -*-
+r"""
+.. currentmodule:: pylayers.antprop.sigstore
+
+Cycle pair signature store
+==========================
+
+This module stores the signatures of a Layout between pairs of cycles in
+a single HDF5 file per Layout, with a memory LRU tier in front of it.
+
+File structure
+--------------
+
++ attributes : layout file name, layout content hash and format version
++ one group per search parameter hash, with the search parameters as
+  attributes
++ one group ``<source>_<target>`` per cycle pair with the flat arrays
+  of the signatures as datasets ``ptr``, ``node``, ``typ`` and ``ratio``
+  (see Signatures.csr)
+
+The layout content hash is obtained from Layout.graphhash. When it
+differs from the one stored in the file, the whole file content is
+discarded.
+
+.. autosummary::
+    :toctree: generated/
+
+    paramkey
+    SignatureStore
+    precompute_signatures
+
+"""
+from __future__ import print_function
+import os
+import time
+import hashlib
+import multiprocessing
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+import h5py
+from tqdm import tqdm
+import pylayers.util.pyutil as pyu
+import pylayers.util.mputil as mpu
+import pylayers.gis.layout as layout
+from pylayers.util.project import pstruc, logger
+from pylayers.antprop.signature import Signatures, SignatureSearch
+
+STORE_VERSION = 2
+
+# search parameters which modify the signatures (see Signatures.run)
+DEFAULTS = OrderedDict([('cutoff', 2),
+                        ('threshold', 0.1),
+                        ('delay_excess_max_ns', 400),
+                        ('nD', 1),
+                        ('nR', 10),
+                        ('nT', 10),
+                        ('bt', True),
+                        ('diffraction', True)])
+
+
+def paramkey(**kwargs):
+    """ normalized search parameters and their hash
+
+    Parameters
+    ----------
+
+    kwargs : search parameters of Signatures.run
+        missing parameters take their default value, parameters
+        which do not modify the result (e.g. progress) are ignored
+
+    Returns
+    -------
+
+    key : string
+        sha1 hexdigest of the normalized parameters
+    param : OrderedDict
+
+    Examples
+    --------
+
+    >>> k1, p1 = paramkey(cutoff=3)
+    >>> k2, p2 = paramkey(cutoff=3, threshold=0.1, progress=True)
+    >>> k1 == k2
+    True
+    >>> k3, p3 = paramkey(cutoff=3, nR=2)
+    >>> k1 == k3
+    False
+
+    """
+    param = OrderedDict()
+    for k in DEFAULTS:
+        v = kwargs.get(k, DEFAULTS[k])
+        if isinstance(DEFAULTS[k], bool):
+            param[k] = bool(v)
+        elif k in ('threshold', 'delay_excess_max_ns'):
+            param[k] = float(v)
+        else:
+            param[k] = int(v)
+    key = hashlib.sha1(repr(list(param.items())).encode('utf-8')).hexdigest()
+    return key, param
+
+
+class SignatureStore(object):
+    """ get or compute store of cycle pair signatures
+
+    Parameters
+    ----------
+
+    L : Layout
+        built layout
+    maxsize : int
+        maximum number of Signatures kept in memory (default 256)
+    filename : string
+        HDF5 file (default <layout name>_sig.h5 in pstruc['DIRSIG'])
+
+    Attributes
+    ----------
+
+    nmem : int
+        number of requests served by the memory tier
+    nfile : int
+        number of requests served by the HDF5 file
+    ncomp : int
+        number of computed cycle pairs
+
+    Notes
+    -----
+
+    A request is served by the memory tier, then by the HDF5 file and
+    is otherwise computed with SignatureSearch and written in both.
+
+    The layout hash is evaluated at the creation of the store and
+    evaluated again when the graphs of the layout have been replaced or
+    rebuilt (Layout.build, Layout.rebuild, Layout.loadc). In case of
+    change, the memory tier and the file are cleared.
+
+    The Signatures objects returned by the memory tier are shared,
+    they should not be modified by the caller.
+
+    Examples
+    --------
+
+    >>> from pylayers.gis.layout import *
+    >>> from pylayers.antprop.sigstore import *
+    >>> L = Layout('defstr.lay')
+    >>> L.build()
+    >>> st = SignatureStore(L)
+    >>> S = st.get(1, 2, cutoff=2)
+    >>> S2 = st.get(1, 2, cutoff=2)
+    >>> S is S2
+    True
+
+    See Also
+    --------
+
+    pylayers.antprop.signature.SignatureSearch
+    pylayers.gis.layout.Layout.graphhash
+
+    """
+
+    def __init__(self, L, maxsize=256, filename=None):
+        self.L = L
+        self.maxsize = maxsize
+        if filename is None:
+            filename = pyu.getlong(L._filename.split('.')[0] + '_sig.h5',
+                                   pstruc['DIRSIG'])
+        self.filename = filename
+        self.lru = OrderedDict()
+        self.nmem = 0
+        self.nfile = 0
+        self.ncomp = 0
+        self._token = None
+        self.lhash = None
+        self.check()
+
+    def __repr__(self):
+        st = 'SignatureStore : ' + self.filename + '\n'
+        st = st + 'layout hash : ' + str(self.lhash) + '\n'
+        st = st + 'memory : ' + str(len(self.lru)) + '/' + str(self.maxsize) + '\n'
+        st = st + 'hits (memory/file/computed) : ' + str(self.nmem) + '/' + \
+            str(self.nfile) + '/' + str(self.ncomp)
+        return st
+
+    def _layouttoken(self):
+        """ objects replaced by a build, a rebuild or a cache load
+        """
+        d = self.L.__dict__
+        return (d.get('Gs'), d.get('_snap'), d.get('_lazyG'))
+
+    def check(self):
+        """ invalidate the store if the layout content has changed
+
+        Returns
+        -------
+
+        boolean : True if the store has been invalidated
+
+        """
+        token = self._layouttoken()
+        if (self._token is not None) and \
+           all(a is b for a, b in zip(token, self._token)):
+            return False
+        self._token = token
+        lhash = self.L.graphhash()
+        if lhash == self.lhash:
+            return False
+        self.lhash = lhash
+        self.lru.clear()
+        fh5 = h5py.File(self.filename, 'a')
+        try:
+            if (fh5.attrs.get('hash', '') != lhash) or \
+               (fh5.attrs.get('version', -1) != STORE_VERSION):
+                for k in list(fh5.keys()):
+                    del fh5[k]
+                fh5.attrs['L'] = self.L._filename
+                fh5.attrs['hash'] = lhash
+                fh5.attrs['version'] = STORE_VERSION
+                return True
+        finally:
+            fh5.close()
+        return False
+
+    def clear(self):
+        """ remove all the signatures of the store
+        """
+        self.lru.clear()
+        fh5 = h5py.File(self.filename, 'a')
+        try:
+            for k in list(fh5.keys()):
+                del fh5[k]
+        finally:
+            fh5.close()
+
+    def _remember(self, key, S):
+        self.lru.pop(key, None)
+        self.lru[key] = S
+        while len(self.lru) > self.maxsize:
+            self.lru.popitem(last=False)
+
+    def _read(self, pkey, source, target):
+        """ read a cycle pair from the file (None if absent)
+        """
+        if not os.path.isfile(self.filename):
+            return None
+        grpname = pkey + '/' + str(source) + '_' + str(target)
+        fh5 = h5py.File(self.filename, 'r')
+        try:
+            if grpname not in fh5:
+                return None
+            f = fh5[grpname]
+            S = Signatures(self.L, source, target,
+                           cutoff=int(fh5[pkey].attrs['cutoff']),
+                           threshold=float(fh5[pkey].attrs['threshold']))
+            S.setcsr(f['ptr'][:], f['node'][:], f['typ'][:], f['ratio'][:])
+        finally:
+            fh5.close()
+        return S
+
+    def _write(self, pkey, param, lS):
+        """ write a list of Signatures in the file
+        """
+        fh5 = h5py.File(self.filename, 'a')
+        try:
+            if pkey not in fh5:
+                g = fh5.create_group(pkey)
+                for k in param:
+                    g.attrs[k] = param[k]
+            g = fh5[pkey]
+            for S in lS:
+                grpname = str(S.source) + '_' + str(S.target)
+                if grpname in g:
+                    del g[grpname]
+                f = g.create_group(grpname)
+                f.attrs['source'] = S.source
+                f.attrs['target'] = S.target
+                ptr, node, typ = S.csr()
+                f.create_dataset('ptr', data=ptr)
+                f.create_dataset('node', data=node)
+                f.create_dataset('typ', data=typ)
+                f.create_dataset('ratio', data=S.ratiocsr())
+        finally:
+            fh5.close()
+
+    def put(self, S, **kwargs):
+        """ store a Signatures
+
+        Parameters
+        ----------
+
+        S : Signatures
+        kwargs : search parameters used for S (see Signatures.run)
+
+        """
+        self.check()
+        pkey, param = paramkey(**kwargs)
+        self._write(pkey, param, [S])
+        self._remember((pkey, S.source, S.target), S)
+
+    def has(self, source, target, **kwargs):
+        """ test if a cycle pair is stored (memory or file)
+        """
+        self.check()
+        pkey, param = paramkey(**kwargs)
+        if (pkey, source, target) in self.lru:
+            return True
+        return (source, target) in self.pairs(**kwargs)
+
+    def pairs(self, **kwargs):
+        """ cycle pairs stored in the file for a set of search parameters
+
+        Returns
+        -------
+
+        lpairs : set of tuple (source, target)
+
+        """
+        self.check()
+        pkey, param = paramkey(**kwargs)
+        lpairs = set()
+        if not os.path.isfile(self.filename):
+            return lpairs
+        fh5 = h5py.File(self.filename, 'r')
+        try:
+            if pkey in fh5:
+                for grpname in fh5[pkey].keys():
+                    s, t = grpname.split('_')
+                    lpairs.add((int(s), int(t)))
+        finally:
+            fh5.close()
+        return lpairs
+
+    def get(self, source, target, **kwargs):
+        """ get or compute the signatures between two cycles
+
+        Parameters
+        ----------
+
+        source : int
+            source cycle
+        target : int
+            target cycle
+        kwargs : search parameters (see Signatures.run)
+
+        Returns
+        -------
+
+        S : Signatures
+
+        """
+        return self.getmany(source, [target], **kwargs)[target]
+
+    def getmany(self, source, targets, **kwargs):
+        """ get or compute the signatures from a cycle to several cycles
+
+        Parameters
+        ----------
+
+        source : int
+            source cycle
+        targets : list of int
+            target cycles
+        kwargs : search parameters (see Signatures.run)
+
+        Returns
+        -------
+
+        dS : dict
+            {target : Signatures}
+
+        Notes
+        -----
+
+        The missing targets are computed in a single SignatureSearch walk.
+
+        """
+        self.check()
+        pkey, param = paramkey(**kwargs)
+        dS = {}
+        lmiss = []
+        for t in targets:
+            key = (pkey, source, t)
+            if key in self.lru:
+                self.nmem += 1
+                S = self.lru.pop(key)
+                self.lru[key] = S
+                dS[t] = S
+                continue
+            S = self._read(pkey, source, t)
+            if S is not None:
+                self.nfile += 1
+                self._remember(key, S)
+                dS[t] = S
+            elif t not in lmiss:
+                lmiss.append(t)
+
+        if len(lmiss) > 0:
+            ss = SignatureSearch(self.L, diffraction=param['diffraction'])
+            dSc = ss.run(source, lmiss,
+                         cutoff=param['cutoff'],
+                         threshold=param['threshold'],
+                         delay_excess_max_ns=param['delay_excess_max_ns'],
+                         nD=param['nD'],
+                         nR=param['nR'],
+                         nT=param['nT'],
+                         bt=param['bt'],
+                         progress=kwargs.get('progress', False))
+            self._write(pkey, param, [dSc[t] for t in lmiss])
+            for t in lmiss:
+                self.ncomp += 1
+                self._remember((pkey, source, t), dSc[t])
+                dS[t] = dSc[t]
+        return dS
+
+
+# layout of a worker process of precompute_signatures
+_sigL = None
+
+
+def _siginit(L, filename):
+    """ worker initializer of precompute_signatures
+
+    Parameters
+    ----------
+
+    L : Layout or None
+        inherited layout (fork start method)
+    filename : string
+        layout file name, used when L is None (the graphs are then
+        restored from the layout graph cache)
+
+    """
+    global _sigL
+    if L is None:
+        L = layout.Layout(filename)
+        L.build(cache=True)
+    _sigL = L
+
+
+def _sigtask(source, targets, param):
+    """ signatures from a source cycle to a group of target cycles
+
+    Parameters
+    ----------
+
+    source : int
+    targets : tuple of int
+    param : dict
+        normalized search parameters (see paramkey)
+
+    Returns
+    -------
+
+    dres : dict
+        {target : (ptr, node, typ, ratio)} flat arrays (see Signatures.csr)
+
+    Notes
+    -----
+
+    Only plain arrays are returned, the Layout is not sent back to the
+    parent process.
+
+    """
+    ss = SignatureSearch(_sigL, diffraction=param['diffraction'])
+    dS = ss.run(source, list(targets),
+                cutoff=param['cutoff'],
+                threshold=param['threshold'],
+                delay_excess_max_ns=param['delay_excess_max_ns'],
+                nD=param['nD'],
+                nR=param['nR'],
+                nT=param['nT'],
+                bt=param['bt'])
+    return {t: dS[t].csr() + (dS[t].ratiocsr(),) for t in dS}
+
+
+def precompute_signatures(L, sources, targets, workers=-1, store=None,
+                          chunksize=16, retries=2, verbose=True, **kwargs):
+    """ compute the signatures of all the cycle pairs with a process pool
+
+    Parameters
+    ----------
+
+    L : Layout
+        built layout
+    sources : list of int
+        source cycles (e.g. access point cycles)
+    targets : list of int
+        target cycles
+    workers : int
+        number of processes, 0 or 1 : serial, -1 : one per cpu (default)
+    store : SignatureStore
+        destination store (default SignatureStore(L))
+    chunksize : int
+        maximal number of targets per task. The targets of a task are
+        evaluated in a single SignatureSearch walk
+    retries : int
+        number of times a failed task is submitted again
+    verbose : boolean
+        display a progress bar with the throughput
+    kwargs : search parameters (see Signatures.run)
+
+    Returns
+    -------
+
+    dstat : dict
+        'npairs' : number of requested pairs
+        'nstored' : pairs already in the store (skipped)
+        'ncomputed' : pairs computed by this call
+        'failed' : list of (source, target) pairs which failed
+        'elapsed' : duration (s)
+        'rate' : computed pairs per second
+
+    Notes
+    -----
+
+    The pairs already present in the store are skipped, and each task
+    result is written in the store file as soon as it is received, so
+    that an interrupted job is resumed by calling the function again.
+
+    When the fork start method is available the workers inherit the
+    Layout graphs (Gi is shared copy on write and never pickled).
+    Otherwise each worker restores the layout from the graph cache
+    (Layout.build(cache=True)).
+
+    A task raising an exception is split into single target tasks
+    which are submitted again, up to retries times. A dead worker
+    breaks the pool, which is restarted ; the tasks in progress are
+    split as well and, as the faulty one is unknown, they are then run
+    one at a time, so that a crash is charged to the right pair.
+
+    Examples
+    --------
+
+    >>> from pylayers.gis.layout import *
+    >>> from pylayers.antprop.sigstore import *
+    >>> L = Layout('defstr.lay')
+    >>> L.build()
+    >>> st = SignatureStore(L)
+    >>> dstat = precompute_signatures(L, [1], [2, 3], workers=0,
+    ...                               store=st, verbose=False, cutoff=1)
+    >>> dstat['npairs']
+    2
+
+    See Also
+    --------
+
+    SignatureStore
+    pylayers.antprop.signature.SignatureSearch
+
+    """
+    if store is None:
+        store = SignatureStore(L)
+    pkey, param = paramkey(**kwargs)
+    store.check()
+
+    t0 = time.time()
+    lpairs = [(s, t) for s in sources for t in targets]
+    done = store.pairs(**kwargs)
+    dmiss = OrderedDict()
+    for s, t in lpairs:
+        if (s, t) not in done:
+            lt = dmiss.setdefault(s, [])
+            if t not in lt:
+                lt.append(t)
+
+    pending = deque()
+    for s in dmiss:
+        for k0, k1 in mpu.chunkslices(len(dmiss[s]), chunksize):
+            pending.append((s, tuple(dmiss[s][k0:k1]), 0))
+    nmiss = sum([len(dmiss[s]) for s in dmiss])
+
+    dstat = {'npairs': len(set(lpairs)),
+             'nstored': len(set(lpairs)) - nmiss,
+             'ncomputed': 0,
+             'failed': [],
+             'elapsed': 0.,
+             'rate': 0.}
+
+    if verbose:
+        pb = tqdm(total=nmiss, desc='Signatures', unit='pair')
+
+    def save(source, dres):
+        lS = []
+        for t in dres:
+            S = Signatures(L, source, t, cutoff=param['cutoff'],
+                           threshold=param['threshold'])
+            S.setcsr(*dres[t])
+            lS.append(S)
+        store._write(pkey, param, lS)
+        dstat['ncomputed'] += len(lS)
+        if verbose:
+            pb.update(len(lS))
+            pb.set_postfix(rate='%.2f pair/s' % (dstat['ncomputed'] /
+                                                max(time.time() - t0, 1e-9)))
+
+    def fail(task, err, natt=None):
+        source, lt, n = task
+        if natt is None:
+            logger.warning('precompute_signatures : source %d targets %s : %s',
+                           source, str(lt), str(err))
+            if n >= retries:
+                dstat['failed'].extend([(source, t) for t in lt])
+                return
+            natt = n + 1
+        pending.extend([(source, (t,), natt) for t in lt])
+
+    nproc = min(mpu.nworkers(workers), max(len(pending), 1))
+    if nproc == 1:
+        global _sigL
+        _siginit(L, L._filename)
+        try:
+            while pending:
+                task = pending.popleft()
+                try:
+                    dres = _sigtask(task[0], task[1], param)
+                except Exception as err:
+                    fail(task, err)
+                else:
+                    save(task[0], dres)
+        finally:
+            # the layout is not kept by the module
+            _sigL = None
+    else:
+        if 'fork' in multiprocessing.get_all_start_methods():
+            ctx = multiprocessing.get_context('fork')
+            initargs = (L, L._filename)
+        else:
+            ctx = multiprocessing.get_context()
+            initargs = (None, L._filename)
+        executor = None
+        running = {}
+        try:
+            while pending or running:
+                if executor is None:
+                    executor = ProcessPoolExecutor(nproc, mp_context=ctx,
+                                                   initializer=_siginit,
+                                                   initargs=initargs)
+                while pending and (len(running) < 2 * nproc):
+                    # a task which already failed runs alone
+                    if (pending[0][2] > 0) and running:
+                        break
+                    task = pending.popleft()
+                    f = executor.submit(_sigtask, task[0], task[1], param)
+                    running[f] = task
+                    if task[2] > 0:
+                        break
+                alone = (len(running) == 1)
+                fdone, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                broken = False
+                for f in fdone:
+                    task = running.pop(f)
+                    try:
+                        dres = f.result()
+                    except BrokenProcessPool as err:
+                        broken = True
+                        if alone:
+                            fail(task, err)
+                        else:
+                            # the faulty task is unknown : isolate
+                            fail(task, err, natt=max(task[2], 1))
+                    except Exception as err:
+                        fail(task, err)
+                    else:
+                        save(task[0], dres)
+                if broken:
+                    # the tasks in progress are lost with the pool
+                    for f in list(running):
+                        task = running.pop(f)
+                        fail(task, None, natt=max(task[2], 1))
+                    executor.shutdown(wait=False)
+                    executor = None
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=True)
+
+    if verbose:
+        pb.close()
+    dstat['elapsed'] = time.time() - t0
+    dstat['rate'] = dstat['ncomputed'] / max(dstat['elapsed'], 1e-9)
+    return dstat
@@ -14,6 +14,8 @@ import doctest
 #import objxml
 import pdb
 import copy
+import hashlib
+from collections import OrderedDict
 import numpy as np
 import scipy as sp
 from scipy.interpolate import interp1d
@@ -23,6 +25,11 @@ import pylayers.util.pyutil as pyu
 import pylayers.util.plotutil as plu
 from pylayers.util.project import *
 
+# R/T tables of the current session, indexed by their key (least recently
+# used first out beyond _ntable tables)
+_dtable = OrderedDict()
+_ntable = 64
+
 """
 .. currentmodule:: pylayers.antprop.slab
 
@@ -1316,6 +1323,24 @@ class Slab(Interface,dict):
                 mi = matDB[matname]
             self['lmat'].append(mi)
 
+    def slabhash(self):
+        """ hash of the slab definition
+
+        Returns
+        -------
+
+        h : string
+            sha1 of the layer thicknesses and of the electrical properties
+            of the layer materials. The name and display attributes of the
+            slab do not enter the hash.
+
+        """
+        lmat = [sorted((k, repr(m[k])) for k in m) for m in self['lmat']]
+        s = repr((list(self['lmatname']),
+                  [float(d) for d in self['lthick']],
+                  lmat))
+        return hashlib.sha1(s.encode('utf-8')).hexdigest()
+
 
     def eval(self, fGHz=np.array([1.0]), theta=np.linspace(0, np.pi / 2, 50),compensate=False,RT='RT'):
         """ evaluation of the Slab
@@ -1335,11 +1360,11 @@ class Slab(Interface,dict):
             fGHz = np.array([fGHz])
         if not isinstance(theta, np.ndarray):
             theta = np.array([theta])
-        theta_in = copy.deepcopy(theta)
+        # theta is rebound (not modified) along the layer chain
+        theta_in = theta
 
         self.theta = theta
         self.fGHz = fGHz
-        theta_in = copy.deepcopy(theta)
 
         nf = len(fGHz)
         #nt = len(theta)
@@ -1670,6 +1695,237 @@ class Slab(Interface,dict):
         return fig,ax
 
 
+class SlabTable(PyLayers):
+    """ tabulated reflection and transmission coefficients of a Slab
+
+    The diagonal terms of the R and T matrices are evaluated once on the
+    exact frequency grid and on a grid of incidence angles spanning
+    [0, pi/2]. Starting from a regular grid, every interval whose linear
+    interpolation error, measured at its middle point over all
+    frequencies and both polarizations, exceeds `tol` is split until the
+    smallest interval allowed by `nmax` is reached.
+
+    Parameters
+    ----------
+
+    slab : Slab
+    fGHz : np.array (nf,)
+    tol : float
+        interpolation error bound on the coefficients (default 1e-4)
+    nmin : int
+        number of angles of the initial regular grid (default 65)
+    nmax : int
+        number of angles of the regular grid with the finest allowed
+        spacing (default 16385)
+
+    Attributes
+    ----------
+
+    theta : np.array (nt,)
+        sorted incidence angles
+    R : np.array (nt,nf,2)
+        diagonal of the reflection matrix
+    T : np.array (nt,nf,2)
+        diagonal of the compensated transmission matrix
+    bad : np.array (nt-1,) boolean
+        intervals where the error bound is not reached. Angles falling
+        into those intervals are evaluated exactly.
+    err : float
+        largest error estimate over the intervals which are not bad
+    thick : float
+        slab thickness
+
+    Notes
+    -----
+
+    The transmission is tabulated with the phase compensation of
+    Slab.eval(compensate=True) which removes most of its angular
+    variation. Entries which are not finite (grazing incidence on a slab
+    of air) are replaced by the closest finite entry.
+
+    Examples
+    --------
+
+    >>> from pylayers.antprop.slab import *
+    >>> sl = SlabDB('slabDB.ini','matDB.ini')
+    >>> fGHz = np.arange(2,6,0.5)
+    >>> tab = SlabTable(sl['WOOD'],fGHz,tol=1e-4)
+    >>> R = tab.eval(np.array([0.1,0.4]),RT='R')
+    >>> R.shape
+    (8, 2, 2, 2)
+
+    """
+
+    def __init__(self, slab, fGHz, tol=1e-4, nmin=65, nmax=16385):
+        self.fGHz = np.asarray(fGHz, dtype=float).ravel()
+        self.tol = tol
+        self.hash = slab.slabhash()
+        self.thick = float(sum(slab['lthick']))
+        self.metalic = 'METAL' in slab['lmatname']
+        self.slab = slab
+
+        theta = np.linspace(0, np.pi / 2, nmin)
+        R, T = self._rt(theta)
+        # intervals to be checked and their error estimate
+        todo = np.ones(nmin - 1, dtype=bool)
+        ierr = np.zeros(nmin - 1)
+        hmin = (np.pi / 2) / (nmax - 1)
+        while todo.any():
+            ib = np.nonzero(todo)[0]
+            thm = 0.5 * (theta[ib] + theta[ib + 1])
+            Rm, Tm = self._rt(thm)
+            eR = np.abs(Rm - 0.5 * (R[ib] + R[ib + 1]))
+            eT = np.abs(Tm - 0.5 * (T[ib] + T[ib + 1]))
+            e = np.maximum(np.nan_to_num(eR).max(axis=(1, 2)),
+                           np.nan_to_num(eT).max(axis=(1, 2)))
+            # the error of the two halves is about e/4
+            split = (e > tol) & (0.5 * (theta[ib + 1] - theta[ib]) > hmin)
+            todo[ib] = split
+            ierr[ib] = np.where(e > tol, e, e / 4.)
+            theta = np.insert(theta, ib + 1, thm)
+            R = np.insert(R, ib + 1, Rm, axis=0)
+            T = np.insert(T, ib + 1, Tm, axis=0)
+            todo = np.insert(todo, ib + 1, todo[ib])
+            ierr = np.insert(ierr, ib + 1, ierr[ib])
+
+        self.theta = theta
+        self.R = self._fill(R)
+        self.T = self._fill(T)
+        self.bad = ierr > tol
+        self.err = ierr[~self.bad].max() if (~self.bad).any() else 0.
+
+    def _rt(self, theta):
+        """ exact diagonal R and compensated T on a set of angles
+
+        Returns
+        -------
+
+        R , T : np.array (nt,nf,2)
+
+        """
+        slab = self.slab
+        with np.errstate(all='ignore'):
+            slab.eval(fGHz=self.fGHz, theta=theta, RT='RT', compensate=True)
+        R = np.stack((slab.R[..., 0, 0], slab.R[..., 1, 1]), axis=-1)
+        if self.metalic:
+            T = np.zeros(R.shape, dtype=complex)
+        else:
+            T = np.stack((slab.T[..., 0, 0], slab.T[..., 1, 1]), axis=-1)
+        return R.swapaxes(0, 1), T.swapaxes(0, 1)
+
+    def _fill(self, A):
+        """ replace non finite entries by the closest finite angle entry
+        """
+        bad = ~np.isfinite(A)
+        if not bad.any():
+            return A
+        it = np.arange(A.shape[0])
+        for kf, kp in zip(*np.nonzero(bad.any(axis=0))):
+            b = bad[:, kf, kp]
+            if b.all():
+                A[:, kf, kp] = 0
+                continue
+            ig = it[~b]
+            u = np.searchsorted(ig, it[b])
+            u0 = ig[np.maximum(u - 1, 0)]
+            u1 = ig[np.minimum(u, len(ig) - 1)]
+            near = np.where(it[b] - u0 <= u1 - it[b], u0, u1)
+            A[b, kf, kp] = A[near, kf, kp]
+        return A
+
+    def eval(self, theta, RT='RT', compensate=False, dtype=complex):
+        """ interpolated R and T matrices
+
+        Parameters
+        ----------
+
+        theta : np.array (N,)
+            incidence angles (radians)
+        RT : string
+            'R', 'T' or 'RT'
+        compensate : boolean
+            same meaning as in Slab.eval
+        dtype : np.dtype
+            complex type of the result
+
+        Returns
+        -------
+
+        R and/or T : np.array (nf,N,2,2)
+
+        """
+        theta = np.clip(np.asarray(theta, dtype=float).ravel(), 0, np.pi / 2)
+        nt = len(self.theta)
+        nf = len(self.fGHz)
+        N = len(theta)
+        i0 = np.searchsorted(self.theta, theta, side='right') - 1
+        i0 = np.clip(i0, 0, nt - 2)
+        th0 = self.theta[i0]
+        w = ((theta - th0) / (self.theta[i0 + 1] - th0))[:, None, None]
+        # angles evaluated exactly
+        ue = np.nonzero(self.bad[i0])[0]
+        if len(ue) > 0:
+            Re, Te = self._rt(theta[ue])
+        lRT = []
+        for key in 'RT':
+            if key not in RT:
+                continue
+            A = getattr(self, key)
+            d = A[i0]
+            d *= (1 - w)
+            d += w * A[i0 + 1]
+            if len(ue) > 0:
+                d[ue] = Re if key == 'R' else Te
+            if key == 'T' and not compensate:
+                d *= np.exp(-1j * 2 * np.pi * self.thick *
+                            np.cos(theta)[:, None, None] *
+                            self.fGHz[None, :, None] / 0.3)
+            M = np.zeros((nf, N, 2, 2), dtype=dtype)
+            M[..., 0, 0] = d[..., 0].T
+            M[..., 1, 1] = d[..., 1].T
+            lRT.append(M)
+        if len(lRT) == 1:
+            return lRT[0]
+        return tuple(lRT)
+
+    def save(self, filename):
+        """ save the table in a .npz file
+        """
+        np.savez(filename, fGHz=self.fGHz, theta=self.theta, R=self.R,
+                 T=self.T, bad=self.bad, err=self.err, tol=self.tol,
+                 thick=self.thick, metalic=self.metalic, hash=self.hash)
+
+    @classmethod
+    def load(cls, filename, slab):
+        """ load a table saved by SlabTable.save
+
+        Parameters
+        ----------
+
+        filename : string
+        slab : Slab
+            slab used for the exact evaluation of the bad intervals
+
+        """
+        f = np.load(filename)
+        tab = cls.__new__(cls)
+        tab.fGHz = f['fGHz']
+        tab.theta = f['theta']
+        tab.R = f['R']
+        tab.T = f['T']
+        tab.bad = f['bad']
+        tab.err = float(f['err'])
+        tab.tol = float(f['tol'])
+        tab.thick = float(f['thick'])
+        tab.metalic = bool(f['metalic'])
+        tab.hash = str(f['hash'])
+        f.close()
+        tab.slab = slab
+        if tab.hash != slab.slabhash():
+            raise ValueError('SlabTable.load : slab definition mismatch')
+        return tab
+
+
 class SlabDB(dict):
     """ Slab data base
 
@@ -1747,6 +2003,69 @@ class SlabDB(dict):
         return(st)
 
 
+    def rttable(self, name, fGHz, tol=1e-4, cache=True):
+        """ get or build the R/T table of a slab
+
+        Parameters
+        ----------
+
+        name : string
+            slab name
+        fGHz : np.array (nf,)
+        tol : float
+            interpolation error bound
+        cache : boolean
+            if True the table is read from / written to the directory
+            pstruc['DIRRTTAB'] of the project
+
+        Returns
+        -------
+
+        tab : SlabTable
+
+        Notes
+        -----
+
+        Tables are keyed by the slab definition hash, the frequency grid
+        and the error bound. The last _ntable tables used in the session
+        are kept in memory.
+
+        """
+        fGHz = np.asarray(fGHz, dtype=float).ravel()
+        slab = self[name]
+        h = hashlib.sha1()
+        h.update(slab.slabhash().encode('utf-8'))
+        h.update(fGHz.tobytes())
+        h.update(repr(float(tol)).encode('utf-8'))
+        key = h.hexdigest()
+        if key in _dtable:
+            _dtable.move_to_end(key)
+            tab = _dtable[key]
+            if tab.slab is not slab:
+                # same definition from another SlabDB
+                tab = copy.copy(tab)
+                tab.slab = slab
+            return tab
+        tab = None
+        if cache:
+            filename = pyu.getlong(key + '.npz', pstruc['DIRRTTAB'])
+            if os.path.isfile(filename):
+                try:
+                    tab = SlabTable.load(filename, slab)
+                except Exception:
+                    tab = None
+        if tab is None:
+            tab = SlabTable(slab, fGHz, tol=tol)
+            if cache:
+                dirname = os.path.dirname(filename)
+                if not os.path.isdir(dirname):
+                    os.makedirs(dirname)
+                tab.save(filename)
+        _dtable[key] = tab
+        while len(_dtable) > _ntable:
+            _dtable.popitem(last=False)
+        return tab
+
     def __contains__(self,sl):
         """ slabDB contains slab
         """
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+from pylayers.gis.layout import Layout
+from pylayers.antprop.signature import Signatures
+
+
+@pytest.fixture(scope='module')
+def _defstr(request):
+    """ link between the cycles 1 and 2 of defstr.lay
+
+    The signature cutoff is the cutoff attribute of the test module
+    (default 3).
+
+    Returns a dict with
+
+        L   : built Layout
+        S   : Signatures of the link
+        tx  : transmitter (3,)
+        rx  : receiver (3,)
+        r2d : 2D rays
+        r3d : 3D rays with their local bases and interactions
+
+    """
+    cutoff = getattr(request.module, 'cutoff', 3)
+    L = Layout('defstr.lay')
+    L.build()
+    S = Signatures(L, 1, 2)
+    S.run(cutoff=cutoff, progress=False)
+    tx = np.r_[np.array(L.Gt.pos[1]), 1.2]
+    rx = np.r_[np.array(L.Gt.pos[2]) + 0.3, 1.5]
+    r3d = S.raysv(tx, rx).to3D(L)
+    r3d.locbas(L)
+    r3d.fillinter(L)
+    return {'L': L, 'S': S, 'tx': tx, 'rx': rx,
+            'r2d': S.raysv(tx, rx), 'r3d': r3d}
+
+
+@pytest.fixture(scope='class')
+def defstr(request, _defstr):
+    """ set the defstr.lay link of the module as attributes of the class
+    """
+    for k in _defstr:
+        setattr(request.cls, k, _defstr[k])
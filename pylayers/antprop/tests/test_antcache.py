@@ -0,0 +1,118 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from pylayers.antprop.antenna import Antenna
+from pylayers.antprop import antcache
+from pylayers.antprop.antcache import PatternCache
+from pylayers.antprop.coverage import Coverage
+
+fGHz = np.linspace(2.412, 2.472, 13)
+rs = np.random.RandomState(1)
+pt = np.array([[1, 2, 1.2]]).T*np.ones(500)[None, :]
+pr = np.vstack((rs.rand(2, 500)*20, 1.5*np.ones(500)))
+
+
+def gaindB(A):
+    A.eval(fGHz=fGHz, pt=pt, pr=pr, azoffset=0.3)
+    return 10*np.log10(A.G*np.ones(len(fGHz))[None, :])
+
+
+class TestAntCache(unittest.TestCase):
+
+    def setUp(self):
+        antcache._dcache.clear()
+
+    def test_gauss(self):
+        A = Antenna('Gauss')
+        G0 = gaindB(A)
+        A.setcache(fGHz=fGHz, tol=0.1)
+        self.assertTrue(A.cache.valid)
+        G1 = gaindB(A)
+        self.assertEqual(A.cache.ninterp, 1)
+        self.assertEqual(G1.shape, G0.shape)
+        u = G0 > G0.max() - 30
+        self.assertTrue(np.all(np.abs(G1[u] - G0[u]) < 0.1))
+        # frequencies out of the cache : exact evaluation
+        A.eval(fGHz=np.array([5.2]), pt=pt, pr=pr)
+        self.assertEqual(A.cache.nexact, 1)
+        B = Antenna('Gauss')
+        B.eval(fGHz=np.array([5.2]), pt=pt, pr=pr)
+        self.assertTrue(np.allclose(A.G, B.G))
+        # same antenna : same grid, counters of each antenna
+        B.setcache(fGHz=fGHz, tol=0.1)
+        self.assertTrue(B.cache.Ft is A.cache.Ft)
+        self.assertEqual((B.cache.ninterp, B.cache.nexact), (0, 0))
+        self.assertEqual(len(antcache._dcache), 1)
+        # the least recently used caches are removed
+        ncache = antcache._ncache
+        antcache._ncache = 1
+        Antenna('3gpp').setcache(fGHz=fGHz, tol=0.1)
+        antcache._ncache = ncache
+        self.assertEqual(len(antcache._dcache), 1)
+        self.assertTrue(A.cache.valid)
+        A.setcache(tol=None)
+        self.assertTrue(A.cache is None)
+
+    def test_fallback(self):
+        # the 3gpp pattern does not meet 0.01 dB with a 0.5 degree grid
+        A = Antenna('3gpp')
+        G0 = gaindB(A)
+        A.setcache(fGHz=fGHz, tol=0.01)
+        self.assertFalse(A.cache.valid)
+        G1 = gaindB(A)
+        self.assertEqual(A.cache.nexact, 1)
+        self.assertTrue(np.allclose(G0, G1))
+
+    def test_nmax(self):
+        # a grid of more than nmax values is not built
+        A = Antenna('Gauss')
+        G0 = gaindB(A)
+        pc = PatternCache(fGHz, tol=0.1, steps=[0.5], nmax=10**6)
+        pc.build(A)
+        self.assertFalse(pc.valid)
+        self.assertEqual(pc.Ft.size, 0)
+        pc = PatternCache(fGHz, tol=0.1, steps=[0.5, 2], nmax=10**6)
+        pc.build(A)
+        self.assertTrue(pc.valid)
+        self.assertEqual((pc.nth, pc.nph), (91, 180))
+        A.cache = pc
+        G1 = gaindB(A)
+        u = G0 > G0.max() - 30
+        self.assertTrue(np.all(np.abs(G1[u] - G0[u]) < 0.1))
+
+    def test_file(self):
+        A = Antenna('Gauss', param={'p0': 1, 't0': 1.4, 'p3': 0.5,
+                                    't3': 0.4, 'pol': 'th'})
+        pc = PatternCache(fGHz, tol=0.05)
+        pc.key = 'gauss'
+        pc.build(A)
+        filename = os.path.join(tempfile.mkdtemp(), 'gauss.npz')
+        pc.save(filename, mtime=10)
+        pl = PatternCache(fGHz, tol=0.05)
+        pl.key = 'gauss'
+        # antenna file more recent than the cache
+        self.assertFalse(pl.load(filename, mtime=20))
+        self.assertTrue(pl.load(filename, mtime=10))
+        th = rs.rand(100)*np.pi
+        ph = rs.rand(100)*2*np.pi
+        self.assertTrue(np.allclose(pl(th, ph, fGHz)[0], pc(th, ph, fGHz)[0]))
+        pl.key = 'other'
+        self.assertFalse(pl.load(filename, mtime=10))
+
+    def test_coverage(self):
+        C = Coverage('coveragedefstr.ini')
+        C.cover()
+        tgain = C.tgain.copy()
+        C.cover(antcache=0.1)
+        for iap in C.dap:
+            A = C.dap[iap].A
+            self.assertEqual(A.cache is None, A.typ == 'Omni')
+        G0 = 10*np.log10(tgain)
+        G1 = 10*np.log10(C.tgain)
+        u = G0 > G0.max() - 30
+        self.assertTrue(np.all(np.abs(G1[u] - G0[u]) < 0.1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+import numpy as np
+from pylayers.antprop.coverage import Coverage
+from pylayers.antprop.applacement import APPlacement
+
+C = Coverage('coveragedefstr.ini')
+x, y = np.meshgrid(np.linspace(1, 9, 4), np.linspace(1, 9, 3))
+sites = np.c_[x.ravel(), y.ravel()]
+A = APPlacement(C, sites, lchan=[1, 6, 11])
+
+
+class TestAPPlacement(unittest.TestCase):
+
+    def test_planes(self):
+        self.assertEqual(A.P.shape, (len(sites), 3, C.ng))
+        # APs on a same channel : SINR of Coverage
+        conf = [(0, 1), (5, 1), (10, 1)]
+        C.dap = A.todap(conf)
+        C.sinr = True
+        C.cover()
+        f = np.argmin(np.abs(C.fGHz - A.fcGHz[1]))
+        self.assertTrue(np.allclose(A.evconf(conf), np.max(C.sinrp[f], axis=1)))
+        # APs on other channels do not interfere
+        s1 = A.evconf([(0, 0)])
+        s2 = A.evconf([(0, 0), (5, 1)])
+        self.assertTrue((s2 >= s1).all())
+
+    def test_run(self):
+        for crit in ['area', 'minsinr']:
+            conf, sg = A.greedy(3, crit=crit, sinrdB=20)
+            self.assertEqual(len(set(k[0] for k in conf)), 3)
+            conf, sl = A.localsearch(conf, crit=crit, sinrdB=20)
+            self.assertTrue(sl >= sg)
+            res = A.run(3, crit=crit, sinrdB=20, anneal=True, niter=100)
+            self.assertTrue(res['score'] >= sl)
+            self.assertEqual(res['sites'].shape, (3, 3))
+            self.assertTrue(set(res['chan']) <= set([1, 6, 11]))
+            self.assertAlmostEqual(A.score(res['conf'], crit, 20), res['score'])
+        db = A.bench(3, neval=100)
+        self.assertEqual(db['neval'], 100)
+        self.assertTrue(db['rate'] > 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+import numpy as np
+from pylayers.antprop.chainprod import chainprod, chainprod_np, numba
+
+
+class TestChainProd(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.nf, self.nr = 4, 5
+        self.A = (rng.randn(self.nf, self.nr, 3, 3, 3) +
+                  1j * rng.randn(self.nf, self.nr, 3, 3, 3))
+        self.B = rng.randn(self.nr, 3, 3, 3)
+        self.B0 = rng.randn(self.nr, 3, 3)
+        self.w = rng.uniform(0.1, 1, self.nr)
+
+    def reference(self, f, r):
+        A, B = self.A[f, r], self.B[r]
+        Z = np.dot(A[0], self.B0[r])
+        Z = np.dot(B[0], Z)
+        Z = np.dot(A[1], Z)
+        Z = np.dot(B[1], Z)
+        Z = np.dot(A[2], Z)
+        Z = np.dot(B[2], Z)
+        return self.w[r] * Z
+
+    def test_numpy(self):
+        Z = chainprod_np(self.A, self.B, self.B0, w=self.w)
+        for f in range(self.nf):
+            for r in range(self.nr):
+                self.assertTrue(np.allclose(Z[f, r], self.reference(f, r)))
+
+    @unittest.skipIf(numba is None, 'numba not installed')
+    def test_numba(self):
+        Z = chainprod(self.A, self.B, self.B0, w=self.w, engine='numba')
+        Zn = chainprod_np(self.A, self.B, self.B0, w=self.w)
+        self.assertTrue(np.allclose(Z, Zn))
+        # single precision is preserved
+        Z = chainprod(self.A.astype(np.complex64), self.B, self.B0,
+                      w=self.w, engine='numba')
+        self.assertEqual(Z.dtype, np.complex64)
+        self.assertTrue(np.allclose(Z, Zn, rtol=1e-4, atol=1e-4))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import unittest
+import numpy as np
+import pylayers.antprop.loss as loss
+from pylayers.antprop.coverage import Coverage
+
+C = Coverage('coveragedefstr.ini')
+C.best = True
+C.cover()
+lres = ['Lwo', 'Lwp', 'Edo', 'Edp', 'freespace', 'tgain', 'CmWo', 'CmWp']
+dres = {k: getattr(C, k).copy() for k in lres}
+
+
+class TestCoverBlock(unittest.TestCase):
+
+    def test_shape(self):
+        for k in lres:
+            self.assertEqual(dres[k].shape, (C.nf, C.ng, C.na))
+        self.assertEqual(C.pa.shape, (3, C.na))
+        self.assertEqual(C.pg.shape, (3, C.ng))
+        # a single best server per grid point
+        self.assertTrue((np.sum(C.bestsvo > 0, axis=2) == 1).all())
+
+    def test_link(self):
+        for g, a in [(0, 0), (123, 1), (C.ng - 1, 2)]:
+            pa = C.pa[:, a:a + 1]
+            pg = C.pg[:, g:g + 1]
+            Lwo, Lwp, Edo, Edp = loss.Losst(C.L, C.fGHz, pa, pg, dB=False)
+            self.assertTrue(np.allclose(dres['Lwo'][:, g, a], Lwo[:, 0]))
+            self.assertTrue(np.allclose(dres['Edp'][:, g, a], Edp[:, 0]))
+            fs = loss.PL(C.fGHz, pa, pg, dB=False)
+            self.assertTrue(np.allclose(dres['freespace'][:, g, a], fs[:, 0]))
+
+    def test_workers(self):
+        # blocks of unequal size evaluated in a process pool
+        C.cover(workers=2, size=37)
+        for k in lres:
+            self.assertTrue(np.allclose(getattr(C, k), dres[k]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from pylayers.antprop.coverage import Coverage
+
+C = Coverage('coveragedefstr.ini')
+C.snr = True
+C.sinr = True
+C.best = True
+C.cover()
+lres = ['Lwo', 'Edp', 'freespace', 'tgain', 'CmWo', 'CmWp',
+        'snro', 'sinrp', 'bestsvo', 'bestsvp']
+
+
+class TestCoverH5(unittest.TestCase):
+
+    def test_h5(self):
+        fd, fname = tempfile.mkstemp(suffix='.h5')
+        os.close(fd)
+        C2 = Coverage('coveragedefstr.ini')
+        C2.snr = True
+        C2.sinr = True
+        C2.best = True
+        # tiles of 64 grid points
+        C2.cover(h5file=fname, size=64)
+        self.assertEqual(C2.CmWo.chunks, (C2.nf, 64, C2.na))
+        for k in lres:
+            self.assertTrue(np.allclose(getattr(C2, k)[...], getattr(C, k)))
+        for typ in ['pr', 'sinr', 'capacity', 'loss']:
+            for a in [-1, 1]:
+                V = C2.evmap(typ=typ, polar='o', f=2, a=a)
+                self.assertTrue(np.allclose(V, C.evmap(typ=typ, polar='o', f=2, a=a)))
+        C2.h5.close()
+        os.remove(fname)
+
+    def test_spawn(self):
+        # workers started without fork : the Coverage is pickled to them
+        fd, fname = tempfile.mkstemp(suffix='.h5')
+        os.close(fd)
+        C2 = Coverage('coveragedefstr.ini')
+        C2.cover(workers=2, start='spawn', h5file=fname, size=64)
+        for k in lres[:6]:
+            self.assertTrue(np.allclose(getattr(C2, k)[...], getattr(C, k)))
+        C2.h5.close()
+        os.remove(fname)
+
+    def test_sinr(self):
+        # interference is the power received from all the other AP
+        NmW = 10**(C.pndbm / 10.)
+        for ka in range(C.na):
+            I = np.sum(np.delete(C.CmWp, ka, axis=2), axis=2)
+            sinr = C.CmWp[:, :, ka] / (I + NmW[0, ka])
+            self.assertTrue(np.allclose(C.sinrp[:, :, ka], sinr))
+        V = C.evmap(typ='pr', polar='p', f=0, a=-1)
+        self.assertTrue(np.allclose(V, np.max(C.CmWp[0], axis=1)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+import numpy as np
+from pylayers.antprop.coverage import Coverage
+
+lres = ['Lwo', 'Lwp', 'Edp', 'freespace', 'tgain', 'CmWo', 'CmWp',
+        'snro', 'sinro', 'sinrp', 'bestsvo', 'bestsvp']
+
+
+def coverage():
+    C = Coverage('coveragedefstr.ini')
+    C.snr = True
+    C.sinr = True
+    C.best = True
+    return C
+
+
+class TestCoverUpdate(unittest.TestCase):
+
+    def check(self, C):
+        # compare with a full evaluation of the same access points
+        R = coverage()
+        R.dap = C.dap
+        R.cover()
+        for k in lres:
+            self.assertEqual(getattr(C, k).shape, getattr(R, k).shape)
+            self.assertTrue(np.allclose(getattr(C, k), getattr(R, k)), k)
+
+    def test_update(self):
+        C = coverage()
+        C.cover()
+        C.dap[1]['PtdBm'] = 8
+        dup = C.update()
+        self.assertEqual(dup, {'computed': [], 'rescaled': [1], 'cached': []})
+        self.check(C)
+        C.dap[2]['p'] = (5, 3, 1.2)
+        dup = C.update()
+        self.assertEqual(dup['computed'], [2])
+        self.check(C)
+        # switched off then on again : planes from the cache
+        C.dap[0]['on'] = False
+        C.update()
+        self.assertEqual(C.na, 2)
+        self.check(C)
+        C.dap[0]['on'] = True
+        dup = C.update()
+        self.assertEqual(dup['cached'], [0])
+        self.check(C)
+        C.dap[2]['phideg'] = 10
+        dup = C.update()
+        self.assertEqual(dup['computed'], [2])
+        self.check(C)
+
+
+if __name__ == '__main__':
+    unittest.main()
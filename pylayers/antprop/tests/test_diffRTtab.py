@@ -0,0 +1,56 @@
+import unittest
+import numpy as np
+from pylayers.antprop.slab import MatDB
+from pylayers.antprop.diffRT import diff, FreF, FreFi, FreFtab
+
+dm = MatDB()
+dm.load('matDB.ini')
+
+
+class TestDiffTab(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        Nr = 200
+        self.fGHz = np.linspace(2, 11, 16)
+        self.N = rng.uniform(1.2, 1.9, Nr)
+        self.phi0 = rng.uniform(0.01, self.N * np.pi - 0.01)
+        self.phi = rng.uniform(0.01, self.N * np.pi - 0.01)
+        self.si = rng.uniform(0.5, 50, Nr)
+        self.sd = rng.uniform(0.5, 50, Nr)
+        self.beta = rng.uniform(0.3, np.pi / 2, Nr)
+
+    def test_FreFi(self):
+        tab = FreFtab(1e-6)
+        self.assertLessEqual(tab['err'], 1e-6)
+        self.assertTrue(FreFtab(1e-6) is tab)
+        x = np.logspace(-10, 3, 2000)
+        self.assertLess(np.abs(FreFi(x) - FreF(x)[0]).max(), 1e-5)
+
+    def test_tab(self):
+        args = (self.fGHz, self.phi0, self.phi, self.si, self.sd, self.N,
+                dm['METAL'], dm['BRICK'])
+        Ds, Dh = diff(*args, beta=self.beta, mode='exact')
+        Dst, Dht = diff(*args, beta=self.beta, mode='tab')
+        self.assertLess(np.abs(Ds - Dst).max(), 1e-5)
+        self.assertLess(np.abs(Dh - Dht).max(), 1e-5)
+
+    def test_material_array(self):
+        # one material per ray gives the same result as the per group calls
+        Nr = len(self.N)
+        u = np.arange(Nr) % 2 == 0
+        lk = ['epr', 'mur', 'sigma', 'roughness']
+        mat0 = {k: np.where(u, dm['METAL'][k], dm['BRICK'][k]) for k in lk}
+        matN = {k: np.where(u, dm['BRICK'][k], dm['WOOD'][k]) for k in lk}
+        Ds, Dh = diff(self.fGHz, self.phi0, self.phi, self.si, self.sd,
+                      self.N, mat0, matN, beta=self.beta)
+        for v, m0, mN in [(u, 'METAL', 'BRICK'), (~u, 'BRICK', 'WOOD')]:
+            Dsg, Dhg = diff(self.fGHz, self.phi0[v], self.phi[v],
+                            self.si[v], self.sd[v], self.N[v],
+                            dm[m0], dm[mN], beta=self.beta[v])
+            self.assertTrue(np.allclose(Ds[:, v], Dsg))
+            self.assertTrue(np.allclose(Dh[:, v], Dhg))
+
+
+if __name__ == '__main__':
+    unittest.main()
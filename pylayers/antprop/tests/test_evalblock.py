@@ -0,0 +1,86 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import h5py
+import pytest
+from pylayers.antprop.antenna import Antenna
+
+
+@pytest.mark.usefixtures('defstr')
+class TestEvalBlock(unittest.TestCase):
+
+    def setUp(self):
+        self.fGHz = np.linspace(2, 11, 101)
+        # reference evaluation over the whole band
+        C = self.r3d.eval(self.fGHz)
+        C.locbas(Ta=np.eye(3), Tb=np.eye(3))
+        self.H = C.prop2tran()
+        self.tol = 1e-3 * np.abs(self.H.y).max()
+
+    def test_modes(self):
+        H = self.r3d.evalblock(self.fGHz, nfb=16, mode='H')
+        self.assertEqual(H.y.shape, self.H.y.shape)
+        self.assertTrue((H.x == self.H.x).all())
+        self.assertLess(np.abs(H.y - self.H.y).max(), self.tol)
+        E = self.r3d.evalblock(self.fGHz, nfb=16, mode='energy')
+        self.assertTrue(np.allclose(E, np.sum(np.abs(H.y)**2, axis=-1)))
+        tf = self.r3d.evalblock(self.fGHz, nfb=30, mode='tf')
+        self.assertTrue(np.allclose(tf.y, np.sum(H.y, axis=0)))
+
+    def test_hdf5(self):
+        fd, filename = tempfile.mkstemp(suffix='.h5')
+        os.close(fd)
+        try:
+            res = self.r3d.evalblock(self.fGHz, nfb=16, mode=None,
+                                     filename=filename)
+            self.assertTrue(res is None)
+            f = h5py.File(filename, 'r')
+            self.assertEqual(f['H'].shape, self.H.y.shape)
+            self.assertTrue((f['fGHz'][:] == self.fGHz).all())
+            self.assertLess(np.abs(f['H'][:] - self.H.y).max(), self.tol)
+            f.close()
+        finally:
+            os.remove(filename)
+
+    def test_antenna(self):
+        # the antennas are evaluated once, not per block
+        A = Antenna('Omni', param={'pol': 't', 'GmaxdB': 0}, fGHz=self.fGHz)
+        B = Antenna('Omni', param={'pol': 't', 'GmaxdB': 0}, fGHz=self.fGHz)
+        n = []
+        evala = A.eval
+
+        def counted(*args, **kwargs):
+            n.append(1)
+            return evala(*args, **kwargs)
+
+        A.eval = counted
+        H = self.r3d.evalblock(self.fGHz, nfb=16, a=A, b=B, mode='H')
+        self.assertEqual(len(n), 1)
+        self.assertLess(np.abs(H.y - self.H.y).max(), self.tol)
+
+    def test_error(self):
+        # an error in a block removes the half written file
+        fd, filename = tempfile.mkstemp(suffix='.h5')
+        os.close(fd)
+        evalr = self.r3d.eval
+        n = []
+
+        def failing(*args, **kwargs):
+            n.append(1)
+            if len(n) == 3:
+                raise MemoryError
+            return evalr(*args, **kwargs)
+
+        self.r3d.eval = failing
+        try:
+            with self.assertRaises(MemoryError):
+                self.r3d.evalblock(self.fGHz, nfb=16, mode=None,
+                                   filename=filename)
+        finally:
+            del self.r3d.eval
+        self.assertFalse(os.path.exists(filename))
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
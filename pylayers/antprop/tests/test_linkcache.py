@@ -0,0 +1,111 @@
+import unittest
+import numpy as np
+from pylayers.gis.layout import Layout
+from pylayers.antprop.signature import Signatures
+from pylayers.antprop.channel import Tchannel
+from pylayers.antprop.linkcache import LinkCache
+
+L = Layout('defstr.lay')
+L.build()
+S = Signatures(L, 1, 2)
+S.run(cutoff=3, progress=False)
+tx = np.r_[np.array(L.Gt.pos[1]), 1.2]
+rx = np.r_[np.array(L.Gt.pos[2]) + 0.3, 1.5]
+fGHz = np.linspace(2, 6, 5)
+
+
+def link(a, b):
+    r3d = S.raysv(tx, rx).to3D(L)
+    r3d.locbas(L)
+    r3d.fillinter(L)
+    return r3d, r3d.evalblock(fGHz)
+
+
+class TestLinkCache(unittest.TestCase):
+
+    def test_tchannel(self):
+        y = np.random.randn(3, 2, 4, 5) + 1j * np.random.randn(3, 2, 4, 5)
+        H = Tchannel(x=fGHz, y=y, tau=np.array([10., 12, 15]),
+                     dod=np.random.rand(3, 2), doa=np.random.rand(3, 2))
+        Hr = H.reciprocal()
+        self.assertEqual(Hr.y.shape, (3, 4, 2, 5))
+        self.assertTrue(np.allclose(Hr.y[:, 1, 0], H.y[:, 0, 1]))
+        self.assertTrue(np.allclose(Hr.dod, H.doa))
+        self.assertTrue(np.allclose(Hr.doa, H.dod))
+        self.assertTrue(np.allclose(Hr.reciprocal().y, H.y))
+
+    def test_rays(self):
+        r3d = S.raysv(tx, rx).to3D(L)
+        rr = r3d.reciprocal()
+        self.assertTrue(np.allclose(rr.pTx, rx))
+        r3d.locbas(L)
+        r3d.fillinter(L)
+        C1 = r3d.eval(fGHz)
+        rr.locbas(L)
+        rr.fillinter(L)
+        C2 = rr.eval(fGHz)
+        self.assertTrue(np.allclose(C1.tauk, C2.tauk))
+        # departure of the reverse rays is the arrival of the direct rays
+        d = np.mod(C2.tang - C1.rang + np.pi, 2 * np.pi) - np.pi
+        self.assertTrue(np.allclose(d, 0))
+        d = np.mod(C2.rang - C1.tang + np.pi, 2 * np.pi) - np.pi
+        self.assertTrue(np.allclose(d, 0))
+
+    def test_cache(self):
+        lc = LinkCache(maxsize=2)
+        r, H = lc.get('ap', 'dev', wstd='wifi', fun=link, fGHz=fGHz)
+        self.assertEqual(lc.nmiss, 1)
+        r2, H2 = lc.get('ap', 'dev', wstd='wifi', fun=link, fGHz=fGHz)
+        self.assertTrue(H2 is H)
+        rr, Hr = lc.get('dev', 'ap', wstd='wifi', fun=link, fGHz=fGHz)
+        self.assertEqual((lc.ndir, lc.nrec, lc.nmiss), (1, 1, 1))
+        self.assertTrue(np.allclose(Hr.y, H.y.swapaxes(1, 2)))
+        self.assertTrue(np.allclose(rr.pTx, r.pRx))
+        # other parameters : other link
+        self.assertTrue(lc.get('dev', 'ap', wstd='wifi', fGHz=fGHz[:2]) is None)
+        self.assertEqual(lc.invalidate('dev'), 1)
+        self.assertEqual(len(lc), 0)
+        # directed cache
+        lc = LinkCache(reciprocal=False)
+        lc.put('ap', 'dev', H=H)
+        self.assertTrue(lc.get('dev', 'ap') is None)
+        self.assertTrue(lc.get('ap', 'dev')[1] is H)
+        # least recently used links are removed first
+        lc = LinkCache(maxsize=2)
+        for n in ['d1', 'd2', 'd3']:
+            lc.put('ap', n, H=H)
+        self.assertEqual(len(lc), 2)
+        self.assertTrue(lc.get('d1', 'ap') is None)
+
+    def test_tchannels(self):
+        prx = np.vstack((rx, rx + np.array([0.3, 0, 0])))
+        lc = LinkCache()
+        lH = S.tchannels(tx, prx, fGHz, lc=lc)
+        self.assertEqual((lc.ndir, lc.nrec, lc.nmiss), (0, 0, 2))
+        raysvm = S.raysvm
+        def fail(*args, **kwargs):
+            raise AssertionError('link evaluated twice')
+        # cache hits : the rays are not traced again
+        S.raysvm = fail
+        try:
+            lH2 = S.tchannels(tx, prx, fGHz, lc=lc)
+        finally:
+            S.raysvm = raysvm
+        self.assertEqual(lc.ndir, 2)
+        self.assertTrue(lH2[0] is lH[0] and lH2[1] is lH[1])
+        # other frequencies : other links
+        lH3 = S.tchannels(tx, prx[:1], fGHz[:3], lc=lc)
+        self.assertEqual(lc.nmiss, 3)
+        self.assertEqual(lH3[0].y.shape[-1], 3)
+        # reverse signatures : the links are served by reciprocity
+        Sr = Signatures(L, 2, 1)
+        for k in S:
+            Sr[k] = S[k][:, ::-1]
+        self.assertEqual(Sr._linkkey(), S._linkkey())
+        Hr = Sr.tchannels(prx[0], tx, fGHz, lc=lc)[0]
+        self.assertEqual(lc.nrec, 1)
+        self.assertTrue(np.allclose(Hr.y, lH[0].y.swapaxes(1, 2)))
+
+
+if __name__ == '__main__':
+    unittest.main()
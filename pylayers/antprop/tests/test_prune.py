@@ -0,0 +1,55 @@
+import unittest
+import numpy as np
+import pytest
+
+# signature cutoff of the defstr fixture
+cutoff = 4
+fGHz = np.linspace(2, 11, 21)
+
+
+@pytest.mark.usefixtures('defstr')
+class TestPrune(unittest.TestCase):
+
+    def test_powerbound(self):
+        r3d = self.S.raysv(self.tx, self.rx).to3D(self.L)
+        ab = r3d.powerbound(self.L, fGHz)
+        # locbas renumbers the rays group by group
+        abk = {k: ab[r3d[k]['rayidx']] for k in r3d}
+        r3d.locbas(self.L)
+        r3d.fillinter(self.L)
+        C = r3d.eval(fGHz)
+        Ct = np.stack((C.Ctt.y, C.Ctp.y, C.Cpt.y, C.Cpp.y))
+        amax = np.abs(Ct).max(axis=(0, 2))
+        for k in r3d:
+            ir = r3d[k]['rayidx']
+            self.assertTrue((amax[ir] <= abk[k] * (1 + 1e-6)).all())
+
+    def test_prune(self):
+        drange = 40
+        r3d = self.S.raysv(self.tx, self.rx).to3D(self.L)
+        ab = r3d.powerbound(self.L, fGHz)
+        aref = 1. / np.sqrt(np.sum((self.tx - self.rx)**2))
+        keep = ab >= aref * 10**(-drange / 20.)
+        report = r3d.prune(self.L, fGHz, drange=drange)
+        self.assertEqual(report['nray'], len(ab))
+        self.assertEqual(report['npruned'], np.sum(~keep))
+        self.assertTrue(0 < report['npruned'] < len(ab))
+        self.assertEqual(r3d.nray, np.sum(keep))
+        self.assertTrue(np.allclose(report['Emax'], np.sum(ab[~keep]**2)))
+        self.assertTrue(report['EmaxdB'] < -drange + 10 * np.log10(len(ab)))
+        lidx = np.sort(np.hstack([r3d[k]['rayidx'] for k in r3d]))
+        self.assertEqual(lidx.tolist(), list(range(r3d.nray)))
+        for k in r3d:
+            self.assertEqual(r3d[k]['pt'].shape[2], r3d[k]['nbrays'])
+            self.assertEqual(r3d[k]['si'].shape[1], r3d[k]['nbrays'])
+        r0 = self.S.raysv(self.tx, self.rx).to3D(self.L)
+        self.assertTrue(np.allclose(np.sort(r3d.delays),
+                                    np.sort(r0.delays[keep])))
+        r3d.locbas(self.L)
+        r3d.fillinter(self.L)
+        C = r3d.eval(fGHz)
+        self.assertEqual(C.Ctt.y.shape, (r3d.nray, len(fGHz)))
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
@@ -0,0 +1,27 @@
+import unittest
+import numpy as np
+import pytest
+
+
+@pytest.mark.usefixtures('defstr')
+class TestRaysDtype(unittest.TestCase):
+
+    def test_complex64(self):
+        r3d = self.r3d
+        fGHz = np.linspace(2, 11, 32)
+        lH = []
+        for dtype in [complex, np.complex64]:
+            C = r3d.eval(fGHz, dtype=dtype)
+            self.assertEqual(r3d.I.I.dtype, dtype)
+            self.assertEqual(C.Ctt.y.dtype, dtype)
+            C.locbas(Ta=np.eye(3), Tb=np.eye(3))
+            H = C.prop2tran()
+            self.assertEqual(H.y.dtype, dtype)
+            lH.append(H.y)
+        H64, H32 = lH
+        erel = np.abs(H32 - H64).max() / np.abs(H64).max()
+        self.assertLess(erel, 1e-5)
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
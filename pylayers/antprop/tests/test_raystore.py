@@ -0,0 +1,100 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from pylayers.gis.layout import Layout
+from pylayers.antprop.signature import Signatures
+from pylayers.antprop.rays import Rays
+from pylayers.antprop.channel import Tchannel
+from pylayers.antprop.raystore import RayStore
+
+L = Layout('defstr.lay')
+L.build()
+S = Signatures(L, 1, 2)
+S.run(cutoff=3, progress=False)
+tx = np.r_[np.array(L.Gt.pos[1]), 1.2]
+rx = np.r_[np.array(L.Gt.pos[2]) + 0.3, 1.5]
+r3 = S.raysv(tx, rx).to3D(L)
+r3d = S.raysv(tx, rx).to3D(L)
+r3d.locbas(L)
+r3d.fillinter(L)
+C = r3d.eval(np.linspace(2, 11, 21))
+C.locbas(Ta=np.eye(3), Tb=np.eye(3))
+H = C.prop2tran()
+
+
+class TestRayStore(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.filename = tempfile.mkstemp(suffix='.h5')
+        os.close(fd)
+        fd, self.filename2 = tempfile.mkstemp(suffix='.h5')
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.filename)
+        os.remove(self.filename2)
+
+    def test_rays(self):
+        st = RayStore(self.filename, mode='w', nbuf=3)
+        for it in range(5):
+            ie = r3.savestore(st, 'ap1', 'ag1', 'wifi', t=0.1*it)
+        H.savestore(st, 'ap1', 'ag1', 'wifi', t=0.)
+        st.close()
+        st = RayStore(self.filename, mode='r')
+        self.assertEqual(len(st), 6)
+        ie = st.query(ida='ap1', t=(0.15, 0.35), table='ray')
+        self.assertEqual(ie.tolist(), [2, 3])
+        r = Rays(np.zeros(3), np.zeros(3))
+        r.loadstore(st, ie[0])
+        self.assertEqual(r.nray, r3.nray)
+        self.assertTrue(np.allclose(r.delays, r3.delays))
+        for k in r3:
+            self.assertTrue(np.allclose(r[k]['pt'], r3[k]['pt']))
+            self.assertTrue((r[k]['sig'] == r3[k]['sig']).all())
+            self.assertTrue((r[k]['rayidx'] == r3[k]['rayidx']).all())
+        # geometry only : locbas can be applied again
+        r.locbas(L)
+        for k in r3d:
+            self.assertTrue(np.allclose(r[k]['B'], r3d[k]['B']))
+        ie = st.query(table='Hray')
+        self.assertEqual(ie.tolist(), [5])
+        Hs = Tchannel()
+        Hs.loadstore(st, ie[0])
+        self.assertTrue(np.allclose(Hs.y, H.y))
+        self.assertTrue(np.allclose(Hs.taud, H.taud))
+        self.assertTrue(np.allclose(Hs.x, H.x))
+        st.close()
+
+    def test_memmap(self):
+        st = RayStore(self.filename, mode='w')
+        for it in range(3):
+            st.append('a', 'b', 'w', it, aktk={'ak': np.arange(4.) + it,
+                                              'tk': np.arange(4.)})
+        self.assertFalse(isinstance(st.column('aktk', 'ak'), np.memmap))
+        sc = st.consolidate(self.filename2)
+        st.close()
+        ak = sc.column('aktk', 'ak')
+        self.assertTrue(isinstance(ak, np.memmap))
+        self.assertEqual(ak.shape, (12,))
+        self.assertEqual(sc.read(2, 'aktk')['ak'].tolist(), [2., 3., 4., 5.])
+        self.assertEqual(sc.entry(1), ('a', 'b', 'w', 1.))
+        sc.close()
+
+    def test_columns(self):
+        st = RayStore(self.filename, mode='w', nbuf=2)
+        st.append('a', 'b', 'w', 0, aktk={'ak': np.ones(3)})
+        # buffered then written table : same columns required
+        for it in range(2):
+            self.assertRaises(ValueError, st.append, 'a', 'b', 'w', 1,
+                              aktk={'ak': np.ones(2), 'tk': np.ones(2)})
+            self.assertRaises(ValueError, st.append, 'a', 'b', 'w', 1,
+                              aktk={'tk': np.ones(2)})
+            st.append('a', 'b', 'w', 1, aktk={'ak': np.ones(2)})
+        self.assertEqual(len(st), 3)
+        self.assertEqual(st.read(2, 'aktk')['ak'].tolist(), [1., 1.])
+        st.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
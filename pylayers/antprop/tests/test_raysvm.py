@@ -0,0 +1,47 @@
+import unittest
+import numpy as np
+import pytest
+
+# receiver offsets from the center of the cycle 2
+drx = np.array([[0, 0, 0],
+                [0.3, 0, 0],
+                [0, 0.3, 0.2],
+                [-0.2, 0.1, 0]])
+
+
+@pytest.mark.usefixtures('defstr')
+class TestRaysvm(unittest.TestCase):
+
+    def setUp(self):
+        self.prx = np.r_[np.array(self.L.Gt.pos[2]), 1.5] + drx
+
+    def test_raysvm(self):
+        # blocks of 3 receivers : a full and a partial block
+        lr = self.S.raysvm(self.tx, self.prx, nrb=3)
+        self.assertEqual(len(lr), len(self.prx))
+        for r2, rx in zip(lr, self.prx):
+            r1 = self.S.raysv(self.tx, rx)
+            self.assertEqual(r1.los, r2.los)
+            self.assertEqual(sorted(r1.keys()), sorted(r2.keys()))
+            self.assertTrue(np.allclose(r2.pRx, rx))
+            for k in r1:
+                self.assertTrue((r1[k]['sig'] == r2[k]['sig']).all())
+                self.assertTrue(np.allclose(r1[k]['pt'], r2[k]['pt']))
+
+    def test_tchannels(self):
+        fGHz = np.linspace(2, 6, 11)
+        lH = self.S.tchannels(self.tx, self.prx, fGHz)
+        self.assertEqual(len(lH), len(self.prx))
+        r3d = self.S.raysv(self.tx, self.prx[2]).to3D(self.L)
+        r3d.locbas(self.L)
+        r3d.fillinter(self.L)
+        H = r3d.evalblock(fGHz)
+        self.assertTrue(np.allclose(lH[2].y, H.y))
+        self.assertTrue(np.allclose(lH[2].taud, H.taud))
+        lHp = self.S.tchannels(self.tx, self.prx, fGHz, drange=30)
+        for Hp, H in zip(lHp, lH):
+            self.assertTrue(Hp.y.shape[0] <= H.y.shape[0])
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
@@ -0,0 +1,127 @@
+import unittest
+import numpy as np
+import h5py
+import pylayers.util.pyutil as pyu
+from pylayers.util.project import pstruc
+from pylayers.gis.layout import Layout
+from pylayers.antprop.signature import Signatures, SignatureSearch, \
+    sigcoord, sigimage, sigbacktrace
+
+L = Layout('defstr.lay')
+L.build()
+
+
+class TestSignatureSearch(unittest.TestCase):
+
+    def test_run(self):
+        S = Signatures(L, 1, 2)
+        S.run(cutoff=3, progress=False)
+        So = Signatures(L, 1, 2)
+        So.runold(cutoff=3, progress=False)
+        self.assertEqual(sorted(S.keys()), sorted(So.keys()))
+        for k in S:
+            self.assertTrue((S[k] == So[k]).all())
+
+    def test_targets(self):
+        lcy = [cy for cy in L.Gt.nodes() if cy > 0]
+        dS = SignatureSearch(L).run(1, lcy, cutoff=2)
+        for cy in lcy:
+            S = SignatureSearch(L).run(1, [cy], cutoff=2)[cy]
+            self.assertEqual(sorted(S.keys()), sorted(dS[cy].keys()))
+            for k in S:
+                self.assertTrue((S[k] == dS[cy][k]).all())
+
+    def test_budget(self):
+        dS = SignatureSearch(L).run(1, [2], cutoff=4, nR=1, nD=0)
+        S = dS[2]
+        for k in S:
+            typ = S[k][1::2, :]
+            self.assertTrue(((typ == 2).sum(axis=1) <= 1).all())
+
+    def test_budget_source(self):
+        # the first interaction counts : no reflection after it with nR=0
+        S = SignatureSearch(L).run(1, [2], cutoff=4, nR=0)[2]
+        nr = 0
+        for k in S:
+            typ = S[k][1::2, :]
+            self.assertTrue((typ[:, 1:] != 2).all())
+            nr += (typ[:, 0] == 2).sum()
+        self.assertTrue(nr > 0)
+
+    def test_csr(self):
+        S = Signatures(L, 1, 2)
+        S.run(cutoff=3, progress=False)
+        ptr, node, typ = S.csr()
+        self.assertEqual(node.dtype, np.int32)
+        self.assertEqual(typ.dtype, np.int8)
+        self.assertEqual(len(S), len(ptr) - 1)
+        for k in S:
+            a = S[k]
+            self.assertTrue(np.shares_memory(S.nodes(k), node))
+            self.assertTrue((a[0::2] == S.nodes(k)).all())
+            self.assertTrue((a[1::2] == S.types(k)).all())
+        # legacy dictionnary interface
+        S2 = Signatures(L, 1, 2)
+        for k in sorted(S, reverse=True):
+            S2[k] = S[k]
+        p2, n2, t2 = S2.csr()
+        self.assertTrue((p2 == ptr).all())
+        self.assertTrue((n2 == node).all() and (t2 == typ).all())
+        k = max(S2.keys())
+        del S2[k]
+        self.assertEqual(len(S2), len(S) - len(S.nodes(k)))
+        # saveh5 writes the flat arrays
+        S.saveh5()
+        f = h5py.File(pyu.getlong(S.filename + '.h5', pstruc['DIRSIG']), 'r')
+        self.assertTrue((f['ptr'][:] == ptr).all())
+        self.assertTrue((f['node'][:] == node).all())
+        self.assertTrue((f['typ'][:] == typ).all())
+        f.close()
+
+
+class TestSigImage(unittest.TestCase):
+
+    def test_reflection(self):
+        # wall y=0 , a second wall x=5 crossed by the ray
+        pa = np.array([[[-1., 0.], [5., -2.]],
+                       [[-1., 0.], [5., 4.]]])
+        pb = np.array([[[3., 0.], [5., 4.]],
+                       [[3., 0.], [5., 8.]]])
+        typ = np.array([[2, 3], [2, 3]])
+        tx = np.array([0., 1.])
+        rx = np.array([8., 1.])
+        M = sigimage(tx, pa, pb, typ)
+        self.assertTrue(np.allclose(M[:, 0], [0., -1.]))
+        self.assertTrue(np.allclose(M[:, 1], [0., -1.]))
+        P, valid = sigbacktrace(rx, M, pa, pb, typ)
+        # the second wall does not intersect the reflected ray
+        self.assertEqual(list(valid), [False, False])
+        rx = np.array([4., 1.])
+        pa[:, 1] = [[3.5, -2.], [6., -2.]]
+        pb[:, 1] = [[3.5, 4.], [6., 4.]]
+        P, valid = sigbacktrace(rx, M, pa, pb, typ)
+        self.assertEqual(list(valid), [True, False])
+        self.assertTrue(np.allclose(P[0, 0], [2., 0.]))
+        self.assertTrue(np.allclose(P[0, 1], [3.5, 0.75]))
+
+    def test_broadcast(self):
+        # a block of receivers against the signatures, not repeated
+        S = Signatures(L, 1, 2)
+        S.run(cutoff=3, progress=False)
+        tx = np.array(L.Gt.pos[1])
+        lrx = np.array(L.Gt.pos[2]) + np.array([[0, 0], [0.3, 0], [0, 0.3]])
+        for k in S:
+            typ = S.types(k)
+            pa, pb = sigcoord(L, S.nodes(k))
+            M = sigimage(tx, pa, pb, typ)
+            P, valid = sigbacktrace(lrx[:, None], M[None], pa[None],
+                                    pb[None], typ[None])
+            self.assertEqual(P.shape, (3,) + M.shape)
+            for j, rx in enumerate(lrx):
+                Pj, vj = sigbacktrace(rx, M, pa, pb, typ)
+                self.assertTrue((valid[j] == vj).all())
+                self.assertTrue(np.allclose(P[j][vj], Pj[vj]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+import os
+import tempfile
+import unittest
+import multiprocessing
+import numpy as np
+from pylayers.gis.layout import Layout
+from pylayers.antprop.signature import Signatures, SignatureSearch
+import pylayers.antprop.sigstore as sst
+from pylayers.antprop.sigstore import SignatureStore, paramkey, \
+    precompute_signatures
+
+L = Layout('defstr.lay')
+L.build()
+
+
+class TestSignatureStore(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.filename = tempfile.mkstemp(suffix='.h5')
+        os.close(fd)
+        os.remove(self.filename)
+
+    def tearDown(self):
+        if os.path.isfile(self.filename):
+            os.remove(self.filename)
+
+    def assertSameSig(self, S1, S2):
+        self.assertEqual(sorted(S1.keys()), sorted(S2.keys()))
+        for k in S1:
+            self.assertTrue((S1[k] == S2[k]).all())
+            self.assertTrue(np.allclose(S1.ratio[k], S2.ratio[k]))
+
+    def test_paramkey(self):
+        k1, p1 = paramkey(cutoff=3)
+        k2, p2 = paramkey(cutoff=3.0, progress=False)
+        k3, p3 = paramkey(cutoff=3, threshold=0.2)
+        self.assertEqual(k1, k2)
+        self.assertNotEqual(k1, k3)
+
+    def test_get(self):
+        st = SignatureStore(L, filename=self.filename)
+        S = st.get(1, 2, cutoff=2)
+        So = Signatures(L, 1, 2)
+        So.run(cutoff=2, progress=False)
+        self.assertSameSig(S, So)
+        self.assertTrue(st.get(1, 2, cutoff=2) is S)
+        self.assertEqual((st.nmem, st.nfile, st.ncomp), (1, 0, 1))
+        # a new store reads the file
+        st2 = SignatureStore(L, filename=self.filename)
+        self.assertSameSig(st2.get(1, 2, cutoff=2), So)
+        self.assertEqual((st2.nfile, st2.ncomp), (1, 0))
+        # other parameters are another entry
+        st2.get(1, 2, cutoff=2, nR=1)
+        self.assertEqual(st2.ncomp, 1)
+        self.assertEqual(st2.pairs(cutoff=2), set([(1, 2)]))
+
+    def test_lru(self):
+        st = SignatureStore(L, maxsize=2, filename=self.filename)
+        st.getmany(1, [2, 3, 4], cutoff=1)
+        self.assertEqual(len(st.lru), 2)
+        self.assertEqual(st.ncomp, 3)
+        st.get(1, 2, cutoff=1)
+        self.assertEqual(st.nfile, 1)
+
+    def test_invalidate(self):
+        st = SignatureStore(L, filename=self.filename)
+        st.get(1, 2, cutoff=1)
+        L2 = Layout('defstr.lay')
+        L2.build()
+        # modified layout content
+        n = [x for x in L2.Gs.nodes() if x < 0][0]
+        L2.Gs.pos[n] = (L2.Gs.pos[n][0] + 0.1, L2.Gs.pos[n][1])
+        st2 = SignatureStore(L2, filename=self.filename)
+        self.assertEqual(st2.pairs(cutoff=1), set())
+
+    def test_precompute(self):
+        lcy = [cy for cy in L.Gt.nodes() if cy > 0]
+        st = SignatureStore(L, filename=self.filename)
+        dstat = precompute_signatures(L, [1, 2], lcy, workers=2, store=st,
+                                      chunksize=2, verbose=False, cutoff=2)
+        self.assertEqual(dstat['ncomputed'], 2 * len(lcy))
+        self.assertEqual(dstat['failed'], [])
+        for t in lcy:
+            S = st.get(2, t, cutoff=2)
+            So = Signatures(L, 2, t)
+            So.run(cutoff=2, progress=False)
+            self.assertSameSig(S, So)
+        self.assertEqual(st.ncomp, 0)
+        # resume : nothing left to compute
+        dstat = precompute_signatures(L, [1, 2, 3], lcy, workers=2,
+                                      store=st, verbose=False, cutoff=2)
+        self.assertEqual(dstat['nstored'], 2 * len(lcy))
+        self.assertEqual(dstat['ncomputed'], len(lcy))
+
+    def test_serial(self):
+        st = SignatureStore(L, filename=self.filename)
+        dstat = precompute_signatures(L, [1], [2, 3], workers=0, store=st,
+                                      verbose=False, cutoff=2)
+        self.assertEqual(dstat['ncomputed'], 2)
+        # the layout is released after the call
+        self.assertTrue(sst._sigL is None)
+
+    @unittest.skipIf('fork' not in multiprocessing.get_all_start_methods(),
+                     'fork start method required')
+    def test_crash(self):
+        lcy = [cy for cy in L.Gt.nodes() if cy > 0]
+
+        class Crash(SignatureSearch):
+            def run(self, source, targets, **kwargs):
+                if 3 in targets:
+                    os._exit(1)
+                return SignatureSearch.run(self, source, targets, **kwargs)
+
+        st = SignatureStore(L, filename=self.filename)
+        sst.SignatureSearch = Crash
+        try:
+            dstat = precompute_signatures(L, [1], lcy, workers=2, store=st,
+                                          chunksize=2, verbose=False,
+                                          cutoff=1)
+        finally:
+            sst.SignatureSearch = SignatureSearch
+        self.assertEqual(dstat['failed'], [(1, 3)])
+        self.assertEqual(st.pairs(cutoff=1),
+                         set([(1, t) for t in lcy if t != 3]))
+
+
+if __name__ == '__main__':
+    unittest.main()
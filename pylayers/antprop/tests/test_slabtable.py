@@ -0,0 +1,84 @@
+import os
+import unittest
+import numpy as np
+import pylayers.util.pyutil as pyu
+from pylayers.util.project import pstruc
+from pylayers.gis.layout import Layout
+from pylayers.antprop import slab
+from pylayers.antprop.slab import SlabTable
+from pylayers.antprop.interactions import Inter, IntR, IntT
+
+L = Layout('defstr.lay')
+fGHz = np.linspace(2, 11, 64)
+
+
+class TestSlabTable(unittest.TestCase):
+
+    def test_eval(self):
+        tol = 1e-4
+        theta = np.hstack((np.linspace(0, np.pi / 2 - 1e-3, 301),
+                           np.pi / 2 - np.logspace(-6, -3, 20)))
+        for name in ['WALL', 'WOOD', 'CEIL']:
+            sl = L.sl[name]
+            tab = SlabTable(sl, fGHz, tol=tol)
+            R, T = tab.eval(theta, RT='RT', compensate=True)
+            sl.eval(fGHz, theta, RT='RT', compensate=True)
+            self.assertLess(np.abs(R - sl.R).max(), tol)
+            self.assertLess(np.abs(T - sl.T).max(), tol)
+            T = tab.eval(theta, RT='T')
+            sl.eval(fGHz, theta, RT='T')
+            self.assertLess(np.abs(T - sl.T).max(), tol)
+
+    def test_rttable(self):
+        tab = L.sl.rttable('WALL', fGHz, tol=1e-3)
+        self.assertTrue(L.sl.rttable('WALL', fGHz, tol=1e-3) is tab)
+        dirname = pyu.getlong('', pstruc['DIRRTTAB'])
+        self.assertTrue(any(f.endswith('.npz') for f in os.listdir(dirname)))
+        # another slab database shares the table of the session
+        L2 = Layout('defstr.lay')
+        tab2 = L2.sl.rttable('WALL', fGHz, tol=1e-3)
+        self.assertTrue(tab2.R is tab.R)
+        self.assertTrue(tab2.slab is L2.sl['WALL'])
+        # out of the session, the table is read from disk
+        slab._dtable.clear()
+        tab2 = L2.sl.rttable('WALL', fGHz, tol=1e-3)
+        self.assertFalse(tab2.R is tab.R)
+        self.assertTrue((tab2.theta == tab.theta).all())
+        self.assertTrue((tab2.R == tab.R).all())
+        # another definition is another table
+        L2.sl['WALL']['lthick'] = [0.2]
+        tab3 = L2.sl.rttable('WALL', fGHz, tol=1e-3)
+        self.assertNotEqual(tab3.hash, tab.hash)
+
+    def test_lru(self):
+        ntable = slab._ntable
+        slab._ntable = 2
+        try:
+            slab._dtable.clear()
+            for name in ['WALL', 'WOOD', 'CEIL']:
+                L.sl.rttable(name, fGHz, tol=1e-3)
+            self.assertEqual(len(slab._dtable), 2)
+            tab = L.sl.rttable('CEIL', fGHz, tol=1e-3)
+            self.assertTrue(list(slab._dtable.values())[-1] is tab)
+        finally:
+            slab._ntable = ntable
+
+    def test_inter(self):
+        # exact evaluation by default
+        self.assertEqual(Inter.rttol, 0)
+        N = 200
+        rng = np.random.RandomState(0)
+        for cls, lsl in [(IntR, ['WALL', 'WOOD']), (IntT, ['WALL', 'AIR'])]:
+            I = cls(slab=L.sl)
+            I.data = np.c_[rng.uniform(0, 1.5, N), np.ones(N), np.ones(N)]
+            I.idx = list(range(N))
+            lab = np.array(lsl)[rng.randint(0, 2, N)]
+            I.dusl = {s: np.nonzero(lab == s)[0] for s in lsl}
+            A0 = I.eval(fGHz).copy()
+            self.assertTrue(np.array_equal(I.eval(fGHz, rttol=0), A0))
+            A = I.eval(fGHz, rttol=1e-4)
+            self.assertLess(np.abs(A - A0).max(), 1e-4)
+
+
+if __name__ == '__main__':
+    unittest.main()
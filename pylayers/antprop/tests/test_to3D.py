@@ -0,0 +1,108 @@
+import unittest
+import numpy as np
+import matplotlib.path as mpath
+import pytest
+from pylayers.antprop.signature import Signatures
+
+# signature cutoff of the defstr fixture
+cutoff = 4
+
+
+@pytest.mark.usefixtures('defstr')
+class TestTo3D(unittest.TestCase):
+
+    def outpaths(self):
+        # contours of the outdoor cycles
+        Gt = self.L.Gt
+        return [mpath.Path(np.array(Gt.nodes[cy]['polyg'].exterior.coords))
+                for cy in Gt.nodes() if (cy > 0) and (not Gt.nodes[cy]['indoor'])]
+
+    def test_alpha(self):
+        r3d = self.r2d.to3D(self.L, H=3, N=1)
+        for k in self.r2d:
+            if k == 0:
+                continue
+            a = self.r2d[k]['alpha']
+            self.assertTrue((np.diff(a, axis=0) >= 0).all())
+            self.assertTrue(((a > 0) & (a < 1)).all())
+            z = self.tx[2] + a * (self.rx[2] - self.tx[2])
+            self.assertTrue(np.allclose(self.r2d[k]['pt'][2], z))
+
+    def test_floor_ceil(self):
+        H = 3
+        r3d = self.r2d.to3D(self.L, H=H, N=2)
+        self.assertTrue(r3d.nray > 0)
+        lpout = self.outpaths()
+        for k in r3d:
+            sig = r3d[k]['sig']
+            pt = r3d[k]['pt']
+            uf = np.where(sig[1] == 4)
+            uc = np.where(sig[1] == 5)
+            self.assertTrue(np.allclose(pt[2, uf[0], uf[1]], 0))
+            self.assertTrue(np.allclose(pt[2, uc[0], uc[1]], H))
+            # no ceil reflexion remains in outdoor cycles
+            for p in lpout:
+                inside = p.contains_points(pt[:2, uc[0], uc[1]].T)
+                self.assertFalse(inside.any())
+            # sorted by length
+            self.assertTrue((np.diff(r3d[k]['dis']) >= 0).all())
+        # rays are delayed according to their length
+        self.assertEqual(len(r3d.delays), r3d.nray)
+
+    def test_indoor_ceil(self):
+        # the rays reflected on the ceil of indoor cycles only are kept
+        lpout = self.outpaths()
+
+        def nindoor(r3d):
+            n = 0
+            for k in r3d:
+                uc = r3d[k]['sig'][1] == 5
+                bout = np.zeros(uc.shape, dtype=bool)
+                for p in lpout:
+                    bout[uc] = bout[uc] | \
+                        p.contains_points(r3d[k]['pt'][:2][:, uc].T)
+                n = n + np.sum(uc.any(axis=0) & ~bout.any(axis=0))
+            return n
+
+        n0 = nindoor(self.r2d.to3D(self.L, H=3, N=2, rmoutceilR=False))
+        n1 = nindoor(self.r2d.to3D(self.L, H=3, N=2))
+        self.assertTrue(n0 > 0)
+        self.assertEqual(n1, n0)
+
+    def test_los(self):
+        # line of sight in an outdoor cycle : the ceil reflexions in the
+        # cycle are removed for every vertical pattern
+        cy = [c for c in self.L.Gt.nodes()
+              if (c > 0) and (not self.L.Gt.nodes[c]['indoor'])][0]
+        So = Signatures(self.L, cy, cy)
+        So.run(cutoff=2, progress=False)
+        ptx = np.r_[np.array(self.L.Gt.pos[cy]), 1.2]
+        prx = np.r_[np.array(self.L.Gt.pos[cy]) + 0.2, 1.5]
+        r3d = So.raysv(ptx, prx).to3D(self.L, H=3, N=2)
+        self.assertEqual(r3d[0]['nbrays'], 1)
+        self.assertTrue(np.allclose(r3d.delays[r3d[0]['rayidx']],
+                                    np.linalg.norm(prx - ptx) / 0.3))
+        p = mpath.Path(np.array(self.L.Gt.nodes[cy]['polyg'].exterior.coords))
+        for k in r3d:
+            uc = r3d[k]['sig'][1] == 5
+            self.assertFalse(p.contains_points(r3d[k]['pt'][:2][:, uc].T).any())
+
+    def test_locbas(self):
+        r3d = self.r2d.to3D(self.L)
+        r3d.locbas(self.L)
+        for k in r3d:
+            if k == 0:
+                continue
+            for B in ['Bi', 'Bo']:
+                M = r3d[k][B]
+                # orthonormal local bases 3 x 3 x i x r
+                G = np.einsum('xv...,xw...->vw...', M, M)
+                self.assertTrue(np.allclose(G, np.eye(3)[..., None, None]))
+            if 'diffslabs' in r3d[k]:
+                ndiff = np.sum(r3d[k]['sig'][1, 1:-1, :] == 1)
+                self.assertEqual(len(r3d[k]['diffslabs']), ndiff)
+                self.assertEqual(r3d[k]['diffvect'].shape, (4, ndiff))
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
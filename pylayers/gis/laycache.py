@@ -0,0 +1,429 @@
+#-*- coding:Utf-8 -*-
+"""
+.. currentmodule:: pylayers.gis.laycache
+
+Layout graphs cache
+===================
+
+This module converts the graphs of a Layout (Gs, Gt, Gv, Gi, ...) into a
+set of plain numpy arrays stored in a compressed ``.npz`` file, without
+any pickled object.
+
+Each file is tagged with CACHE_VERSION, a file written with another
+version of the format is ignored.
+
+Graph encoding
+--------------
+
++ nodes : node array. Tuple nodes (Gi) are right padded with 0 and their
+  length is stored in nodes_len
++ edges : (Ne,2) array of node indices
++ pos : (N,2) node positions if the graph has a pos dictionnary
++ n__<key>__* : node attribute <key>
++ e__<key>__* : edge attribute <key>
+
+Attribute values are encoded according to their kind :
+
++ num : scalar (bool, int, float)
++ str : string
++ arr : 1D np.array
++ seq : list or tuple of scalars
++ tuplist : list of tuples of int (e.g. Gt 'inter')
++ ndict : dictionnary {node : float} (e.g. Gi 'output')
++ polyg : geomutil.Polygon (Gt 'polyg')
+
+Ragged values are stored as CSR pairs (ptr,val).
+
+.. autosummary::
+    :toctree: generated/
+
+    graph2arrays
+    arrays2graph
+    savegraph
+    loadgraph
+    savejson
+    loadjson
+
+"""
+from __future__ import print_function
+import os
+import json
+import numpy as np
+import networkx as nx
+import pylayers.util.geomutil as geu
+
+CACHE_VERSION = 1
+
+
+def _tup2arr(ltup):
+    """ encode a list of int tuples in a padded array
+
+    Parameters
+    ----------
+
+    ltup : list of tuples
+
+    Returns
+    -------
+
+    arr : np.array (N x w)
+    alen : np.array (N,)
+
+    Examples
+    --------
+
+    >>> arr, alen = _tup2arr([(1,),(2,3),(4,5,6)])
+    >>> arr.shape
+    (3, 3)
+    >>> _arr2tup(arr,alen)
+    [(1,), (2, 3), (4, 5, 6)]
+
+    """
+    alen = np.array([len(t) for t in ltup], dtype=int)
+    w = max(alen.max(), 1) if len(alen) > 0 else 1
+    arr = np.zeros((len(ltup), w), dtype=int)
+    for k, t in enumerate(ltup):
+        arr[k, :len(t)] = t
+    return arr, alen
+
+
+def _arr2tup(arr, alen):
+    """ decode _tup2arr
+    """
+    return [tuple(a[:l].tolist()) for a, l in zip(arr, alen)]
+
+
+def _ragged(lval, dtype=float):
+    """ encode a list of sequences in CSR arrays (ptr,val)
+    """
+    ptr = np.hstack((0, np.cumsum([len(v) for v in lval]))).astype(int)
+    if ptr[-1] > 0:
+        val = np.hstack([np.asarray(v, dtype=dtype).ravel() for v in lval
+                         if len(v) > 0])
+    else:
+        val = np.array([], dtype=dtype)
+    return ptr, val
+
+
+def _kind(lval):
+    """ determine the encoding kind of a list of attribute values
+    """
+    for v in lval:
+        if isinstance(v, geu.Polygon):
+            return 'polyg'
+        if isinstance(v, dict):
+            return 'ndict'
+        if isinstance(v, str):
+            return 'str'
+        if isinstance(v, np.ndarray):
+            return 'arr'
+        if isinstance(v, (bool, int, float, np.number, np.bool_)):
+            return 'num'
+        if isinstance(v, (list, tuple)):
+            if len(v) == 0:
+                continue
+            if isinstance(v[0], tuple):
+                return 'tuplist'
+            return 'seq'
+        raise TypeError('unable to encode attribute value of type '
+                        + type(v).__name__)
+    # only void sequences
+    return 'seq'
+
+
+def _attr2arrays(prefix, lidx, lval, dno):
+    """ encode the values of an attribute
+
+    Parameters
+    ----------
+
+    prefix : string
+        'n__<key>' or 'e__<key>'
+    lidx : list of int
+        index of the nodes (edges) having this attribute
+    lval : list
+        attribute values
+    dno : dict
+        node -> node index (for ndict keys)
+
+    Returns
+    -------
+
+    d : dict of np.array
+
+    """
+    kind = _kind(lval)
+    d = {prefix + '__kind': np.array(kind),
+         prefix + '__idx': np.array(lidx, dtype=int)}
+    if kind == 'num':
+        d[prefix + '__val'] = np.array(lval)
+    elif kind == 'str':
+        d[prefix + '__val'] = np.array(lval, dtype=str)
+    elif kind == 'arr':
+        ptr, val = _ragged(lval)
+        d[prefix + '__ptr'] = ptr
+        d[prefix + '__val'] = val
+    elif kind == 'seq':
+        ptr, val = _ragged(lval, dtype=np.asarray(
+            [x for v in lval for x in v]).dtype)
+        d[prefix + '__ptr'] = ptr
+        d[prefix + '__val'] = val
+        d[prefix + '__istup'] = np.array([isinstance(v, tuple) for v in lval],
+                                         dtype=bool)
+    elif kind == 'tuplist':
+        ltup = [t for v in lval for t in v]
+        d[prefix + '__ptr'] = np.hstack((0, np.cumsum([len(v) for v in lval]))).astype(int)
+        d[prefix + '__val'], d[prefix + '__len'] = _tup2arr(ltup)
+    elif kind == 'ndict':
+        d[prefix + '__ptr'] = np.hstack((0, np.cumsum([len(v) for v in lval]))).astype(int)
+        d[prefix + '__key'] = np.array([dno[k] for v in lval for k in v], dtype=int)
+        d[prefix + '__val'] = np.array([v[k] for v in lval for k in v], dtype=float)
+    elif kind == 'polyg':
+        lxy = [np.array(v.exterior.xy).T[:-1, :] for v in lval]
+        d[prefix + '__ptr'] = np.hstack((0, np.cumsum([len(xy) for xy in lxy]))).astype(int)
+        d[prefix + '__val'] = np.vstack(lxy)
+        d[prefix + '__vptr'], d[prefix + '__vval'] = _ragged(
+            [v.vnodes for v in lval], dtype=int)
+    return d
+
+
+def _arrays2attr(prefix, d, lno):
+    """ decode _attr2arrays
+
+    Returns
+    -------
+
+    lidx : np.array
+    lval : list
+
+    """
+    kind = str(d[prefix + '__kind'])
+    lidx = d[prefix + '__idx']
+    N = len(lidx)
+    if kind == 'num':
+        lval = d[prefix + '__val'].tolist()
+    elif kind == 'str':
+        lval = [str(x) for x in d[prefix + '__val']]
+    else:
+        ptr = d[prefix + '__ptr']
+        val = d[prefix + '__val']
+        if kind == 'arr':
+            lval = [val[ptr[k]:ptr[k + 1]].copy() for k in range(N)]
+        elif kind == 'seq':
+            istup = d[prefix + '__istup']
+            lval = [tuple(val[ptr[k]:ptr[k + 1]].tolist()) if istup[k]
+                    else val[ptr[k]:ptr[k + 1]].tolist() for k in range(N)]
+        elif kind == 'tuplist':
+            ltup = _arr2tup(val, d[prefix + '__len'])
+            lval = [ltup[ptr[k]:ptr[k + 1]] for k in range(N)]
+        elif kind == 'ndict':
+            key = d[prefix + '__key']
+            lval = [{lno[u]: p for u, p in
+                     zip(key[ptr[k]:ptr[k + 1]], val[ptr[k]:ptr[k + 1]].tolist())}
+                    for k in range(N)]
+        elif kind == 'polyg':
+            vptr = d[prefix + '__vptr']
+            vval = d[prefix + '__vval']
+            lval = [geu.Polygon(p=val[ptr[k]:ptr[k + 1], :].T,
+                                vnodes=vval[vptr[k]:vptr[k + 1]].tolist())
+                    for k in range(N)]
+        else:
+            raise TypeError('unknown attribute kind ' + kind)
+    return lidx, lval
+
+
+def graph2arrays(G):
+    """ convert a networkx graph into a dictionnary of arrays
+
+    Parameters
+    ----------
+
+    G : nx.Graph | nx.DiGraph
+
+    Returns
+    -------
+
+    d : dict of np.array
+
+    Examples
+    --------
+
+    >>> import networkx as nx
+    >>> G = nx.DiGraph(name='Gi')
+    >>> G.add_edge((1,2),(-3,),output={(1,2):0.5})
+    >>> G.pos = {(1,2):(0.,1.),(-3,):(2.,3.)}
+    >>> d = graph2arrays(G)
+    >>> H = arrays2graph(d)
+    >>> H.edges[(1,2),(-3,)]['output']
+    {(1, 2): 0.5}
+    >>> H.pos[(-3,)]
+    (2.0, 3.0)
+
+    See Also
+    --------
+
+    arrays2graph
+
+    """
+    lno = list(G.nodes())
+    dno = {n: k for k, n in enumerate(lno)}
+    d = {'version': np.array(CACHE_VERSION),
+         'gtype': np.array(type(G).__name__),
+         'gname': np.array(G.graph.get('name', ''))}
+
+    if len(lno) > 0 and isinstance(lno[0], tuple):
+        d['nodes'], d['nodes_len'] = _tup2arr(lno)
+    else:
+        d['nodes'] = np.array(lno, dtype=int)
+
+    d['edges'] = np.array([(dno[e[0]], dno[e[1]]) for e in G.edges()],
+                          dtype=int).reshape(-1, 2)
+
+    if hasattr(G, 'pos'):
+        pos = np.zeros((len(lno), 2))
+        mask = np.zeros(len(lno), dtype=bool)
+        for n in G.pos:
+            if n in dno:
+                pos[dno[n], :] = G.pos[n]
+                mask[dno[n]] = True
+        d['pos'] = pos
+        d['pos_mask'] = mask
+        ispos = [type(v) for v in G.pos.values()]
+        d['pos_kind'] = np.array('arr' if np.ndarray in ispos else 'tuple')
+
+    for typ, litems in [('n', [(k, G.nodes[n]) for k, n in enumerate(lno)]),
+                        ('e', [(k, G.edges[e]) for k, e in enumerate(G.edges())])]:
+        dattr = {}
+        for k, da in litems:
+            for key in da:
+                dattr.setdefault(key, ([], []))
+                dattr[key][0].append(k)
+                dattr[key][1].append(da[key])
+        for key in dattr:
+            d.update(_attr2arrays(typ + '__' + key, dattr[key][0],
+                                  dattr[key][1], dno))
+    return d
+
+
+def arrays2graph(d):
+    """ convert a dictionnary of arrays back into a networkx graph
+
+    Parameters
+    ----------
+
+    d : dict of np.array (or NpzFile)
+
+    Returns
+    -------
+
+    G : nx.Graph | nx.DiGraph
+
+    See Also
+    --------
+
+    graph2arrays
+
+    """
+    if str(d['gtype']) == 'DiGraph':
+        G = nx.DiGraph(name=str(d['gname']))
+    else:
+        G = nx.Graph(name=str(d['gname']))
+
+    if 'nodes_len' in d:
+        lno = _arr2tup(d['nodes'], d['nodes_len'])
+    else:
+        lno = d['nodes'].tolist()
+    G.add_nodes_from(lno)
+    G.add_edges_from([(lno[u], lno[v]) for u, v in d['edges']])
+
+    if 'pos' in d:
+        pos = d['pos']
+        mask = d['pos_mask']
+        if str(d['pos_kind']) == 'arr':
+            G.pos = {lno[k]: pos[k, :].copy() for k in np.where(mask)[0]}
+        else:
+            G.pos = {lno[k]: tuple(pos[k, :].tolist()) for k in np.where(mask)[0]}
+
+    ledges = list(G.edges())
+    lkeys = [k for k in d.keys() if k.endswith('__kind')]
+    for k in lkeys:
+        prefix = k[:-len('__kind')]
+        typ, key = prefix.split('__', 1)
+        lidx, lval = _arrays2attr(prefix, d, lno)
+        if typ == 'n':
+            for u, v in zip(lidx, lval):
+                G.nodes[lno[u]][key] = v
+        else:
+            for u, v in zip(lidx, lval):
+                G.edges[ledges[u]][key] = v
+    return G
+
+
+def savegraph(filename, G):
+    """ save a graph in a compressed npz file
+
+    Parameters
+    ----------
+
+    filename : string
+    G : nx.Graph
+
+    """
+    np.savez_compressed(filename, **graph2arrays(G))
+
+
+def loadgraph(filename):
+    """ load a graph saved with savegraph
+
+    Parameters
+    ----------
+
+    filename : string
+
+    Returns
+    -------
+
+    G : nx.Graph or None if the file has not the current CACHE_VERSION
+
+    """
+    with np.load(filename, allow_pickle=False) as d:
+        if int(d['version']) != CACHE_VERSION:
+            return None
+        return arrays2graph(d)
+
+
+def _tojson(o):
+    if isinstance(o, np.ndarray):
+        return o.tolist()
+    if isinstance(o, np.generic):
+        return o.item()
+    raise TypeError(type(o).__name__)
+
+
+def savejson(filename, obj):
+    """ save a small python object (dict, list) in json
+
+    Notes
+    -----
+
+    json converts integer keys in strings, see loadjson
+
+    """
+    with open(filename, 'w') as fd:
+        json.dump({'version': CACHE_VERSION, 'data': obj}, fd, default=_tojson)
+
+
+def loadjson(filename):
+    """ load an object saved with savejson
+
+    Returns
+    -------
+
+    obj : object or None if the file has not the current CACHE_VERSION
+
+    """
+    with open(filename, 'r') as fd:
+        d = json.load(fd)
+    if d['version'] != CACHE_VERSION:
+        return None
+    return d['data']
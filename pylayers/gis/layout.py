@@ -45,10 +45,12 @@ from descartes.patch import PolygonPatch
 from numpy import array
 import PIL.Image as Image
 import hashlib
+import shutil
 import pylayers.gis.kml as gkml
 #from pathos.multiprocessing import ProcessingPool as Pool
 #from pathos.multiprocessing import cpu_count
 from functools import partial
+from multiprocessing import Pool
 
 if sys.version_info.major==2:
     from  urllib2 import urlopen
@@ -92,12 +94,15 @@ from pylayers.util import plotutil as plu
 from pylayers.util import pyutil as pyu
 from pylayers.util import graphutil as gru
 from pylayers.util import cone
+from pylayers.util import mputil as mpu
+from pylayers.util import gridindex as gix
 
 # Handle furnitures
 
 import pylayers.gis.furniture as fur
 import pylayers.gis.osmparser as osm
 from pylayers.gis.selectl import SelectL
+import pylayers.gis.laycache as lca
 import pylayers.util.graphutil as gph
 import pylayers.util.project as pro
 from pylayers.util.project import logger
@@ -221,6 +226,8 @@ class Layout(pro.PyLayers):
         force : boolean
         check : boolean
         build : boolean
+        bcache : boolean
+            use the content addressed graph cache when building (see build)
         verbose : boolean
         bcartesian : boolean
         xlim : '(xmin,xmax,ymin,ymax) | () default'
@@ -238,6 +245,7 @@ class Layout(pro.PyLayers):
         self.bcheck = kwargs.pop('bcheck',False)
         self.bbuild = kwargs.pop('bbuild',False)
         self.bgraphs = kwargs.pop('bgraphs',False)
+        self.bcache = kwargs.pop('bcache',False)
         self.bverbose = kwargs.pop('bverbose',False)
         self.bcartesian = kwargs.pop('bcartesian',True)
         self.xlim = kwargs.pop('xlim',())
@@ -413,7 +421,7 @@ class Layout(pro.PyLayers):
                 if self.bbuild:
                     # ans = raw_input('Do you want to build the layout (y/N) ? ')
                     # if ans.lower()=='y'
-                    self.build()
+                    self.build(cache=self.bcache)
                     self.lbltg.append('s')
                     self.dumpw()
                 #
@@ -450,6 +458,19 @@ class Layout(pro.PyLayers):
                         self.lbltg.append('s')
                         self.dumpw()
 
+    def __getattr__(self, name):
+        """ lazy loading of the graphs restored from the cache (see loadc)
+        """
+        lazy = self.__dict__.get('_lazyG', {})
+        if name in lazy:
+            G = lca.loadgraph(lazy.pop(name))
+            setattr(self, name, G)
+            if name == 'Gi':
+                self.Gi_A = nx.adjacency_matrix(self.Gi)
+                self.Gi_no = self.Gi.nodes()
+            return G
+        raise AttributeError(name)
+
     def __repr__(self):
         st = '\n'
         st = st + "----------------\n"
@@ -1055,6 +1076,8 @@ class Layout(pro.PyLayers):
         + self.lsss : list of iso segments
         + self.maxheight :
         + self.normal :
+        + self._sgrid : spatial index of the segments (see extrseg)
+        + self._pgrid : spatial index of the nodes of Gs
 
         assert self.pt[self.iupnt[-1]] == self.pt[:,self.iupnt[-1]]
 
@@ -1372,6 +1395,23 @@ class Layout(pro.PyLayers):
             # calculate extremum of segments
             self.extrseg()
 
+        # spatial index of the nodes of Gs (used in ispoint)
+        self._pindex()
+
+    def _pindex(self):
+        """ build the spatial index of the nodes of Gs
+
+        Notes
+        -----
+
+        The functions which move nodes of Gs without calling g2npy set
+        self._pgrid to None, the index is then rebuilt by ispoint.
+
+        """
+        self._pkey = np.array(list(self.Gs.pos.keys()), dtype=int)
+        ppos = np.array(list(self.Gs.pos.values()), dtype=float).reshape(-1, 2).T
+        self._pgrid = gix.GridIndex(ppos[0], ppos[0], ppos[1], ppos[1])
+
     def importshp(self, **kwargs):
         """ import layout from shape file
 
@@ -3390,6 +3430,8 @@ class Layout(pro.PyLayers):
         for k in self.Gs.pos:
             pt = self.Gs.pos[k]
             self.Gs.pos[k] = (pt[0] + vec[0], pt[1] + vec[1])
+        # the node index is rebuilt by ispoint
+        self._pgrid = None
 
     def rotate(self, angle=90):
         """ rotate the layout
@@ -3904,6 +3946,163 @@ class Layout(pro.PyLayers):
 
         return((pt,ke))
 
+    def angleonlinks(self, pa, pb, nmax=2000000):
+        """ segments crossed by a batch of 3D links and incidence angles
+
+        Parameters
+        ----------
+
+        pa : np.array (N,3) or (3,)
+            links first extremity
+        pb : np.array (N,3) or (3,)
+            links second extremity
+        nmax : int
+            maximal number of (link, segment) bounding box tests held in
+            memory at once. The links are processed in consecutive tiles
+            of about nmax / (number of candidate segments) links.
+
+        Returns
+        -------
+
+        indptr : np.array (N+1,)
+            the crossings of link i are data[indptr[i]:indptr[i+1]]
+        data : structured array
+            'k' : segment index in tahe
+            's' : segment number in Gs
+            'a' : angle (in radians) between link and segment normal
+
+        Notes
+        -----
+
+        For each tile the candidate segments are taken from the grid
+        index of the segments (see extrseg) over the bounding box of the
+        tile, then pruned link by link with the segment bounding boxes.
+        The exact crossing test is only evaluated on the remaining
+        (link, segment) pairs. It is the test of geomutil.intersect3
+        specialized to vertical screens, hence no (links x segments)
+        linear system is formed.
+
+        Iso segments (several segments sharing the same extremities at
+        different heights) are reported as separate crossings.
+
+        Within a link the crossings are sorted by increasing segment
+        index in tahe.
+
+        Examples
+        --------
+
+        >>> from pylayers.gis.layout import *
+        >>> L = Layout('defstr.lay')
+        >>> pa = np.array([[2,2.5,1.5],[2,2,1.5]])
+        >>> pb = np.array([[8,4,1.5],[8,4,1.5]])
+        >>> indptr, data = L.angleonlinks(pa,pb)
+        >>> len(indptr)
+        3
+
+        See Also
+        --------
+
+        angleonlink3
+        pylayers.util.geomutil.intersect3
+
+        """
+        pa = np.asarray(pa, dtype=float)
+        pb = np.asarray(pb, dtype=float)
+        if pa.ndim == 1:
+            pa = pa[None, :]
+        if pb.ndim == 1:
+            pb = pb[None, :]
+        assert pa.shape[1] == 3
+        assert pb.shape[1] == 3
+        N = max(pa.shape[0], pb.shape[0])
+        if pa.shape[0] < N:
+            pa = np.repeat(pa, N, axis=0)
+        if pb.shape[0] < N:
+            pb = np.repeat(pb, N, axis=0)
+
+        dtype = [('k', 'i8'), ('s', 'i8'), ('a', np.float32)]
+        if (N == 0) or (self.Ns == 0):
+            return np.zeros(N + 1, dtype=int), np.zeros(0, dtype=dtype)
+
+        # segment screens
+        Pta = self.pt[:, self.tahe[0, :]]
+        Phe = self.pt[:, self.tahe[1, :]]
+        Pg = (Pta + Phe) / 2.
+        Ptahe = Phe - Pta
+        L1 = np.sqrt(np.sum(Ptahe * Ptahe, axis=0))
+        U1 = Ptahe / L1
+        zg = (self.max_sz + self.min_sz) / 2.
+        L2 = self.max_sz - self.min_sz
+
+        lmin_x = np.minimum(pa[:, 0], pb[:, 0])
+        lmax_x = np.maximum(pa[:, 0], pb[:, 0])
+        lmin_y = np.minimum(pa[:, 1], pb[:, 1])
+        lmax_y = np.maximum(pa[:, 1], pb[:, 1])
+
+        lk = []
+        li = []
+        k0 = 0
+        nt = max(1, nmax // self.Ns)
+        while k0 < N:
+            nt = min(nt, N - k0)
+            while True:
+                sl = slice(k0, k0 + nt)
+                cand = self._sgrid.query(lmin_x[sl].min(), lmax_x[sl].max(),
+                                         lmin_y[sl].min(), lmax_y[sl].max(),
+                                         strict=False)
+                if (nt * len(cand) <= nmax) or (nt == 1):
+                    break
+                nt = max(1, nt // 2)
+            # (link, candidate) bounding box overlap
+            b = ((self.max_sx[cand][None, :] >= lmin_x[sl][:, None]) &
+                 (self.min_sx[cand][None, :] <= lmax_x[sl][:, None]) &
+                 (self.max_sy[cand][None, :] >= lmin_y[sl][:, None]) &
+                 (self.min_sy[cand][None, :] <= lmax_y[sl][:, None]))
+            ui, uc = np.nonzero(b)
+            li.append(ui + k0)
+            lk.append(cand[uc])
+            k0 = k0 + nt
+            # the next tile is sized on the candidates of this one
+            nt = max(1, nmax // max(1, len(cand)))
+
+        il = np.hstack(li)
+        ik = np.hstack(lk)
+
+        # exact crossing test on the remaining pairs
+        a = pa[il, :]
+        ba = pb[il, :] - a
+        u1 = U1[:, ik]
+        d = Pg[:, ik] - a[:, 0:2].T
+        D = ba[:, 0] * u1[1, :] - ba[:, 1] * u1[0, :]
+        valid = ~ np.isclose(D, 0)
+        D[~valid] = 1.
+        t = (d[0, :] * u1[1, :] - d[1, :] * u1[0, :]) / D
+        x1 = (ba[:, 1] * d[0, :] - ba[:, 0] * d[1, :]) / D
+        x2 = a[:, 2] + t * ba[:, 2] - zg[ik]
+        # eps keeps the crossings at the links or segments extremities
+        # which are subject to rounding errors
+        eps = 1e-9
+        bo = (valid & (t >= -eps) & (t <= 1 + eps) &
+              (np.abs(x1) <= L1[ik] / 2. + eps) &
+              (np.abs(x2) <= L2[ik] / 2. + eps))
+
+        il = il[bo]
+        ik = ik[bo]
+
+        # angle between link and segment normal
+        u = pa[il, :] - pb[il, :]
+        nu = np.sqrt(np.sum(u * u, axis=1))
+        unn = abs(np.sum(u * self.normal[:, ik].T, axis=1)) / nu
+
+        data = np.zeros(len(il), dtype=dtype)
+        data['k'] = ik
+        data['s'] = self.tsg[ik]
+        data['a'] = np.arccos(unn)
+
+        indptr = np.hstack((0, np.cumsum(np.bincount(il, minlength=N))))
+
+        return indptr, data
+
     def angleonlink3(self, p1=np.array([0, 0, 1]), p2=np.array([10, 3, 1])):
         """ return (seglist,angle) between p1 and p2
 
@@ -3935,9 +4134,16 @@ class Layout(pro.PyLayers):
                (0, 65, 0.29145678877830505)],
               dtype=[('i', '<i8'), ('s', '<i8'), ('a', '<f4')])
 
+        Notes
+        -----
+
+        This is a wrapper of angleonlinks which returns the link index of
+        each crossing instead of the CSR pointer.
+
         See Also
         --------
 
+        angleonlinks
         antprop.loss.Losst
         geomutil.intersect3
 
@@ -3959,85 +4165,12 @@ class Layout(pro.PyLayers):
             p1 = np.outer(p1, np.ones(1))
             p2 = np.outer(p2, np.ones(1))
 
-        # 3 x N
-        u = p1 - p2
-        # 1 x N
-        nu = np.sqrt(np.sum(u * u, axis=0))
-        # 3 x N
-        un = u / nu[np.newaxis, :]
-
-        #
-        # warning : seglist contains the segment number in tahe not in Gs
-        #
-
-        seglist  = np.unique(self.seginframe2(p1[0:2], p2[0:2])).astype(int)
-        #seglist  = np.unique(self.seginframe(p1[0:2], p2[0:2]))
-
-        upos = np.nonzero(seglist >= 0)[0]
-        uneg = np.nonzero(seglist < 0)[0]
-
-
-        # nNLOS = len(uneg) + 1
-        # # retrieve the number of segments per link
-        # if nNLOS > 1:
-        #     llink = np.hstack(
-        #         (uneg[0], np.hstack((uneg[1:], array([len(seglist)]))) - uneg - 1))
-        # else:
-        #     llink = np.array([len(seglist)])
-        # [(link id,number of seg),...]
-        # nl = zip(np.arange(nlink),llink)n
-
-        seglist = seglist[upos]
-
-        npta = self.tahe[0, seglist]
-        nphe = self.tahe[1, seglist]
-
-        Pta = self.pt[:, npta]
-        Phe = self.pt[:, nphe]
-
-        Nscreen = len(npta)
-        # get segment height bounds
-        zmin = np.array([self.Gs.nodes[x]['z'][0]
-                         for x in self.tsg[seglist]])
-        zmax = np.array([self.Gs.nodes[x]['z'][1]
-                         for x in self.tsg[seglist]])
-        # centroid of the screen
-        Pg = np.vstack(((Phe + Pta) / 2., (zmax + zmin) / 2.))
-        Ptahe = Phe - Pta
-        L1 = np.sqrt(np.sum(Ptahe * Ptahe, axis=0))
-        # 3 x Nscreen U1 is in plane xy
-        U1 = np.vstack((Ptahe / L1, np.zeros(Nscreen)))
-        L2 = zmax - zmin
-        U2 = np.array([0, 0, 1])[:, None]  # 3 x 1  U2 is along z
-        #
-        # p1 : 3 x Ng
-        # p2 : 3 x Ng
-        # Pg : 3 x Nscreen
-        # U1 : 3 x Nscreen
-        # U2 : 3 x 1
-        # L1 : ,Nscreen
-        # L2 : ,Nscreen
-
-        bo, pt = geu.intersect3(p1, p2, Pg, U1, U2, L1, L2)
-        ubo = np.where(bo)
-
-        Nseg = len(ubo[0])
-        data = np.zeros(Nseg, dtype=[('i', 'i8'), ('s', 'i8'), ('a', np.float32)])
+        indptr, dat = self.angleonlinks(p1.T, p2.T)
 
-        data['i'] = ubo[0]
-        data['s'] = self.tsg[seglist[ubo[1]]]
-
-        #
-        # Calculate angle of incidence refered from segment normal
-        #
-
-        norm = self.normal[:, seglist[ubo[1]]]
-        # vector along the link
-        uu = un[:, ubo[0]]
-        unn = abs(np.sum(uu * norm, axis=0))
-        angle = np.arccos(unn)
-
-        data['a'] = angle
+        data = np.zeros(len(dat), dtype=[('i', 'i8'), ('s', 'i8'), ('a', np.float32)])
+        data['i'] = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+        data['s'] = dat['s']
+        data['a'] = dat['a']
 
         return(data)
 
@@ -4098,38 +4231,19 @@ class Layout(pro.PyLayers):
         seglist = self.seginframe2(p1, p2)
         #seglist = self.seginframe(p1, p2)
         upos = np.nonzero(seglist >= 0)[0]
-        uneg = np.nonzero(seglist < 0)[0]
 
-        nNLOS = len(uneg) + 1
-        # retrieve the number of segments per link
-        if nNLOS > 1:
-            llink = np.hstack(
-                (uneg[0], np.hstack((uneg[1:], array([len(seglist)]))) - uneg - 1))
-        else:
-            llink = np.array([len(seglist)])
+        # link index of each candidate segment
+        # -1 in seglist acts as a delimiter between links
+        ilink = (np.cumsum(seglist < 0) - 1)[upos]
 
-        # llink : list of link length
         npta = self.tahe[0, seglist[upos]]
         nphe = self.tahe[1, seglist[upos]]
 
         Pta = self.pt[:, npta]
         Phe = self.pt[:, nphe]
 
-
-        #
-        # This part should possibly be improved
-        #
-
-        for i, nl in enumerate(llink):
-            try:
-                P1 = np.hstack((P1, np.outer(p1[:, i], np.ones(nl))))
-                P2 = np.hstack((P2, np.outer(p2[:, i], np.ones(nl))))
-                ilink = np.hstack(
-                    (ilink, array([-1]), i * np.ones(nl, dtype='int')))
-            except:
-                P1 = np.outer(p1[:, i], np.ones(nl))
-                P2 = np.outer(p2[:, i], np.ones(nl))
-                ilink = i * np.ones(nl, dtype='int')
+        P1 = p1[:, ilink]
+        P2 = p2[:, ilink]
 
         bo = geu.intersect(P1, P2, Pta, Phe)
 
@@ -4137,7 +4251,7 @@ class Layout(pro.PyLayers):
 
         seglist2 = seglist[upos_intersect]
 
-        idxlnk = ilink[upos_intersect]
+        idxlnk = ilink[bo]
         #
         # Calculate angle of incidence refered from segment normal
         #
@@ -4403,7 +4517,10 @@ class Layout(pro.PyLayers):
             `max_sx`
             `min_sy`
             `max_sy`
-        Used in seginframe
+            `min_sz`
+            `max_sz`
+            `_sgrid` : spatial index of the segment bounding boxes
+        Used in seginframe2, onseg, angleonlinks
 
         """
         # 2 x Np
@@ -4417,6 +4534,13 @@ class Layout(pro.PyLayers):
         self.min_sx = np.minimum(pt[0,ta],pt[0,he])
         self.max_sy = np.maximum(pt[1,ta],pt[1,he])
         self.min_sy = np.minimum(pt[1,ta],pt[1,he])
+        sz = np.array([self.Gs.nodes[x]['z'] for x in self.tsg],
+                      dtype=float).reshape(-1, 2)
+        self.min_sz = sz[:, 0]
+        self.max_sz = sz[:, 1]
+        # uniform grid index of the segment bounding boxes
+        self._sgrid = gix.GridIndex(self.min_sx, self.max_sx,
+                                    self.min_sy, self.max_sy)
         #self.max_sx = np.array([ np.maximum(pt[0, x[0]], pt[0, x[1]]) for x in th ])
         #self.min_sx = np.array([ np.minimum(pt[0, x[0]], pt[0, x[1]]) for x in th ])
         #self.max_sy = np.array([ np.maximum(pt[1, x[0]], pt[1, x[1]]) for x in th ])
@@ -4492,21 +4616,25 @@ class Layout(pro.PyLayers):
         max_y = np.maximum(p1[1,:],p2[1,:])
         min_y = np.minimum(p1[1,:],p2[1,:])
 
-        seglist = [ np.nonzero((self.max_sx > x[0]) &
-                               (self.min_sx < x[1]) &
-                               (self.max_sy > x[2]) &
-                               (self.min_sy < x[3]))[0]
-                   for x in zip(min_x, max_x, min_y, max_y) ]
+        # candidate segments are taken from the grid index built in g2npy
+        sgrid = getattr(self, '_sgrid', None)
+        if sgrid is not None:
+            seglist = [ sgrid.query(*x)
+                       for x in zip(min_x, max_x, min_y, max_y) ]
+        else:
+            seglist = [ np.nonzero((self.max_sx > x[0]) &
+                                   (self.min_sx < x[1]) &
+                                   (self.max_sy > x[2]) &
+                                   (self.min_sy < x[3]))[0]
+                       for x in zip(min_x, max_x, min_y, max_y) ]
 
         # np.array stacking
         # -1 acts as a deliminiter (not as a segment number)
 
-        # seglist = reduce(lambda x, y: np.hstack((x, array([-1]), y)), seglist)
-        x = np.array([]).astype(int)
-        for y in seglist:
-            x = np.hstack((x, np.array([-1]), y))
+        x = np.hstack([np.array([-1])] + [np.hstack((y, [-1]))
+                                          for y in seglist])[:-1]
 
-        return(x)
+        return(x.astype(int))
 
     def seginframe(self, p1, p2):
         """ return the seg list of a given zone defined by two points
@@ -5485,7 +5613,8 @@ class Layout(pro.PyLayers):
 
         return fig, ax
 
-    def build(self, graph='tvirw',verbose=False,difftol=0.15,multi=False):
+    def build(self, graph='tvirw',verbose=False,difftol=0.15,multi=False,
+              workers=0,chunksize=2000,cache=False):
         """ build graphs
 
         Parameters
@@ -5500,7 +5629,15 @@ class Layout(pro.PyLayers):
         verbose : boolean
         difftol : diffraction tolerance
         multi : boolean
-            enable multi processing
+            enable multi processing (one worker per cpu)
+        workers : int
+            number of processes used for the Gi output filtering
+            0 or 1 : serial, -1 : one worker per cpu (default 0)
+        chunksize : int
+            number of Gi edges processed per task (default 2000)
+        cache : boolean
+            if True the graphs are restored from the content addressed
+            cache when available, and stored in it after the build
 
         Notes
         -----
@@ -5509,7 +5646,25 @@ class Layout(pro.PyLayers):
 
         Warning : by default the layout is saved (dumpw) after each build
 
+        See Also
+        --------
+
+        outputGi
+        outputGi_mp
+        graphhash
+        dumpc
+        loadc
+
         """
+        if multi and (workers == 0):
+            workers = -1
+
+        if cache:
+            # the key is evaluated before the build modifies Gs (airwalls)
+            key = self.graphhash(graph=graph, difftol=difftol)
+            if self.loadc(key):
+                return
+
         # list of built graphs
         if not self.hasboundary:
             self.boundary()
@@ -5533,10 +5688,11 @@ class Layout(pro.PyLayers):
             Buildpbar.update(1)
         if 'i' in graph:
             self.buildGi(verbose=verbose, tqdmpos=1)
-            if not multi:
+            if mpu.nworkers(workers) == 1:
                 self.outputGi(verbose=verbose,tqdmpos=1)
             else:
-                self.outputGi_mp()
+                self.outputGi_mp(workers=workers, chunksize=chunksize,
+                                 verbose=verbose, tqdmpos=1)
             self.lbltg.extend('i')
         if verbose:
             Buildpbar.update(1)
@@ -5560,10 +5716,260 @@ class Layout(pro.PyLayers):
 
         # There is a dumpw after each build
         self.dumpw()
+        if cache:
+            self.dumpc(key)
+        # snapshot for incremental rebuild
+        self._snap = self._gsnap()
         self.isbuilt = True
         if verbose:
             Buildpbar.update(1)
 
+    def _gsnap(self):
+        """ snapshot of the Gs data the graphs Gt, Gv and Gi depend on
+
+        Returns
+        -------
+
+        dsnap : dict
+            point : (coordinates, sorted neighbor segments)
+            segment : (points, name, iso, transition, 0 in ncycles)
+
+        See Also
+        --------
+
+        rebuild
+
+        """
+        dsnap = {}
+        for n in self.Gs.nodes():
+            if n < 0:
+                dsnap[n] = (tuple(float(x) for x in self.Gs.pos[n]),
+                            tuple(sorted(self.Gs[n])))
+            elif n > 0:
+                d = self.Gs.nodes[n]
+                dsnap[n] = (tuple(self.Gs[n]),
+                            d['name'],
+                            tuple(sorted(d['iso'])),
+                            d['transition'],
+                            0 in d['ncycles'])
+        return dsnap
+
+    def rebuild(self, difftol=0.15, verbose=False):
+        """ incremental update of Gt, Gv and Gi after an edition of Gs
+
+        Parameters
+        ----------
+
+        difftol : float
+            diffraction tolerance
+        verbose : boolean
+
+        Returns
+        -------
+
+        dstat : dict
+            'dirty' : number of modified Gs nodes
+            'Gv' : number of cycles whose visibility graph is recomputed
+            'Gi' : number of Gi edges whose output is recomputed
+
+        Notes
+        -----
+
+        To be called instead of build after add_segment, del_segment,
+        edit_seg, add_furniture, ...
+
+        The modified Gs nodes are obtained by comparing Gs with the
+        snapshot taken at the end of the previous build (see _gsnap).
+
+        + Gt is rebuilt (the convex decomposition is not local) and the
+          new cycles are matched with the previous ones through their
+          vnodes.
+        + the visibility graph of a cycle is recomputed only if the cycle
+          is new or touches a modified Gs node.
+        + Gi nodes are rebuilt and the output of a Gi edge is recomputed
+          only if it involves a new cycle, a modified Gs node, or if the
+          successors of its central interaction have changed.
+
+        checkrebuild compares the result with a full rebuild.
+
+        See Also
+        --------
+
+        build
+        checkrebuild
+
+        """
+        if (not self.isbuilt) or (not hasattr(self, '_snap')):
+            self.build(difftol=difftol, verbose=verbose)
+            return {'dirty': len(self.Gs), 'Gv': len(self.Gt) - 1,
+                    'Gi': len(self.Gi.edges())}
+
+        self.g2npy()
+
+        snap0 = self._snap
+        Gt0 = self.Gt
+        dGv0 = getattr(self, 'dGv', {})
+        Gi0 = self.Gi
+        ddiff0 = self.ddiff
+
+        self.buildGt(difftol=difftol, verbose=verbose)
+        self._snap = self._gsnap()
+        dirty = set([n for n in set(snap0) | set(self._snap)
+                     if snap0.get(n) != self._snap.get(n)])
+
+        #
+        # matching of old and new cycles
+        #
+        def cykey(G, c):
+            return (frozenset(G.nodes[c]['polyg'].vnodes),
+                    G.nodes[c]['indoor'])
+
+        dold = {cykey(Gt0, c): c for c in Gt0.nodes() if c != 0}
+        dcy = {0: 0}   # new -> old
+        for c in self.Gt.nodes():
+            if c != 0:
+                k = cykey(self.Gt, c)
+                if k in dold:
+                    dcy[c] = dold[k]
+        dcyo = {v: k for k, v in dcy.items()}  # old -> new
+
+        #
+        # visibility graph
+        #
+        self.Gv = nx.Graph(name='Gv')
+        self.dGv = {}
+        nGv = 0
+        for c in self.Gt.nodes():
+            if c == 0:
+                continue
+            c0 = dcy.get(c)
+            reuse = (c0 in dGv0)
+            if reuse:
+                vnodes = self.Gt.nodes[c]['polyg'].vnodes
+                liso = [x for n in vnodes if n > 0
+                        for x in self.Gs.nodes[n]['iso']]
+                reuse = not any(n in dirty for n in list(vnodes) + liso)
+            if reuse:
+                for n in vnodes:
+                    if n < 0:
+                        b0 = (n in ddiff0) and (c0 in ddiff0[n][0])
+                        b1 = (n in self.ddiff) and (c in self.ddiff[n][0])
+                        if b0 != b1:
+                            reuse = False
+                            break
+            if reuse:
+                Gv = dGv0[c0]
+            else:
+                Gv = self._buildGvcycle(c)
+                nGv = nGv + 1
+            self.Gv = nx.compose(self.Gv, Gv)
+            self.dGv[c] = Gv
+
+        #
+        # graph of interactions
+        #
+        self.buildGi(verbose=verbose)
+
+        def tonode(i, dmap):
+            # translate the cycles of a Gi node
+            try:
+                return (i[0],) + tuple(dmap[c] for c in i[1:])
+            except KeyError:
+                return None
+
+        darr, lno = self._Gi_arrays()
+        nGi = 0
+        for ke, (i0, i1) in enumerate(self.Gi.edges()):
+            o0 = tonode(i0, dcy)
+            o1 = tonode(i1, dcy)
+            reuse = ((o0 is not None) and (o1 is not None) and
+                     Gi0.has_edge(o0, o1) and
+                     (i0[0] not in dirty) and (i1[0] not in dirty))
+            if reuse:
+                lsucc = [tonode(i2, dcy) for i2 in self.Gi[i1]]
+                reuse = ((lsucc == list(Gi0[o1])) and
+                         not any(i2[0] in dirty for i2 in self.Gi[i1]))
+            if reuse:
+                output = {tonode(k, dcyo): v
+                          for k, v in Gi0.edges[o0, o1]['output'].items()}
+            else:
+                iout, pout = _outputGi_edge(darr, ke)
+                output = {lno[u]: p for u, p in zip(iout, pout)}
+                nGi = nGi + 1
+            self.Gi.add_edge(i0, i1, output=output)
+
+        dstat = {'dirty': len(dirty), 'Gv': nGv, 'Gi': nGi}
+        if verbose:
+            print('rebuild : ', dstat)
+        return dstat
+
+    def checkrebuild(self, difftol=0.15):
+        """ compare the current graphs with a full rebuild
+
+        Parameters
+        ----------
+
+        difftol : float
+            diffraction tolerance
+
+        Returns
+        -------
+
+        bok : boolean
+            True if Gt, Gv and Gi are identical
+        ddiff : dict
+            'Gt' : cycles (as frozenset of vnodes) which differ
+            'Gv' : visibility edges which differ
+            'Gi' : Gi edges whose output differ
+
+        Notes
+        -----
+
+        The full rebuild is done on a copy of the Layout.
+
+        Examples
+        --------
+
+        >>> from pylayers.gis.layout import *
+        >>> L = Layout('defstr.lay')
+        >>> L.build()
+        >>> ns = L.add_segment(-1,-8,name='PARTITION',verbose=False)
+        >>> dstat = L.rebuild()
+        >>> bok, dd = L.checkrebuild()
+        >>> bok
+        True
+
+        See Also
+        --------
+
+        rebuild
+
+        """
+        L = copy.deepcopy(self)
+        L.buildGt(difftol=difftol)
+        L.buildGv()
+        L.buildGi()
+        L.outputGi()
+
+        def cycles(G):
+            return set([(frozenset(G.nodes[c]['polyg'].vnodes),
+                         G.nodes[c]['indoor']) for c in G.nodes() if c != 0])
+
+        def edges(G):
+            return set([frozenset(e) for e in G.edges()])
+
+        def outputs(G):
+            return {e: G.edges[e]['output'] for e in G.edges()}
+
+        ddiff = {}
+        ddiff['Gt'] = cycles(self.Gt) ^ cycles(L.Gt)
+        ddiff['Gv'] = edges(self.Gv) ^ edges(L.Gv)
+        o0 = outputs(self.Gi)
+        o1 = outputs(L.Gi)
+        ddiff['Gi'] = [e for e in set(o0) | set(o1) if o0.get(e) != o1.get(e)]
+        bok = all(len(ddiff[k]) == 0 for k in ddiff)
+        return bok, ddiff
+
     def dumpw(self):
         """ write a dump of given Graph
 
@@ -5687,6 +6093,191 @@ class Layout(pro.PyLayers):
         if os.path.isfile(filem):
             setattr(self, 'm', read_gpickle(filem))
 
+    def graphhash(self, graph='tvirw', difftol=0.15):
+        """ content hash of the Layout for a given build
+
+        Parameters
+        ----------
+
+        graph : string
+            graphs to be built (see build)
+        difftol : float
+            diffraction tolerance (see build)
+
+        Returns
+        -------
+
+        key : string
+            sha1 hexdigest
+
+        Notes
+        -----
+
+        The key depends on the points coordinates, the segments
+        (connection, slab name, z, offset, transition, iso), the slabs and
+        materials in use, the Layout type, the build parameters and the
+        cache format version. It does not depend on the file name.
+
+        It has to be evaluated before the build, as buildGt adds air walls
+        in Gs.
+
+        See Also
+        --------
+
+        build
+        dumpc
+        loadc
+
+        """
+        h = hashlib.sha1()
+
+        def upd(x):
+            h.update(repr(x).encode('utf-8'))
+
+        upd((lca.CACHE_VERSION, str(graph), float(difftol), self.typ))
+        lnames = set()
+        for n in sorted(self.Gs.nodes()):
+            if n < 0:
+                upd((int(n), tuple(float(x) for x in self.Gs.pos[n])))
+            elif n > 0:
+                d = self.Gs.nodes[n]
+                lnames.add(d['name'])
+                upd((int(n),
+                     tuple(int(x) for x in d.get('connect', list(self.Gs[n]))),
+                     d['name'],
+                     tuple(float(x) for x in d.get('z', ())),
+                     float(d.get('offset', 0)),
+                     bool(d.get('transition', False)),
+                     tuple(sorted(int(x) for x in d.get('iso', [])))))
+        for name in sorted(lnames):
+            if name in self.sl:
+                slab = self.sl[name]
+                upd((name, list(slab['lmatname']),
+                     [float(x) for x in slab['lthick']]))
+                for matname in slab['lmatname']:
+                    if matname in self.sl.mat:
+                        mat = self.sl.mat[matname]
+                        upd((matname, sorted((k, str(mat[k])) for k in mat)))
+        return h.hexdigest()
+
+    def _cachepath(self, key):
+        """ directory of the graph cache entry key
+        """
+        return os.path.join(pro.basename, pro.pstruc['DIRGCACHE'], key)
+
+    def dumpc(self, key):
+        """ write the built graphs in the content addressed cache
+
+        Parameters
+        ----------
+
+        key : string
+            cache key returned by graphhash
+
+        Notes
+        -----
+
+        Each graph of self.lbltg is stored in a compressed npz file made
+        of plain arrays (see pylayers.gis.laycache). ddiff, lnss and dca
+        are stored in a json file. The entry is written in a temporary
+        directory which is renamed at the end, so that concurrent
+        processes never see a partial entry.
+
+        See Also
+        --------
+
+        graphhash
+        loadc
+
+        """
+        path = self._cachepath(key)
+        if os.path.isdir(path):
+            return
+        tmppath = path + '.' + str(os.getpid())
+        if not os.path.isdir(tmppath):
+            os.makedirs(tmppath)
+        lg = []
+        for g in self.lbltg:
+            if g not in lg:
+                lca.savegraph(os.path.join(tmppath, 'G' + g + '.npz'),
+                              getattr(self, 'G' + g))
+                lg.append(g)
+        extra = {'graphs': ''.join(lg)}
+        if hasattr(self, 'ddiff'):
+            extra['ddiff'] = self.ddiff
+        if hasattr(self, 'lnss'):
+            extra['lnss'] = self.lnss
+        if hasattr(self, 'dca'):
+            extra['dca'] = self.dca
+        lca.savejson(os.path.join(tmppath, 'extra.json'), extra)
+        try:
+            os.rename(tmppath, path)
+        except OSError:
+            # entry written meanwhile by another process
+            shutil.rmtree(tmppath, ignore_errors=True)
+
+    def loadc(self, key):
+        """ restore the built graphs from the content addressed cache
+
+        Parameters
+        ----------
+
+        key : string
+            cache key returned by graphhash
+
+        Returns
+        -------
+
+        boolean : True if the cache entry exists and has been restored
+
+        Notes
+        -----
+
+        Gs is loaded immediately (self.g2npy is needed).
+        Other graphs are loaded lazily at their first access.
+
+        See Also
+        --------
+
+        graphhash
+        dumpc
+
+        """
+        path = self._cachepath(key)
+        fileextra = os.path.join(path, 'extra.json')
+        if not os.path.isfile(fileextra):
+            return False
+        extra = lca.loadjson(fileextra)
+        if extra is None:
+            return False
+        Gs = lca.loadgraph(os.path.join(path, 'Gs.npz'))
+        if Gs is None:
+            return False
+
+        self.Gs = Gs
+        lseg = [x for x in self.Gs.nodes if x > 0]
+        for name in self.name:
+            self.name[name] = [
+                x for x in lseg if self.Gs.nodes[x]['name'] == name]
+        self.g2npy()
+
+        self.ddiff = {int(k): (v[0], v[1])
+                      for k, v in extra.get('ddiff', {}).items()}
+        self.lnss = extra.get('lnss', [])
+        if 'dca' in extra:
+            self.dca = {int(k): v for k, v in extra['dca'].items()}
+
+        self._lazyG = {}
+        self._cgrid = None
+        for g in extra['graphs']:
+            if g != 's':
+                self.__dict__.pop('G' + g, None)
+                self._lazyG['G' + g] = os.path.join(path, 'G' + g + '.npz')
+            self.lbltg.extend(g)
+        self._snap = self._gsnap()
+        self.isbuilt = True
+        return True
+
     def polysh2geu(self, poly):
         """ transform sh.Polygon into geu.Polygon
         """
@@ -6127,6 +6718,9 @@ class Layout(pro.PyLayers):
 
         """
 
+        # the cycle index used in pt2cy is rebuilt on demand
+        self._cgrid = None
+
         # 1. Do a Delaunay triangulation
         #       build a list of triangle polygons : lTP
         #       vnodes refers to the nodes of Gs
@@ -7091,164 +7685,188 @@ class Layout(pro.PyLayers):
             if verbose:
                 Gvpbar.update(100.*cpt)
             if icycle != 0:
-                #if self.indoor or not self.Gt.nodes[icycle]['indoor']:
-                    #print(icycle)
-                #    pass
+                Gv = self._buildGvcycle(icycle)
+                #
+                # Graph Gv composition
                 #
-                #  If indoor or outdoor all visibility are calculated
-                #  If outdoor only visibility between iso = 'AIR' and '_AIR' are calculated 
-                # 
-                #if self.indoor or not self.Gt.nodes[icycle]['indoor']:
-                polyg = self.Gt.nodes[icycle]['polyg']
 
-                # plt.show(polyg.plot(fig=plt.gcf(),ax=plt.gca())
+                self.Gv = nx.compose(self.Gv, Gv)
+                self.dGv[icycle] = Gv
+
+    def _buildGvcycle(self, icycle):
+        """ build the visibility graph of a single convex cycle
 
-                # take a single segment between 2 points 
+        Parameters
+        ----------
 
-                vnodes = polyg.vnodes
+        icycle : int
+            cycle number (node of Gt, different from 0)
 
-                # list of index of points in vodes
-                unodes = np.where(vnodes<0)[0]
+        Returns
+        -------
 
-                # list of position of an incomplete list of segments 
-                # used rule : after a point there is always a segment 
-                useg = np.mod(unodes+1,len(vnodes))
+        Gv : nx.Graph
+            visibility graph of the cycle
 
-                # list of points 
-                #npt  = filter(lambda x: x < 0, vnodes)
-                npt = [ x for x in vnodes if x <0 ]
+        See Also
+        --------
 
-                nseg_full = [x for x in vnodes if x > 0]
-                # nseg : incomplete list of segments
-                #
-                # if mode outdoor and cycle is indoor only 
-                # the part above the building (AIR and _AIR) is considered
-                if ((self.typ=='outdoor') and (self.Gt.nodes[icycle]['indoor'])):
-                    nseg = [ x for x in nseg_full if ((self.Gs.nodes[x]['name']=='AIR') or (self.Gs.nodes[x]['name']=='_AIR') ) ]
-                else:
-                    nseg = vnodes[useg]
+        buildGv
 
+        """
+        #if self.indoor or not self.Gt.nodes[icycle]['indoor']:
+            #print(icycle)
+        #    pass
+        #
+        #  If indoor or outdoor all visibility are calculated
+        #  If outdoor only visibility between iso = 'AIR' and '_AIR' are calculated 
+        # 
+        #if self.indoor or not self.Gt.nodes[icycle]['indoor']:
+        polyg = self.Gt.nodes[icycle]['polyg']
 
-                # # nseg_full : full list of segments
-                # #nseg_full = filter(lambda x: x > 0, vnodes)
+        # plt.show(polyg.plot(fig=plt.gcf(),ax=plt.gca())
 
-                # # keep only airwalls without iso single (_AIR)
-                # nseg_single = filter(lambda x: len(self.Gs.nodes[x]['iso'])==0, nseg)
+        # take a single segment between 2 points 
 
-                # lair1 = self.name['AIR'] 
-                # lair2 = self.name['_AIR']
-                # lair  = lair1 + lair2
+        vnodes = polyg.vnodes
 
-                # # list of airwalls in nseg_single
+        # list of index of points in vodes
+        unodes = np.where(vnodes<0)[0]
 
-                # airwalls = filter(lambda x: x in lair, nseg_single)
+        # list of position of an incomplete list of segments 
+        # used rule : after a point there is always a segment 
+        useg = np.mod(unodes+1,len(vnodes))
 
-                # diffraction points 
+        # list of points 
+        #npt  = filter(lambda x: x < 0, vnodes)
+        npt = [ x for x in vnodes if x <0 ]
 
-                ndiff = [x for x in npt if x in self.ddiff.keys()]
-                #
-                # Create a graph
-                #
+        nseg_full = [x for x in vnodes if x > 0]
+        # nseg : incomplete list of segments
+        #
+        # if mode outdoor and cycle is indoor only 
+        # the part above the building (AIR and _AIR) is considered
+        if ((self.typ=='outdoor') and (self.Gt.nodes[icycle]['indoor'])):
+            nseg = [ x for x in nseg_full if ((self.Gs.nodes[x]['name']=='AIR') or (self.Gs.nodes[x]['name']=='_AIR') ) ]
+        else:
+            nseg = vnodes[useg]
 
-                Gv = nx.Graph(name='Gv')
-                #
-                # in convex case :
-                #
-                #    i)  every non aligned segments see each other
-                #
-                for nk in combinations(nseg, 2):
-                    nk0 = self.tgs[nk[0]]
-                    nk1 = self.tgs[nk[1]]
-                    tahe0 = self.tahe[:, nk0]
-                    tahe1 = self.tahe[:, nk1]
-
-                    pta0 = self.pt[:, tahe0[0]]
-                    phe0 = self.pt[:, tahe0[1]]
-                    pta1 = self.pt[:, tahe1[0]]
-                    phe1 = self.pt[:, tahe1[1]]
-
-                    aligned = geu.is_aligned4(pta0,phe0,pta1,phe1)
-                    # A0 = np.vstack((pta0, phe0, pta1))
-                    # A0 = np.hstack((A0, np.ones((3, 1))))
-
-                    # A1 = np.vstack((pta0, phe0, phe1))
-                    # A1 = np.hstack((A1, np.ones((3, 1))))
-
-                    # d0 = np.linalg.det(A0)
-                    # d1 = np.linalg.det(A1)
-
-                    #if not ((abs(d0) < 1e-1) & (abs(d1) < 1e-1)):
-                    if not aligned:
-                        if ((0 not in self.Gs.nodes[nk[0]]['ncycles']) and
-                            (0 not in self.Gs.nodes[nk[1]]['ncycles'])):
-                            # get the iso segments of both nk[0] and nk[1]
-                            if ((self.typ=='indoor') or (not self.Gt.nodes[icycle]['indoor'])):
-                                l0 = [nk[0]]+self.Gs.nodes[nk[0]]['iso']
-                                l1 = [nk[1]]+self.Gs.nodes[nk[1]]['iso']
-                            else:
-                                l0 = [nk[0]]
-                                l1 = [nk[1]]
 
-                            for vlink in product(l0,l1):
-                                #printicycle,vlink[0],vlink[1]
-                                Gv.add_edge(vlink[0], vlink[1])
+        # # nseg_full : full list of segments
+        # #nseg_full = filter(lambda x: x > 0, vnodes)
 
+        # # keep only airwalls without iso single (_AIR)
+        # nseg_single = filter(lambda x: len(self.Gs.nodes[x]['iso'])==0, nseg)
+
+        # lair1 = self.name['AIR'] 
+        # lair2 = self.name['_AIR']
+        # lair  = lair1 + lair2
+
+        # # list of airwalls in nseg_single
+
+        # airwalls = filter(lambda x: x in lair, nseg_single)
+
+        # diffraction points 
+
+        ndiff = [x for x in npt if x in self.ddiff.keys()]
+        #
+        # Create a graph
+        #
+
+        Gv = nx.Graph(name='Gv')
+        #
+        # in convex case :
+        #
+        #    i)  every non aligned segments see each other
+        #
+        for nk in combinations(nseg, 2):
+            nk0 = self.tgs[nk[0]]
+            nk1 = self.tgs[nk[1]]
+            tahe0 = self.tahe[:, nk0]
+            tahe1 = self.tahe[:, nk1]
+
+            pta0 = self.pt[:, tahe0[0]]
+            phe0 = self.pt[:, tahe0[1]]
+            pta1 = self.pt[:, tahe1[0]]
+            phe1 = self.pt[:, tahe1[1]]
+
+            aligned = geu.is_aligned4(pta0,phe0,pta1,phe1)
+            # A0 = np.vstack((pta0, phe0, pta1))
+            # A0 = np.hstack((A0, np.ones((3, 1))))
+
+            # A1 = np.vstack((pta0, phe0, phe1))
+            # A1 = np.hstack((A1, np.ones((3, 1))))
+
+            # d0 = np.linalg.det(A0)
+            # d1 = np.linalg.det(A1)
+
+            #if not ((abs(d0) < 1e-1) & (abs(d1) < 1e-1)):
+            if not aligned:
+                if ((0 not in self.Gs.nodes[nk[0]]['ncycles']) and
+                    (0 not in self.Gs.nodes[nk[1]]['ncycles'])):
+                    # get the iso segments of both nk[0] and nk[1]
+                    if ((self.typ=='indoor') or (not self.Gt.nodes[icycle]['indoor'])):
+                        l0 = [nk[0]]+self.Gs.nodes[nk[0]]['iso']
+                        l1 = [nk[1]]+self.Gs.nodes[nk[1]]['iso']
+                    else:
+                        l0 = [nk[0]]
+                        l1 = [nk[1]]
+
+                    for vlink in product(l0,l1):
+                        #printicycle,vlink[0],vlink[1]
+                        Gv.add_edge(vlink[0], vlink[1])
+
+        #
+        # Handle diffraction points
+        #
+        #    ii) all non adjascent valid diffraction points see each other
+        #    iii) all valid diffraction points see segments non aligned
+        #    with adjascent segments
+        #
+        #if diffraction:
+        #
+        # diffraction only if indoor or outdoor cycle if outdoor
+        # 
+        if ((self.typ=='indoor') or (not self.Gt.nodes[icycle]['indoor'])):
+            ndiffvalid = [ x for x in ndiff if icycle in self.ddiff[x][0]]
+
+                # non adjascent segment of vnodes see valid diffraction
+                # points
+            for idiff in ndiffvalid:
                 #
-                # Handle diffraction points
+                # segments voisins du point de diffraction valide
                 #
-                #    ii) all non adjascent valid diffraction points see each other
-                #    iii) all valid diffraction points see segments non aligned
-                #    with adjascent segments
+                # v1.1 nsneigh = [x for x in 
+                #           nx.neighbors(self.Gs, idiff) 
+                #           if x in nseg_full]
+                nsneigh = [x for x in self.Gs[idiff] if x in nseg_full]
+                # segvalid : not adjascent segment
+                seen_from_neighbors = []
+
                 #
-                #if diffraction:
+                # point to point
                 #
-                # diffraction only if indoor or outdoor cycle if outdoor
-                # 
-                if ((self.typ=='indoor') or (not self.Gt.nodes[icycle]['indoor'])):
-                    ndiffvalid = [ x for x in ndiff if icycle in self.ddiff[x][0]]
-
-                        # non adjascent segment of vnodes see valid diffraction
-                        # points
-                    for idiff in ndiffvalid:
-                        #
-                        # segments voisins du point de diffraction valide
-                        #
-                        # v1.1 nsneigh = [x for x in 
-                        #           nx.neighbors(self.Gs, idiff) 
-                        #           if x in nseg_full]
-                        nsneigh = [x for x in self.Gs[idiff] if x in nseg_full]
-                        # segvalid : not adjascent segment
-                        seen_from_neighbors = []
-
-                        #
-                        # point to point
-                        #
-                        for npoint in ndiffvalid:
-                            if npoint != idiff:
-                                Gv.add_edge(idiff, npoint)
-
-                        #
-                        # All the neighbors segment in visibility which are not connected to cycle 0
-                        # and which are not neighbors of the point idiff
-                        #
-                        for x in nsneigh:
-                            # v1.1 neighbx = [ y for y in nx.neighbors(Gv, x) 
-                            #            if 0 not in self.Gs.nodes[y]['ncycles'] 
-                            #            and y not in nsneigh]
-                            neighbx = [ y for y in Gv[x] 
-                                        if 0 not in self.Gs.nodes[y]['ncycles'] 
-                                        and y not in nsneigh]
-                            seen_from_neighbors += neighbx
-
-                        for ns in seen_from_neighbors:
-                            Gv.add_edge(idiff, ns)
+                for npoint in ndiffvalid:
+                    if npoint != idiff:
+                        Gv.add_edge(idiff, npoint)
 
                 #
-                # Graph Gv composition
+                # All the neighbors segment in visibility which are not connected to cycle 0
+                # and which are not neighbors of the point idiff
                 #
+                for x in nsneigh:
+                    # v1.1 neighbx = [ y for y in nx.neighbors(Gv, x) 
+                    #            if 0 not in self.Gs.nodes[y]['ncycles'] 
+                    #            and y not in nsneigh]
+                    neighbx = [ y for y in Gv[x] 
+                                if 0 not in self.Gs.nodes[y]['ncycles'] 
+                                and y not in nsneigh]
+                    seen_from_neighbors += neighbx
 
-                self.Gv = nx.compose(self.Gv, Gv)
-                self.dGv[icycle] = Gv
+                for ns in seen_from_neighbors:
+                    Gv.add_edge(idiff, ns)
+
+        return Gv
 
     def buildGi(self,verbose=False,tqdmpos=0):
         """ build graph of interactions
@@ -7618,6 +8236,7 @@ class Layout(pro.PyLayers):
 
             # list of authorized outputs. Initialized void
             output = []
+            dintprob = {}
 
             # nstr1 : segment number of central interaction
             if nstr1 > 0:
@@ -8047,279 +8666,126 @@ class Layout(pro.PyLayers):
                 pass
 
 
-    def outputGi_mp(self):
-        """ filter output of Gi edges
+    def _Gi_arrays(self):
+        """ pack the geometry required by the Gi output filtering in arrays
 
-        Parameters
-        ----------
+        Returns
+        -------
 
-        L : Layout
+        darr : dict of np.array
+            'pt'      : (2,Np) point coordinates
+            'ipt'     : point column in pt, indexed by -(point node)
+            'upnt'    : (Np,) point node of each pt column
+            'tahe'    : (2,Ns) tail/head column in pt of each segment
+            'tgs'     : segment index in tahe, indexed by segment node
+            'gino'    : (Ni,3) Gi nodes, right padded with 0
+            'gilen'   : (Ni,) length of Gi nodes tuples
+            'indptr'  : (Ni+1,) CSR row pointers of Gi successors
+            'indices' : Gi successors (index in gino)
+            'edges'   : (Ne,2) Gi edges (index in gino)
+        lno : list
+            Gi nodes in gino order
 
         Notes
         -----
 
-        Let assume a sequence (nstr0,nstr1,{nstr2A,nstr2B,...}) in a signature.
-        This function checks whether this sequence is feasible or not
-        , whatever the type of nstr0 and nstr1.
-        The feasible outputs from nstr0 to nstr1 are stored in an output field of
-        edge (nstr0,nstr1)
+        Successors and edges keep the Gi iteration order so that the
+        filtered outputs are identical to the ones of outputGi.
 
-        See Also
-        --------
+        """
+        lno = list(self.Gi.nodes())
+        dno = {n: k for k, n in enumerate(lno)}
+        Ni = len(lno)
 
-        pylayers.util.cone.Cone.from2seg
-        pylayers.util.cone.Cone.belong_seg
+        gino = np.zeros((Ni, 3), dtype=int)
+        gilen = np.zeros(Ni, dtype=int)
+        for k, n in enumerate(lno):
+            gino[k, :len(n)] = n
+            gilen[k] = len(n)
 
+        lsucc = [[dno[m] for m in self.Gi[n]] for n in lno]
+        indptr = np.hstack((0, np.cumsum([len(x) for x in lsucc]))).astype(int)
+        indices = np.array([m for x in lsucc for m in x], dtype=int)
+        edges = np.array([(dno[e[0]], dno[e[1]]) for e in self.Gi.edges()],
+                         dtype=int).reshape(-1, 2)
 
-        """
+        ipt = -np.ones(-min(self.upnt) + 1, dtype=int)
+        ipt[-self.upnt] = np.arange(len(self.upnt))
 
+        darr = {'pt': self.pt,
+                'ipt': ipt,
+                'upnt': self.upnt,
+                'tahe': self.tahe,
+                'tgs': self.tgs,
+                'gino': gino,
+                'gilen': gilen,
+                'indptr': indptr,
+                'indices': indices,
+                'edges': edges}
 
-        # assert('Gi' in self.__dict__)
+        return darr, lno
 
-        # oGipbar=pbar(verbose,total=100.,leave=False,desc='OutputGi',position=tqdmpos)
-        # # loop over all edges of Gi
-        # Nedges = len(self.Gi.edges())
-        # cpt = 100./Nedges
-        # print "Gi Nedges :",Nedges
-        e = self.Gi.edges()
-        #Gi_no = [self.Gi_no]*len(e)
-
-        # densify sparse matrix
-        #aGi_A = self.Gi_A.toarray()
-        #ap2pc = self.p2pc.toarray()
-        #asgsg = self.sgsg.toarray()
-        #as2pc = self.s2pc.toarray()
-        #as2pu = self.s2pu.toarray()
-
-        global Gi_A
-        global Gi_no
-        global p2pc
-        global sgsg
-        global s2pc
-        global s2pu
-
-        Gi_A = self.Gi_A
-        Gi_no = self.Gi_no
-        p2pc = self.p2pc
-        sgsg = self.sgsg
-        s2pc = self.s2pc
-        s2pu = self.s2pu
-
-
-        #Gi_A = [aGi_A]*len(e)
-        #p2pc = [ap2pc]*len(e)
-        #s2pc = [as2pc]*len(e)
-        #s2pu = [as2pu]*len(e)
-        #sgsg = [asgsg]*len(e)
-
-        pool = Pool(cpu_count())
-
-        # multiprocessing style
-        #Z=zip(e, Gi_no, Gi_A, p2pc, sgsg, s2pc, s2pu)
-        #res = pool.map(outputGi_func,Z)
-        Z = zip(e)
-        res = pool.map(outputGi_func,Z)
-        self.Gi.add_edges_from(res)
-
-
-
-
-        # res = pool.map(outputGi_func_test,e)
-        # print('e')
-        # time.sleep(1)
-        # res = pool.map(outputGi_func_test,Gi_no)
-        # print('no')
-        # time.sleep(1)
-        # res = pool.map(outputGi_func_test,Gi_A)
-        # print('A')
-        # time.sleep(1)
-        # res = pool.map(outputGi_func_test,Gspos)
-        # print('pos')
-        # time.sleep(1)
-        # res = pool.map(outputGi_func_test,sgsg)
-        # print('sgsg')
-        # time.sleep(1)
-        # res = pool.map(outputGi_func_test,s2pc)
-        # print('s2pc')
-        # time.sleep(1)
-        # res = pool.map(outputGi_func_test,s2pu)
-        # print('s2pu')
-        # time.sleep(1)
-        # res = pool.map(outputGi_func_test,Z)
-        # print('Z')
-        
+    def outputGi_mp(self, workers=-1, chunksize=2000, verbose=False, tqdmpos=0.):
+        """ filter output of Gi edges with a pool of processes
 
+        Parameters
+        ----------
 
+        workers : int
+            number of processes (-1 : one per cpu)
+        chunksize : int
+            number of Gi edges per task
+        verbose : boolean
+        tqdmpos : int
+            position of the progress bar
 
-    #def outputGi_func(arg):
-           
-        # if (k%100)==0:
-        # print"edge :  ",k
-        # extract  both termination interactions nodes
-
-        #for k in arg:
-        #    Z=arg*arg
-        # e=arg[0]
-        # s2pc=arg[1]
-        # Gs=arg[2]
-        # Gi=arg[3]
-
-        # i0 = e[0]
-        # i1 = e[1]
-        # nstr0 = i0[0]
-        # nstr1 = i1[0]
-        # print(i0,i1)
-
-        # for k in range(1000):
-        #     y=k*k
-        # # list of authorized outputs. Initialized void
-        # output = []
-        # # nstr1 : segment number of central interaction
-        # if nstr1 > 0:
-        #     # central interaction is a segment
-        #     pseg1 = np.array(s2pc[nstr1,:].todense()).reshape(2, 2).T
-        #     # create a Cone object
-        #     cn = cone.Cone()
-        #     # if starting from segment
-        #     if nstr0 > 0:
-        #         pseg0 = np.array(s2pc[nstr0,:].todense()).reshape(2, 2).T
-        #         # if nstr0 and nstr1 are connected segments
-        #         if (len(np.intersect1d(nx.neighbors(Gs, nstr0), nx.neighbors(Gs, nstr1))) == 0):
-        #             # from 2 not connected segment
-        #             cn.from2segs(pseg0, pseg1)
-        #         else:
-        #             # from 2 connected segments
-        #             cn.from2csegs(pseg0, pseg1)
-        #     # if starting from a point
-        #     else:
-        #         pt = np.array(Gs.pos[nstr0])
-        #         cn.fromptseg(pt, pseg1)
-
-        #     # list all potential successors of interaction i1
-        #     i2 = nx.neighbors(Gi, i1)
-        #     ipoints = [x for x in i2 if len(x)==1 ]
-        #     #ipoints = [ x for x in rle if  len(x) == 1, i2)
-        #     pipoints = np.array([Gs.pos[ip[0]] for ip in ipoints]).T
-        #     # filter tuple (R | T)
-        #     #istup = filter(lambda x : type(eval(x))==tuple,i2)
-        #     # map first argument segment number
-        #     #isegments = np.unique(map(lambda x : eval(x)[0],istup))
-        #     isegments = np.unique(
-        #         filter(lambda y: y > 0, map(lambda x: x[0], i2)))
-        #     # if nstr0 and nstr1 are adjescent segment remove nstr0 from
-        #     # potential next interaction
-        #     # Fix 01/2017
-        #     # This is not always True if the angle between 
-        #     # the two adjascent segments is < pi/2
-        #     nb_nstr0 = Gs.neighbors(nstr0)
-        #     nb_nstr1 = Gs.neighbors(nstr1)
-        #     common_point = np.intersect1d(nb_nstr0,nb_nstr1)
-        #     if len(common_point) == 1:
-        #         num0 = [x for x in nb_nstr0 if x != common_point]
-        #         num1 = [x for x in nb_nstr1 if x != common_point]
-        #         p0 = np.array(Gs.pos[num0[0]])
-        #         p1 = np.array(Gs.pos[num1[0]])
-        #         pc = np.array(Gs.pos[common_point[0]])
-        #         v0 = p0-pc 
-        #         v1 = p1-pc 
-        #         v0n = v0/np.sqrt(np.sum(v0*v0))
-        #         v1n = v1/np.sqrt(np.sum(v1*v1))
-        #         if np.dot(v0n,v1n)<=0:
-        #             isegments = np.array([ x for x in isegments if x != nstr0 ]) 
-        #         #    [ x for x in rle if  x != nstr0, isegments))
-        #     # there are one or more segments
-        #     if len(isegments) > 0:
-        #         points = np.array(s2pc[isegments,:].todense()).T
-        #         pta = points[0:2, :]
-        #         phe = points[2:, :]
-        #         # add difraction points
-        #         # WARNING Diffraction points are added only if a segment is seen
-        #         # it should be the case in 99% of cases
-
-        #         if len(ipoints) > 0:
-        #             isegments = np.hstack(
-        #                 (isegments, np.array(ipoints)[:, 0]))
-        #             pta = np.hstack((pta, pipoints))
-        #             phe = np.hstack((phe, pipoints))
-
-        #         # cn.show()
-
-        #         # if i0 == (38,79) and i1 == (135,79,23):
-        #         #     printi0,i1
-        #         #     import ipdb
-        #         #     ipdb.set_trace()
-        #         # i1 : interaction T
-        #         if len(i1) == 3:
-        #             typ, prob = cn.belong_seg(pta, phe)
-        #             # if bs.any():
-        #             #    plu.displot(pta[:,bs],phe[:,bs],color='g')
-        #             # if ~bs.any():
-        #             #    plu.displot(pta[:,~bs],phe[:,~bs],color='k')
-
-        #         # i1 : interaction R --> mirror
-        #         if len(i1) == 2:
-        #             Mpta = geu.mirror(pta, pseg1[:, 0], pseg1[:, 1])
-        #             Mphe = geu.mirror(phe, pseg1[:, 0], pseg1[:, 1])
-        #             typ, prob = cn.belong_seg(Mpta, Mphe)
-        #             # printi0,i1
-        #             # if ((i0 == (6, 0)) & (i1 == (7, 0))):
-        #             #    pdb.set_trace()
-        #             # if bs.any():
-        #             #    plu.displot(pta[:,bs],phe[:,bs],color='g')
-        #             # if ~bs.any():
-        #             #    plu.displot(pta[:,~bs],phe[:,~bs],color='m')
-        #             #    plt.show()
-        #             #    pdb.set_trace())
-        #         ########
-        #         # SOMETIMES PROBA IS 0 WHEREAS SEG IS SEEN
-        #         ###########
-        #         # # keep segment with prob above a threshold
-        #         # isegkeep = isegments[prob>0]
-        #         # # dict   {numint : proba}
-        #         # dsegprob = {k:v for k,v in zip(isegkeep,prob[prob>0])}
-        #         # 4 lines are replaced by
-        #         # keep segment with prob above a threshold
-        #         utypseg = typ != 0
-        #         isegkeep = isegments[utypseg]
-        #         # dict   {numint : proba}
-        #         dsegprob = {k: v for k, v in zip(isegkeep, prob[utypseg])}
-        #         #########
-        #         # output = [ x for x in rle if  x[0] in isegkeep, i2)
-        #         output = [x for x in i2 if x[0] in isegkeep]
-        #         # probint = map(lambda x: dsegprob[x[0]], output)
-        #         probint = [dsegprob[x[0]] for x in output]
-        #         # dict interaction : proba
-        #         dintprob = {k: v for k, v in zip(output, probint)}
-
-        #         # keep all segment above nstr1 and in Cone if T
-        #         # keep all segment below nstr1 and in Cone if R
+        Notes
+        -----
 
-        # else:
-        #     # central interaction is a point
-
-        #     # 1) Simple approach
-        #     #       output interaction are all visible interactions
-        #     # 2) TO BE DONE
-        #     #
-        #     #       output of the diffraction points
-        #     #       exploring
-        #     # b
-        #     #          + right of ISB
-        #     #          + right of RSB
-        #     #
-        #     #  + using the wedge cone
-        #     #  + using the incident cone
-        #     #
-
-        #     output = nx.neighbors(Gi, (nstr1,))
-        #     nout = len(output)
-        #     probint = np.ones(nout)  # temporarybns
-        #     dintprob = {k: v for k, v in zip(output, probint)}
-
-        # return(i0,i1,dintprob)
-        #self.Gi.add_edge(i0, i1, output=dintprob)
+        This is the parallel counterpart of outputGi.
 
-        
+        The Layout geometry and the Gi adjacency are packed in arrays
+        (see _Gi_arrays) which are copied once in shared memory.
+        The Gi edges are split in contiguous chunks of chunksize edges
+        which are processed by _outputGi_chunk. Workers only receive
+        the shared memory descriptors and the chunk bounds.
+
+        Chunks are merged in edge order, so the output edge attribute
+        is the same as the one obtained with outputGi.
+
+        See Also
+        --------
+
+        outputGi
+        _outputGi_chunk
+        pylayers.util.mputil.SharedArrays
+
+        """
+        assert('Gi' in self.__dict__)
+
+        darr, lno = self._Gi_arrays()
+        edges = darr['edges']
+        lslices = mpu.chunkslices(len(edges), chunksize)
+        nproc = min(mpu.nworkers(workers), max(len(lslices), 1))
+
+        oGipbar = pbar(verbose, total=len(edges), leave=False,
+                       desc='OutputGi', position=tqdmpos)
+
+        with mpu.SharedArrays(darr) as sa:
+            func = partial(_outputGi_chunk, sa.desc)
+            pool = Pool(nproc)
+            try:
+                for (k0, k1), res in zip(lslices, pool.imap(func, lslices)):
+                    for ke, (iout, pout) in zip(range(k0, k1), res):
+                        i0 = lno[edges[ke, 0]]
+                        i1 = lno[edges[ke, 1]]
+                        dintprob = {lno[u]: p for u, p in zip(iout, pout)}
+                        self.Gi.add_edge(i0, i1, output=dintprob)
+                    if verbose:
+                        oGipbar.update(k1 - k0)
+            finally:
+                pool.close()
+                pool.join()
 
     def intercy(self, ncy, typ='source'):
         """ return the list of interactions seen from a cycle
@@ -9267,17 +9733,46 @@ class Layout(pro.PyLayers):
         """
 
         ptsh = sh.Point(pt[0], pt[1])
-        cycle_exists = False
-
-        for ncy in list(dict(self.Gt.nodes).keys()):
-            if ncy > 0:
-                criter1 = self.Gt.nodes[ncy]['polyg'].touches(ptsh)
-                criter2 = self.Gt.nodes[ncy]['polyg'].contains(ptsh)
-                if (criter1 or criter2):
-                    cycle_exists = True
-                    return(ncy)
-        if not cycle_exists:
-            raise NameError(str(pt) + " is not in any cycle")
+
+        lcy, cgrid = self._cyindex()
+        # candidate cycles are visited in Gt order
+        for k in cgrid.query_point(pt[0], pt[1]):
+            ncy = lcy[k]
+            criter1 = self.Gt.nodes[ncy]['polyg'].touches(ptsh)
+            criter2 = self.Gt.nodes[ncy]['polyg'].contains(ptsh)
+            if (criter1 or criter2):
+                return(ncy)
+        raise NameError(str(pt) + " is not in any cycle")
+
+    def _cyindex(self):
+        """ grid index of the bounding boxes of the cycles of Gt
+
+        Returns
+        -------
+
+        lcy : np.array
+            cycle numbers (>0) in Gt order
+        cgrid : GridIndex
+
+        Notes
+        -----
+
+        The index is built on first use and rebuilt when Gt is replaced
+        or its number of nodes has changed.
+
+        """
+        key = (id(self.Gt), self.Gt.number_of_nodes())
+        cyi = getattr(self, '_cgrid', None)
+        if (cyi is None) or (cyi[0] != key):
+            lcy = np.array([ncy for ncy in self.Gt.nodes() if ncy > 0],
+                           dtype=int)
+            bounds = np.array([self.Gt.nodes[ncy]['polyg'].bounds
+                               for ncy in lcy], dtype=float).reshape(-1, 4)
+            cgrid = gix.GridIndex(bounds[:, 0], bounds[:, 2],
+                                  bounds[:, 1], bounds[:, 3])
+            cyi = (key, lcy, cgrid)
+            self._cgrid = cyi
+        return cyi[1], cyi[2]
 
     def cy2pt(self, cy=0, h=1.2):
         """returns a point into a given cycle
@@ -9868,6 +10363,16 @@ class Layout(pro.PyLayers):
 
         pt : point number if point exists 0 otherwise
 
+        Notes
+        -----
+
+        The candidates are pruned with the grid index of the nodes of Gs
+        built in g2npy. The index is rebuilt when it has been invalidated
+        (self._pgrid set to None by the functions which move nodes) or
+        when the number of nodes has changed. If no indexed candidate is
+        within tol, all the nodes are scanned, a node moved without
+        invalidating the index is then still found.
+
         See Also
         --------
 
@@ -9875,10 +10380,31 @@ class Layout(pro.PyLayers):
 
         """
         # print"ispoint : pt ", pt
-        pts = np.array(list(self.Gs.pos.values())).T
-        ke = np.array(list(self.Gs.pos.keys()))
-        diff = pts - pt.reshape(2, 1)
-        v = np.sqrt(np.sum(diff * diff, axis=0))
+        pt = np.asarray(pt, dtype=float)
+        if len(self.Gs.pos) == 0:
+            return(0)
+        ke = None
+        if hasattr(self, '_pgrid'):
+            if (self._pgrid is None) or (len(self._pkey) != len(self.Gs.pos)):
+                self._pindex()
+            # candidates from the index of the nodes
+            ke = self._pkey[self._pgrid.query_point(pt.ravel()[0], pt.ravel()[1], tol)]
+            if not all([k in self.Gs.pos for k in ke]):
+                ke = None
+        if ke is not None:
+            v = np.array([np.inf])
+            if len(ke) > 0:
+                pts = np.array([self.Gs.pos[k] for k in ke], dtype=float).T
+                diff = pts - pt.reshape(2, 1)
+                v = np.sqrt(np.sum(diff * diff, axis=0))
+            if (v > tol).all():
+                # stale index : scan all the nodes
+                ke = None
+        if ke is None:
+            ke = np.array(list(self.Gs.pos.keys()))
+            pts = np.array([self.Gs.pos[k] for k in ke], dtype=float).T
+            diff = pts - pt.reshape(2, 1)
+            v = np.sqrt(np.sum(diff * diff, axis=0))
         nz = (v > tol)
         b = nz.prod()
         if b == 1:
@@ -9904,37 +10430,43 @@ class Layout(pro.PyLayers):
         pt  np.array(1x2)
         tol = 0.01      tolerance
 
-        """
+        Returns
+        -------
+
+        nbu : np.array
+            segment numbers
 
-        pts = np.array(self.Gs.pos.values()).T   # structure points
-        ke = np.array(list(dict(self.Gs.pos).keys()))        # point keys
-        n = np.shape(pts)[1]
-        nbu = np.array([])
-        if (n > 0):
-            num = np.arange(n)                   #
-            b = self.inbox(pt, tol)
+        """
 
-            ta = self.tahe[0, b]
-            he = self.tahe[1, b]
+        pt = np.asarray(pt, dtype=float).ravel()
+        nbu = np.array([], dtype=int)
+        if self.Ns > 0:
+            # segments whose bounding box contains the point
+            nb = self._sgrid.query_point(pt[0], pt[1], tol)
 
-            nb = num[b]
+            ta = self.tahe[0, nb]
+            he = self.tahe[1, nb]
 
             n = len(nb)
             p = np.outer(pt, np.ones(n))
 
-            # printta
-            v1 = p - pts[:, ta]
-            v2 = pts[:, he] - p
+            v1 = p - self.pt[:, ta]
+            v2 = self.pt[:, he] - p
 
             nv1 = np.sqrt(v1[0, :] * v1[0, :] + v1[1, :] * v1[1, :])
             nv2 = np.sqrt(v2[0, :] * v2[0, :] + v2[1, :] * v2[1, :])
 
+            # a point on a segment extremity belongs to the segment
+            ext = (nv1 < tol) | (nv2 < tol)
+            nv1[nv1 == 0] = 1.
+            nv2[nv2 == 0] = 1.
+
             v1n = v1 / nv1
             v2n = v2 / nv2
 
             ps = v1n[0, :] * v2n[0, :] + v1n[1, :] * v2n[1, :]
-            u = abs(1. - ps) < tol
-            nbu = nb[u]
+            u = (abs(1. - ps) < tol) | ext
+            nbu = self.tsg[nb[u]]
 
         return nbu
 
@@ -11050,66 +11582,95 @@ class Layout(pro.PyLayers):
         return paths
 
 
-def outputGi_func_test(args):
-    for k in range(10000):
-        y = k*k+k*k
-    return y
+def _outputGi_chunk(desc, bounds):
+    """ filter output of a chunk of Gi edges
 
-def outputGi_func(args):
-# def outputGi_func(e, Gi_no, Gi_A, Gspos, sgsg, s2pc, s2pu):
+    Parameters
+    ----------
 
+    desc : dict
+        shared array descriptors of Layout._Gi_arrays
+    bounds : tuple
+        (k0,k1) range of edges to be processed
 
-    # for k in range(10000):
-    #     y = k*k
-    #     # time.sleep(0.01)
-    # return y
+    Returns
+    -------
 
-    def Gspos(n):
-        if n>0:
-            #return np.mean(s2pc[n].reshape(2,2),axis=0)
-            return np.mean(s2pc[n].toarray().reshape(2,2),axis=0)
-        else:
-            return p2pc[-n]
+    lres : list
+        for each edge, a tuple (iout,pout) of the authorized output
+        interactions (index in gino) and their probability
 
-    e = args[0]
-    #Gi_no = args[1]
-    #Gi_A = args[2]
-    #p2pc = args[3]
-    #sgsg = args[4]
-    #s2pc = args[5]
-    #s2pu = args[6]
+    See Also
+    --------
 
-    print(e)
+    Layout.outputGi_mp
 
+    """
+    darr, handles = mpu.attach(desc)
+    try:
+        lres = [_outputGi_edge(darr, ke) for ke in range(bounds[0], bounds[1])]
+    finally:
+        del darr
+        mpu.release(handles)
+    return lres
 
 
-    i0 = e[0]
-    i1 = e[1]
-    nstr0 = i0[0]
-    nstr1 = i1[0]
+def _outputGi_edge(darr, ke):
+    """ filter output of a single Gi edge
 
-    # list of authorized outputs. Initialized void
-    output = []
+    Parameters
+    ----------
+
+    darr : dict
+        arrays of Layout._Gi_arrays
+    ke : int
+        edge index
+
+    Returns
+    -------
+
+    iout : np.array
+        index of authorized output interactions
+    pout : np.array
+        associated probabilities
+
+    Notes
+    -----
+
+    Array transcription of the loop body of Layout.outputGi
+
+    """
+    pt = darr['pt']
+    ipt = darr['ipt']
+    upnt = darr['upnt']
+    tahe = darr['tahe']
+    tgs = darr['tgs']
+    gino = darr['gino']
+    gilen = darr['gilen']
+
+    u0, u1 = darr['edges'][ke]
+    i2 = darr['indices'][darr['indptr'][u1]:darr['indptr'][u1 + 1]]
+    nstr0 = gino[u0, 0]
+    nstr1 = gino[u1, 0]
+
+    def pos(n):
+        return pt[:, ipt[-n]]
+
+    iout = np.array([], dtype=int)
+    pout = np.array([])
 
     # nstr1 : segment number of central interaction
     if nstr1 > 0:
         # central interaction is a segment
-        # pseg1 = self.s2pc[nstr1,:].toarray().reshape(2, 2).T
-        pseg1 = s2pc[nstr1,:].toarray().reshape(2, 2).T
-        # pseg1 = self.s2pc[nstr1,:].data.reshape(2, 2).T
-        # pseg1o = self.seg2pts(nstr1).reshape(2, 2).T
-
-        # create a Cone object
+        pseg1 = pt[:, tahe[:, tgs[nstr1]]]
+        nb_nstr1 = upnt[tahe[:, tgs[nstr1]]]
         cn = cone.Cone()
         # if starting from segment
         if nstr0 > 0:
-            # pseg0 = self.s2pc[nstr0,:].toarray().reshape(2, 2).T
-            pseg0 = s2pc[nstr0,:].toarray().reshape(2, 2).T
-            # pseg0 = self.s2pc[nstr0,:].data.reshape(2, 2).T
-            # pseg0o = self.seg2pts(nstr0).reshape(2, 2).T
-
-            # if nstr0 and nstr1 are connected segments
-            if sgsg[nstr0,nstr1] == 0:
+            pseg0 = pt[:, tahe[:, tgs[nstr0]]]
+            nb_nstr0 = upnt[tahe[:, tgs[nstr0]]]
+            common_point = np.intersect1d(nb_nstr0, nb_nstr1)
+            if len(common_point) == 0:
                 # from 2 not connected segment
                 cn.from2segs(pseg0, pseg1)
             else:
@@ -11117,168 +11678,57 @@ def outputGi_func(args):
                 cn.from2csegs(pseg0, pseg1)
         # if starting from a point
         else:
-            pt = Gspos(nstr0)
-            cn.fromptseg(pt, pseg1)
-
-        # list all potential successors of interaction i1
-        ui2 = Gi_no.index(i1)
-        ui = np.where(Gi_A[ui2,:]!=0)[0]
-        i2 = [Gi_no[u] for u in ui]
-        # i2 = nx.neighbors(self.Gi, i1)
-
-        # how to find neighbors without network
-        # ngi=L.Gi.nodes()
-        # A=nx.adjacency_matrix(L.Gi)
-        # inter = ngi[10]
-        # u = ngi.index(inter)
-        # ui = A[u,:].indices
-        # neigh_inter = np.array([ngi[u] for u in ui])
-
-
-        ipoints = [x for x in i2 if len(x)==1 ]
-        #ipoints = filter(lambda x: len(x) == 1, i2)
-        pipoints = np.array([Gspos(ip[0]) for ip in ipoints]).T
-        # filter tuple (R | T)
-        #istup = filter(lambda x : type(eval(x))==tuple,i2)
-        # map first argument segment number
-        #isegments = np.unique(map(lambda x : eval(x)[0],istup))
-        # isegments = np.unique(
-        #     filter(lambda y: y > 0, map(lambda x: x[0], i2)))
-        isegments = np.unique([x[0] for x in i2 if x[0]>0])
-        
-        # if nstr0 and nstr1 are adjescent segment remove nstr0 from
-        # potential next interaction
-        # Fix 01/2017
-        # This is not always True if the angle between 
-        # the two adjascent segments is < pi/2
-        # nb_nstr0 = self.Gs.neighbors(nstr0)
-        # nb_nstr1 = self.Gs.neighbors(nstr1)
-        # nb_nstr0 = np.array([self.s2pu[nstr0,0],self.s2pu[nstr0,1]])
-        # nb_nstr1 = np.array([self.s2pu[nstr1,0],self.s2pu[nstr1,1]])
-        nb_nstr0 = s2pu[nstr0,:].toarray()[0]
-        nb_nstr1 = s2pu[nstr1,:].toarray()[0]
-        print('nb_nstr0',nb_nstr0)
-        #nb_nstr0 = s2pu[nstr0,:]
-        #nb_nstr1 = s2pu[nstr1,:]
-        # common_point = np.intersect1d(nb_nstr0,nb_nstr1)
-        common_point = np.array([x for x in nb_nstr0 if x in nb_nstr1])
-        # if len(common_point) == 1:
-        if common_point.any():
-            num0 = [x for x in nb_nstr0 if x != common_point]
-            num1 = [x for x in nb_nstr1 if x != common_point]
-            p0 = Gspos(num0[0])
-            p1 = Gspos(num1[0])
-            pc = Gspos(common_point[0])
-            v0 = p0-pc 
-            v1 = p1-pc 
+            common_point = []
+            cn.fromptseg(pos(nstr0), pseg1)
+
+        n2 = gino[i2, 0]
+        # diffraction successors, excluding the starting point
+        ipoints = i2[(gilen[i2] == 1) & (n2 != nstr0)]
+        isegments = np.unique(n2[n2 > 0])
+
+        # if nstr0 and nstr1 are adjascent segments with an angle
+        # larger than pi/2, remove nstr0 from potential next interaction
+        if len(common_point) == 1:
+            p0 = pos(nb_nstr0[nb_nstr0 != common_point[0]][0])
+            p1 = pos(nb_nstr1[nb_nstr1 != common_point[0]][0])
+            pc = pos(common_point[0])
+            v0 = p0 - pc
+            v1 = p1 - pc
             v0n = v0/np.sqrt(np.sum(v0*v0))
             v1n = v1/np.sqrt(np.sum(v1*v1))
-            if np.dot(v0n,v1n)<=0:
-                isegments = np.array([ x for x in isegments if x != nstr0 ]) 
-            #    filter(lambda x: x != nstr0, isegments))
-        # there are one or more segments
-        # if len(isegments) > 0:
-        if isegments.any():
-
-            li1 = len(i1)
-
-            points = self.s2pc[isegments,:].toarray().T
-            #points = s2pc[isegments,:].T
-            # points = self.s2pc[isegments,:].data.reshape(4,len(isegments))
-            # pointso = self.seg2pts(isegments)
-
-            pta = points[0:2, :]
-            phe = points[2:, :]
-            # add difraction points
-            # WARNING Diffraction points are added only if a segment is seen
-            # it should be the case in 99% of cases
+            if np.dot(v0n, v1n) <= 0:
+                isegments = isegments[isegments != nstr0]
 
+        # there are one or more segments
+        if len(isegments) > 0:
+            pta = pt[:, tahe[0, tgs[isegments]]]
+            phe = pt[:, tahe[1, tgs[isegments]]]
+            # add diffraction points
             if len(ipoints) > 0:
-                isegments = np.hstack(
-                    (isegments, np.array(ipoints)[:, 0]))
+                npoints = gino[ipoints, 0]
+                pipoints = pt[:, ipt[-npoints]]
+                isegments = np.hstack((isegments, npoints))
                 pta = np.hstack((pta, pipoints))
                 phe = np.hstack((phe, pipoints))
-
-            # cn.show()
-
-            # if i0 == (38,79) and i1 == (135,79,23):
-            #     printi0,i1
-            #     import ipdb
-            #     ipdb.set_trace()
             # i1 : interaction T
-            if li1 == 3:
+            if gilen[u1] == 3:
                 typ, prob = cn.belong_seg(pta, phe)
-                # if bs.any():
-                #    plu.displot(pta[:,bs],phe[:,bs],color='g')
-                # if ~bs.any():
-                #    plu.displot(pta[:,~bs],phe[:,~bs],color='k')
-
             # i1 : interaction R --> mirror
-            elif li1 == 2:
+            if gilen[u1] == 2:
                 Mpta = geu.mirror(pta, pseg1[:, 0], pseg1[:, 1])
                 Mphe = geu.mirror(phe, pseg1[:, 0], pseg1[:, 1])
                 typ, prob = cn.belong_seg(Mpta, Mphe)
-                # printi0,i1
-                # if ((i0 == (6, 0)) & (i1 == (7, 0))):
-                #    pdb.set_trace()
-                # if bs.any():
-                #    plu.displot(pta[:,bs],phe[:,bs],color='g')
-                # if ~bs.any():
-                #    plu.displot(pta[:,~bs],phe[:,~bs],color='m')
-                #    plt.show()
-                #    pdb.set_trace())
-            ########
-            # SOMETIMES PROBA IS 0 WHEREAS SEG IS SEEN
-            ###########
-            # # keep segment with prob above a threshold
-            # isegkeep = isegments[prob>0]
-            # # dict   {numint : proba}
-            # dsegprob = {k:v for k,v in zip(isegkeep,prob[prob>0])}
-            # 4 lines are replaced by
-            # keep segment with prob above a threshold
             utypseg = typ != 0
-            isegkeep = isegments[utypseg]
-            # dict   {numint : proba}
-            dsegprob = {k: v for k, v in zip(isegkeep, prob[utypseg])}
-            #########
-            # output = filter(lambda x: x[0] in isegkeep, i2)
-            output = [x for x in i2 if x[0] in isegkeep]
-            # probint = map(lambda x: dsegprob[x[0]], output)
-            probint = [dsegprob[x[0]] for x in output]
-            # dict interaction : proba
-            dintprob = {k: v for k, v in zip(output, probint)}
-
-            # keep all segment above nstr1 and in Cone if T
-            # keep all segment below nstr1 and in Cone if R
-
+            dsegprob = {k: v for k, v in zip(isegments[utypseg], prob[utypseg])}
+            iout = np.array([u for u in i2 if gino[u, 0] in dsegprob], dtype=int)
+            pout = np.array([dsegprob[gino[u, 0]] for u in iout])
     else:
         # central interaction is a point
+        # output interactions are all the visible interactions
+        iout = np.array(i2)
+        pout = np.ones(len(iout))
 
-        # 1) Simple approach
-        #       output interaction are all visible interactions
-        # 2) TO BE DONE
-        #
-        #       output of the diffraction points
-        #       exploring
-        # b
-        #          + right of ISB
-        #          + right of RSB
-        #
-        #  + using the wedge cone
-        #  + using the incident cone
-        #
-
-        # output = nx.neighbors(self.Gi, (nstr1,))
-        uout = Gi_no.index((nstr1,))
-        ui = np.where(Gi_A[uout,:]!=0)[0]
-        output = [Gi_no[u] for u in ui]
-
-        nout = len(output)
-        probint = np.ones(nout)  # temporarybns
-        dintprob = {k: v for k, v in zip(output, probint)}
-
-    return (i0,i1, {'output':dintprob})
-    # self.Gi.add_edge(i0, i1, output=dintprob)
+    return iout, pout
 
 
 if __name__ == "__main__":
@@ -553,6 +553,7 @@ class SelectL(object):
         if self.evt == 'v':
             for n in self.L.Gs.pos:
                 self.L.Gs.pos[n]=(self.L.Gs.pos[n][0],-self.L.Gs.pos[n][1])
+            self.L._pgrid = None
             self.update_state()
             return
         #
@@ -701,6 +702,7 @@ class SelectL(object):
                             self.L.Gs.pos[nd]=(mtp[0],y)
                         if ind ==1:
                             self.L.Gs.pos[nd]=(x,mtp[1])
+                    self.L._pgrid = None
                     plt.axis('tight')
                     self.fig,self.ax = self.show(self.fig,self.ax,clear=True)
                     self.update_state()
@@ -744,6 +746,7 @@ class SelectL(object):
                 hscale = eval(enterbox('enter hscale',argDefaultText='1.0'))
                 for n in self.L.Gs.pos:
                     self.L.Gs.pos[n]=(self.L.Gs.pos[n][0]*hscale,self.L.Gs.pos[n][1]*vscale)
+                self.L._pgrid = None
                 plt.axis('tight')
                 self.fig,self.ax = self.show(self.fig,self.ax,clear=True)
                 self.update_state()
@@ -36,6 +36,19 @@ class TestLayout(unittest.TestCase):
         print(data1)
         print(data2)
 
+    def test_angleonlinks(self):
+        pa = np.array([[2,2.5,1.5],[2,2,1.5],[0.5,0.5,1.]])
+        pb = np.array([[8,4,1.5],[8,4,1.5],[9,5,2.]])
+        indptr, data = L1.angleonlinks(pa,pb)
+        self.assertEqual(len(indptr),4)
+        data3 = L1.angleonlink3(pa.T,pb.T)
+        self.assertTrue((data3['s']==data['s']).all())
+        self.assertTrue((data3['i']==np.repeat(np.arange(3),np.diff(indptr))).all())
+        # tiling does not change the result
+        indptr1, data1 = L1.angleonlinks(pa,pb,nmax=1)
+        self.assertTrue((indptr1==indptr).all())
+        self.assertTrue((data1==data).all())
+
     def test_boundary(self):
         L = Layout('defstr.lay')
         L.boundary()
@@ -44,6 +57,61 @@ class TestLayout(unittest.TestCase):
         L = Layout('defstr.lay')
         L.build()
 
+    def test_build_workers(self):
+        L = Layout('defstr.lay')
+        L.build()
+        L2 = Layout('defstr.lay')
+        L2.build(workers=2,chunksize=50)
+        self.assertEqual(list(L.Gi.edges()),list(L2.Gi.edges()))
+        for e in L.Gi.edges():
+            self.assertEqual(L.Gi.edges[e]['output'],L2.Gi.edges[e]['output'])
+
+    def test_build_cache(self):
+        L = Layout('defstr.lay')
+        key = L.graphhash()
+        L.build(cache=True)
+        L2 = Layout('defstr.lay')
+        self.assertEqual(L2.graphhash(),key)
+        self.assertTrue(L2.loadc(key))
+        self.assertEqual(list(L.Gt.nodes()),list(L2.Gt.nodes()))
+        self.assertEqual(list(L.Gi.edges()),list(L2.Gi.edges()))
+        for e in L.Gi.edges():
+            self.assertEqual(L.Gi.edges[e]['output'],L2.Gi.edges[e]['output'])
+        self.assertNotEqual(L2.graphhash(difftol=0.01),key)
+
+    def test_rebuild(self):
+        L = Layout('defstr.lay')
+        L.build()
+        ns = L.add_segment(-1,-8,name='PARTITION',verbose=False)
+        dstat = L.rebuild()
+        self.assertEqual(dstat['dirty'],3)
+        bok,dd = L.checkrebuild()
+        self.assertTrue(bok)
+        L.del_segment([ns],verbose=False)
+        L.rebuild()
+        bok,dd = L.checkrebuild()
+        self.assertTrue(bok)
+
+    def test_spatial_index(self):
+        L = Layout('defstr.lay')
+        L.build()
+        L._sgrid.nscan = 0
+        L._pgrid.nscan = 0
+        p1 = np.array([[0,2,4.5],[0,2.5,1]])
+        p2 = np.array([[10,8,5],[3,4,6]])
+        seglist = L.seginframe2(p1,p2)
+        sgrid = L._sgrid
+        L._sgrid = None
+        self.assertTrue((seglist==L.seginframe2(p1,p2)).all())
+        L._sgrid = sgrid
+        for k in L.Gs.pos:
+            if k < 0:
+                self.assertEqual(L.ispoint(np.array(L.Gs.pos[k])),k)
+        for cy in L.Gt.nodes():
+            if cy > 0:
+                self.assertEqual(L.pt2cy(np.array(L.Gt.pos[cy])),cy)
+        self.assertTrue(L.tsg[0] in L.onseg(L.pt[:,L.tahe[:,0]].mean(axis=1)))
+
     def test_cleanup(self):
         L = Layout('defstr.lay')
         L.add_fnod(p=(10,10))
@@ -92,6 +160,19 @@ class TestLayout(unittest.TestCase):
         num = L1.ispoint(pto)
         self.assertEqual(num,-1)
 
+    def test_ispoint_translate(self):
+        L = Layout('defstr.lay')
+        L.build()
+        L.translate(np.array([3.5, -2]))
+        self.assertTrue(L._pgrid is None)
+        for k in L.Gs.pos:
+            if k < 0:
+                self.assertEqual(L.ispoint(np.array(L.Gs.pos[k])), k)
+        # node moved without invalidating the index
+        L._pgrid.nscan = 0
+        L.Gs.pos[-1] = (L.Gs.pos[-1][0] + 7, L.Gs.pos[-1][1])
+        self.assertEqual(L.ispoint(np.array(L.Gs.pos[-1])), -1)
+
     def test_seg_intersection(self):
         pt1 = L1.Gs.pos[-8]
         pt2 = L1.Gs.pos[-7]
@@ -104,12 +104,17 @@ class Bsignal(PyLayers):
         y : ndarray
             values  (...,Nx)
             the number of dimensions of y is arbitrary.
-            the last dimension of y must be the primary axis
+            the last dimension of y must be the primary axis.
+            complex64 values are kept in single precision, any other
+            type is converted to complex.
         label : list of labels
 
         """
         self.x = x.astype(float)
-        self.y = y.astype(complex)
+        if y.dtype == np.complex64:
+            self.y = y.astype(np.complex64)
+        else:
+            self.y = y.astype(complex)
         ndim = self.y.ndim
         if ndim==1:
             self.y=self.y.reshape((1,len(self.y)))
@@ -2778,6 +2783,8 @@ class FUsignal(FBsignal,Usignal):
 
         if not self.isFriis:
             factor = -1j*0.3/(4*np.pi*self.x)
+            # preserve the precision of y (complex64 or complex128)
+            factor = factor.astype(np.result_type(self.y.dtype, np.complex64))
             factor = factor.reshape(self.uax)
             self.y = self.y*factor
             self.isFriis = True
@@ -3854,7 +3854,7 @@ def intersect3(a, b, pg, u1, u2, l1, l2,binter=False):
     # x (Nseg,Nscreen,3)
     # pinter (Nseg,Nscreen,3)
     if boolvalid.all():
-        x  = np.linalg.solve(A, c)
+        x  = np.linalg.solve(A, c[..., None])[..., 0]
         # calculate intersection points
         pinter = ba.T[:,None,:]*x+a.T[:,None,:]
 
@@ -3888,7 +3888,7 @@ def intersect3(a, b, pg, u1, u2, l1, l2,binter=False):
     #
     # x : Nseg x Nscreen
         if Am.size > 0:
-            x = np.linalg.solve(Am, cm)
+            x = np.linalg.solve(Am, cm[..., None])[..., 0]
             pinter = ba.T[ui[0],None,:]*x+a.T[ui[0],None,:]
         # condition of occultation
 
@@ -0,0 +1,230 @@
+#-*- coding:Utf-8 -*-
+r"""
+.. currentmodule:: pylayers.util.gridindex
+
+Uniform grid spatial index over 2D bounding boxes
+
+.. autosummary::
+    :toctree: generated
+
+    GridIndex
+
+"""
+from __future__ import print_function
+import numpy as np
+from math import floor
+
+
+class GridIndex(object):
+    """ uniform grid index of axis aligned 2D bounding boxes
+
+    Each item is registered in every cell its bounding box overlaps.
+    The cell to item table is stored in compressed sparse row format
+    (`indptr`, `indices`) so that a query only visits the items of the
+    cells covered by the query region before applying the exact bounding
+    box test.
+
+    Parameters
+    ----------
+
+    xmin : np.array (N,)
+    xmax : np.array (N,)
+    ymin : np.array (N,)
+    ymax : np.array (N,)
+    cellsize : float
+        cell size (default None : about one item per cell)
+
+    Attributes
+    ----------
+
+    N : int
+        number of items
+    x0 , y0 : float
+        grid origin
+    dx , dy : float
+        cell size
+    nx , ny : int
+        number of cells along x and y
+    indptr : np.array (nx*ny+1,)
+    indices : np.array
+        item indices of cell k are indices[indptr[k]:indptr[k+1]]
+
+    Notes
+    -----
+
+    Layouts with less than `nscan` items are scanned globally, the
+    per query overhead of the grid being larger than the scan itself.
+
+    The mapping from coordinates to cells is monotone, hence two
+    overlapping boxes always share at least one cell, including boxes
+    lying outside of the grid extent (clipped to the border cells).
+
+    Examples
+    --------
+
+    >>> import numpy as np
+    >>> xmin = np.array([0.,5.,9.])
+    >>> xmax = np.array([1.,6.,10.])
+    >>> gi = GridIndex(xmin,xmax,xmin,xmax)
+    >>> gi.nscan = 0
+    >>> gi.query(4.5,9.5,4.5,9.5)
+    array([1, 2])
+    >>> gi.query_point(0.5,0.5)
+    array([0])
+
+    """
+
+    # maximal number of cells along one axis
+    nmax = 1024
+    # below this number of items a global scan is faster than the grid
+    nscan = 5000
+
+    def __init__(self, xmin, xmax, ymin, ymax, cellsize=None):
+        self.xmin = np.asarray(xmin, dtype=float)
+        self.xmax = np.asarray(xmax, dtype=float)
+        self.ymin = np.asarray(ymin, dtype=float)
+        self.ymax = np.asarray(ymax, dtype=float)
+        self.N = len(self.xmin)
+
+        if self.N > 0:
+            self.x0 = self.xmin.min()
+            self.y0 = self.ymin.min()
+            W = self.xmax.max() - self.x0
+            H = self.ymax.max() - self.y0
+        else:
+            self.x0 = self.y0 = 0.
+            W = H = 0.
+
+        if cellsize is None:
+            # about one item per cell, but not smaller than the typical
+            # item extent in order to limit the replication of items
+            cellsize = np.sqrt(max(W * H, 1e-12) / max(self.N, 1))
+            if self.N > 0:
+                ext = np.maximum(self.xmax - self.xmin, self.ymax - self.ymin)
+                cellsize = max(cellsize, np.median(ext))
+        cellsize = max(cellsize, max(W, H, 1e-6) / self.nmax)
+
+        self.dx = self.dy = cellsize
+        self.nx = int(min(max(np.ceil(W / self.dx), 1), self.nmax))
+        self.ny = int(min(max(np.ceil(H / self.dy), 1), self.nmax))
+
+        ix0, ix1, iy0, iy1 = self._cells(self.xmin, self.xmax,
+                                         self.ymin, self.ymax)
+        wx = ix1 - ix0 + 1
+        nc = wx * (iy1 - iy0 + 1)
+        item = np.repeat(np.arange(self.N), nc)
+        # local index of the cell inside the item footprint
+        k = np.arange(len(item)) - np.repeat(np.cumsum(nc) - nc, nc)
+        wxr = wx[item]
+        cell = (iy0[item] + k // wxr) * self.nx + ix0[item] + k % wxr
+        u = np.argsort(cell, kind='stable')
+        self.indices = item[u]
+        cnt = np.bincount(cell, minlength=self.nx * self.ny)
+        self.indptr = np.hstack((0, np.cumsum(cnt)))
+
+    def _cells(self, xmin, xmax, ymin, ymax):
+        """ cell index ranges covered by boxes (clipped to the grid)
+        """
+        ix0 = np.clip(np.floor((np.asarray(xmin) - self.x0) / self.dx),
+                      0, self.nx - 1).astype(int)
+        ix1 = np.clip(np.floor((np.asarray(xmax) - self.x0) / self.dx),
+                      0, self.nx - 1).astype(int)
+        iy0 = np.clip(np.floor((np.asarray(ymin) - self.y0) / self.dy),
+                      0, self.ny - 1).astype(int)
+        iy1 = np.clip(np.floor((np.asarray(ymax) - self.y0) / self.dy),
+                      0, self.ny - 1).astype(int)
+        return ix0, ix1, iy0, iy1
+
+    def candidates(self, xmin, xmax, ymin, ymax):
+        """ items registered in the cells covered by a box
+
+        Parameters
+        ----------
+
+        xmin , xmax , ymin , ymax : float
+
+        Returns
+        -------
+
+        ic : np.array
+            sorted candidate item indices, or None if the box covers more
+            than half of the grid (a global scan is then cheaper)
+
+        """
+        ix0 = min(max(int(floor((xmin - self.x0) / self.dx)), 0), self.nx - 1)
+        ix1 = min(max(int(floor((xmax - self.x0) / self.dx)), 0), self.nx - 1)
+        iy0 = min(max(int(floor((ymin - self.y0) / self.dy)), 0), self.ny - 1)
+        iy1 = min(max(int(floor((ymax - self.y0) / self.dy)), 0), self.ny - 1)
+        ncx = ix1 - ix0 + 1
+        ncy = iy1 - iy0 + 1
+        if 2 * ncx * ncy > self.nx * self.ny:
+            return None
+        indptr = self.indptr
+        # a row of cells is a contiguous range of indices
+        lrow = [self.indices[indptr[iy * self.nx + ix0]:
+                             indptr[iy * self.nx + ix1 + 1]]
+                for iy in range(iy0, iy1 + 1)]
+        if len(lrow) == 1:
+            ic = lrow[0]
+        else:
+            ic = np.concatenate(lrow)
+        if (ncx * ncy) > 1:
+            ic = np.unique(ic)
+        return ic
+
+    def query(self, xmin, xmax, ymin, ymax, strict=True):
+        """ items whose bounding box overlaps a box
+
+        Parameters
+        ----------
+
+        xmin , xmax , ymin , ymax : float
+            query box
+        strict : boolean
+            if True boxes which only touch the query box are excluded
+
+        Returns
+        -------
+
+        iu : np.array
+            sorted item indices
+
+        """
+        ic = None
+        if self.N > self.nscan:
+            ic = self.candidates(xmin, xmax, ymin, ymax)
+        if ic is None:
+            # global scan
+            if strict:
+                b = ((self.xmax > xmin) & (self.xmin < xmax) &
+                     (self.ymax > ymin) & (self.ymin < ymax))
+            else:
+                b = ((self.xmax >= xmin) & (self.xmin <= xmax) &
+                     (self.ymax >= ymin) & (self.ymin <= ymax))
+            return np.nonzero(b)[0]
+        if strict:
+            b = ((self.xmax[ic] > xmin) & (self.xmin[ic] < xmax) &
+                 (self.ymax[ic] > ymin) & (self.ymin[ic] < ymax))
+        else:
+            b = ((self.xmax[ic] >= xmin) & (self.xmin[ic] <= xmax) &
+                 (self.ymax[ic] >= ymin) & (self.ymin[ic] <= ymax))
+        return ic[b]
+
+    def query_point(self, x, y, tol=0.):
+        """ items whose bounding box contains a point
+
+        Parameters
+        ----------
+
+        x , y : float
+        tol : float
+            the bounding boxes are enlarged by tol
+
+        Returns
+        -------
+
+        iu : np.array
+            sorted item indices
+
+        """
+        return self.query(x - tol, x + tol, y - tol, y + tol, strict=False)
@@ -0,0 +1,190 @@
+#-*- coding:Utf-8 -*-
+r"""
+.. currentmodule:: pylayers.util.mputil
+
+Multiprocessing helpers
+
+.. autosummary::
+    :toctree: generated
+
+    nworkers
+    chunkslices
+    SharedArrays
+    attach
+    release
+
+"""
+from __future__ import print_function
+import multiprocessing
+import numpy as np
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    # python < 3.8 : arrays are pickled to the workers
+    shared_memory = None
+
+
+def nworkers(workers):
+    """ resolve a number of worker processes
+
+    Parameters
+    ----------
+
+    workers : int
+        0 or 1 : serial execution
+        -1 : one worker per cpu
+        N > 1 : N workers
+
+    Returns
+    -------
+
+    n : int
+
+    Examples
+    --------
+
+    >>> nworkers(0)
+    1
+    >>> nworkers(3)
+    3
+
+    """
+    if workers is None:
+        return 1
+    if workers < 0:
+        return multiprocessing.cpu_count()
+    return max(int(workers), 1)
+
+
+def chunkslices(N, chunksize):
+    """ partition range(N) into contiguous slices
+
+    Parameters
+    ----------
+
+    N : int
+        number of items
+    chunksize : int
+        maximal number of items per slice
+
+    Returns
+    -------
+
+    lslices : list of (start,stop) tuples, in increasing order
+
+    Examples
+    --------
+
+    >>> chunkslices(5,2)
+    [(0, 2), (2, 4), (4, 5)]
+    >>> chunkslices(0,2)
+    []
+
+    """
+    chunksize = max(int(chunksize), 1)
+    return [(k, min(k + chunksize, N)) for k in range(0, N, chunksize)]
+
+
+class SharedArrays(object):
+    """ set of named read-only numpy arrays exposed to worker processes
+
+    Attributes
+    ----------
+
+    desc : dict
+        picklable descriptors of the arrays, to be passed to the workers
+        and resolved with :func:`attach`
+
+    Notes
+    -----
+
+    When ``multiprocessing.shared_memory`` is available each array is
+    copied once into a shared memory block and only (name, shape, dtype)
+    is pickled to the workers. Otherwise the descriptor holds the array
+    itself.
+
+    The shared blocks are released by :meth:`close` (or on exit of a
+    ``with`` block).
+
+    Examples
+    --------
+
+    >>> import numpy as np
+    >>> with SharedArrays({'a':np.arange(3)}) as sa:
+    ...     d, h = attach(sa.desc)
+    ...     s = int(d['a'].sum())
+    ...     del d
+    ...     release(h)
+    >>> s
+    3
+
+    """
+
+    def __init__(self, darr):
+        self._shm = []
+        self.desc = {}
+        for k in darr:
+            a = np.ascontiguousarray(darr[k])
+            if (shared_memory is None) or (a.nbytes == 0):
+                self.desc[k] = a
+            else:
+                shm = shared_memory.SharedMemory(create=True, size=a.nbytes)
+                b = np.ndarray(a.shape, dtype=a.dtype, buffer=shm.buf)
+                b[...] = a
+                self._shm.append(shm)
+                self.desc[k] = (shm.name, a.shape, a.dtype.str)
+
+    def close(self):
+        """ release the shared memory blocks
+        """
+        for shm in self._shm:
+            shm.close()
+            shm.unlink()
+        self._shm = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def attach(desc):
+    """ resolve descriptors built by :class:`SharedArrays`
+
+    Parameters
+    ----------
+
+    desc : dict
+        SharedArrays.desc
+
+    Returns
+    -------
+
+    darr : dict
+        numpy arrays (read-only when backed by shared memory)
+    handles : list
+        shared memory handles, to be released with :func:`release` once
+        all the references to the arrays have been dropped
+
+    """
+    darr = {}
+    handles = []
+    for k in desc:
+        d = desc[k]
+        if isinstance(d, tuple):
+            shm = shared_memory.SharedMemory(name=d[0])
+            a = np.ndarray(d[1], dtype=np.dtype(d[2]), buffer=shm.buf)
+            a.flags.writeable = False
+            handles.append(shm)
+        else:
+            a = d
+        darr[k] = a
+    return darr, handles
+
+
+def release(handles):
+    """ close shared memory handles returned by :func:`attach`
+    """
+    for shm in handles:
+        shm.close()
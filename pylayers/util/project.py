@@ -173,6 +173,7 @@ pstruc['DIROSM'] =os.path.join('struc','osm')
 pstruc['DIRFUR'] = os.path.join('struc','furnitures')
 pstruc['DIRIMAGE'] = os.path.join('struc','images')
 pstruc['DIRPICKLE'] = os.path.join('struc','gpickle')
+pstruc['DIRGCACHE'] = os.path.join('struc','gcache')
 pstruc['DIRRES'] = os.path.join('struc','res')
 pstruc['DIRSTR'] = os.path.join('struc','str')
 pstruc['DIRSLAB'] = 'ini'
@@ -189,7 +190,8 @@ pstruc['DIRTRA'] = 'output'
 pstruc['DIRCIR'] = 'output'
 pstruc['DIRMES'] = 'meas'
 pstruc['DIRNETSAVE'] = 'netsave'
-# pstruc['DIRSIG'] = os.path.join('output','sig')
+pstruc['DIRSIG'] = os.path.join('output','sig')
+pstruc['DIRRTTAB'] = os.path.join('output','rttab')
 pstruc['DIRR2D'] = os.path.join('output','r2d')
 pstruc['DIRR3D'] = os.path.join('output','r3d')
 pstruc['DIRCT'] = os.path.join('output','Ct')
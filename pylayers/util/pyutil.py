@@ -47,11 +47,13 @@ r"""
     has_colours
     printout
     in_ipynb
+    hashkey
 
 """
 from __future__ import print_function
 import os
 import re
+import hashlib
 import numpy as np
 import scipy as sp
 import matplotlib.pylab as plt
@@ -1993,6 +1995,44 @@ def npextract(y,s):
     return(ye)
 
 
+def hashkey(**kwargs):
+    """ hash of a set of named parameters
+
+    Parameters
+    ----------
+
+    kwargs : parameters (e.g. frequency, ray tracing parameters, antenna
+        names, ...). np.array values are hashed by content.
+
+    Returns
+    -------
+
+    key : string
+        sha1 hexdigest, independent of the order of the parameters
+
+    Examples
+    --------
+
+    >>> import numpy as np
+    >>> k1 = hashkey(fGHz=np.arange(2,6.),cutoff=3)
+    >>> k2 = hashkey(cutoff=3,fGHz=np.arange(2,6.))
+    >>> k3 = hashkey(fGHz=np.arange(2,7.),cutoff=3)
+    >>> print(k1 == k2, k1 == k3)
+    True False
+
+    """
+    h = hashlib.sha1()
+    for k in sorted(kwargs):
+        v = kwargs[k]
+        h.update(k.encode('utf-8'))
+        if isinstance(v, np.ndarray):
+            h.update(str(v.dtype).encode('utf-8'))
+            h.update(repr(v.shape).encode('utf-8'))
+            h.update(np.ascontiguousarray(v).tobytes())
+        else:
+            h.update(repr(v).encode('utf-8'))
+    return h.hexdigest()
+
 
 if __name__ == "__main__":
     doctest.testmod()